@@ -0,0 +1,490 @@
+"""
+Async-native read endpoints for ASGI deployments.
+
+Under ASGI a DRF view runs on a thread for the whole request. These views
+run on the event loop instead and leave it only for database work, through
+Django's async ORM, so a slow client or a long poll holds a coroutine, not
+a busy thread. They serve the reads field apps poll all day:
+
+* GET /api/async/follow-ups/ - FollowUpViewSet.list, which can also long
+  poll: with If-None-Match and `?wait=<seconds>` the request waits for the
+  list to change before answering, instead of the client re-polling;
+* GET /api/async/customers/ - CustomerViewSet.list (lookup by `search` and
+  the same filters);
+* GET /api/async/agent-queue/ - the requesting user's open follow-ups due
+  today, or within `?days=<n>`, overdue first, then by priority;
+* GET /api/async/customers/{id}/timeline/ - a customer's interactions,
+  follow-ups and payments, newest first;
+* GET /api/async/follow-ups/events/ - a server-sent event stream of the
+  changes to the requesting user's follow-ups (see core.events), which
+  replaces polling the follow-up list.
+
+DRF does not run async views, so authentication, throttling, permissions,
+filtering and pagination are done here with DRF's own pieces: the same JWT
+and session authentication, throttle and permission classes, filter
+backends and role scopes as the viewsets in api.views, and page bodies and
+errors shaped the way DRF shapes them. Serializers only read relations
+fetched with select_related, so serializing never touches the database.
+"""
+import asyncio
+import base64
+import binascii
+import json
+import math
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.db.models import Case, Count, IntegerField, Max, Q, Value, When
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from core.events import format_event, get_broker, parse_event_id
+from core.renderers import FastJSONRenderer
+from customers.models import Customer
+from interactions.models import Interaction, FollowUp
+from loans.models import Payment
+
+from .mixins import ConditionalGetMixin
+from .permissions import CustomerAccessPermission, InteractionAndFollowUpPermission, IsCallingAgentOrAbove
+from .scopes import scope_customers, scope_follow_ups, scope_interactions, scope_payments
+from .serializers import FollowUpSerializer, InteractionSerializer, PaymentSerializer
+from .views import CustomerViewSet, FollowUpViewSet
+
+
+_jwt = JWTAuthentication()
+
+
+def release_connections():
+    """
+    Close this thread's connections, returning them to the pool with DB_POOL.
+    """
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def int_param(request, name, default, minimum, maximum):
+    """
+    Read an integer query parameter, clamped to [minimum, maximum].
+    """
+    try:
+        value = int(request.GET.get(name, default))
+    except ValueError:
+        raise exceptions.ValidationError({name: ['A valid integer is required.']})
+    return max(minimum, min(value, maximum))
+
+
+class AsyncAPIView(View):
+    """
+    Base class running DRF's authentication, throttles and permissions
+    around an async handler, and rendering DRF-shaped JSON responses.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    renderer = FastJSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            await self.initial(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except (exceptions.APIException, Http404, PermissionDenied) as exc:
+            return self.handle_exception(exc)
+
+    async def initial(self, request):
+        request.user = await self.authenticate(request)
+        self.check_permissions(request)
+        # Throttle history lives in the cache.
+        waits = await sync_to_async(self.throttle_waits)(request)
+        if waits is not None:
+            raise exceptions.Throttled(max((wait for wait in waits if wait is not None), default=None))
+
+    async def authenticate(self, request):
+        """
+        Return the user of the bearer token, else the session user.
+        """
+        header = _jwt.get_header(request)
+        raw_token = _jwt.get_raw_token(header) if header else None
+        if raw_token is not None:
+            validated_token = _jwt.get_validated_token(raw_token)
+            return await sync_to_async(_jwt.get_user)(validated_token)
+
+        if hasattr(request, 'auser'):
+            user = await request.auser()
+            if user.is_active:
+                return user
+        return AnonymousUser()
+
+    def check_permissions(self, request):
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(
+                    getattr(permission, 'message', None), getattr(permission, 'code', None)
+                )
+
+    def check_object_permissions(self, request, obj):
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_object_permission(request, self, obj):
+                raise exceptions.PermissionDenied(
+                    getattr(permission, 'message', None), getattr(permission, 'code', None)
+                )
+
+    def throttle_waits(self, request):
+        """
+        Return the waits of the throttles that refused the request, or None.
+        """
+        waits = [throttle.wait() for throttle in [throttle() for throttle in self.throttle_classes]
+                 if not throttle.allow_request(request, self)]
+        return waits or None
+
+    def handle_exception(self, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            exc.auth_header = _jwt.authenticate_header(self.request)
+        context = {'view': self, 'args': self.args, 'kwargs': self.kwargs, 'request': self.request}
+        handled = api_settings.EXCEPTION_HANDLER(exc, context)
+        response = self.render(handled.data, status=handled.status_code)
+        for header, value in handled.items():
+            if header.lower() != 'content-type':
+                response[header] = value
+        return response
+
+    def render(self, data, status=200):
+        return HttpResponse(self.renderer.render(data), status=status, content_type=self.renderer.media_type)
+
+    async def paginate(self, request, queryset, serializer_class):
+        """
+        Return the body PageNumberPagination would render for `queryset`.
+        """
+        page_size = api_settings.PAGE_SIZE
+        count = await queryset.acount()
+        num_pages = max(1, math.ceil(count / page_size))
+        page = request.GET.get('page', 1)
+        try:
+            number = num_pages if page == 'last' else int(page)
+        except ValueError:
+            raise exceptions.NotFound('Invalid page.')
+        if not 1 <= number <= num_pages:
+            raise exceptions.NotFound('Invalid page.')
+
+        offset = (number - 1) * page_size
+        rows = [row async for row in queryset[offset:offset + page_size]]
+        url = request.build_absolute_uri()
+        previous = None
+        if number == 2:
+            previous = remove_query_param(url, 'page')
+        elif number > 2:
+            previous = replace_query_param(url, 'page', number - 1)
+        return {
+            'count': count,
+            'next': replace_query_param(url, 'page', number + 1) if number < num_pages else None,
+            'previous': previous,
+            'results': serializer_class(rows, many=True, context={'request': request}).data,
+        }
+
+
+class AsyncListView(ConditionalGetMixin, AsyncAPIView):
+    """
+    Async counterpart of a viewset's list action.
+
+    Takes the viewset's filters, search and ordering, scopes rows with the
+    same scope function and sends the same ETag validator as
+    ConditionalGetMixin. With If-None-Match and `?wait=<seconds>` (at
+    most LONG_POLL_MAX_SECONDS) a request whose list has not changed is
+    held, re-checking every LONG_POLL_INTERVAL_SECONDS, and answered as
+    soon as it changes or with a 304 once the wait is over.
+    """
+    viewset = None
+    scope = None
+    select_related = ()
+
+    @property
+    def filter_backends(self):
+        return self.viewset.filter_backends
+
+    @property
+    def filterset_fields(self):
+        return self.viewset.filterset_fields
+
+    @property
+    def search_fields(self):
+        return self.viewset.search_fields
+
+    @property
+    def ordering_fields(self):
+        return self.viewset.ordering_fields
+
+    def get_queryset(self):
+        queryset = self.viewset.queryset.select_related(*self.select_related)
+        return self.scope(queryset, self.request.user)
+
+    def filter_queryset(self, queryset):
+        # The backends read DRF's request.query_params.
+        request = Request(self.request)
+        request.user = self.request.user
+        for backend in self.filter_backends:
+            queryset = backend().filter_queryset(request, queryset, self)
+        return queryset
+
+    def etag_path(self, request):
+        # `wait` only sets how long the request is held, so a poll revalidates
+        # against the ETag of the plain list.
+        return remove_query_param(request.get_full_path(), 'wait')
+
+    async def validator(self, request, queryset):
+        """
+        Return the list's ETag, as ConditionalGetMixin.list does.
+        """
+        fingerprint = await queryset.order_by().aaggregate(
+            last_modified=Max(self.conditional_field),
+            count=Count('*'),
+        )
+        last_modified = fingerprint['last_modified']
+        return self.build_etag(
+            request, fingerprint['count'], last_modified.isoformat() if last_modified else ''
+        )
+
+    def not_modified(self, request, etag):
+        return get_conditional_response(request, etag=etag) is not None
+
+    async def get(self, request):
+        wait = int_param(request, 'wait', 0, 0, getattr(settings, 'LONG_POLL_MAX_SECONDS', 25))
+        # django-filter checks related ids against the database while validating.
+        queryset = await sync_to_async(self.filter_queryset)(self.get_queryset())
+        etag = await self.validator(request, queryset)
+
+        if wait and 'HTTP_IF_NONE_MATCH' in request.META:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + wait
+            interval = getattr(settings, 'LONG_POLL_INTERVAL_SECONDS', 2)
+            while self.not_modified(request, etag) and loop.time() < deadline:
+                # Do not hold a database connection while waiting.
+                await sync_to_async(release_connections)()
+                await asyncio.sleep(min(interval, deadline - loop.time()))
+                etag = await self.validator(request, queryset)
+
+        response = None
+        if not self.not_modified(request, etag):
+            response = self.render(await self.paginate(request, queryset, self.viewset.serializer_class))
+        return self.conditional_response(request, etag, lambda: response)
+
+
+class FollowUpListView(AsyncListView):
+    """
+    GET /api/async/follow-ups/ - FollowUpViewSet.list.
+    """
+    viewset = FollowUpViewSet
+    scope = staticmethod(scope_follow_ups)
+    select_related = ('customer', 'assigned_to', 'created_by', 'completed_by')
+    permission_classes = [IsAuthenticated, InteractionAndFollowUpPermission]
+
+
+class CustomerListView(AsyncListView):
+    """
+    GET /api/async/customers/ - CustomerViewSet.list.
+    """
+    viewset = CustomerViewSet
+    scope = staticmethod(scope_customers)
+    select_related = ('assigned_officer',)
+    permission_classes = [CustomerAccessPermission]
+
+
+# Most urgent first within a day.
+PRIORITY_RANK = Case(
+    When(priority='URGENT', then=Value(0)),
+    When(priority='HIGH', then=Value(1)),
+    When(priority='MEDIUM', then=Value(2)),
+    default=Value(3),
+    output_field=IntegerField(),
+)
+
+
+class AgentQueueView(AsyncAPIView):
+    """
+    GET /api/async/agent-queue/?days=<n>
+
+    The requesting user's pending and rescheduled follow-ups due today, or
+    within the next `days` (at most 30) days, overdue first, then by
+    priority and time. Paginated like the list endpoints.
+    """
+    permission_classes = [IsCallingAgentOrAbove]
+
+    async def get(self, request):
+        days = int_param(request, 'days', 0, 0, 30)
+        due = timezone.localdate() + timedelta(days=days)
+        queryset = scope_follow_ups(
+            FollowUp.objects.select_related('customer', 'assigned_to', 'created_by', 'completed_by'),
+            request.user,
+        ).filter(
+            assigned_to=request.user,
+            status__in=[FollowUp.FollowUpStatus.PENDING, FollowUp.FollowUpStatus.RESCHEDULED],
+            scheduled_date__lte=due,
+        ).annotate(priority_rank=PRIORITY_RANK).order_by('scheduled_date', 'priority_rank', 'scheduled_time', 'pk')
+        return self.render(await self.paginate(request, queryset, FollowUpSerializer))
+
+
+# (type, model, serializer, scope, customer lookup, timestamp field, select_related)
+TIMELINE_SOURCES = (
+    ('interaction', Interaction, InteractionSerializer, scope_interactions, 'customer', 'start_time',
+     ('customer', 'loan', 'initiated_by')),
+    ('follow_up', FollowUp, FollowUpSerializer, scope_follow_ups, 'customer', 'created_at',
+     ('customer', 'assigned_to', 'created_by', 'completed_by')),
+    ('payment', Payment, PaymentSerializer, scope_payments, 'loan__customer', 'created_at',
+     ('loan__customer', 'received_by')),
+)
+
+
+def encode_cursor(timestamp, kind, pk):
+    raw = json.dumps([timestamp.isoformat(), kind, pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """
+    Decode a timeline cursor into (timestamp, kind, pk), or return None.
+    """
+    try:
+        timestamp, kind, pk = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    timestamp = parse_datetime(timestamp) if isinstance(timestamp, str) else None
+    if timestamp is None or not isinstance(kind, str) or not isinstance(pk, int):
+        return None
+    return timestamp, kind, pk
+
+
+class CustomerTimelineView(AsyncAPIView):
+    """
+    GET /api/async/customers/{id}/timeline/?before=<cursor or timestamp>&limit=<n>
+
+    A customer's interactions (at their start time), follow-ups and payments
+    (when they were recorded), newest first, as {type, timestamp, data}
+    events. Access to the customer is checked like CustomerViewSet.retrieve
+    and each kind of event is scoped like its own list endpoint. Pass
+    `next_before` back as `before` for older events: it is a (timestamp,
+    type, id) keyset cursor, so events sharing a timestamp are split across
+    pages without being skipped. A plain timestamp as `before` gives the
+    events strictly before it.
+    """
+    permission_classes = [CustomerAccessPermission]
+
+    async def get_customer(self, request, pk):
+        queryset = scope_customers(Customer.objects.select_related('assigned_officer'), request.user)
+        try:
+            customer = await queryset.aget(pk=pk)
+        except Customer.DoesNotExist:
+            raise Http404(f'No {Customer._meta.object_name} matches the given query.')
+        # Managers' object permission looks up their hierarchy.
+        await sync_to_async(self.check_object_permissions)(request, customer)
+        return customer
+
+    async def get(self, request, pk):
+        limit = int_param(request, 'limit', 50, 1, 200)
+        before = request.GET.get('before')
+        cursor = None
+        if before is not None:
+            timestamp = parse_datetime(before)
+            cursor = (timestamp, None, None) if timestamp is not None else decode_cursor(before)
+            if cursor is None:
+                raise exceptions.ValidationError({'before': ['Enter a valid date/time or cursor.']})
+            if timezone.is_naive(cursor[0]):
+                cursor = (timezone.make_aware(cursor[0]), *cursor[1:])
+
+        customer = await self.get_customer(request, pk)
+        events = []
+        for kind, model, serializer_class, scope, lookup, field, related in TIMELINE_SOURCES:
+            queryset = scope(model.objects.select_related(*related), request.user).filter(**{lookup: customer})
+            if cursor is not None:
+                queryset = queryset.filter(self.older(cursor, kind, field))
+            rows = [row async for row in queryset.order_by(f'-{field}', '-pk')[:limit + 1]]
+            data = serializer_class(rows, many=True, context={'request': request}).data
+            events.extend((getattr(row, field), kind, row.pk, item) for row, item in zip(rows, data))
+
+        # Newest first; ties on the timestamp are ordered by type, then id.
+        events.sort(key=lambda event: event[:3], reverse=True)
+        has_more = len(events) > limit
+        events = events[:limit]
+        return self.render({
+            'customer': customer.pk,
+            'next_before': encode_cursor(*events[-1][:3]) if has_more else None,
+            'results': [
+                {'type': kind, 'timestamp': timestamp.isoformat(), 'data': data}
+                for timestamp, kind, _, data in events
+            ],
+        })
+
+    @staticmethod
+    def older(cursor, kind, field):
+        """
+        Filter for the events of `kind` after `cursor` in timeline order.
+        """
+        timestamp, cursor_kind, pk = cursor
+        if cursor_kind is None or kind > cursor_kind:
+            return Q(**{f'{field}__lt': timestamp})
+        if kind < cursor_kind:
+            return Q(**{f'{field}__lte': timestamp})
+        return Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'pk__lt': pk})
+
+
+class StreamUnavailable(exceptions.APIException):
+    status_code = 501
+    default_detail = 'Event streams are only served by ASGI workers.'
+    default_code = 'not_implemented'
+
+
+class FollowUpEventStreamView(AsyncAPIView):
+    """
+    GET /api/async/follow-ups/events/ - the requesting user's follow-up events.
+
+    A client reconnecting after a drop sends the id of the last event it
+    saw as Last-Event-ID (EventSource does this itself) or `?last_event_id=`
+    and first receives what it missed. Comments are sent every
+    EVENTS_KEEPALIVE_SECONDS so proxies keep the connection open, and the
+    stream ends after EVENTS_STREAM_MAX_SECONDS for the client to reconnect,
+    which spreads long-lived connections over restarted workers.
+
+    Under WSGI Django would buffer the whole stream, holding a sync worker
+    until the stream ends, so such requests get 501 instead.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            raise StreamUnavailable()
+        last_event_id = parse_event_id(request.headers.get('Last-Event-ID') or request.GET.get('last_event_id'))
+        response = StreamingHttpResponse(
+            self.stream(request.user.pk, last_event_id), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx would buffer the events otherwise
+        return response
+
+    async def stream(self, user_id, last_event_id):
+        # Authentication is the only database work of the stream.
+        await sync_to_async(release_connections)()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + getattr(settings, 'EVENTS_STREAM_MAX_SECONDS', 300)
+        keepalive = getattr(settings, 'EVENTS_KEEPALIVE_SECONDS', 15)
+
+        yield f"retry: {getattr(settings, 'EVENTS_RETRY_MS', 3000)}\n\n"
+        async with get_broker().subscribe(user_id, last_event_id) as subscription:
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), min(keepalive, remaining))
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_event(event)
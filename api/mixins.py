@@ -0,0 +1,97 @@
+import hashlib
+import json
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.idempotency import idempotent_response
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag validators to the list and retrieve actions.
+
+    - Detail responses are validated by an ETag of the serialized body,
+      which embeds related rows (`customer_name`, `assigned_officer_name`)
+      whose changes do not move the object's `updated_at`. A 304 saves the
+      transfer, not the serialization.
+    - List responses are validated by an ETag of a `MAX(updated_at)` /
+      `COUNT(*)` fingerprint over the scoped and filtered queryset, so a poll
+      that matches `If-None-Match` returns 304 without loading or serializing
+      rows.
+
+    Neither sends Last-Modified: a delete, a second write within the same
+    second or a change to a related row would not move it.
+
+    The validators are salted with the requesting user and the full request
+    path, because the same URL renders different rows for different roles.
+    """
+    conditional_field = 'updated_at'
+
+    def get_list_fingerprint(self, queryset):
+        """
+        Return (last_modified, count) for the queryset in a single aggregate.
+        """
+        fingerprint = queryset.order_by().aggregate(
+            last_modified=Max(self.conditional_field),
+            count=Count('*'),
+        )
+        return fingerprint['last_modified'], fingerprint['count']
+
+    def etag_path(self, request):
+        return request.get_full_path()
+
+    def build_etag(self, request, *parts):
+        user_id = getattr(request.user, 'pk', None)
+        source = '|'.join(str(part) for part in (user_id, self.etag_path(request), *parts))
+        return quote_etag(hashlib.md5(source.encode(), usedforsecurity=False).hexdigest())
+
+    def conditional_response(self, request, etag, build_response):
+        """
+        Return a 304 if the client's ETag matches, otherwise the response
+        produced by `build_response()` with the ETag attached.
+        """
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            response = not_modified
+        else:
+            response = build_response()
+
+        if 200 <= response.status_code < 400:
+            response['ETag'] = etag
+            # Clients may cache, but must revalidate before reusing the body.
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        last_modified, count = self.get_list_fingerprint(queryset)
+        etag = self.build_etag(request, count, last_modified.isoformat() if last_modified else '')
+        return self.conditional_response(
+            request, etag,
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        data = self.get_serializer(instance).data
+        etag = self.build_etag(request, json.dumps(data, cls=JSONEncoder, sort_keys=True))
+        return self.conditional_response(request, etag, lambda: Response(data))
+
+
+class IdempotentCreateMixin:
+    """
+    Honours the Idempotency-Key header on the create action.
+
+    A retried POST with the same key replays the stored response instead of
+    creating the object again; see core.idempotency.
+    """
+
+    def create(self, request, *args, **kwargs):
+        return idempotent_response(
+            request,
+            lambda: super(IdempotentCreateMixin, self).create(request, *args, **kwargs),
+        )
@@ -0,0 +1,171 @@
+"""
+Role-based visibility rules for the domain models.
+
+Each function narrows a queryset to the rows the given user may see. The
+viewsets and the sync endpoint share these so that every read path applies
+the same rules.
+
+Rules with several branches (a collection officer sees a loan assigned to
+them or a loan of one of their customers) are written as `pk IN (a UNION
+of one id subquery per branch)`. Each branch is a single-table condition
+answered from its own index; an OR of them, or of IN subqueries, would be
+planned as a filter over every row on PostgreSQL. An officer's lists so
+cost the same however large the tables grow. They remain plain filters, so
+filtering, search and ordering compose with them as before.
+"""
+
+from django.db.models import Q
+
+from customers.models import Customer
+from interactions.models import FollowUp, Interaction
+from loans.models import Loan, Payment
+from users.models import User, Hierarchy
+
+
+# Loan statuses a calling agent works on.
+CALLING_AGENT_LOAN_STATUSES = (Loan.Status.ACTIVE, Loan.Status.DEFAULTED)
+
+
+def officer_customer_ids(user):
+    """
+    Subquery of the ids of the customers assigned to a collection officer.
+    """
+    return Customer.objects.filter(assigned_officer=user).values('pk')
+
+
+def union_ids(*querysets):
+    """
+    Subquery of the ids of the rows matched by any of `querysets`.
+    """
+    first, *rest = (queryset.order_by().values('pk') for queryset in querysets)
+    return first.union(*rest)
+
+
+def officer_loan_ids(user):
+    """
+    Subquery of the ids of the loans a collection officer can see.
+    """
+    return union_ids(
+        Loan.objects.filter(assigned_officer=user),
+        Loan.objects.filter(customer_id__in=officer_customer_ids(user)),
+    )
+
+
+def scope_customers(queryset, user):
+    """
+    Filter a Customer queryset based on user role.
+    """
+    # Super Managers can see all customers
+    if user.role == User.Role.SUPER_MANAGER:
+        return queryset
+
+    # Managers can see customers of officers who report to them (directly or indirectly)
+    if user.role == User.Role.MANAGER:
+        # Get all collection officers under this manager
+        subordinate_ids = Hierarchy.objects.filter(
+            manager=user
+        ).values_list('collection_officer_id', flat=True)
+
+        # Return customers assigned to any of these officers
+        return queryset.filter(assigned_officer_id__in=subordinate_ids)
+
+    # Collection Officers can only see their assigned customers
+    if user.role == User.Role.COLLECTION_OFFICER:
+        return queryset.filter(assigned_officer=user)
+
+    # Calling Agents can see all active customers
+    if user.role == User.Role.CALLING_AGENT:
+        return queryset.filter(is_active=True)
+
+    return queryset.none()
+
+
+def scope_loans(queryset, user):
+    """
+    Filter a Loan queryset based on user role.
+    """
+    # Super Managers and Managers can see all loans
+    if user.role in [User.Role.SUPER_MANAGER, User.Role.MANAGER]:
+        return queryset
+
+    # Collection Officers can see loans for their assigned customers
+    if user.role == User.Role.COLLECTION_OFFICER:
+        return queryset.filter(pk__in=officer_loan_ids(user))
+
+    # Calling Agents can see loans they're assigned to work on
+    if user.role == User.Role.CALLING_AGENT:
+        # This is a simplified implementation
+        # In a real system, you might have a separate model for call assignments
+        return queryset.filter(status__in=CALLING_AGENT_LOAN_STATUSES)
+
+    return queryset.none()
+
+
+def scope_payments(queryset, user):
+    """
+    Filter a Payment queryset based on user role.
+    """
+    # Super Managers and Managers can see all payments
+    if user.role in [User.Role.SUPER_MANAGER, User.Role.MANAGER]:
+        return queryset
+
+    # Collection Officers can see payments for their assigned loans/customers
+    if user.role == User.Role.COLLECTION_OFFICER:
+        return queryset.filter(pk__in=union_ids(
+            Payment.objects.filter(loan_id__in=officer_loan_ids(user)),
+            Payment.objects.filter(received_by=user),
+        ))
+
+    # Calling Agents can see payments they received
+    if user.role == User.Role.CALLING_AGENT:
+        return queryset.filter(received_by=user)
+
+    return queryset.none()
+
+
+def scope_interactions(queryset, user):
+    """
+    Filter an Interaction queryset based on user role.
+    """
+    # Super Managers and Managers can see all interactions
+    if user.role in [User.Role.SUPER_MANAGER, User.Role.MANAGER]:
+        return queryset
+
+    # Collection Officers can see interactions for their assigned customers
+    if user.role == User.Role.COLLECTION_OFFICER:
+        return queryset.filter(pk__in=union_ids(
+            Interaction.objects.filter(customer_id__in=officer_customer_ids(user)),
+            Interaction.objects.filter(initiated_by=user),
+        ))
+
+    # Calling Agents can see interactions they initiated
+    if user.role == User.Role.CALLING_AGENT:
+        return queryset.filter(initiated_by=user)
+
+    return queryset.none()
+
+
+def scope_follow_ups(queryset, user):
+    """
+    Filter a FollowUp queryset based on user role.
+    """
+    # Super Managers and Managers can see all follow-ups
+    if user.role in [User.Role.SUPER_MANAGER, User.Role.MANAGER]:
+        return queryset
+
+    # Collection Officers can see follow-ups for their assigned customers or created by them
+    if user.role == User.Role.COLLECTION_OFFICER:
+        return queryset.filter(pk__in=union_ids(
+            FollowUp.objects.filter(customer_id__in=officer_customer_ids(user)),
+            FollowUp.objects.filter(created_by=user),
+            FollowUp.objects.filter(assigned_to=user),
+        ))
+
+    # Calling Agents can see follow-ups they created or are assigned to them
+    if user.role == User.Role.CALLING_AGENT:
+        return queryset.filter(
+            Q(created_by=user) |
+            Q(assigned_to=user)
+        )
+
+    return queryset.none()
@@ -1,6 +1,13 @@
+from datetime import timedelta
+
 from rest_framework import serializers
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.reverse import reverse
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
 from users.models import User, Hierarchy
@@ -8,6 +15,9 @@ from customers.models import Customer
 from loans.models import Loan, Payment
 from interactions.models import Interaction, FollowUp
 from dummy_app.models import DummyEntity
+from core import jobs
+from core.models import Job, ProfileSession
+from core.references import loan_references, payment_references
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -145,11 +155,10 @@ class LoanSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
             validated_data['created_by'] = request.user
-            
-            # Generate a unique loan reference
-            import uuid
-            validated_data['loan_reference'] = f"LN-{str(uuid.uuid4())[:8].upper()}"
-            
+
+        # Generate a unique loan reference
+        validated_data['loan_reference'] = loan_references.next(branch=validated_data['customer'].branch)
+
         return super().create(validated_data)
     
     def update(self, instance, validated_data):
@@ -182,8 +191,9 @@ class PaymentSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         # Generate a unique payment reference
-        import uuid
-        validated_data['payment_reference'] = f"PMT-{str(uuid.uuid4())[:8].upper()}"
+        validated_data['payment_reference'] = payment_references.next(
+            branch=validated_data['loan'].customer.branch
+        )
         
         # Use the current user as the receiver if not specified
         if 'received_by' not in validated_data:
@@ -300,4 +310,82 @@ class DummyEntitySerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request and hasattr(request, 'user') and 'owner' not in validated_data:
             validated_data['owner'] = request.user
-        return super().create(validated_data) 
\ No newline at end of file
+        return super().create(validated_data)
+
+
+class ProfileSessionSerializer(serializers.ModelSerializer):
+    """Serializer for the ProfileSession model"""
+
+    sample_count = serializers.IntegerField(source='samples.count', read_only=True)
+    expires_at = serializers.DateTimeField(required=False)
+
+    class Meta:
+        model = ProfileSession
+        fields = ('id', 'view', 'user', 'role', 'sample_rate', 'interval_ms', 'max_requests',
+                  'is_active', 'expires_at', 'sample_count', 'created_by', 'created_at')
+        read_only_fields = ('id', 'created_by', 'created_at')
+
+    def validate_sample_rate(self, value):
+        if not 0 < value <= 1:
+            raise serializers.ValidationError(_("Sample rate must be greater than 0 and at most 1."))
+        return value
+
+    def validate_interval_ms(self, value):
+        if value < 1:
+            raise serializers.ValidationError(_("Sampling interval must be at least 1 ms."))
+        return value
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        if request and hasattr(request, 'user'):
+            validated_data['created_by'] = request.user
+        if 'expires_at' not in validated_data:
+            ttl = getattr(settings, 'PROFILER_SESSION_TTL_MINUTES', 60)
+            validated_data['expires_at'] = now() + timedelta(minutes=ttl)
+        return super().create(validated_data)
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for the Job model; a submission sets only `kind` and `params`"""
+
+    params = serializers.JSONField(required=False, default=dict)
+    progress = serializers.FloatField(read_only=True)
+    eta_seconds = serializers.FloatField(read_only=True)
+    artifact_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ('id', 'kind', 'params', 'status', 'total', 'processed', 'progress', 'eta_seconds', 'attempts',
+                  'cancel_requested', 'result', 'error', 'artifact_url', 'created_by', 'created_at', 'started_at',
+                  'heartbeat_at', 'finished_at')
+        read_only_fields = ('id', 'status', 'total', 'processed', 'attempts', 'cancel_requested', 'result', 'error',
+                            'created_by', 'created_at', 'started_at', 'heartbeat_at', 'finished_at')
+
+    def validate_kind(self, value):
+        if value not in jobs.KINDS:
+            raise serializers.ValidationError(_("Unknown job kind. Choose one of: %s.") % ', '.join(sorted(jobs.KINDS)))
+        return value
+
+    def validate_params(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError(_("Parameters must be an object."))
+        return value
+
+    def validate(self, data):
+        user = self.context['request'].user
+        kind = jobs.get_kind(data['kind'])
+        if not kind.allowed(user):
+            raise PermissionDenied(_("Your role cannot run %s jobs.") % kind.name)
+        try:
+            data['params'] = kind.clean_params(data.get('params') or {}, user)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError({'params': e.message_dict})
+        return data
+
+    def create(self, validated_data):
+        return jobs.submit(validated_data['kind'], validated_data['params'], self.context['request'].user)
+
+    def get_artifact_url(self, obj):
+        if obj.status != Job.Status.SUCCEEDED or not obj.artifact:
+            return None
+        return reverse('job-artifact', kwargs={'pk': obj.pk}, request=self.context.get('request'))
@@ -0,0 +1,173 @@
+"""
+Delta sync for offline clients.
+
+A client holds an opaque change token. Each call returns, per collection, the
+rows in the user's scope whose `updated_at` moved past the token's cursor,
+plus tombstones for rows that were deleted or reassigned away, and a new
+token. Rows are walked in (updated_at, id) order so that batches can resume
+exactly where the previous one stopped.
+
+Clients must apply `deleted` before `changes` within a page.
+"""
+import base64
+import binascii
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from core.models import Tombstone
+from customers.models import Customer
+from loans.models import Loan, Payment
+from interactions.models import Interaction, FollowUp
+
+from .scopes import (
+    scope_customers,
+    scope_loans,
+    scope_payments,
+    scope_interactions,
+    scope_follow_ups,
+)
+from .serializers import (
+    CustomerSerializer,
+    LoanSerializer,
+    PaymentSerializer,
+    InteractionSerializer,
+    FollowUpSerializer,
+)
+
+
+TOKEN_VERSION = 1
+
+# (collection, model, serializer, scope, select_related)
+SYNC_COLLECTIONS = (
+    ('customers', Customer, CustomerSerializer, scope_customers, ('assigned_officer',)),
+    ('loans', Loan, LoanSerializer, scope_loans, ('customer', 'assigned_officer')),
+    ('payments', Payment, PaymentSerializer, scope_payments, ('loan__customer', 'received_by')),
+    ('interactions', Interaction, InteractionSerializer, scope_interactions,
+     ('customer', 'loan', 'initiated_by')),
+    ('follow_ups', FollowUp, FollowUpSerializer, scope_follow_ups,
+     ('customer', 'assigned_to', 'created_by', 'completed_by')),
+)
+
+COLLECTION_BY_LABEL = {model._meta.label_lower: name for name, model, *_ in SYNC_COLLECTIONS}
+
+
+def encode_token(state):
+    raw = json.dumps(state, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_token(token):
+    """
+    Decode a change token, or build one from a plain ISO-8601 timestamp.
+    """
+    since = parse_datetime(token)
+    if since is not None:
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        cursor = [since.isoformat(), 0]
+        return {
+            'v': TOKEN_VERSION,
+            'cursors': {name: cursor for name, *_ in SYNC_COLLECTIONS},
+            'tombstones': cursor,
+        }
+
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (binascii.Error, ValueError):
+        raise ValidationError({'updated_since': ['Invalid change token.']})
+    if not isinstance(state, dict) or state.get('v') != TOKEN_VERSION:
+        raise ValidationError({'updated_since': ['Unsupported change token.']})
+
+    if not isinstance(state.get('cursors', {}), dict):
+        raise ValidationError({'updated_since': ['Invalid change token.']})
+    cursors = [state.get('tombstones'), *state.get('cursors', {}).values()]
+    for cursor in cursors:
+        if cursor is not None and not (
+            isinstance(cursor, list) and len(cursor) == 2
+            and parse_datetime(str(cursor[0])) is not None and isinstance(cursor[1], int)
+        ):
+            raise ValidationError({'updated_since': ['Invalid change token.']})
+    return state
+
+
+def after_cursor(queryset, cursor, field):
+    """
+    Narrow a queryset to rows strictly after an (timestamp, id) cursor.
+    """
+    if not cursor:
+        return queryset
+    timestamp, pk = parse_datetime(cursor[0]), cursor[1]
+    return queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'pk__gt': pk}))
+
+
+def build_sync_page(request, token=None, limit=None):
+    """
+    Return one page of changes for `request.user` since `token`.
+    """
+    user = request.user
+    limit = limit or getattr(settings, 'SYNC_BATCH_SIZE', 500)
+    now = timezone.now()
+
+    # Rows written in the last few seconds may belong to transactions that
+    # have not committed yet; leave them for the next call so that a cursor
+    # never jumps past a row that becomes visible later.
+    upper = now - timedelta(seconds=getattr(settings, 'SYNC_SAFETY_WINDOW_SECONDS', 2))
+    retention = timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+
+    state = decode_token(token) if token else None
+    reset = False
+    if state is not None:
+        tombstone_cursor = state.get('tombstones')
+        if not tombstone_cursor or parse_datetime(tombstone_cursor[0]) < now - retention:
+            # Tombstones this old have been pruned; the client must start over.
+            state, reset = None, True
+
+    if state is None:
+        cursors, tombstone_cursor = {}, [upper.isoformat(), 0]
+    else:
+        cursors, tombstone_cursor = state.get('cursors', {}), state['tombstones']
+
+    context = {'request': request}
+    changes, next_cursors, has_more = {}, {}, False
+    for name, model, serializer_class, scope, related in SYNC_COLLECTIONS:
+        queryset = scope(model.objects.select_related(*related), user).filter(updated_at__lte=upper)
+        queryset = after_cursor(queryset, cursors.get(name), 'updated_at')
+        rows = list(queryset.order_by('updated_at', 'pk')[:limit + 1])
+        if len(rows) > limit:
+            rows, has_more = rows[:limit], True
+
+        changes[name] = serializer_class(rows, many=True, context=context).data
+        next_cursors[name] = [rows[-1].updated_at.isoformat(), rows[-1].pk] if rows else cursors.get(name)
+
+    deleted = {name: [] for name, *_ in SYNC_COLLECTIONS}
+    tombstones = Tombstone.objects.filter(
+        Q(user__isnull=True) | Q(user=user),
+        created_at__lte=upper,
+    )
+    tombstones = list(after_cursor(tombstones, tombstone_cursor, 'created_at').order_by('created_at', 'pk')[:limit + 1])
+    if len(tombstones) > limit:
+        tombstones, has_more = tombstones[:limit], True
+    for tombstone in tombstones:
+        name = COLLECTION_BY_LABEL.get(tombstone.model)
+        if name:
+            deleted[name].append(tombstone.object_id)
+    if tombstones:
+        tombstone_cursor = [tombstones[-1].created_at.isoformat(), tombstones[-1].pk]
+    elif parse_datetime(tombstone_cursor[0]) < upper:
+        # Nothing was deleted up to `upper`; move on so that a client with no
+        # tombstones for a while is not reset once its cursor passes retention.
+        tombstone_cursor = [upper.isoformat(), 0]
+
+    return {
+        'token': encode_token({'v': TOKEN_VERSION, 'cursors': next_cursors, 'tombstones': tombstone_cursor}),
+        'has_more': has_more,
+        'reset': reset,
+        'deleted': deleted,
+        'changes': changes,
+    }
@@ -0,0 +1,267 @@
+"""
+Tests for the async read endpoints.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from io import StringIO
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.scopes import scope_customers
+from core.benchmarks import role_users
+from core.events import get_broker, reset_broker
+from customers.models import Customer
+from interactions.models import Interaction, FollowUp
+from users.models import User
+
+
+def auth(user):
+    return {'authorization': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class AsyncReadAPITestCase(TestCase):
+    """Test case for the async read endpoints against their sync counterparts."""
+
+    def setUp(self):
+        """Set up test data."""
+        call_command(
+            'generate_dataset', customers=20, prefix='async', super_managers=1, managers=1,
+            officers_per_manager=2, agents=2, stdout=StringIO()
+        )
+        self.users = role_users('async')
+        self.agent = self.users[User.Role.CALLING_AGENT]
+        self.officer = self.users[User.Role.COLLECTION_OFFICER]
+        self.client = Client(SERVER_NAME='localhost')
+
+    def get(self, url, user, **params):
+        return self.client.get(url, params, headers=auth(user))
+
+    def test_lists_match_sync(self):
+        """Test that every role sees the same rows, in the same order, as the sync list endpoints."""
+        cases = [
+            ('/api/follow-ups/', '/api/async/follow-ups/', {}),
+            ('/api/follow-ups/', '/api/async/follow-ups/', {'status': 'PENDING', 'ordering': '-priority'}),
+            ('/api/customers/', '/api/async/customers/', {}),
+            ('/api/customers/', '/api/async/customers/', {'search': 'a', 'ordering': 'last_name'}),
+        ]
+        for role, user in self.users.items():
+            for sync_url, async_url, params in cases:
+                with self.subTest(role=role, url=async_url, params=params):
+                    expected = self.get(sync_url, user, **params)
+                    response = self.get(async_url, user, **params)
+                    self.assertEqual(response.status_code, expected.status_code)
+                    self.assertEqual(response['Content-Type'], 'application/json')
+                    self.assertEqual(response.json()['count'], expected.json()['count'])
+                    self.assertEqual(response.json()['results'], expected.json()['results'])
+                    self.assertEqual(response.json()['previous'] is None, expected.json()['previous'] is None)
+
+    def test_errors(self):
+        """Test that authentication, filter and page errors are reported like DRF reports them."""
+        response = self.client.get('/api/async/follow-ups/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+        self.assertFalse(response.json()['success'])
+
+        response = self.client.get('/api/async/follow-ups/', headers={'authorization': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, 401)
+
+        for params, status_code in (({'assigned_to': 999999}, 400), ({'page': 99}, 404), ({'wait': 'x'}, 400)):
+            with self.subTest(params=params):
+                expected = self.get('/api/follow-ups/', self.agent, **params)
+                response = self.get('/api/async/follow-ups/', self.agent, **params)
+                self.assertEqual(response.status_code, status_code)
+                if 'wait' not in params:
+                    self.assertEqual(response.json(), expected.json())
+
+    def test_conditional_get(self):
+        """Test that an unchanged list answers 304 to its ETag."""
+        response = self.get('/api/async/follow-ups/', self.officer)
+        self.assertEqual(response.status_code, 200)
+
+        headers = {**auth(self.officer), 'if-none-match': response['ETag']}
+        self.assertEqual(self.client.get('/api/async/follow-ups/', headers=headers).status_code, 304)
+
+        FollowUp.objects.filter(assigned_to=self.officer).first().save()
+        self.assertEqual(self.client.get('/api/async/follow-ups/', headers=headers).status_code, 200)
+
+    def test_agent_queue(self):
+        """Test that the queue holds the user's open follow-ups due by the horizon, overdue and urgent first."""
+        FollowUp.objects.filter(assigned_to=self.agent).delete()
+        interaction = Interaction.objects.first()
+        today = timezone.localdate()
+
+        def follow_up(days, priority, status=FollowUp.FollowUpStatus.PENDING, assigned_to=self.agent):
+            return FollowUp.objects.create(
+                interaction=interaction, customer=interaction.customer, follow_up_type='CALL',
+                scheduled_date=today + timedelta(days=days), assigned_to=assigned_to,
+                priority=priority, status=status, created_by=self.officer,
+            ).pk
+
+        high = follow_up(0, 'HIGH')
+        urgent = follow_up(0, 'URGENT')
+        overdue = follow_up(-2, 'LOW', status=FollowUp.FollowUpStatus.RESCHEDULED)
+        later = follow_up(3, 'URGENT')
+        follow_up(0, 'URGENT', status=FollowUp.FollowUpStatus.COMPLETED)
+        follow_up(0, 'URGENT', assigned_to=self.officer)
+
+        response = self.get('/api/async/agent-queue/', self.agent)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']], [overdue, urgent, high])
+
+        response = self.get('/api/async/agent-queue/', self.agent, days=3)
+        self.assertEqual([row['id'] for row in response.json()['results']], [overdue, urgent, high, later])
+
+    def test_timeline(self):
+        """Test that a customer's timeline is scoped, newest first and pages with next_before."""
+        customer = Customer.objects.filter(assigned_officer=self.officer, interactions__isnull=False).first()
+        manager = self.users[User.Role.SUPER_MANAGER]
+
+        response = self.get(f'/api/async/customers/{customer.pk}/timeline/', manager)
+        self.assertEqual(response.status_code, 200)
+        events = response.json()['results']
+        self.assertEqual(len(events), customer.interactions.count() + customer.follow_ups.count()
+                         + sum(loan.payments.count() for loan in customer.loans.all()))
+        self.assertEqual([event['timestamp'] for event in events],
+                         sorted((event['timestamp'] for event in events), reverse=True))
+        self.assertIsNone(response.json()['next_before'])
+
+        first = self.get(f'/api/async/customers/{customer.pk}/timeline/', manager, limit=2).json()
+        rest = self.get(f'/api/async/customers/{customer.pk}/timeline/', manager,
+                        before=first['next_before'], limit=200).json()
+        self.assertEqual(first['results'] + rest['results'], events)
+
+        # Events sharing a timestamp are split across pages, not skipped.
+        moment = timezone.now()
+        FollowUp.objects.filter(customer=customer).update(created_at=moment)
+        Interaction.objects.filter(customer=customer).update(start_time=moment)
+        events = self.get(f'/api/async/customers/{customer.pk}/timeline/', manager).json()['results']
+        paged, before = [], None
+        while True:
+            page = self.get(f'/api/async/customers/{customer.pk}/timeline/', manager, limit=1,
+                            **({'before': before} if before else {})).json()
+            paged += page['results']
+            before = page['next_before']
+            if not before:
+                break
+        self.assertEqual(paged, events)
+
+        other = scope_customers(Customer.objects.all(), self.officer).values('pk')
+        hidden = Customer.objects.exclude(pk__in=other).first()
+        response = self.get(f'/api/async/customers/{hidden.pk}/timeline/', self.officer)
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(AUDIT_LOG_ASYNC=False, LONG_POLL_INTERVAL_SECONDS=0.05)
+class AsyncLongPollTestCase(TestCase):
+    """Test case for long polling through the ASGI handler."""
+
+    def setUp(self):
+        """Set up test data."""
+        call_command(
+            'generate_dataset', customers=5, prefix='poll', super_managers=1, managers=1,
+            officers_per_manager=1, agents=1, stdout=StringIO()
+        )
+        self.user = role_users('poll')[User.Role.SUPER_MANAGER]
+        self.headers = auth(self.user)
+
+    async def test_wait_for_change(self):
+        """Test that a held request returns 304 after the wait, or 200 as soon as the list changes."""
+        response = await self.async_client.get('/api/async/follow-ups/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        headers = {**self.headers, 'if-none-match': response['ETag']}
+
+        started = time.monotonic()
+        response = await self.async_client.get('/api/async/follow-ups/', {'wait': 1}, headers=headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertGreaterEqual(time.monotonic() - started, 1)
+
+        async def change():
+            await asyncio.sleep(0.2)
+            follow_up = await FollowUp.objects.afirst()
+            await follow_up.asave()
+
+        started = time.monotonic()
+        response, _ = await asyncio.gather(
+            self.async_client.get('/api/async/follow-ups/', {'wait': 20}, headers=headers), change()
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 10)
+        self.assertNotEqual(response['ETag'], headers['if-none-match'])
+
+    def test_middleware_is_not_adapted(self):
+        """Test that no middleware makes Django run the async chain through a thread."""
+        logger = logging.getLogger('django.request')
+        with override_settings(DEBUG=True), self.assertLogs(logger, 'DEBUG') as logs:
+            logger.debug('Loading middleware')  # assertLogs needs at least one record
+            ASGIHandler()
+        self.assertEqual([line for line in logs.output if 'adapted' in line], [])
+
+
+@override_settings(AUDIT_LOG_ASYNC=False, EVENTS_REDIS_URL='', EVENTS_KEEPALIVE_SECONDS=0.2)
+class FollowUpEventStreamTestCase(TestCase):
+    """Test case for the follow-up event stream."""
+
+    def setUp(self):
+        """Set up test data."""
+        reset_broker()
+        call_command(
+            'generate_dataset', customers=3, prefix='events', super_managers=1, managers=1,
+            officers_per_manager=1, agents=1, stdout=StringIO()
+        )
+        self.agent = role_users('events')[User.Role.CALLING_AGENT]
+        self.url = '/api/async/follow-ups/events/'
+
+    async def next_event(self, chunks):
+        while True:
+            chunk = (await asyncio.wait_for(anext(chunks), 5)).decode()
+            if not chunk.startswith(':'):
+                return chunk
+
+    async def test_stream(self):
+        """Test that the user's events are pushed as they are published, with keepalives in between."""
+        response = await self.async_client.get(self.url, headers=auth(self.agent))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        chunks = response.streaming_content
+        try:
+            self.assertEqual(await self.next_event(chunks), 'retry: 3000\n\n')
+            reading = asyncio.ensure_future(self.next_event(chunks))
+            await asyncio.sleep(0.05)
+            get_broker().publish(self.agent.pk + 1, 'follow_up.created', {'follow_up': 1})
+            get_broker().publish(self.agent.pk, 'follow_up.created', {'follow_up': 2})
+            self.assertEqual(await reading, 'id: 1\nevent: follow_up.created\ndata: {"follow_up":2}\n\n')
+            self.assertEqual((await anext(chunks)).decode(), ': keepalive\n\n')
+        finally:
+            await chunks.aclose()
+
+    async def test_resume(self):
+        """Test that a reconnecting client first gets the events after its Last-Event-ID."""
+        for number in range(3):
+            get_broker().publish(self.agent.pk, 'follow_up.updated', {'follow_up': number})
+
+        response = await self.async_client.get(self.url, headers={**auth(self.agent), 'last-event-id': '1'})
+        chunks = response.streaming_content
+        try:
+            await self.next_event(chunks)
+            self.assertTrue((await self.next_event(chunks)).startswith('id: 2\n'))
+            self.assertTrue((await self.next_event(chunks)).startswith('id: 3\n'))
+        finally:
+            await chunks.aclose()
+
+    def test_wsgi(self):
+        """Test that a stream is refused rather than buffered under WSGI."""
+        response = self.client.get(self.url, headers=auth(self.agent))
+        self.assertEqual(response.status_code, 501)
+
+    async def test_unauthenticated(self):
+        """Test that a stream needs a user."""
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
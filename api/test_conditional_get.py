@@ -0,0 +1,109 @@
+"""
+Tests for conditional GET (ETag / Last-Modified) on list and detail endpoints.
+"""
+from decimal import Decimal
+
+from django.urls import reverse
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+
+from users.models import User
+from customers.models import Customer
+from loans.models import Loan
+
+from .test_views import TEST_DRF_SETTINGS
+
+
+@override_settings(REST_FRAMEWORK=TEST_DRF_SETTINGS)
+class ConditionalGetTestCase(APITestCase):
+    """Test case for ETag / Last-Modified validators."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.superuser = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpassword',
+            first_name='Admin',
+            last_name='User'
+        )
+        self.customer = Customer.objects.create(
+            first_name='Jane',
+            last_name='Doe',
+            primary_phone='+1234567890',
+            created_by=self.superuser
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+
+    def test_list_returns_not_modified(self):
+        """Test that a matching If-None-Match on a list returns 304."""
+        url = reverse('customer-list')
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', response)
+        # MAX(updated_at) misses deletes and same-second writes.
+        self.assertNotIn('Last-Modified', response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    def test_list_etag_changes_on_update(self):
+        """Test that modifying a row in the list invalidates the ETag."""
+        url = reverse('customer-list')
+        etag = self.client.get(url)['ETag']
+
+        self.customer.notes = 'Changed'
+        self.customer.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_ignores_if_modified_since(self):
+        """Test that a list is not validated by date, which would hide a delete."""
+        url = reverse('customer-list')
+        Customer.objects.create(first_name='John', last_name='Roe', primary_phone='+1234567891',
+                                created_by=self.superuser).delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_etag_depends_on_query(self):
+        """Test that different filters produce different ETags."""
+        url = reverse('customer-list')
+        self.assertNotEqual(
+            self.client.get(url)['ETag'],
+            self.client.get(url + '?city=Nowhere')['ETag'],
+        )
+
+    def test_detail_returns_not_modified(self):
+        """Test that a matching If-None-Match on a detail returns 304."""
+        url = reverse('customer-detail', kwargs={'pk': self.customer.pk})
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.customer.first_name = 'Janet'
+        self.customer.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['first_name'], 'Janet')
+
+    def test_detail_etag_follows_related_rows(self):
+        """Test that a change to a related row embedded in a detail invalidates its ETag."""
+        loan = Loan.objects.create(customer=self.customer, loan_reference='LN-1001',
+                                   principal_amount=Decimal('10000.00'), interest_rate=Decimal('12.00'),
+                                   term_months=12)
+        url = reverse('loan-detail', kwargs={'pk': loan.pk})
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+
+        self.customer.first_name = 'Janet'
+        self.customer.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Janet', response.data['customer_name'])
@@ -0,0 +1,107 @@
+"""
+Tests for Idempotency-Key handling on create endpoints.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.urls import reverse
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+
+from users.models import User
+from customers.models import Customer
+from loans.models import Loan, Payment
+from core.idempotency import hash_key
+from core.models import IdempotencyKey
+
+from .test_views import TEST_DRF_SETTINGS
+
+
+@override_settings(REST_FRAMEWORK=TEST_DRF_SETTINGS)
+class IdempotencyTestCase(APITestCase):
+    """Test case for replaying payment creation."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.superuser = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpassword',
+            first_name='Admin',
+            last_name='User'
+        )
+        self.customer = Customer.objects.create(
+            first_name='Jane',
+            last_name='Doe',
+            primary_phone='+1234567890',
+            created_by=self.superuser
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer,
+            loan_reference='LN-1001',
+            principal_amount=Decimal('10000.00'),
+            interest_rate=Decimal('12.00'),
+            term_months=12,
+            status=Loan.Status.ACTIVE,
+            created_by=self.superuser
+        )
+        self.url = reverse('payment-list')
+        self.data = {
+            'loan': self.loan.id,
+            'amount': '500.00',
+            'payment_date': date.today().isoformat(),
+            'payment_method': Payment.PaymentMethod.CASH,
+        }
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+
+    def test_retry_is_replayed(self):
+        """Test that a retried POST does not create a second payment."""
+        first = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        second = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['payment_reference'], first.data['payment_reference'])
+        self.assertEqual(Payment.objects.count(), 1)
+
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_paid, Decimal('500.00'))
+
+    def test_key_reused_for_different_request(self):
+        """Test that reusing a key with a different payload is rejected."""
+        self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        response = self.client.post(
+            self.url, dict(self.data, amount='600.00'), format='json', HTTP_IDEMPOTENCY_KEY='abc-123'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_request_in_progress(self):
+        """Test that a duplicate of an unfinished request gets a 409."""
+        first = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        IdempotencyKey.objects.filter(key_hash=hash_key(self.superuser, 'abc-123')).update(status_code=None)
+
+        response = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_expired_key_runs_again(self):
+        """Test that an expired key no longer replays."""
+        self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        response = self.client.post(self.url, self.data, format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_without_key(self):
+        """Test that requests without the header behave as before."""
+        self.client.post(self.url, self.data, format='json')
+        self.client.post(self.url, self.data, format='json')
+        self.assertEqual(Payment.objects.count(), 2)
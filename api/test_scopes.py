@@ -0,0 +1,82 @@
+"""
+Tests for the role-based visibility rules.
+"""
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.scopes import scope_loans, scope_payments, scope_interactions, scope_follow_ups
+from interactions.models import Interaction, FollowUp
+from loans.models import Loan, Payment
+from users.models import User
+
+
+class OfficerScopeTestCase(TestCase):
+    """Test case for the collection officer scopes."""
+
+    def setUp(self):
+        """Set up test data."""
+        call_command(
+            'generate_dataset', customers=30, prefix='scope', super_managers=1, managers=1,
+            officers_per_manager=3, agents=2, stdout=StringIO()
+        )
+        self.officers = list(User.objects.filter(role=User.Role.COLLECTION_OFFICER).order_by('username'))
+        self.officer, other = self.officers[0], self.officers[1]
+
+        # A loan of another officer's customer assigned to this officer, and a
+        # payment this officer took on a loan that is not theirs.
+        loan = Loan.objects.filter(customer__assigned_officer=other).order_by('pk').first()
+        loan.assigned_officer = self.officer
+        loan.save(update_fields=['assigned_officer'])
+        self.foreign_loan = Loan.objects.filter(customer__assigned_officer=other).exclude(pk=loan.pk).first()
+        Payment.objects.create(
+            loan=self.foreign_loan, amount=Decimal('100.00'), payment_date=timezone.now().date(),
+            received_by=self.officer,
+        )
+
+    def test_same_rows_as_join(self):
+        """Test that the subquery scopes match the OR across the join."""
+        expected = {
+            Loan: lambda user: Q(assigned_officer=user) | Q(customer__assigned_officer=user),
+            Payment: lambda user: (
+                Q(loan__assigned_officer=user) | Q(loan__customer__assigned_officer=user) | Q(received_by=user)
+            ),
+            Interaction: lambda user: Q(customer__assigned_officer=user) | Q(initiated_by=user),
+            FollowUp: lambda user: Q(customer__assigned_officer=user) | Q(created_by=user) | Q(assigned_to=user),
+        }
+        scopes = {Loan: scope_loans, Payment: scope_payments, Interaction: scope_interactions,
+                  FollowUp: scope_follow_ups}
+        for officer in self.officers:
+            for model, scope in scopes.items():
+                with self.subTest(officer=officer.username, model=model.__name__):
+                    self.assertEqual(
+                        set(scope(model.objects.all(), officer).values_list('pk', flat=True)),
+                        set(model.objects.filter(expected[model](officer)).values_list('pk', flat=True)),
+                    )
+
+        payments = scope_payments(Payment.objects.all(), self.officer)
+        self.assertTrue(payments.filter(loan=self.foreign_loan).exists())
+
+    def test_filters_search_and_ordering(self):
+        """Test that the list endpoints still filter, search and order within the scope."""
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=self.officer)
+        visible = scope_loans(Loan.objects.all(), self.officer)
+
+        response = client.get('/api/loans/', {'status': 'ACTIVE', 'ordering': '-principal_amount', 'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        amounts = [Decimal(row['principal_amount']) for row in response.data['results']]
+        self.assertEqual(amounts, sorted(amounts, reverse=True))
+        self.assertEqual(response.data['count'], visible.filter(status='ACTIVE').count())
+
+        last_name = visible.first().customer.last_name
+        response = client.get('/api/loans/', {'search': last_name})
+        self.assertEqual(response.data['count'], visible.filter(customer__last_name__icontains=last_name).count())
+
+        response = client.get('/api/payments/', {'loan': self.foreign_loan.pk})
+        self.assertEqual(response.data['count'], 1)
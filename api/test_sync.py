@@ -0,0 +1,304 @@
+"""
+Tests for the delta sync endpoint.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.urls import reverse
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+
+from core.transitions import run_rule
+from users.models import User, Hierarchy
+from customers.models import Customer
+from interactions.models import FollowUp, Interaction
+from loans.models import Loan, Payment
+
+from .sync import decode_token
+from .test_views import TEST_DRF_SETTINGS
+
+
+@override_settings(REST_FRAMEWORK=TEST_DRF_SETTINGS, SYNC_SAFETY_WINDOW_SECONDS=0)
+class SyncAPITestCase(APITestCase):
+    """Test case for GET /api/sync/."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.officer = User.objects.create_user(
+            username='officer',
+            email='officer@example.com',
+            password='password123',
+            role=User.Role.COLLECTION_OFFICER
+        )
+        self.other_officer = User.objects.create_user(
+            username='other',
+            email='other@example.com',
+            password='password123',
+            role=User.Role.COLLECTION_OFFICER
+        )
+        self.customer = Customer.objects.create(
+            first_name='Jane',
+            last_name='Doe',
+            primary_phone='+1234567890',
+            assigned_officer=self.officer
+        )
+        self.other_customer = Customer.objects.create(
+            first_name='John',
+            last_name='Smith',
+            primary_phone='+0987654321',
+            assigned_officer=self.other_officer
+        )
+        self.loan = Loan.objects.create(
+            customer=self.other_customer,
+            loan_reference='LN-1001',
+            principal_amount=Decimal('10000.00'),
+            interest_rate=Decimal('12.00'),
+            term_months=12
+        )
+        self.url = reverse('sync')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.officer)
+
+    def test_full_sync_is_scoped(self):
+        """Test that an initial sync returns only the officer's portfolio."""
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([c['id'] for c in response.data['changes']['customers']], [self.customer.id])
+        self.assertEqual(response.data['changes']['loans'], [])
+        self.assertFalse(response.data['has_more'])
+        self.assertTrue(response.data['token'])
+
+    def test_delta_returns_only_changes(self):
+        """Test that a follow-up sync returns only rows changed since the token."""
+        token = self.client.get(self.url).data['token']
+
+        response = self.client.get(self.url, {'updated_since': token})
+        self.assertEqual(response.data['changes']['customers'], [])
+
+        self.customer.notes = 'Visited today'
+        self.customer.save()
+        response = self.client.get(self.url, {'updated_since': token})
+        self.assertEqual(response.data['changes']['customers'][0]['notes'], 'Visited today')
+
+    def test_reassignment_creates_tombstone(self):
+        """Test that reassigned customers are tombstoned for the previous officer only."""
+        token = self.client.get(self.url).data['token']
+        self.client.force_authenticate(user=self.other_officer)
+        other_token = self.client.get(self.url).data['token']
+
+        self.other_customer.assigned_officer = self.officer
+        self.other_customer.save()
+
+        response = self.client.get(self.url, {'updated_since': other_token})
+        self.assertEqual(response.data['deleted']['customers'], [self.other_customer.id])
+
+        self.client.force_authenticate(user=self.officer)
+        response = self.client.get(self.url, {'updated_since': token})
+        self.assertEqual(response.data['deleted']['customers'], [])
+        self.assertEqual([c['id'] for c in response.data['changes']['customers']], [self.other_customer.id])
+        self.assertEqual([loan['id'] for loan in response.data['changes']['loans']], [self.loan.id])
+
+    def test_reassignment_tombstones_dependents(self):
+        """Test that a reassigned customer's rows are tombstoned too, except those the officer still sees."""
+        payment = Payment.objects.create(loan=self.loan, payment_reference='P-1', amount=Decimal('100.00'),
+                                          payment_date=timezone.localdate())
+        received = Payment.objects.create(loan=self.loan, payment_reference='P-2', amount=Decimal('100.00'),
+                                           payment_date=timezone.localdate(), received_by=self.other_officer)
+        interaction = Interaction.objects.create(customer=self.other_customer, loan=self.loan,
+                                                 interaction_type='CALL', initiated_by=self.officer,
+                                                 start_time=timezone.now(), notes='Called')
+        follow_up = FollowUp.objects.create(interaction=interaction, customer=self.other_customer, assigned_to=self.officer,
+                                            created_by=self.officer, follow_up_type='CALL',
+                                            scheduled_date=timezone.localdate())
+        self.client.force_authenticate(user=self.other_officer)
+        token = self.client.get(self.url).data['token']
+
+        self.other_customer.assigned_officer = self.officer
+        self.other_customer.save()
+
+        deleted = self.client.get(self.url, {'updated_since': token}).data['deleted']
+        self.assertEqual(deleted['loans'], [self.loan.id])
+        self.assertEqual(deleted['payments'], [payment.id])
+        self.assertEqual(deleted['interactions'], [interaction.id])
+        self.assertEqual(deleted['follow_ups'], [follow_up.id])
+        self.assertNotIn(received.id, deleted['payments'])
+
+    def test_tombstone_cursor_advances(self):
+        """Test that the tombstone cursor moves on when there are no tombstones, so idle clients are not reset."""
+        since = timezone.now() - timedelta(days=20)
+        response = self.client.get(self.url, {'updated_since': since.isoformat()})
+        self.assertFalse(response.data['reset'])
+        cursor = decode_token(response.data['token'])['tombstones']
+        self.assertGreater(parse_datetime(cursor[0]), timezone.now() - timedelta(minutes=1))
+
+    def test_deletion_creates_tombstone(self):
+        """Test that deleted rows are reported as tombstones."""
+        token = self.client.get(self.url).data['token']
+        customer_id = self.customer.id
+        self.customer.delete()
+
+        response = self.client.get(self.url, {'updated_since': token})
+        self.assertIn(customer_id, response.data['deleted']['customers'])
+
+    def test_batching(self):
+        """Test that a small limit pages through changes with has_more."""
+        Customer.objects.create(
+            first_name='Amy',
+            last_name='Adams',
+            primary_phone='+1122334455',
+            assigned_officer=self.officer
+        )
+        first = self.client.get(self.url, {'limit': 1}).data
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['changes']['customers']), 1)
+
+        second = self.client.get(self.url, {'limit': 1, 'updated_since': first['token']}).data
+        self.assertEqual(len(second['changes']['customers']), 1)
+        self.assertNotEqual(first['changes']['customers'][0]['id'], second['changes']['customers'][0]['id'])
+
+    def test_invalid_token(self):
+        """Test that a garbage token is rejected."""
+        response = self.client.get(self.url, {'updated_since': 'not-a-token'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(REST_FRAMEWORK=TEST_DRF_SETTINGS, SYNC_SAFETY_WINDOW_SECONDS=0)
+class ScopeTombstoneTestCase(APITestCase):
+    """Test case for tombstones of rows that leave a user's scope without being deleted."""
+
+    def setUp(self):
+        """Set up test data."""
+        users = {}
+        for username, role in (
+            ('manager', User.Role.MANAGER),
+            ('other_manager', User.Role.MANAGER),
+            ('officer', User.Role.COLLECTION_OFFICER),
+            ('other_officer', User.Role.COLLECTION_OFFICER),
+            ('agent', User.Role.CALLING_AGENT),
+        ):
+            users[username] = User.objects.create_user(
+                username=username,
+                email=f'{username}@example.com',
+                password='password123',
+                role=role
+            )
+        self.manager, self.other_manager = users['manager'], users['other_manager']
+        self.officer, self.other_officer = users['officer'], users['other_officer']
+        self.agent = users['agent']
+        self.hierarchy = Hierarchy.objects.create(manager=self.manager, collection_officer=self.officer)
+        self.customer = Customer.objects.create(first_name='Jane', last_name='Doe', primary_phone='+1234567890',
+                                                assigned_officer=self.officer)
+        self.other_customer = Customer.objects.create(first_name='John', last_name='Smith',
+                                                      primary_phone='+0987654321', assigned_officer=self.other_officer)
+        self.loan = Loan.objects.create(customer=self.customer, loan_reference='LN-1001',
+                                        principal_amount=Decimal('10000.00'), interest_rate=Decimal('12.00'),
+                                        term_months=12, status=Loan.Status.ACTIVE, assigned_officer=self.officer)
+        self.url = reverse('sync')
+        self.client = APIClient()
+
+    def token(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.get(self.url).data['token']
+
+    def delta(self, user, token):
+        self.client.force_authenticate(user=user)
+        return self.client.get(self.url, {'updated_since': token}).data
+
+    def test_customer_reassignment_tombstones_for_previous_manager(self):
+        """Test that a customer moved out of a manager's team is tombstoned for the manager."""
+        token = self.token(self.manager)
+        self.customer.assigned_officer = self.other_officer
+        self.customer.save()
+        self.assertEqual(self.delta(self.manager, token)['deleted']['customers'], [self.customer.id])
+
+    def test_loan_reassignment(self):
+        """Test that a loan moved to another officer is tombstoned with its payments for the previous officer."""
+        loan = Loan.objects.create(customer=self.other_customer, loan_reference='LN-1002',
+                                   principal_amount=Decimal('10000.00'), interest_rate=Decimal('12.00'),
+                                   term_months=12, status=Loan.Status.ACTIVE, assigned_officer=self.officer)
+        payment = Payment.objects.create(loan=loan, payment_reference='P-1', amount=Decimal('100.00'),
+                                         payment_date=timezone.localdate())
+        token = self.token(self.officer)
+        other_token = self.token(self.other_officer)
+
+        loan.assigned_officer = self.other_officer
+        loan.save()
+
+        deleted = self.delta(self.officer, token)['deleted']
+        self.assertEqual(deleted['loans'], [loan.id])
+        self.assertEqual(deleted['payments'], [payment.id])
+        changes = self.delta(self.other_officer, other_token)['changes']
+        self.assertEqual([p['id'] for p in changes['payments']], [payment.id])
+
+    def test_customer_deactivation(self):
+        """Test that a deactivated customer is tombstoned for calling agents only."""
+        token = self.token(self.agent)
+        officer_token = self.token(self.officer)
+        self.customer.is_active = False
+        self.customer.save()
+        self.assertEqual(self.delta(self.agent, token)['deleted']['customers'], [self.customer.id])
+        self.assertEqual(self.delta(self.officer, officer_token)['deleted']['customers'], [])
+
+    def test_loan_status_change(self):
+        """Test that a loan leaving ACTIVE/DEFAULTED is tombstoned for calling agents."""
+        token = self.token(self.agent)
+        self.loan.status = Loan.Status.DEFAULTED
+        self.loan.save()
+        self.assertEqual(self.delta(self.agent, token)['deleted']['loans'], [])
+
+        self.loan.status = Loan.Status.RESTRUCTURED
+        self.loan.save()
+        self.assertEqual(self.delta(self.agent, token)['deleted']['loans'], [self.loan.id])
+
+    def test_transition_tombstones(self):
+        """Test that loans moved by a bulk transition are tombstoned for calling agents."""
+        token = self.token(self.agent)
+        run_rule('write_off', {'references': [self.loan.loan_reference]})
+        self.assertEqual(self.delta(self.agent, token)['deleted']['loans'], [self.loan.id])
+
+    def test_paid_off_tombstones(self):
+        """Test that a loan paid off by a payment is tombstoned for calling agents."""
+        token = self.token(self.agent)
+        Payment.objects.create(loan=self.loan, payment_reference='P-1', amount=self.loan.total_amount_due,
+                               payment_date=timezone.localdate())
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, Loan.Status.PAID)
+        self.assertEqual(self.delta(self.agent, token)['deleted']['loans'], [self.loan.id])
+
+    def test_follow_up_handover(self):
+        """Test that a follow-up handed to someone else is tombstoned for the previous assignee."""
+        interaction = Interaction.objects.create(customer=self.customer, loan=self.loan, interaction_type='CALL',
+                                                 initiated_by=self.officer, start_time=timezone.now())
+        follow_up = FollowUp.objects.create(interaction=interaction, customer=self.customer, assigned_to=self.agent,
+                                            created_by=self.officer, follow_up_type='CALL',
+                                            scheduled_date=timezone.localdate())
+        token = self.token(self.agent)
+        officer_token = self.token(self.officer)
+
+        follow_up.assigned_to = self.officer
+        follow_up.save()
+
+        self.assertEqual(self.delta(self.agent, token)['deleted']['follow_ups'], [follow_up.id])
+        self.assertEqual(self.delta(self.officer, officer_token)['deleted']['follow_ups'], [])
+
+    def test_team_change(self):
+        """Test that an officer's customers move from the previous manager to the new one."""
+        token = self.token(self.manager)
+        other_token = self.token(self.other_manager)
+
+        self.hierarchy.manager = self.other_manager
+        self.hierarchy.save()
+
+        self.assertEqual(self.delta(self.manager, token)['deleted']['customers'], [self.customer.id])
+        changes = self.delta(self.other_manager, other_token)['changes']
+        self.assertEqual([c['id'] for c in changes['customers']], [self.customer.id])
+
+    def test_team_removal(self):
+        """Test that removing an officer from a team tombstones their customers for the manager."""
+        token = self.token(self.manager)
+        self.hierarchy.delete()
+        self.assertEqual(self.delta(self.manager, token)['deleted']['customers'], [self.customer.id])
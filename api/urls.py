@@ -10,6 +10,12 @@ from .views import (
     InteractionViewSet,
     FollowUpViewSet,
     DummyEntityViewSet,
+    SyncView,
+    ProfileSessionViewSet,
+    JobViewSet,
+)
+from .async_views import (
+    AgentQueueView, CustomerListView, CustomerTimelineView, FollowUpEventStreamView, FollowUpListView,
 )
 
 # Create a router and register our viewsets with it
@@ -22,8 +28,17 @@ router.register(r'payments', PaymentViewSet, basename='payment')
 router.register(r'interactions', InteractionViewSet, basename='interaction')
 router.register(r'follow-ups', FollowUpViewSet, basename='follow-up')
 router.register(r'dummy-entities', DummyEntityViewSet, basename='dummy-entity')
+router.register(r'profiling/sessions', ProfileSessionViewSet, basename='profile-session')
+router.register(r'jobs', JobViewSet, basename='job')
 
 # The API URLs are determined automatically by the router
 urlpatterns = [
+    path('sync/', SyncView.as_view(), name='sync'),
+    # Async-native read paths for ASGI deployments (see api.async_views)
+    path('async/follow-ups/', FollowUpListView.as_view(), name='async-follow-up-list'),
+    path('async/follow-ups/events/', FollowUpEventStreamView.as_view(), name='async-follow-up-events'),
+    path('async/customers/', CustomerListView.as_view(), name='async-customer-list'),
+    path('async/customers/<int:pk>/timeline/', CustomerTimelineView.as_view(), name='async-customer-timeline'),
+    path('async/agent-queue/', AgentQueueView.as_view(), name='async-agent-queue'),
     path('', include(router.urls)),
 ]
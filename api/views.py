@@ -1,8 +1,13 @@
-from rest_framework import viewsets, permissions, filters, status
+from datetime import date
+
+from rest_framework import viewsets, mixins, permissions, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db import transaction
 from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -21,8 +26,19 @@ from .serializers import (
     InteractionSerializer,
     FollowUpSerializer,
     DummyEntitySerializer,
+    ProfileSessionSerializer,
+    JobSerializer,
 )
 
+from .mixins import ConditionalGetMixin, IdempotentCreateMixin
+from .sync import build_sync_page
+from .scopes import (
+    scope_customers,
+    scope_loans,
+    scope_payments,
+    scope_interactions,
+    scope_follow_ups,
+)
 from .permissions import (
     IsSuperManager,
     IsManagerOrSuperManager,
@@ -34,6 +50,10 @@ from .permissions import (
     IsOwnerOrReadOnly,
 )
 
+from core import jobs, ledger, outbox
+from core.idempotency import idempotent_response
+from core.models import Job, ProfileSession
+from core.profiling import invalidate_sessions, merge_samples, render_collapsed, render_flamegraph
 from core.utils import DynamicPermission, check_role_permission
 
 
@@ -154,7 +174,7 @@ class HierarchyViewSet(viewsets.ModelViewSet):
         return queryset.none()
 
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(ConditionalGetMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     API endpoint for Customer management.
     Access is controlled by CustomerAccessPermission.
@@ -191,29 +211,7 @@ class CustomerViewSet(viewsets.ModelViewSet):
         if 'test' in self.request.META.get('SERVER_NAME', '').lower():
             return queryset
             
-        # Super Managers can see all customers
-        if self.request.user.role == User.Role.SUPER_MANAGER:
-            return queryset
-        
-        # Managers can see customers of officers who report to them (directly or indirectly)
-        if self.request.user.role == User.Role.MANAGER:
-            # Get all collection officers under this manager
-            subordinate_ids = Hierarchy.objects.filter(
-                manager=self.request.user
-            ).values_list('collection_officer_id', flat=True)
-            
-            # Return customers assigned to any of these officers
-            return queryset.filter(assigned_officer_id__in=subordinate_ids)
-        
-        # Collection Officers can only see their assigned customers
-        if self.request.user.role == User.Role.COLLECTION_OFFICER:
-            return queryset.filter(assigned_officer=self.request.user)
-        
-        # Calling Agents can see all active customers
-        if self.request.user.role == User.Role.CALLING_AGENT:
-            return queryset.filter(is_active=True)
-        
-        return queryset.none()
+        return scope_customers(queryset, self.request.user)
     
     def perform_create(self, serializer):
         """
@@ -248,7 +246,7 @@ class CustomerViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class LoanViewSet(viewsets.ModelViewSet):
+class LoanViewSet(ConditionalGetMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     API endpoint for Loan management.
     Access is controlled by LoanAccessPermission.
@@ -282,24 +280,7 @@ class LoanViewSet(viewsets.ModelViewSet):
         if 'test' in self.request.META.get('SERVER_NAME', '').lower():
             return queryset
         
-        # Super Managers and Managers can see all loans
-        if self.request.user.role in [User.Role.SUPER_MANAGER, User.Role.MANAGER]:
-            return queryset
-        
-        # Collection Officers can see loans for their assigned customers
-        if self.request.user.role == User.Role.COLLECTION_OFFICER:
-            return queryset.filter(
-                Q(assigned_officer=self.request.user) | 
-                Q(customer__assigned_officer=self.request.user)
-            )
-        
-        # Calling Agents can see loans they're assigned to work on
-        if self.request.user.role == User.Role.CALLING_AGENT:
-            # This is a simplified implementation
-            # In a real system, you might have a separate model for call assignments
-            return queryset.filter(status__in=['ACTIVE', 'DEFAULTED'])
-        
-        return queryset.none()
+        return scope_loans(queryset, self.request.user)
     
     def perform_create(self, serializer):
         """
@@ -323,6 +304,41 @@ class LoanViewSet(viewsets.ModelViewSet):
         serializer = PaymentSerializer(payments, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def balance(self, request, pk=None):
+        """
+        Endpoint to retrieve a loan's ledger balance, now or at the end of
+        ?as_of=YYYY-MM-DD. A loan not posted to yet has its ledger opened
+        first; a pending loan has none.
+        """
+        loan = self.get_object()
+        as_of = request.query_params.get('as_of')
+        if as_of:
+            try:
+                as_of = date.fromisoformat(as_of)
+            except ValueError:
+                return Response(
+                    {"as_of": ["Enter a date as YYYY-MM-DD."]},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        balance = ledger.balance(loan.pk, as_of or None)
+        # A ledger with no entries reads as zero too.
+        if not balance and not loan.ledger_entries.exists():
+            if loan.status == Loan.Status.PENDING:
+                return Response(
+                    {"detail": "A loan has no ledger until it is approved."},
+                    status=status.HTTP_409_CONFLICT
+                )
+            # Open it from the loan's history, and read it back on the primary.
+            with transaction.atomic():
+                ledger.open_ledgers([loan.pk])
+                balance = ledger.balance(loan.pk, as_of or None)
+        return Response({
+            'loan': loan.pk,
+            'as_of': as_of or None,
+            'balance': balance,
+        })
+    
     @action(detail=True, methods=['post'], permission_classes=[IsCollectionOfficerOrAbove])
     def approve(self, request, pk=None):
         """
@@ -336,10 +352,14 @@ class LoanViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        previous_status = loan.status
         loan.status = Loan.Status.ACTIVE
         loan.approval_date = timezone.now().date()
         loan.updated_by = request.user
-        loan.save()
+        with transaction.atomic():
+            loan.save()
+            ledger.open_ledgers([loan.pk])
+            outbox.loan_status_changed('loan.approved', loan, previous_status, request.user)
         
         serializer = self.get_serializer(loan)
         return Response(serializer.data)
@@ -357,9 +377,12 @@ class LoanViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        previous_status = loan.status
         loan.status = Loan.Status.RESTRUCTURED
         loan.updated_by = request.user
-        loan.save()
+        with transaction.atomic():
+            loan.save()
+            outbox.loan_status_changed('loan.restructured', loan, previous_status, request.user)
         
         serializer = self.get_serializer(loan)
         return Response(serializer.data)
@@ -377,18 +400,24 @@ class LoanViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        previous_status = loan.status
         loan.status = Loan.Status.WRITTEN_OFF
         loan.updated_by = request.user
-        loan.save()
+        with transaction.atomic():
+            loan.save()
+            ledger.write_off([loan.pk])
+            outbox.loan_status_changed('loan.written_off', loan, previous_status, request.user)
         
         serializer = self.get_serializer(loan)
         return Response(serializer.data)
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(ConditionalGetMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     API endpoint for Payment management.
-    Collection Officers and above can create payments.
+    Collection Officers and above can create payments. Payments are posted to
+    the loan's ledger and allocated when created, so they cannot be updated
+    or deleted.
     """
     queryset = Payment.objects.all().order_by('-payment_date')
     serializer_class = PaymentSerializer
@@ -396,12 +425,13 @@ class PaymentViewSet(viewsets.ModelViewSet):
     filterset_fields = ['loan', 'payment_method', 'payment_date', 'received_by']
     search_fields = ['payment_reference', 'loan__loan_reference', 'notes']
     ordering_fields = ['payment_date', 'amount', 'created_at']
+    http_method_names = ['get', 'post', 'head', 'options']  # Exclude put, patch, delete
     
     def get_permissions(self):
         """
         Instantiates and returns the list of permissions that this view requires.
         """
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        if self.action == 'create':
             permission_classes = [IsCollectionOfficerOrAbove]
         else:
             permission_classes = [IsCallingAgentOrAbove]
@@ -414,26 +444,17 @@ class PaymentViewSet(viewsets.ModelViewSet):
         """
         queryset = Payment.objects.all().order_by('-payment_date')
         
-        # Super Managers and Managers can see all payments
-        if self.request.user.role in [User.Role.SUPER_MANAGER, User.Role.MANAGER]:
-            return queryset
-        
-        # Collection Officers can see payments for their assigned loans/customers
-        if self.request.user.role == User.Role.COLLECTION_OFFICER:
-            return queryset.filter(
-                Q(loan__assigned_officer=self.request.user) | 
-                Q(loan__customer__assigned_officer=self.request.user) |
-                Q(received_by=self.request.user)
-            )
-        
-        # Calling Agents can see payments they received
-        if self.request.user.role == User.Role.CALLING_AGENT:
-            return queryset.filter(received_by=self.request.user)
-        
-        return queryset.none()
+        return scope_payments(queryset, self.request.user)
+    
+    def perform_create(self, serializer):
+        """
+        Save the payment and its outbox event in one transaction.
+        """
+        with transaction.atomic():
+            outbox.payment_created(serializer.save())
 
 
-class InteractionViewSet(viewsets.ModelViewSet):
+class InteractionViewSet(ConditionalGetMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     API endpoint for Interaction management.
     All authenticated users can create interactions, but interactions cannot be updated or deleted.
@@ -473,34 +494,25 @@ class InteractionViewSet(viewsets.ModelViewSet):
         if 'test' in self.request.META.get('SERVER_NAME', '').lower():
             return queryset
         
-        # Super Managers and Managers can see all interactions
-        if self.request.user.role in [User.Role.SUPER_MANAGER, User.Role.MANAGER]:
-            return queryset
-        
-        # Collection Officers can see interactions for their assigned customers
-        if self.request.user.role == User.Role.COLLECTION_OFFICER:
-            return queryset.filter(
-                Q(customer__assigned_officer=self.request.user) | 
-                Q(initiated_by=self.request.user)
-            )
-        
-        # Calling Agents can see interactions they initiated
-        if self.request.user.role == User.Role.CALLING_AGENT:
-            return queryset.filter(initiated_by=self.request.user)
-        
-        return queryset.none()
+        return scope_interactions(queryset, self.request.user)
     
     def perform_create(self, serializer):
         """
-        Set the initiated_by field to the current user.
+        Set the initiated_by field to the current user, and record the
+        interaction in the outbox in the same transaction.
         """
-        serializer.save(initiated_by=self.request.user)
+        with transaction.atomic():
+            outbox.interaction_created(serializer.save(initiated_by=self.request.user))
     
     @action(detail=True, methods=['post'])
     def create_follow_up(self, request, pk=None):
         """
         Endpoint to create a follow-up for a specific interaction.
+        Honours the Idempotency-Key header like the create endpoints.
         """
+        return idempotent_response(request, lambda: self._create_follow_up(request))
+    
+    def _create_follow_up(self, request):
         interaction = self.get_object()
         
         # Check if the required fields are provided
@@ -532,7 +544,7 @@ class InteractionViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class FollowUpViewSet(viewsets.ModelViewSet):
+class FollowUpViewSet(ConditionalGetMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     API endpoint for FollowUp management.
     Access is controlled by InteractionAndFollowUpPermission.
@@ -556,26 +568,7 @@ class FollowUpViewSet(viewsets.ModelViewSet):
         """
         queryset = FollowUp.objects.all().order_by('status', 'scheduled_date', 'scheduled_time')
         
-        # Super Managers and Managers can see all follow-ups
-        if self.request.user.role in [User.Role.SUPER_MANAGER, User.Role.MANAGER]:
-            return queryset
-        
-        # Collection Officers can see follow-ups for their assigned customers or created by them
-        if self.request.user.role == User.Role.COLLECTION_OFFICER:
-            return queryset.filter(
-                Q(customer__assigned_officer=self.request.user) | 
-                Q(created_by=self.request.user) |
-                Q(assigned_to=self.request.user)
-            )
-        
-        # Calling Agents can see follow-ups they created or are assigned to them
-        if self.request.user.role == User.Role.CALLING_AGENT:
-            return queryset.filter(
-                Q(created_by=self.request.user) | 
-                Q(assigned_to=self.request.user)
-            )
-        
-        return queryset.none()
+        return scope_follow_ups(queryset, self.request.user)
     
     def perform_create(self, serializer):
         """
@@ -750,4 +743,137 @@ class DummyEntityViewSet(viewsets.ModelViewSet):
         entity.save()
         
         serializer = self.get_serializer(entity)
-        return Response(serializer.data) 
\ No newline at end of file
+        return Response(serializer.data) 
+
+
+class SyncView(APIView):
+    """
+    Delta sync endpoint for offline field apps.
+
+    GET /api/sync/?updated_since=<token>&limit=<n>
+
+    Returns the customers, loans, payments, interactions and follow-ups in the
+    user's scope that changed since the change token (or ISO-8601 timestamp),
+    ids of rows that were deleted or reassigned away, and the token to send
+    next time. Without `updated_since` the whole portfolio is returned in
+    batches; keep calling with the new token while `has_more` is true.
+    """
+    permission_classes = [IsCallingAgentOrAbove]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 0)) or None
+        except ValueError:
+            return Response(
+                {"limit": ["A valid integer is required."]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if limit is not None:
+            limit = max(1, min(limit, 2000))
+
+        page = build_sync_page(request, request.query_params.get('updated_since'), limit)
+        return Response(page)
+
+
+class ProfileSessionViewSet(viewsets.ModelViewSet):
+    """
+    Admin-only API to switch the sampling profiler on for a view action,
+    user and/or role, and to download what it captured.
+
+    GET /api/profiling/sessions/{id}/collapsed/ returns collapsed stacks for
+    flamegraph.pl or speedscope; .../flamegraph/ returns an SVG.
+    """
+    queryset = ProfileSession.objects.all().select_related('user', 'created_by')
+    serializer_class = ProfileSessionSerializer
+    permission_classes = [permissions.IsAdminUser]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['view', 'user', 'role', 'is_active']
+    ordering = ['-created_at']
+
+    def perform_create(self, serializer):
+        serializer.save()
+        invalidate_sessions()
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_sessions()
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidate_sessions()
+
+    def _download(self, content, content_type, extension):
+        session = self.get_object()
+        response = HttpResponse(content(session), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="profile-{session.pk}.{extension}"'
+        return response
+
+    @action(detail=True, methods=['get'])
+    def collapsed(self, request, pk=None):
+        return self._download(
+            lambda session: render_collapsed(merge_samples(session.samples.all())),
+            'text/plain; charset=utf-8', 'folded'
+        )
+
+    @action(detail=True, methods=['get'])
+    def flamegraph(self, request, pk=None):
+        return self._download(
+            lambda session: render_flamegraph(merge_samples(session.samples.all()), title=str(session)),
+            'image/svg+xml', 'svg'
+        )
+
+
+class JobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    API to run long operations (exports, bulk reassignment, days past due
+    recomputation) as background jobs; see core.jobs.
+
+    POST /api/jobs/ with {"kind": ..., "params": {...}} queues a job and
+    answers 202. GET /api/jobs/{id}/ reports its status, progress and ETA,
+    POST .../cancel/ stops it and GET .../artifact/ downloads its result
+    file. Users see their own jobs; Super Managers see everyone's.
+    """
+    serializer_class = JobSerializer
+    permission_classes = [IsCallingAgentOrAbove]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['kind', 'status']
+    ordering_fields = ['created_at', 'finished_at']
+    ordering = ['-created_at']
+
+    def get_queryset(self):
+        queryset = Job.objects.all()
+        if self.request.user.role != User.Role.SUPER_MANAGER:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+    def perform_create(self, serializer):
+        job = serializer.save()
+        # Eager mode (no broker) has already run it.
+        job.refresh_from_db()
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        job = self.get_object()
+        if job.is_finished:
+            return Response(
+                {"detail": f"The job has already {job.get_status_display().lower()}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        jobs.cancel(job)
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True, methods=['get'])
+    def artifact(self, request, pk=None):
+        job = self.get_object()
+        if job.status != Job.Status.SUCCEEDED or not job.artifact:
+            raise Http404(_("This job has no result file."))
+        try:
+            handle = open(jobs.artifact_path(job), 'rb')
+        except FileNotFoundError:
+            raise Http404(_("The result file has been deleted."))
+        return FileResponse(handle, as_attachment=True, filename=f'{job.kind}-{job.pk}.{job.artifact.rsplit(".", 1)[-1]}')
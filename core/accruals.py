@@ -0,0 +1,224 @@
+"""
+Nightly interest and penalty accrual.
+
+`accrue(business_date)` posts to the ledger of every open loan (core.ledger)
+the interest and penalties it accrued since its `accrued_through` date up to
+the end of the business date, then moves `accrued_through` on:
+
+* interest is the loan's contractual interest accrued in equal daily parts
+  over its term (Loan.interest_accrued), so that interest_rate drives what
+  is owed day by day while the parts still add up to total_amount_due;
+* penalties are LOAN_PENALTY_RATE percent a year of the overdue amount,
+  charged daily: the installments due before the day (the schedule of
+  Loan.installment_due_date, in equal shares of total_amount_due) less
+  amount_paid.
+
+Loans are processed in chunks of LOAN_ACCRUAL_BATCH_SIZE in primary key
+order. Each chunk loads its loans' terms into columns of integers (amounts
+in cents, rates in hundredths of a percent, dates as ordinals), computes
+every loan's interest and penalty column by column with exact integer
+arithmetic, and in one transaction appends the ledger entries (COPY on
+PostgreSQL, see core.bulk) and moves `accrued_through` on. A loan whose
+`accrued_through` is already the business date is not selected, so a run
+that stops part way can simply be started again, and running a business
+date twice posts nothing the second time. A missed night is caught up by
+the next run.
+
+`manage.py accrue_interest` runs a business date from the command line; the
+`accrue_interest` job kind (core.jobs) runs one in the background.
+"""
+import calendar
+from array import array
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from loans.models import LedgerEntry, Loan, PAYMENT_PERIODS, add_months
+
+from . import ledger
+from .transitions import OPEN_STATUSES
+
+
+Chunk = namedtuple('Chunk', ['last_id', 'loans', 'accrued', 'interest', 'penalties', 'last'])
+
+FIELDS = ('pk', 'principal_amount', 'interest_rate', 'term_months', 'payment_frequency', 'disbursement_date',
+          'approval_date', 'application_date', 'first_payment_date', 'amount_paid', 'accrued_through')
+
+DAYS_IN_YEAR = 365
+
+
+def penalty_rate():
+    """
+    LOAN_PENALTY_RATE in hundredths of a percent a year.
+    """
+    return int(round(float(getattr(settings, 'LOAN_PENALTY_RATE', 24)) * 100))
+
+
+def pending(business_date):
+    """
+    Loans that still have days to accrue by the end of the business date.
+    """
+    return Loan.objects.filter(status__in=OPEN_STATUSES).filter(
+        Q(accrued_through__lt=business_date) | Q(accrued_through__isnull=True)
+    )
+
+
+class Columns:
+    """
+    The terms of a chunk of loans as parallel arrays of integers.
+    """
+
+    def __init__(self, rows):
+        self.ids = array('q')
+        self.principal = array('q')  # cents
+        self.interest = array('q')  # contractual interest, cents
+        self.paid = array('q')  # cents
+        self.start = array('q')  # accrual start, ordinal
+        self.term_days = array('q')
+        self.through = array('q')  # accrued through, ordinal
+        self.first = array('q')  # first payment date, ordinal, or 0 without a schedule
+        self.first_month = array('q')  # year * 12 + month of the first payment date
+        self.first_day = array('q')
+        self.step_months = array('q')
+        self.step_days = array('q')
+        self.count = array('q')  # installments
+
+        for (pk, principal, rate, term_months, frequency, disbursement_date, approval_date, application_date,
+             first_payment_date, amount_paid, accrued_through) in rows:
+            start = disbursement_date or approval_date or application_date
+            principal = int(principal * 100)
+            months, days = PAYMENT_PERIODS.get(frequency, (1, 0))
+            self.ids.append(pk)
+            self.principal.append(principal)
+            self.interest.append((principal * int(rate * 100) * term_months * 2 + 120000) // 240000)
+            self.paid.append(int(amount_paid * 100))
+            self.start.append(start.toordinal())
+            self.term_days.append(max(1, (add_months(start, term_months) - start).days))
+            # A loan never accrued accrues from its start.
+            self.through.append((accrued_through or start).toordinal())
+            if first_payment_date is None:
+                self.first.append(0)
+                self.first_month.append(0)
+                self.first_day.append(0)
+            else:
+                self.first.append(first_payment_date.toordinal())
+                self.first_month.append(first_payment_date.year * 12 + first_payment_date.month)
+                self.first_day.append(first_payment_date.day)
+            self.step_months.append(months)
+            self.step_days.append(days)
+            self.count.append(max(1, -(-term_months // months)) if months else
+                              max(1, round(term_months * DAYS_IN_YEAR / 12 / days)))
+
+    def accrued_interest(self, days):
+        """
+        Contractual interest accrued by the end of each loan's day in `days`
+        (ordinals), in cents, per loan.
+        """
+        return [
+            interest * min(max(day - start, 0), term_days) // term_days
+            for interest, start, term_days, day in zip(self.interest, self.start, self.term_days, days)
+        ]
+
+    def installments_due(self, day):
+        """
+        Installments due on or before `day` (a date), per loan.
+        """
+        ordinal = day.toordinal()
+        month = day.year * 12 + day.month
+        month_days = calendar.monthrange(day.year, day.month)[1]
+        return [
+            0 if not first or ordinal < first else min(count, (
+                (month - first_month - (day.day < min(first_day, month_days))) // step_months if step_months
+                else (ordinal - first) // step_days
+            ) + 1)
+            for first, first_month, first_day, step_months, step_days, count in zip(
+                self.first, self.first_month, self.first_day, self.step_months, self.step_days, self.count
+            )
+        ]
+
+    def penalty(self, day, rate):
+        """
+        Penalty charged for `day` (a date), in cents, per loan: `rate`
+        hundredths of a percent a year of what was overdue at its start.
+        """
+        scale = 10000 * DAYS_IN_YEAR
+        return [
+            (max(0, (principal + interest) * installments // count - paid) * rate * 2 + scale) // (2 * scale)
+            for principal, interest, paid, count, installments in zip(
+                self.principal, self.interest, self.paid, self.count,
+                self.installments_due(date.fromordinal(day.toordinal() - 1))
+            )
+        ]
+
+
+def accrue_chunk(business_date, after=0, size=None):
+    """
+    Accrue the next chunk of loans after the loan id `after`. Return a Chunk
+    with the last loan id, the loans looked at and accrued, the interest and
+    penalties posted in cents, and whether it was the last chunk.
+    """
+    size = size or getattr(settings, 'LOAN_ACCRUAL_BATCH_SIZE', 1000)
+    ids = list(pending(business_date).filter(pk__gt=after).order_by('pk').values_list('pk', flat=True)[:size])
+    if not ids:
+        return Chunk(after, 0, 0, 0, 0, True)
+
+    end = business_date.toordinal()
+    rate = penalty_rate()
+    with transaction.atomic():
+        # Locks the loans, and opens their ledgers up to the day before if
+        # need be.
+        ledgers = ledger.lock_ledgers(ids, through=business_date - timedelta(days=1))
+        columns = Columns(pending(business_date).filter(pk__in=ids).order_by('pk').values_list(*FIELDS))
+
+        interest = [
+            later - earlier for later, earlier in zip(
+                columns.accrued_interest([end] * len(columns.ids)), columns.accrued_interest(columns.through)
+            )
+        ]
+        penalties = [0] * len(columns.ids)
+        for day in range(min(columns.through, default=end) + 1, end + 1):
+            charged = columns.penalty(date.fromordinal(day), rate)
+            penalties = [
+                total + (amount if through < day else 0)
+                for total, amount, through in zip(penalties, charged, columns.through)
+            ]
+
+        postings = []
+        for pk, amount, penalty in zip(columns.ids, interest, penalties):
+            if amount:
+                postings.append(ledger.Posting(pk, LedgerEntry.EntryType.INTEREST, Decimal(amount) / 100,
+                                               business_date, 'accrual'))
+            if penalty:
+                postings.append(ledger.Posting(pk, LedgerEntry.EntryType.PENALTY, Decimal(penalty) / 100,
+                                               business_date, 'accrual'))
+        ledger.append(postings, ledgers.last)
+        Loan.objects.filter(pk__in=columns.ids).update(accrued_through=business_date)
+    return Chunk(ids[-1], len(ids), len(columns.ids), sum(interest), sum(penalties), len(ids) < size)
+
+
+def accrue(business_date, size=None):
+    """
+    Accrue every open loan by the end of the business date; return a
+    summary.
+    """
+    after, accrued, interest, penalties, last = 0, 0, 0, 0, False
+    while not last:
+        chunk = accrue_chunk(business_date, after, size)
+        after, last = chunk.last_id, chunk.last
+        accrued += chunk.accrued
+        interest += chunk.interest
+        penalties += chunk.penalties
+    return summary(business_date, accrued, interest, penalties)
+
+
+def summary(business_date, accrued, interest, penalties):
+    return {
+        'business_date': business_date.isoformat(),
+        'loans': accrued,
+        'interest': str((Decimal(interest) / 100).quantize(ledger.CENT)),
+        'penalties': str((Decimal(penalties) / 100).quantize(ledger.CENT)),
+    }
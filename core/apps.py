@@ -0,0 +1,21 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'core'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals  # noqa: F401
+        from . import events  # noqa: F401
+
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+        from .slow_queries import install
+        connection_created.connect(install, dispatch_uid='core.slow_queries')
+
+        if getattr(settings, 'METRICS_ENABLED', True):
+            from . import metrics
+            connection_created.connect(metrics.install, dispatch_uid='core.metrics')
+            metrics.instrument_serializers()
@@ -0,0 +1,238 @@
+"""
+Asynchronous audit trail for API requests.
+
+The audit middleware only captures raw request/response data into an
+AuditEntry and hands it to `audit_writer`; decoding, redaction and I/O all
+happen on a background thread that drains an in-process queue in batches.
+Batches go either to the append-only `core_auditlog` table (COPY on
+PostgreSQL, bulk_create elsewhere) or to gzip compressed JSON-lines files
+that rotate by size and day.
+
+If the queue is full (the writer cannot keep up) entries are dropped and
+counted rather than slowing requests down.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.db import connection
+
+from .bulk import insert_rows
+from .models import AuditLog
+
+
+logger = logging.getLogger('repaysync.audit')
+
+# Queued by flush() so the writer thread stops waiting to fill its batch.
+_FLUSH = object()
+
+REDACTED = '[REDACTED]'
+
+# Captured on the request thread; kept as cheap as possible.
+AuditEntry = namedtuple('AuditEntry', [
+    'timestamp', 'method', 'path', 'query_string', 'user_id', 'username', 'role',
+    'remote_addr', 'status_code', 'duration_ms',
+    'request_content_type', 'request_body', 'response_content_type', 'response_body',
+])
+
+COLUMNS = (
+    'created_at', 'method', 'path', 'query_string', 'user_id', 'username', 'role',
+    'remote_addr', 'status_code', 'duration_ms', 'request_body', 'response_body',
+)
+
+
+def redact(data, fields):
+    """
+    Return a copy of `data` with the values of sensitive keys replaced.
+    """
+    if isinstance(data, dict):
+        return {
+            key: REDACTED if str(key).lower() in fields else redact(value, fields)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [redact(item, fields) for item in data]
+    return data
+
+
+def decode_body(body, content_type, fields):
+    """
+    Turn a captured body into a JSON-serialisable, redacted value.
+
+    Bodies over the size limit are captured as their length only, since a
+    truncated payload could not be parsed (or reliably redacted).
+    """
+    if body is None:
+        return None
+    if isinstance(body, int):
+        return {'truncated': True, 'size': body}
+    if not body:
+        return None
+    content_type = (content_type or '').lower()
+    try:
+        if 'json' in content_type:
+            return redact(json.loads(body), fields)
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            form = parse_qs(body.decode('utf-8'), keep_blank_values=True)
+            return redact({key: values[0] if len(values) == 1 else values for key, values in form.items()}, fields)
+    except (ValueError, UnicodeDecodeError):
+        pass
+    return {'content_type': content_type, 'size': len(body)}
+
+
+def build_row(entry, fields):
+    return {
+        'created_at': datetime.fromtimestamp(entry.timestamp, tz=dt_timezone.utc),
+        'method': entry.method,
+        'path': entry.path[:500],
+        'query_string': entry.query_string,
+        'user_id': entry.user_id,
+        'username': entry.username,
+        'role': entry.role,
+        'remote_addr': entry.remote_addr,
+        'status_code': entry.status_code,
+        'duration_ms': round(entry.duration_ms, 3),
+        'request_body': decode_body(entry.request_body, entry.request_content_type, fields),
+        'response_body': decode_body(entry.response_body, entry.response_content_type, fields),
+    }
+
+
+class RotatingGzipSink:
+    """
+    Appends batches to `audit-<YYYYMMDD>-<pid>-<n>.jsonl.gz` files.
+
+    Every batch is written as its own gzip member, so files are valid gzip
+    streams at all times and can be read with `zcat` while still growing.
+    """
+
+    def __init__(self):
+        self._day = None
+        self._part = 0
+
+    def path(self):
+        directory = getattr(settings, 'AUDIT_LOG_DIR', os.path.join(settings.BASE_DIR, 'logs', 'audit'))
+        os.makedirs(directory, exist_ok=True)
+        day = time.strftime('%Y%m%d')
+        if day != self._day:
+            self._day, self._part = day, 0
+        max_bytes = getattr(settings, 'AUDIT_LOG_FILE_MAX_BYTES', 50 * 1024 * 1024)
+        while True:
+            path = os.path.join(directory, f'audit-{day}-{os.getpid()}-{self._part:03d}.jsonl.gz')
+            if not os.path.exists(path) or os.path.getsize(path) < max_bytes:
+                return path
+            self._part += 1
+
+    def write(self, rows):
+        lines = ''.join(json.dumps(row, default=str, separators=(',', ':')) + '\n' for row in rows)
+        with gzip.open(self.path(), 'at', encoding='utf-8') as handle:
+            handle.write(lines)
+
+
+class AuditWriter:
+    """
+    Queues audit entries and writes them from a background thread.
+
+    With AUDIT_LOG_ASYNC = False entries are written immediately on the
+    calling thread instead, which is what the test suite uses.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._file_sink = RotatingGzipSink()
+        self.dropped = 0
+
+    def submit(self, entry):
+        if not getattr(settings, 'AUDIT_LOG_ASYNC', True):
+            self.write([entry])
+            return
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning('Audit queue full; %d entries dropped so far', self.dropped)
+
+    def flush(self):
+        """
+        Write everything queued so far and wait for in-flight batches.
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        entries = [entry for entry in batch if entry is not _FLUSH]
+        if entries:
+            self._write_safely(entries)
+        for _ in batch:
+            self._queue.task_done()
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def write(self, entries):
+        fields = {field.lower() for field in getattr(settings, 'AUDIT_LOG_REDACT_FIELDS', ())}
+        rows = [build_row(entry, fields) for entry in entries]
+        if getattr(settings, 'AUDIT_LOG_SINK', 'database') == 'file':
+            self._file_sink.write(rows)
+        else:
+            insert_rows(AuditLog, COLUMNS, [[row[column] for column in COLUMNS] for row in rows])
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker must not share its parent's queue or thread.
+            self._queue = queue.Queue(maxsize=getattr(settings, 'AUDIT_LOG_QUEUE_SIZE', 10000))
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.flush)
+
+    def _run(self):
+        batch_size = getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 500)
+        interval = getattr(settings, 'AUDIT_LOG_FLUSH_SECONDS', 1.0)
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size and batch[-1] is not _FLUSH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            entries = [entry for entry in batch if entry is not _FLUSH]
+            if entries:
+                self._write_safely(entries)
+                # Batches are at least a flush interval apart; don't hold a
+                # database connection open in between.
+                connection.close()
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_safely(self, batch):
+        try:
+            self.write(batch)
+        except Exception:
+            logger.exception('Failed to write %d audit entries', len(batch))
+
+
+audit_writer = AuditWriter()
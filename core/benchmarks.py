@@ -0,0 +1,338 @@
+"""
+Endpoint benchmarks (see `manage.py benchmark_endpoints`).
+
+Every action routed by `api.urls.router`, plus the sync endpoint, is
+requested as a user of each of the four roles against whatever data is in
+the database (usually a `generate_dataset` run). For each (action, role)
+pair we record the status code, latency percentiles, the number of SQL
+queries and the response size, and compare them against a budgets file
+checked into the repository. Query counts are compared exactly, so an N+1
+introduced in a serializer fails the run; median latency and size get a
+tolerance (tail percentiles are reported but too noisy to gate on).
+
+Requests go through the full middleware stack with the Django test client,
+authenticated with force_authenticate. Write actions run inside a
+transaction that is rolled back, so the dataset is the same for every
+iteration and every run. Throttling is switched off for the run, and
+queued audit rows are written between requests rather than during them.
+"""
+import json
+import logging
+import statistics
+import time
+from collections import namedtuple
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from api.urls import router
+from api.scopes import scope_customers, scope_loans, scope_payments, scope_interactions, scope_follow_ups
+from customers.models import Customer
+from dummy_app.models import DummyEntity
+from interactions.models import Interaction, FollowUp
+from loans.models import Loan, Payment
+from users.models import User, Hierarchy
+
+from .audit import audit_writer
+from .metrics import RequestStats
+from .models import Job
+
+
+ROLES = (User.Role.SUPER_MANAGER, User.Role.MANAGER, User.Role.COLLECTION_OFFICER, User.Role.CALLING_AGENT)
+SAFE_METHODS = ('get', 'head', 'options')
+
+Endpoint = namedtuple('Endpoint', ['name', 'method', 'url_name', 'detail'])
+
+
+def discover_endpoints():
+    """
+    List every (action, method) the API router exposes, plus the sync view.
+    """
+    endpoints = []
+    for _prefix, viewset, basename in router.registry:
+        for route in router.get_routes(viewset):
+            mapping = router.get_method_map(viewset, route.mapping)
+            for method, action in mapping.items():
+                if method not in viewset.http_method_names:
+                    continue
+                endpoints.append(Endpoint(
+                    f'{viewset.__name__}.{action}', method, route.name.format(basename=basename), route.detail
+                ))
+    endpoints.append(Endpoint('SyncView.get', 'get', 'sync', False))
+    return endpoints
+
+
+def first(queryset):
+    return queryset.order_by('pk').first()
+
+
+def scoped(model, scope):
+    """
+    Target the first object the user can see, or any object when none.
+    """
+    def target(user):
+        queryset = model.objects.all()
+        return first(scope(queryset, user)) or first(queryset)
+    return target
+
+
+def unscoped(model, **filters):
+    return lambda user: first(model.objects.filter(**filters))
+
+
+def with_status(model, scope, status):
+    def target(user):
+        queryset = model.objects.filter(status=status)
+        return first(scope(queryset, user)) or first(queryset)
+    return target
+
+
+# Object each detail action is requested for, per viewset and per action.
+TARGETS = {
+    'UserViewSet': lambda user: user,
+    'UserViewSet.destroy': unscoped(User, role=User.Role.CALLING_AGENT),
+    'HierarchyViewSet': lambda user: first(Hierarchy.objects.filter(manager=user)) or first(Hierarchy.objects.all()),
+    'CustomerViewSet': scoped(Customer, scope_customers),
+    'LoanViewSet': scoped(Loan, scope_loans),
+    'LoanViewSet.approve': with_status(Loan, scope_loans, Loan.Status.PENDING),
+    'LoanViewSet.restructure': with_status(Loan, scope_loans, Loan.Status.ACTIVE),
+    'LoanViewSet.write_off': with_status(Loan, scope_loans, Loan.Status.ACTIVE),
+    'PaymentViewSet': scoped(Payment, scope_payments),
+    'InteractionViewSet': scoped(Interaction, scope_interactions),
+    'FollowUpViewSet': scoped(FollowUp, scope_follow_ups),
+    'FollowUpViewSet.complete': with_status(FollowUp, scope_follow_ups, FollowUp.FollowUpStatus.PENDING),
+    'FollowUpViewSet.reschedule': with_status(FollowUp, scope_follow_ups, FollowUp.FollowUpStatus.PENDING),
+    'DummyEntityViewSet': unscoped(DummyEntity),
+    'ProfileSessionViewSet': lambda user: None,
+    'JobViewSet': lambda user: first(Job.objects.filter(created_by=user)),
+}
+
+
+def next_week():
+    return (timezone.now() + timedelta(days=7)).date().isoformat()
+
+
+def customer_for(user):
+    return TARGETS['CustomerViewSet'](user)
+
+
+def interaction_for(user):
+    return TARGETS['InteractionViewSet'](user)
+
+
+# Request bodies for write actions; update (PUT) resends the object's own
+# representation and partial_update sends an empty PATCH.
+PAYLOADS = {
+    'UserViewSet.create': lambda user, obj: {
+        'username': 'benchmark-user', 'email': 'benchmark-user@example.com',
+        'password': 'Benchmark-Password-2024', 'role': User.Role.CALLING_AGENT,
+    },
+    'HierarchyViewSet.create': lambda user, obj: {
+        'manager': user.pk,
+        'collection_officer': getattr(first(
+            User.objects.filter(role=User.Role.COLLECTION_OFFICER).exclude(reporting_managers__manager=user)
+        ), 'pk', None),
+    },
+    'CustomerViewSet.create': lambda user, obj: {
+        'first_name': 'Bench', 'last_name': 'Mark', 'primary_phone': '+919999999999',
+        'assigned_officer': getattr(customer_for(user), 'assigned_officer_id', None),
+    },
+    'LoanViewSet.create': lambda user, obj: {
+        'customer': getattr(customer_for(user), 'pk', None),
+        'principal_amount': '25000.00', 'interest_rate': '14.50', 'term_months': 12,
+    },
+    'PaymentViewSet.create': lambda user, obj: {
+        'loan': getattr(TARGETS['LoanViewSet'](user), 'pk', None),
+        'amount': '1500.00', 'payment_date': timezone.now().date().isoformat(), 'payment_method': 'CASH',
+    },
+    'InteractionViewSet.create': lambda user, obj: {
+        'customer': getattr(customer_for(user), 'pk', None), 'initiated_by': user.pk,
+        'interaction_type': 'CALL', 'start_time': timezone.now().isoformat(),
+        'outcome': 'NO_ANSWER', 'notes': 'Benchmark call',
+    },
+    'InteractionViewSet.create_follow_up': lambda user, obj: {
+        'follow_up_type': 'CALL', 'scheduled_date': next_week(), 'assigned_to': user.pk,
+    },
+    'FollowUpViewSet.create': lambda user, obj: {
+        'interaction': getattr(interaction_for(user), 'pk', None),
+        'customer': getattr(interaction_for(user), 'customer_id', None),
+        'follow_up_type': 'CALL', 'scheduled_date': next_week(), 'assigned_to': user.pk,
+    },
+    'FollowUpViewSet.complete': lambda user, obj: {'result': 'Benchmark'},
+    'FollowUpViewSet.reschedule': lambda user, obj: {'scheduled_date': next_week()},
+    'DummyEntityViewSet.create': lambda user, obj: {'name': 'Benchmark'},
+    'ProfileSessionViewSet.create': lambda user, obj: {'view': 'CustomerViewSet.list'},
+    'JobViewSet.create': lambda user, obj: {'kind': 'export_customers'},
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def role_users(prefix):
+    """
+    Return the first generated user of each role.
+    """
+    users = {}
+    for role in ROLES:
+        user = User.objects.filter(username__startswith=f'{prefix}-', role=role).order_by('username').first()
+        if user is None:
+            raise ValueError(f"No {role} user with prefix '{prefix}'; run generate_dataset first.")
+        users[role] = user
+    return users
+
+
+def build_request(endpoint, user):
+    """
+    Return (url, payload) for one endpoint and user, or None when there is
+    no object to request it for.
+    """
+    viewset = endpoint.name.split('.')[0]
+    target = None
+    if endpoint.detail:
+        find = TARGETS.get(endpoint.name) or TARGETS.get(viewset)
+        target = find(user) if find else None
+        if target is None:
+            return None
+        url = reverse(endpoint.url_name, kwargs={'pk': target.pk})
+    else:
+        url = reverse(endpoint.url_name)
+
+    payload = None
+    if endpoint.method not in SAFE_METHODS:
+        if endpoint.name in PAYLOADS:
+            payload = PAYLOADS[endpoint.name](user, target)
+        elif endpoint.name.endswith('.update'):
+            viewset_class = next(v for _p, v, _b in router.registry if v.__name__ == viewset)
+            payload = json.loads(json.dumps(viewset_class.serializer_class(target).data, default=str))
+        else:
+            payload = {}
+    return url, payload
+
+
+def measure(client, endpoint, url, payload, iterations):
+    """
+    Issue one warm-up and `iterations` timed requests.
+    """
+    call = getattr(client, endpoint.method)
+    kwargs = {'format': 'json'} if payload is not None else {}
+    args = (url, payload) if payload is not None else (url,)
+    timings, db_timings, query_counts = [], [], []
+    status_code = size = None
+
+    for iteration in range(iterations + 1):
+        stats = RequestStats()
+        with transaction.atomic(), connection.execute_wrapper(stats):
+            started = time.perf_counter()
+            response = call(*args, **kwargs)
+            elapsed = (time.perf_counter() - started) * 1000
+            if endpoint.method not in SAFE_METHODS:
+                transaction.set_rollback(True)
+        # Write queued audit rows now rather than during the next request.
+        audit_writer.flush()
+        if iteration == 0:
+            continue
+        timings.append(elapsed)
+        db_timings.append(stats.db_time * 1000)
+        query_counts.append(stats.queries)
+        status_code = response.status_code
+        size = len(response.content)
+
+    return {
+        'status': status_code,
+        'p50_ms': round(percentile(timings, 0.50), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'max_ms': round(max(timings), 2),
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'db_ms': round(statistics.median(db_timings), 2),
+        'queries': int(statistics.median_low(query_counts)),
+        'max_queries': max(query_counts),
+        'bytes': size,
+    }
+
+
+def run(prefix, iterations=20, only=None, on_result=None):
+    """
+    Benchmark every endpoint for every role; returns the list of results.
+    """
+    users = role_users(prefix)
+    results = []
+    # Views check SERVER_NAME for 'test' to skip scoping, so don't use 'testserver'.
+    client = APIClient(SERVER_NAME='localhost')
+    # 403 and 404 responses are expected for some roles; don't log each one.
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        with mock.patch.object(APIView, 'throttle_classes', ()):
+            for endpoint in discover_endpoints():
+                if only and not any(endpoint.name.startswith(name) for name in only):
+                    continue
+                for role, user in users.items():
+                    result = {'action': endpoint.name, 'method': endpoint.method.upper(), 'role': str(role)}
+                    request = build_request(endpoint, user)
+                    if request is None:
+                        result['skipped'] = 'no object to request'
+                    else:
+                        client.force_authenticate(user=user)
+                        result.update(measure(client, endpoint, *request, iterations))
+                    results.append(result)
+                    if on_result:
+                        on_result(result)
+    finally:
+        request_logger.setLevel(level)
+    return results
+
+
+def compare(results, budgets, latency_tolerance=0.5, latency_slack_ms=5.0, bytes_tolerance=0.1, check_latency=True):
+    """
+    Annotate results with their budget and return the list of regressions.
+    """
+    regressions = []
+    for result in results:
+        budget = budgets.get(result['action'], {}).get(result['role'])
+        if budget is None or 'skipped' in result:
+            continue
+        result['budget'] = budget
+        problems = []
+        if result['status'] != budget['status']:
+            problems.append(f"status {result['status']} (budget {budget['status']})")
+        if result['queries'] > budget['queries']:
+            problems.append(f"{result['queries']} queries (budget {budget['queries']})")
+        if check_latency and result['p50_ms'] > budget['p50_ms'] * (1 + latency_tolerance) + latency_slack_ms:
+            problems.append(f"p50 {result['p50_ms']:.1f} ms (budget {budget['p50_ms']:.1f} ms)")
+        if result['bytes'] > budget['bytes'] * (1 + bytes_tolerance):
+            problems.append(f"{result['bytes']} bytes (budget {budget['bytes']})")
+        result['regressions'] = problems
+        if problems:
+            regressions.append(f"{result['action']} as {result['role']}: {', '.join(problems)}")
+    return regressions
+
+
+def budgets_from(results):
+    budgets = {}
+    for result in results:
+        if 'skipped' not in result:
+            budgets.setdefault(result['action'], {})[result['role']] = {
+                key: result[key] for key in ('status', 'queries', 'p50_ms', 'bytes')
+            }
+    return budgets
+
+
+def dataset_summary():
+    return {
+        'users': User.objects.count(),
+        'customers': Customer.objects.count(),
+        'loans': Loan.objects.count(),
+        'payments': Payment.objects.count(),
+        'interactions': Interaction.objects.count(),
+        'follow_ups': FollowUp.objects.count(),
+    }
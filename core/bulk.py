@@ -0,0 +1,100 @@
+"""
+Bulk insert and update helpers.
+
+`insert_rows` loads rows with PostgreSQL's COPY when available and falls
+back to bulk_create elsewhere (SQLite in development and tests).
+`update_rows` updates rows by primary key with one prepared statement run
+for every row, rather than bulk_update's CASE WHEN per column. Rows are
+sequences of values in the order of `columns`, which are field attnames
+(e.g. ``customer_id``); model save() methods and signals are bypassed.
+"""
+import io
+import json
+from decimal import Decimal
+
+from django.db import connections, router
+
+
+NULL = '\\N'
+
+
+def copy_value(value):
+    """
+    A value as a PostgreSQL CSV field: NULL as an unquoted \\N, numbers bare
+    and everything else quoted, so that an empty string or a literal \\N stays
+    a string.
+    """
+    if value is None:
+        return NULL
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_rows(model, columns, rows, using=None):
+    """
+    Insert rows with a single COPY ... FROM STDIN on PostgreSQL.
+    """
+    using = using or router.db_for_write(model)
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    db_columns = [fields[name].column for name in columns]
+    json_positions = [index for index, name in enumerate(columns) if fields[name].get_internal_type() == 'JSONField']
+
+    buffer = io.StringIO()
+    for row in rows:
+        if json_positions:
+            row = list(row)
+            for index in json_positions:
+                if row[index] is not None:
+                    row[index] = json.dumps(row[index], default=str)
+        buffer.write(','.join(map(copy_value, row)))
+        buffer.write('\n')
+
+    table = connections[using].ops.quote_name(model._meta.db_table)
+    quoted = ', '.join(connections[using].ops.quote_name(column) for column in db_columns)
+    sql = f"COPY {table} ({quoted}) FROM STDIN WITH (FORMAT csv, NULL '{NULL}')"
+
+    with connections[using].cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            buffer.seek(0)
+            raw.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def insert_rows(model, columns, rows, using=None, batch_size=5000):
+    """
+    Insert rows as fast as the database allows.
+    """
+    using = using or router.db_for_write(model)
+    if not rows:
+        return
+    if connections[using].vendor == 'postgresql':
+        copy_rows(model, columns, rows, using=using)
+    else:
+        model.objects.using(using).bulk_create(
+            [model(**dict(zip(columns, row))) for row in rows],
+            batch_size=batch_size
+        )
+
+
+def update_rows(model, columns, rows, using=None):
+    """
+    Update rows of (pk, *values) with a single executemany.
+    """
+    using = using or router.db_for_write(model)
+    if not rows:
+        return
+    connection = connections[using]
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    targets = [fields[name] for name in columns] + [model._meta.pk]
+    assignments = ', '.join(f'{connection.ops.quote_name(field.column)} = %s' for field in targets[:-1])
+    sql = (f'UPDATE {connection.ops.quote_name(model._meta.db_table)} SET {assignments} '
+           f'WHERE {connection.ops.quote_name(model._meta.pk.column)} = %s')
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(value, connection) for field, value in zip(targets, (*values, pk))]
+            for pk, *values in rows
+        ])
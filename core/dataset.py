@@ -0,0 +1,530 @@
+"""
+Deterministic synthetic datasets (see `manage.py generate_dataset`).
+
+Users and the reporting hierarchy are created first. Customers are then
+generated in chunks; each chunk creates its customers together with their
+loans, payments, interactions and follow-ups. A chunk draws from its own
+random.Random seeded with (seed, chunk index) and writes into its own
+reserved primary-key ranges, so the data does not depend on the number of
+workers or the order in which chunks finish. Only loan and payment
+references differ between runs, since they come from the reference
+sequences.
+
+Rows are written with COPY on PostgreSQL (bulk_create elsewhere), bypassing
+model save() methods and signals; derived fields such as
+`Loan.amount_paid` are computed here instead.
+"""
+import calendar
+import math
+import multiprocessing
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from functools import partial
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+
+from customers.models import Customer
+from interactions.models import Interaction, FollowUp
+from loans.models import Loan, Payment
+from users.models import User, Hierarchy
+
+from .bulk import insert_rows
+from .references import loan_references, payment_references
+
+
+FIRST_NAMES = (
+    'Aarav', 'Aditi', 'Amit', 'Ananya', 'Arjun', 'Deepa', 'Divya', 'Farhan', 'Gaurav', 'Isha',
+    'Karan', 'Kavya', 'Lakshmi', 'Manoj', 'Meera', 'Neha', 'Nikhil', 'Pooja', 'Priya', 'Rahul',
+    'Ravi', 'Rohan', 'Sanjay', 'Shreya', 'Sneha', 'Suresh', 'Tanvi', 'Varun', 'Vikram', 'Zara',
+)
+LAST_NAMES = (
+    'Agarwal', 'Bhat', 'Chopra', 'Das', 'Desai', 'Gupta', 'Iyer', 'Jain', 'Joshi', 'Kapoor',
+    'Khan', 'Kumar', 'Menon', 'Mehta', 'Nair', 'Patel', 'Pillai', 'Rao', 'Reddy', 'Shah',
+    'Sharma', 'Singh', 'Srinivasan', 'Verma', 'Yadav',
+)
+BRANCHES = (
+    ('Bengaluru', 'Karnataka'), ('Mumbai', 'Maharashtra'), ('Pune', 'Maharashtra'),
+    ('Chennai', 'Tamil Nadu'), ('Hyderabad', 'Telangana'), ('Delhi', 'Delhi'),
+    ('Kolkata', 'West Bengal'), ('Jaipur', 'Rajasthan'), ('Lucknow', 'Uttar Pradesh'),
+    ('Kochi', 'Kerala'), ('Ahmedabad', 'Gujarat'), ('Indore', 'Madhya Pradesh'),
+)
+EMPLOYERS = ('', 'Self-employed', 'Tata Motors', 'Infosys', 'State Government', 'Reliance Retail', 'Local Cooperative')
+
+LOAN_STATUSES = (
+    (Loan.Status.ACTIVE, 55),
+    (Loan.Status.PAID, 20),
+    (Loan.Status.DEFAULTED, 10),
+    (Loan.Status.PENDING, 7),
+    (Loan.Status.RESTRUCTURED, 5),
+    (Loan.Status.WRITTEN_OFF, 3),
+)
+# Days past due for ACTIVE loans: mostly current, with a tail into each bucket
+ACTIVE_DPD_BUCKETS = (((0, 0), 70), ((1, 30), 15), ((31, 60), 8), ((61, 90), 7))
+TERMS = (6, 12, 18, 24, 36, 48, 60)
+
+PAYMENT_METHODS = (
+    (Payment.PaymentMethod.MOBILE_MONEY, 40),
+    (Payment.PaymentMethod.BANK_TRANSFER, 30),
+    (Payment.PaymentMethod.CASH, 20),
+    (Payment.PaymentMethod.CHEQUE, 7),
+    (Payment.PaymentMethod.OTHER, 3),
+)
+INTERACTION_TYPES = (
+    (Interaction.InteractionType.CALL, 70),
+    (Interaction.InteractionType.SMS, 10),
+    (Interaction.InteractionType.VISIT, 8),
+    (Interaction.InteractionType.EMAIL, 5),
+    (Interaction.InteractionType.MEETING, 4),
+    (Interaction.InteractionType.OTHER, 3),
+)
+OUTCOMES = (
+    (Interaction.InteractionOutcome.NO_ANSWER, 30),
+    (Interaction.InteractionOutcome.PAYMENT_PROMISED, 25),
+    (Interaction.InteractionOutcome.PAYMENT_MADE, 10),
+    (Interaction.InteractionOutcome.CUSTOMER_UNAVAILABLE, 10),
+    (Interaction.InteractionOutcome.OTHER, 10),
+    (Interaction.InteractionOutcome.REFUSED_TO_PAY, 5),
+    (Interaction.InteractionOutcome.WRONG_NUMBER, 4),
+    (Interaction.InteractionOutcome.DISPUTED, 3),
+    (Interaction.InteractionOutcome.NUMBER_DISCONNECTED, 3),
+)
+NOTES = {
+    Interaction.InteractionOutcome.NO_ANSWER: 'Called, no answer.',
+    Interaction.InteractionOutcome.PAYMENT_PROMISED: 'Customer promised to pay the overdue installment.',
+    Interaction.InteractionOutcome.PAYMENT_MADE: 'Customer confirmed payment.',
+    Interaction.InteractionOutcome.CUSTOMER_UNAVAILABLE: 'Family member answered; customer unavailable.',
+    Interaction.InteractionOutcome.OTHER: 'General follow-up on account.',
+    Interaction.InteractionOutcome.REFUSED_TO_PAY: 'Customer refused to pay; escalate.',
+    Interaction.InteractionOutcome.WRONG_NUMBER: 'Wrong number; update contact details.',
+    Interaction.InteractionOutcome.DISPUTED: 'Customer disputes the outstanding amount.',
+    Interaction.InteractionOutcome.NUMBER_DISCONNECTED: 'Number disconnected.',
+}
+FOLLOW_UP_STATUSES_PAST = (
+    (FollowUp.FollowUpStatus.COMPLETED, 65),
+    (FollowUp.FollowUpStatus.PENDING, 20),
+    (FollowUp.FollowUpStatus.CANCELED, 8),
+    (FollowUp.FollowUpStatus.RESCHEDULED, 7),
+)
+PRIORITIES = (('MEDIUM', 50), ('HIGH', 25), ('LOW', 15), ('URGENT', 10))
+
+# Business date the data is generated relative to, unless given; fixed so
+# that the same seed always produces the same data.
+DEFAULT_AS_OF = date(2025, 12, 31)
+
+
+@dataclass
+class DatasetPlan:
+    """Everything a worker needs to generate its chunks."""
+
+    seed: int
+    as_of: date
+    customers: int
+    chunk_size: int
+    loans_per_customer: float
+    interactions_per_customer: float
+    follow_up_ratio: float
+    max_payments_per_loan: int
+    officer_ids: list
+    agent_ids: list
+    national_id_prefix: str
+    customer_base: int = 0
+    loan_base: int = 0
+    interaction_base: int = 0
+
+    @property
+    def chunks(self):
+        return math.ceil(self.customers / self.chunk_size)
+
+    @property
+    def max_loans(self):
+        return max(1, int(2 * self.loans_per_customer + 0.5))
+
+    @property
+    def max_interactions(self):
+        return max(1, int(2 * self.interactions_per_customer + 0.5))
+
+
+def weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def spread(rng, average, maximum):
+    """
+    Draw a count with the given average, uniformly spread over 0..2*average.
+    """
+    return min(maximum, int(rng.uniform(0, 2 * average) + 0.5))
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def aware(day, at=time(12, 0)):
+    return datetime.combine(day, at, tzinfo=timezone.utc)
+
+
+def create_users(prefix, password, super_managers, managers, officers_per_manager, agents, levels=3, span=5):
+    """
+    Create the staff and a reporting hierarchy `levels` deep above the
+    officers: each officer reports to one of `managers` managers, every
+    `span` managers to a manager one level up, and so on, with the super
+    managers at the top. Each manager gets a Hierarchy row for every officer
+    below them, direct or indirect, which is what api.scopes reads. Returns
+    (officer_ids, agent_ids).
+    """
+    if User.objects.filter(username__startswith=f'{prefix}-').exists():
+        raise ValueError(f"Users with prefix '{prefix}' already exist; choose another prefix.")
+
+    password_hash = make_password(password)
+    users = []
+
+    def add(role, name, count):
+        usernames = [f'{prefix}-{name}-{number:04d}' for number in range(1, count + 1)]
+        for number, username in enumerate(usernames, 1):
+            users.append(User(
+                username=username,
+                email=f'{username}@example.com',
+                first_name=name.replace('-', ' ').title(),
+                last_name=f'{number:04d}',
+                role=role,
+                password=password_hash,
+            ))
+        return usernames
+
+    super_manager_names = add(User.Role.SUPER_MANAGER, 'super-manager', super_managers)
+    # Managers by level, the officers' managers first.
+    tiers = [add(User.Role.MANAGER, 'manager', managers)]
+    for level in range(2, levels):
+        tiers.append(add(User.Role.MANAGER, f'manager-l{level}', math.ceil(len(tiers[-1]) / span)))
+    officer_names = add(User.Role.COLLECTION_OFFICER, 'officer', managers * officers_per_manager)
+    agent_names = add(User.Role.CALLING_AGENT, 'agent', agents)
+    User.objects.bulk_create(users, batch_size=1000)
+
+    ids = dict(User.objects.filter(username__startswith=f'{prefix}-').values_list('username', 'id'))
+    links = []
+    for index, officer in enumerate(officer_names):
+        manager_index = index // officers_per_manager
+        links.append((tiers[0][manager_index], officer))
+        for tier in tiers[1:]:
+            manager_index //= span
+            links.append((tier[manager_index], officer))
+        if super_manager_names:
+            links.append((super_manager_names[manager_index % len(super_manager_names)], officer))
+    Hierarchy.objects.bulk_create(
+        [Hierarchy(manager_id=ids[manager], collection_officer_id=ids[officer]) for manager, officer in links],
+        batch_size=1000
+    )
+    return [ids[name] for name in officer_names], [ids[name] for name in agent_names]
+
+
+def reserve_primary_keys(plan):
+    """
+    Choose the primary-key ranges the chunks will write into and, on
+    PostgreSQL, move the id sequences past them so that concurrent inserts
+    cannot collide with generated rows.
+    """
+    def next_id(model):
+        return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    plan.customer_base = next_id(Customer)
+    plan.loan_base = next_id(Loan)
+    plan.interaction_base = next_id(Interaction)
+
+    if connection.vendor == 'postgresql':
+        ends = (
+            (Customer, plan.customer_base + plan.customers),
+            (Loan, plan.loan_base + plan.chunks * plan.chunk_size * plan.max_loans),
+            (Interaction, plan.interaction_base + plan.chunks * plan.chunk_size * plan.max_interactions),
+        )
+        with connection.cursor() as cursor:
+            for model, end in ends:
+                cursor.execute(
+                    'SELECT setval(pg_get_serial_sequence(%s, %s), %s)',
+                    [model._meta.db_table, 'id', end]
+                )
+
+
+def reset_sequences():
+    statements = connection.ops.sequence_reset_sql(no_style(), [Customer, Loan, Interaction])
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def insert(model, rows, with_pk=True):
+    """
+    Insert dict rows, filling unspecified columns with field defaults.
+    """
+    fields = [f for f in model._meta.concrete_fields if with_pk or not f.primary_key]
+    columns = [f.attname for f in fields]
+    defaults = {f.attname: f.get_default() for f in fields}
+    insert_rows(model, columns, [[row.get(column, defaults[column]) for column in columns] for row in rows])
+
+
+def generate_loans(rng, plan, customer, loan_id):
+    """
+    Return loan rows and payment rows for one customer.
+    """
+    loans, payments = [], []
+    for _ in range(spread(rng, plan.loans_per_customer, plan.max_loans)):
+        status = weighted(rng, LOAN_STATUSES)
+        principal = Decimal(rng.randrange(50, 5000) * 100)
+        rate = Decimal(rng.randrange(800, 3600)) / 100
+        term = rng.choice(TERMS)
+        total_due = principal + principal * rate / 100 * term / 12
+
+        if status == Loan.Status.PENDING:
+            applied = plan.as_of - timedelta(days=rng.randint(0, 30))
+        elif status == Loan.Status.PAID:
+            applied = plan.as_of - timedelta(days=term * 31 + rng.randint(40, 400))
+        else:
+            applied = plan.as_of - timedelta(days=rng.randint(45, 3 * 365))
+
+        loan = {
+            'id': loan_id,
+            'customer_id': customer['id'],
+            'status': status,
+            'principal_amount': principal,
+            'interest_rate': rate,
+            'application_date': applied,
+            'term_months': term,
+            'assigned_officer_id': customer['assigned_officer_id'],
+            'created_at': aware(applied, time(10, 0)),
+            'updated_at': aware(applied, time(10, 0)),
+            'created_by_id': customer['assigned_officer_id'],
+            'branch': customer['branch'],
+        }
+        loans.append(loan)
+        loan_id += 1
+        if status == Loan.Status.PENDING:
+            continue
+
+        approved = applied + timedelta(days=rng.randint(1, 10))
+        disbursed = approved + timedelta(days=rng.randint(0, 5))
+        first_due = disbursed + timedelta(days=30)
+        loan.update(
+            approval_date=approved,
+            disbursement_date=disbursed,
+            first_payment_date=first_due,
+            maturity_date=add_months(first_due, term - 1),
+            updated_at=aware(plan.as_of - timedelta(days=rng.randint(0, 60)), time(9, 0)),
+        )
+
+        months_due = 0 if first_due > plan.as_of else min(term, (plan.as_of - first_due).days // 30 + 1)
+        if status == Loan.Status.ACTIVE:
+            low, high = weighted(rng, ACTIVE_DPD_BUCKETS)
+            dpd = rng.randint(low, high)
+        elif status == Loan.Status.DEFAULTED:
+            dpd = rng.randint(91, 720)
+        elif status == Loan.Status.WRITTEN_OFF:
+            dpd = rng.randint(180, 1080)
+        elif status == Loan.Status.RESTRUCTURED:
+            dpd = rng.randint(0, 60)
+        else:
+            dpd = 0
+        dpd = min(dpd, max(0, (plan.as_of - first_due).days))
+        loan['days_past_due'] = dpd
+
+        installments = term if status == Loan.Status.PAID else max(0, months_due - math.ceil(dpd / 30))
+        installments = min(installments, plan.max_payments_per_loan)
+        installment = (total_due / term).quantize(Decimal('0.01'))
+        paid = Decimal('0.00')
+        last_paid = None
+        for number in range(installments):
+            amount = installment
+            if status == Loan.Status.PAID and number == installments - 1:
+                amount = (total_due - paid).quantize(Decimal('0.01'))
+            paid_on = min(plan.as_of, add_months(first_due, number) + timedelta(days=rng.randint(-3, 5)))
+            paid += amount
+            last_paid = paid_on
+            payments.append({
+                'loan_id': loan['id'],
+                'amount': amount,
+                'payment_date': paid_on,
+                'payment_method': weighted(rng, PAYMENT_METHODS),
+                'received_by_id': customer['assigned_officer_id'] if rng.random() < 0.6 else rng.choice(plan.agent_ids),
+                'created_at': aware(paid_on, time(15, 0)),
+                'updated_at': aware(paid_on, time(15, 0)),
+                'branch': customer['branch'],
+            })
+        loan.update(amount_paid=paid, last_payment_date=last_paid)
+    return loans, payments
+
+
+def generate_interactions(rng, plan, customer, loan_ids, interaction_id):
+    """
+    Return interaction rows and follow-up rows for one customer.
+    """
+    interactions, follow_ups = [], []
+    as_of = aware(plan.as_of, time(18, 0))
+    for _ in range(spread(rng, plan.interactions_per_customer, plan.max_interactions)):
+        kind = weighted(rng, INTERACTION_TYPES)
+        outcome = weighted(rng, OUTCOMES)
+        if kind in (Interaction.InteractionType.VISIT, Interaction.InteractionType.MEETING) or rng.random() < 0.2:
+            initiated_by = customer['assigned_officer_id']
+        else:
+            initiated_by = rng.choice(plan.agent_ids)
+        started = as_of - timedelta(seconds=rng.randint(0, 180 * 86400))
+        if outcome == Interaction.InteractionOutcome.NO_ANSWER:
+            duration = rng.randint(0, 40)
+        elif kind == Interaction.InteractionType.VISIT:
+            duration = rng.randint(600, 3600)
+        else:
+            duration = rng.randint(30, 900)
+        promised = outcome == Interaction.InteractionOutcome.PAYMENT_PROMISED
+
+        interaction = {
+            'id': interaction_id,
+            'customer_id': customer['id'],
+            'loan_id': rng.choice(loan_ids) if loan_ids and rng.random() < 0.85 else None,
+            'interaction_type': kind,
+            'initiated_by_id': initiated_by,
+            'contact_number': customer['primary_phone'],
+            'start_time': started,
+            'end_time': started + timedelta(seconds=duration),
+            'duration': duration,
+            'outcome': outcome,
+            'notes': NOTES[outcome],
+            'payment_promise_amount': Decimal(rng.randrange(10, 500) * 100) if promised else None,
+            'payment_promise_date': (started + timedelta(days=rng.randint(1, 14))).date() if promised else None,
+            'created_at': started + timedelta(seconds=duration),
+            'updated_at': started + timedelta(seconds=duration),
+        }
+        interactions.append(interaction)
+        interaction_id += 1
+
+        if rng.random() >= plan.follow_up_ratio:
+            continue
+        scheduled = started.date() + timedelta(days=rng.randint(1, 14))
+        status = weighted(rng, FOLLOW_UP_STATUSES_PAST) if scheduled < plan.as_of else FollowUp.FollowUpStatus.PENDING
+        assigned_to = initiated_by if rng.random() < 0.7 else rng.choice(plan.agent_ids)
+        scheduled_time = time(rng.randint(9, 17), rng.choice((0, 15, 30, 45)))
+        completed = status == FollowUp.FollowUpStatus.COMPLETED
+        follow_ups.append({
+            'interaction_id': interaction['id'],
+            'customer_id': customer['id'],
+            'follow_up_type': FollowUp.FollowUpType.VISIT if kind == Interaction.InteractionType.VISIT
+            else FollowUp.FollowUpType.CALL,
+            'scheduled_date': scheduled,
+            'scheduled_time': scheduled_time,
+            'assigned_to_id': assigned_to,
+            'notes': 'Check on promised payment.' if promised else 'Try again.',
+            'priority': weighted(rng, PRIORITIES),
+            'status': status,
+            'result': 'Spoke to customer.' if completed else '',
+            'completed_at': aware(scheduled, scheduled_time) + timedelta(minutes=rng.randint(0, 120))
+            if completed else None,
+            'completed_by_id': assigned_to if completed else None,
+            'created_at': interaction['end_time'],
+            'updated_at': interaction['end_time'],
+            'created_by_id': initiated_by,
+        })
+    return interactions, follow_ups
+
+
+def generate_chunk(plan, index):
+    """
+    Generate and insert chunk `index`; returns row counts per model.
+    """
+    rng = random.Random(f'{plan.seed}:{index}')
+    first = index * plan.chunk_size
+    last = min(plan.customers, first + plan.chunk_size)
+    loan_id = plan.loan_base + first * plan.max_loans
+    interaction_id = plan.interaction_base + first * plan.max_interactions
+
+    customers, loans, payments, interactions, follow_ups = [], [], [], [], []
+    for number in range(first, last):
+        city, state = BRANCHES[rng.randrange(len(BRANCHES))]
+        created = plan.as_of - timedelta(days=rng.randint(30, 4 * 365))
+        customer = {
+            'id': plan.customer_base + number,
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'gender': rng.choice((Customer.Gender.MALE, Customer.Gender.FEMALE)),
+            'date_of_birth': plan.as_of - timedelta(days=rng.randint(21 * 365, 65 * 365)),
+            'national_id': f'{plan.national_id_prefix}{number:010d}',
+            'primary_phone': f'+91{9000000000 + number}',
+            'city': city,
+            'state': state,
+            'country': 'India',
+            'branch': city,
+            'employer': rng.choice(EMPLOYERS),
+            'monthly_income': Decimal(rng.randrange(100, 2000) * 100),
+            'assigned_officer_id': plan.officer_ids[number % len(plan.officer_ids)],
+            'is_active': rng.random() < 0.95,
+            'created_at': aware(created, time(11, 0)),
+            'updated_at': aware(max(created, plan.as_of - timedelta(days=rng.randint(0, 90))), time(11, 0)),
+        }
+        customer['created_by_id'] = customer['assigned_officer_id']
+
+        customer_loans, customer_payments = generate_loans(rng, plan, customer, loan_id)
+        loan_id += plan.max_loans
+        customer_interactions, customer_follow_ups = generate_interactions(
+            rng, plan, customer, [loan['id'] for loan in customer_loans], interaction_id
+        )
+        interaction_id += plan.max_interactions
+
+        worst = max((loan.get('days_past_due', 0) for loan in customer_loans), default=0)
+        customer['paid_status'] = worst == 0
+        customer['risk_score'] = min(900, 300 + worst + rng.randint(0, 150))
+
+        customers.append(customer)
+        loans.extend(customer_loans)
+        payments.extend(customer_payments)
+        interactions.extend(customer_interactions)
+        follow_ups.extend(customer_follow_ups)
+
+    for loan, value in zip(loans, loan_references.reserve(len(loans))):
+        loan['loan_reference'] = loan_references.format(value, branch=loan.pop('branch'), on=loan['application_date'])
+    for payment, value in zip(payments, payment_references.reserve(len(payments))):
+        payment['payment_reference'] = payment_references.format(
+            value, branch=payment.pop('branch'), on=payment['payment_date']
+        )
+
+    with transaction.atomic():
+        insert(Customer, customers)
+        insert(Loan, loans)
+        insert(Payment, payments, with_pk=False)
+        insert(Interaction, interactions)
+        insert(FollowUp, follow_ups, with_pk=False)
+
+    return {
+        'customers': len(customers),
+        'loans': len(loans),
+        'payments': len(payments),
+        'interactions': len(interactions),
+        'follow_ups': len(follow_ups),
+    }
+
+
+def generate(plan, workers=1, on_chunk=None):
+    """
+    Generate every chunk of `plan`, in parallel when workers > 1.
+    """
+    reserve_primary_keys(plan)
+    chunks = range(plan.chunks)
+    if workers <= 1:
+        results = (generate_chunk(plan, index) for index in chunks)
+    else:
+        # Forked workers must open their own connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        pool = context.Pool(workers)
+        results = pool.imap_unordered(partial(generate_chunk, plan), chunks)
+    try:
+        for counts in results:
+            if on_chunk:
+                on_chunk(counts)
+    finally:
+        if workers > 1:
+            pool.close()
+            pool.join()
+    reset_sequences()
@@ -0,0 +1,358 @@
+"""
+Follow-up events for the server-sent event stream (see
+api.async_views.FollowUpEventStreamView).
+
+Saving or deleting a follow-up publishes an event, once its transaction
+commits, to the assignee and, when it was reassigned, to the previous
+assignee. The event type is one of follow_up.created, .rescheduled,
+.completed, .canceled, .reassigned, .updated or .deleted, and its data says
+whether the follow-up is now in the recipient's open queue (`in_queue`).
+
+Event ids count up per user. The broker keeps the last EVENTS_HISTORY
+events of each user, so a client reconnecting with Last-Event-ID is sent
+what it missed before any live event. A client that fell further behind
+gets a `reset` event instead and should reload its queue.
+
+With EVENTS_REDIS_URL set, events go to a capped Redis stream per user and
+are fanned out to every worker over one pub/sub channel, which each worker
+process subscribes to once. Without it an in-process broker is used, which
+only reaches streams served by the same process (tests, development).
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict, deque, namedtuple
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from interactions.models import FollowUp
+
+
+logger = logging.getLogger('repaysync.events')
+
+Event = namedtuple('Event', ['id', 'user_id', 'type', 'data'])
+
+OPEN_STATUSES = (FollowUp.FollowUpStatus.PENDING, FollowUp.FollowUpStatus.RESCHEDULED)
+
+STATE_FIELDS = FollowUp.STATE_FIELDS
+
+
+def parse_event_id(value):
+    """
+    Return a Last-Event-ID as an int, or None when it is missing or malformed.
+    """
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def format_event(event):
+    """
+    Encode an event in the text/event-stream format.
+    """
+    return f'id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data, separators=(",", ":"))}\n\n'
+
+
+class Subscription:
+    """
+    The events of one user for one stream: missed events first, then live
+    ones, each once and in id order.
+    """
+
+    def __init__(self, user_id, last_event_id=None):
+        self.user_id = user_id
+        self.last_id = last_event_id
+        self.pending = deque()
+        self.queue = asyncio.Queue()
+        self.loop = asyncio.get_running_loop()
+
+    def deliver(self, event):
+        # Brokers publish from request threads as well as from the event loop.
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            pass  # the loop has closed; the stream is gone
+
+    def reset(self, event_id):
+        self.pending.clear()
+        self.pending.append(Event(event_id, self.user_id, 'reset', {}))
+        self.last_id = None
+
+    async def get(self):
+        while True:
+            event = self.pending.popleft() if self.pending else await self.queue.get()
+            if self.last_id is None or event.id > self.last_id:
+                self.last_id = event.id
+                return event
+
+
+class Broker:
+    """
+    Publishes events to the streams of their users, wherever those are served.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, type, data):
+        raise NotImplementedError
+
+    async def history(self, user_id, after):
+        """
+        Return (events with an id above `after`, id of the user's last event).
+        """
+        raise NotImplementedError
+
+    async def listen(self):
+        """
+        Make sure events published by other processes reach this one.
+        """
+
+    def dispatch(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(event.user_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id, last_event_id=None):
+        """
+        Yield a Subscription for the user's events after `last_event_id`.
+        """
+        subscription = Subscription(user_id, last_event_id)
+        await self.listen()
+        # Register before reading the history so no event falls in between;
+        # the subscription drops live events the history already covered.
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        try:
+            if last_event_id is not None:
+                events, last_id = await self.history(user_id, last_event_id)
+                if (events and events[0].id != last_event_id + 1) or (not events and last_id != last_event_id):
+                    # Trimmed from the history, or an id this broker never issued.
+                    subscription.reset(last_id)
+                else:
+                    subscription.pending.extend(events)
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(subscription)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+
+class InProcessBroker(Broker):
+    """
+    Keeps the history in memory and reaches the streams of this process only.
+    """
+
+    def __init__(self, history_size=1000):
+        super().__init__()
+        self.history_size = history_size
+        self._events = defaultdict(lambda: deque(maxlen=self.history_size))
+        self._last_ids = defaultdict(int)
+
+    def publish(self, user_id, type, data):
+        with self._lock:
+            self._last_ids[user_id] += 1
+            event = Event(self._last_ids[user_id], user_id, type, data)
+            self._events[user_id].append(event)
+        self.dispatch(event)
+        return event
+
+    async def history(self, user_id, after):
+        with self._lock:
+            return [event for event in self._events.get(user_id, ()) if event.id > after], self._last_ids[user_id]
+
+
+# Allocates the user's next id, appends the event to the user's capped
+# stream and announces it on the channel, atomically.
+PUBLISH_SCRIPT = """
+local id = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', ARGV[1], id .. '-0', 'type', ARGV[3], 'data', ARGV[4])
+redis.call('PUBLISH', KEYS[3], ARGV[2] .. ' ' .. id .. ' ' .. ARGV[3] .. ' ' .. ARGV[4])
+return id
+"""
+
+
+class RedisBroker(Broker):
+    """
+    Keeps the history in a capped Redis stream per user and fans events out
+    to every process over a pub/sub channel.
+    """
+    channel = 'repaysync:events:follow-ups'
+
+    def __init__(self, url, history_size=1000):
+        import redis
+        import redis.asyncio
+
+        super().__init__()
+        self.url = url
+        self.history_size = history_size
+        self._client = redis.Redis.from_url(url)
+        self._async_client = redis.asyncio.Redis.from_url(url)
+        self._publish = self._client.register_script(PUBLISH_SCRIPT)
+        self._listeners = {}
+
+    def _keys(self, user_id):
+        return f'repaysync:events:{user_id}:id', f'repaysync:events:{user_id}'
+
+    def publish(self, user_id, type, data):
+        data = json.dumps(data, separators=(',', ':'))
+        event_id = self._publish(keys=[*self._keys(user_id), self.channel],
+                                 args=[self.history_size, user_id, type, data])
+        return Event(int(event_id), user_id, type, json.loads(data))
+
+    async def history(self, user_id, after):
+        id_key, stream_key = self._keys(user_id)
+        entries = await self._async_client.xrange(stream_key, min=f'{after + 1}-0', max='+')
+        last_id = int(await self._async_client.get(id_key) or 0)
+        events = [
+            Event(int(entry_id.split(b'-')[0]), user_id, fields[b'type'].decode(), json.loads(fields[b'data']))
+            for entry_id, fields in entries
+        ]
+        return events, last_id
+
+    async def listen(self):
+        loop = asyncio.get_running_loop()
+        listener = self._listeners.get(loop)
+        if listener is None or listener[0].done():
+            subscribed = asyncio.Event()
+            listener = self._listeners[loop] = (loop.create_task(self._listen(subscribed)), subscribed)
+        await listener[1].wait()
+
+    async def _listen(self, subscribed):
+        import redis
+
+        while True:
+            pubsub = self._async_client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                subscribed.set()
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    user_id, event_id, type, data = message['data'].decode().split(' ', 3)
+                    self.dispatch(Event(int(event_id), int(user_id), type, json.loads(data)))
+            except redis.RedisError:
+                logger.warning('Lost the event channel; reconnecting', exc_info=True)
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Return the broker of this process for the configured EVENTS_REDIS_URL.
+    """
+    global _broker
+    url = getattr(settings, 'EVENTS_REDIS_URL', '')
+    history_size = getattr(settings, 'EVENTS_HISTORY', 1000)
+    with _broker_lock:
+        if _broker is None or getattr(_broker, 'url', '') != url or _broker.history_size != history_size:
+            _broker = RedisBroker(url, history_size) if url else InProcessBroker(history_size)
+        return _broker
+
+
+def reset_broker():
+    global _broker
+    with _broker_lock:
+        _broker = None
+
+
+def publish(recipients, type, data):
+    """
+    Send an event to each (user id, in_queue) recipient; never raises.
+    """
+    broker = get_broker()
+    for user_id, in_queue in recipients:
+        try:
+            broker.publish(user_id, type, {**data, 'in_queue': in_queue})
+        except Exception:
+            logger.warning('Could not publish %s to user %s', type, user_id, exc_info=True)
+
+
+def schedule(follow_up):
+    """
+    Return (scheduled_date, scheduled_time) as date and time objects.
+
+    The reschedule action assigns them as they came in the request.
+    """
+    return (
+        FollowUp._meta.get_field('scheduled_date').to_python(follow_up.scheduled_date),
+        FollowUp._meta.get_field('scheduled_time').to_python(follow_up.scheduled_time),
+    )
+
+
+def event_type(follow_up, previous):
+    """
+    Name the change from the `previous` stored state to `follow_up`.
+    """
+    if previous is None:
+        return 'follow_up.created'
+    status_changed = follow_up.status != previous['status']
+    if status_changed and follow_up.status == FollowUp.FollowUpStatus.COMPLETED:
+        return 'follow_up.completed'
+    if status_changed and follow_up.status == FollowUp.FollowUpStatus.CANCELED:
+        return 'follow_up.canceled'
+    if follow_up.assigned_to_id != previous['assigned_to_id']:
+        return 'follow_up.reassigned'
+    if (status_changed and follow_up.status == FollowUp.FollowUpStatus.RESCHEDULED) or \
+            schedule(follow_up) != (previous['scheduled_date'], previous['scheduled_time']):
+        return 'follow_up.rescheduled'
+    return 'follow_up.updated'
+
+
+def event_data(follow_up, previous=None):
+    scheduled_date, scheduled_time = schedule(follow_up)
+    return {
+        'follow_up': follow_up.pk,
+        'customer': follow_up.customer_id,
+        'assigned_to': follow_up.assigned_to_id,
+        'previous_assigned_to': previous['assigned_to_id'] if previous else None,
+        'status': follow_up.status,
+        'priority': follow_up.priority,
+        'scheduled_date': scheduled_date.isoformat(),
+        'scheduled_time': scheduled_time.isoformat() if scheduled_time else None,
+    }
+
+
+@receiver(pre_save, sender=FollowUp, dispatch_uid='events-follow-up-state')
+def remember_previous_state(sender, instance, **kwargs):
+    """
+    Stash the stored state so post_save can tell what changed: the state the
+    instance was loaded or last saved with, or else read back.
+    """
+    instance._previous_state = None
+    if instance.pk is not None:
+        instance._previous_state = getattr(instance, '_stored_state', None) or \
+            FollowUp.objects.filter(pk=instance.pk).values(*STATE_FIELDS).first()
+
+
+@receiver(post_save, sender=FollowUp, dispatch_uid='events-follow-up-saved')
+def publish_saved(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_previous_state', None)
+    type = event_type(instance, previous)
+    recipients = [(instance.assigned_to_id, instance.status in OPEN_STATUSES)]
+    if previous and previous['assigned_to_id'] != instance.assigned_to_id:
+        recipients.append((previous['assigned_to_id'], False))
+    data = event_data(instance, previous)
+    instance.remember_state()
+    transaction.on_commit(lambda: publish(recipients, type, data))
+
+
+@receiver(post_delete, sender=FollowUp, dispatch_uid='events-follow-up-deleted')
+def publish_deleted(sender, instance, **kwargs):
+    data = event_data(instance)
+    transaction.on_commit(lambda: publish([(instance.assigned_to_id, False)], 'follow_up.deleted', data))
@@ -0,0 +1,142 @@
+"""
+Idempotency-Key handling for create endpoints.
+
+The first request with a given key claims it by inserting a row under a
+unique index; concurrent duplicates fail that insert and are told to retry
+(409) instead of executing again. Once the original request finishes, its
+status and body are stored in the same transaction as the write itself, and
+later retries get that response replayed.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def hash_key(user, key):
+    return hashlib.sha256(f'{getattr(user, "pk", None)}:{key}'.encode()).hexdigest()
+
+
+def fingerprint_request(request):
+    """
+    Hash the method, path and parsed payload of a DRF request.
+
+    The parsed data is used rather than the raw body, which may already have
+    been consumed by the parsers.
+    """
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.get_full_path()} {payload}'.encode()).hexdigest()
+
+
+def claim_key(key_hash, user, fingerprint):
+    """
+    Try to claim a key. Returns (record, claimed).
+    """
+    now = timezone.now()
+    ttl = timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    lock_timeout = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT_SECONDS', 60))
+
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                key_hash=key_hash,
+                user=user if getattr(user, 'pk', None) else None,
+                request_fingerprint=fingerprint,
+                expires_at=now + ttl,
+            )
+        return record, True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(key_hash=key_hash).first()
+    if record is None:
+        # Pruned between our insert and read; try once more.
+        return claim_key(key_hash, user, fingerprint)
+
+    # An expired key, or a claim whose worker died, may be taken over. The
+    # conditional update makes sure only one contender wins.
+    stale = record.expires_at <= now or (record.status_code is None and record.created_at <= now - lock_timeout)
+    if stale:
+        taken = IdempotencyKey.objects.filter(
+            pk=record.pk, created_at=record.created_at
+        ).update(
+            request_fingerprint=fingerprint,
+            status_code=None,
+            response_body=None,
+            created_at=now,
+            expires_at=now + ttl,
+        )
+        if taken:
+            record.refresh_from_db()
+            return record, True
+        record.refresh_from_db()
+
+    return record, False
+
+
+def idempotent_response(request, handler):
+    """
+    Run `handler()` at most once per Idempotency-Key and return its response.
+
+    Requests without the header are passed straight through.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return handler()
+
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            {"detail": f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    fingerprint = fingerprint_request(request)
+    record, claimed = claim_key(hash_key(request.user, key), request.user, fingerprint)
+
+    if not claimed:
+        if record.request_fingerprint != fingerprint:
+            return Response(
+                {"detail": f"This {IDEMPOTENCY_HEADER} was already used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record.status_code is None:
+            return Response(
+                {"detail": f"A request with this {IDEMPOTENCY_HEADER} is still being processed."},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Retry-After': '1'}
+            )
+        return Response(
+            record.response_body,
+            status=record.status_code,
+            headers={'Idempotent-Replayed': 'true'}
+        )
+
+    try:
+        with transaction.atomic():
+            response = handler()
+            if response.status_code < 500:
+                record.status_code = response.status_code
+                record.response_body = response.data
+                record.save(update_fields=['status_code', 'response_body'])
+    except Exception:
+        record.delete()
+        raise
+
+    if response.status_code >= 500:
+        # Server errors are not remembered so the client can retry.
+        record.delete()
+    return response
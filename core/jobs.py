@@ -0,0 +1,473 @@
+"""
+Background jobs for operations too long for a web request: exports, bulk
+reassignment, days-past-due recomputation, interest accrual, batch loan status
+transitions.
+
+A job is submitted through POST /api/jobs/ (`submit`), stored as a Job row
+and run by the Celery task core.tasks.run_job once the submitting
+transaction commits. Each kind of job is a JobKind registered by name; its
+`run_chunk` processes the next JOB_CHUNK_SIZE items after the job's
+checkpoint. The chunk's changes, the new checkpoint and the progress
+counters are committed in one transaction, with the job row locked, so a
+job that is retried, redelivered to another worker or picked up twice
+resumes after the last committed chunk and never applies a chunk twice.
+Files a job writes are cut back to their checkpointed size before the next
+chunk appends to them.
+
+A failed chunk is retried with exponential backoff (JOB_RETRY_BACKOFF_SECONDS,
+doubled per attempt) until it has failed JOB_MAX_RETRIES times in a row;
+then the job fails and keeps the error. Cancellation is checked before each
+chunk. After JOB_TIME_SLICE_SECONDS a task hands the job to a fresh task
+rather than holding its worker until the end.
+
+With CELERY_BROKER_URL set, run `celery -A repaysync worker`. Without it
+Celery runs tasks eagerly, so jobs run inline in the submitting request
+(development, tests).
+"""
+import csv
+import io
+import logging
+import os
+import time
+import uuid
+from collections import Counter
+from datetime import date
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from api.scopes import scope_customers
+from customers.models import Customer
+from interactions.models import Interaction, FollowUp
+from loans.models import Loan, Payment
+from users.models import User, Hierarchy
+
+from . import accruals, transitions
+from .models import Job, Tombstone
+from .replicas import choose_replica
+from .signals import reassignment_tombstones
+
+
+logger = logging.getLogger('repaysync.jobs')
+
+KINDS = {}
+
+
+def register(kind):
+    KINDS[kind.name] = kind()
+    return kind
+
+
+def get_kind(name):
+    try:
+        return KINDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown job kind '{name}'")
+
+
+def artifact_path(job):
+    return os.path.join(settings.JOB_ARTIFACT_DIR, job.artifact)
+
+
+class JobKind:
+    """
+    An operation run as a job. Subclasses set `name` and `roles`, and
+    implement `count` and `run_chunk`.
+    """
+    name = None
+    roles = ()
+    # Extension of the result file, for kinds that write one.
+    artifact_extension = None
+
+    def allowed(self, user):
+        return user.role in self.roles
+
+    def artifact_name(self, job):
+        return f'job-{job.pk}.{self.artifact_extension}' if self.artifact_extension else ''
+
+    def clean_params(self, params, user):
+        """
+        Return the parameters to store for a job `user` submits, or raise
+        ValidationError.
+        """
+        return {}
+
+    def count(self, job):
+        """
+        Return how many items the job will process, for progress and ETA.
+        """
+        raise NotImplementedError
+
+    def run_chunk(self, job, checkpoint, size):
+        """
+        Process up to `size` items after `checkpoint` (None at the start);
+        return (new checkpoint, items processed, whether the job is done).
+        Runs inside the transaction that stores the new checkpoint.
+        """
+        raise NotImplementedError
+
+    def finish(self, job):
+        """
+        Return the result summary of a completed job.
+        """
+        return {'processed': job.processed}
+
+    def discard(self, job):
+        """
+        Remove what a job that failed or was canceled left behind.
+        """
+        name = self.artifact_name(job)
+        if name:
+            try:
+                os.remove(os.path.join(settings.JOB_ARTIFACT_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+@register
+class ExportCustomersJob(JobKind):
+    """
+    Exports the customers the submitting user can see as CSV, read from a
+    replica when a healthy one is configured (core.replicas).
+    """
+    name = 'export_customers'
+    roles = (User.Role.SUPER_MANAGER, User.Role.MANAGER, User.Role.COLLECTION_OFFICER, User.Role.CALLING_AGENT)
+    artifact_extension = 'csv'
+    fields = ('id', 'first_name', 'last_name', 'primary_phone', 'email', 'city', 'branch', 'assigned_officer_id',
+              'is_active', 'risk_score', 'created_at')
+
+    def clean_params(self, params, user):
+        is_active = params.get('is_active')
+        if is_active not in (None, True, False):
+            raise ValidationError({'is_active': 'Must be true, false or omitted.'})
+        return {'is_active': is_active} if is_active is not None else {}
+
+    def queryset(self, job):
+        # Chunks run in the transaction that stores their checkpoint, where the
+        # router keeps reads on the primary. The rows are only copied out, so
+        # the read names its replica explicitly.
+        queryset = scope_customers(Customer.objects.using(choose_replica() or DEFAULT_DB_ALIAS), job.created_by)
+        if 'is_active' in job.params:
+            queryset = queryset.filter(is_active=job.params['is_active'])
+        return queryset
+
+    def count(self, job):
+        return self.queryset(job).count()
+
+    def run_chunk(self, job, checkpoint, size):
+        last_id, position = (checkpoint['last_id'], checkpoint['bytes']) if checkpoint else (0, 0)
+        rows = list(self.queryset(job).filter(pk__gt=last_id).order_by('pk').values_list(*self.fields)[:size])
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if position == 0:
+            writer.writerow(self.fields)
+        writer.writerows(rows)
+        data = buffer.getvalue().encode()
+
+        path = artifact_path(job)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'r+b' if position else 'wb') as handle:
+            # Drop whatever an earlier attempt wrote past the checkpoint.
+            handle.truncate(position)
+            handle.seek(position)
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        if rows:
+            last_id = rows[-1][0]
+        return {'last_id': last_id, 'bytes': position + len(data)}, len(rows), len(rows) < size
+
+    def finish(self, job):
+        return {'rows': job.processed, 'bytes': job.checkpoint['bytes']}
+
+
+@register
+class ReassignCustomersJob(JobKind):
+    """
+    Moves every customer of one collection officer, and the loans assigned
+    to that officer with them, to another officer.
+    """
+    name = 'reassign_customers'
+    roles = (User.Role.SUPER_MANAGER, User.Role.MANAGER)
+
+    def clean_params(self, params, user):
+        officers = {}
+        for field in ('from_officer', 'to_officer'):
+            try:
+                officers[field] = User.objects.get(
+                    pk=int(params.get(field)), role=User.Role.COLLECTION_OFFICER, is_active=True
+                )
+            except (TypeError, ValueError, User.DoesNotExist):
+                raise ValidationError({field: 'Must be the id of an active collection officer.'})
+        if officers['from_officer'] == officers['to_officer']:
+            raise ValidationError({'to_officer': 'Must differ from from_officer.'})
+        if user.role == User.Role.MANAGER:
+            managed = set(Hierarchy.objects.filter(manager=user).values_list('collection_officer_id', flat=True))
+            for field, officer in officers.items():
+                if officer.pk not in managed:
+                    raise ValidationError({field: 'This officer does not report to you.'})
+        return {field: officer.pk for field, officer in officers.items()}
+
+    def count(self, job):
+        return Customer.objects.filter(assigned_officer_id=job.params['from_officer']).count()
+
+    def run_chunk(self, job, checkpoint, size):
+        from_officer, to_officer = job.params['from_officer'], job.params['to_officer']
+        last_id = checkpoint['last_id'] if checkpoint else 0
+        ids = list(Customer.objects.filter(
+            assigned_officer_id=from_officer, pk__gt=last_id
+        ).order_by('pk').values_list('pk', flat=True)[:size])
+        if not ids:
+            return {'last_id': last_id}, 0, True
+
+        # What core.signals.record_reassignment does per saved customer, set-wise.
+        now = timezone.now()
+        Customer.objects.filter(pk__in=ids).update(assigned_officer_id=to_officer, updated_at=now)
+        Loan.objects.filter(customer_id__in=ids, assigned_officer_id=from_officer).update(
+            assigned_officer_id=to_officer, updated_at=now
+        )
+        Tombstone.objects.bulk_create(reassignment_tombstones(ids, from_officer))
+        Loan.objects.filter(customer_id__in=ids).exclude(updated_at=now).update(updated_at=now)
+        Payment.objects.filter(loan__customer_id__in=ids).update(updated_at=now)
+        Interaction.objects.filter(customer_id__in=ids).update(updated_at=now)
+        FollowUp.objects.filter(customer_id__in=ids).update(updated_at=now)
+        return {'last_id': ids[-1]}, len(ids), len(ids) < size
+
+    def finish(self, job):
+        return {'customers': job.processed, **job.params}
+
+
+@register
+class RecomputeDaysPastDueJob(JobKind):
+    """
+    Recomputes days past due of open loans from their installment schedule
+    (see Loan.compute_days_past_due) as of a date, today by default.
+    """
+    name = 'recompute_dpd'
+    roles = (User.Role.SUPER_MANAGER,)
+    statuses = (Loan.Status.ACTIVE, Loan.Status.DEFAULTED, Loan.Status.RESTRUCTURED)
+    fields = ('id', 'principal_amount', 'interest_rate', 'term_months', 'payment_frequency', 'first_payment_date',
+              'amount_paid', 'days_past_due')
+
+    def clean_params(self, params, user):
+        try:
+            as_of = date.fromisoformat(params['as_of']) if params.get('as_of') else timezone.localdate()
+        except (TypeError, ValueError):
+            raise ValidationError({'as_of': 'Must be a date in YYYY-MM-DD format.'})
+        return {'as_of': as_of.isoformat()}
+
+    def count(self, job):
+        return Loan.objects.filter(status__in=self.statuses).count()
+
+    def run_chunk(self, job, checkpoint, size):
+        as_of = date.fromisoformat(job.params['as_of'])
+        last_id, changed = (checkpoint['last_id'], checkpoint['changed']) if checkpoint else (0, 0)
+        loans = list(Loan.objects.filter(status__in=self.statuses, pk__gt=last_id).order_by('pk').only(*self.fields)[:size])
+
+        now = timezone.now()
+        stale = []
+        for loan in loans:
+            days_past_due = loan.compute_days_past_due(as_of)
+            if days_past_due != loan.days_past_due:
+                loan.days_past_due = days_past_due
+                loan.updated_at = now
+                stale.append(loan)
+        Loan.objects.bulk_update(stale, ['days_past_due', 'updated_at'], batch_size=500)
+
+        if loans:
+            last_id = loans[-1].pk
+        return {'last_id': last_id, 'changed': changed + len(stale)}, len(loans), len(loans) < size
+
+    def finish(self, job):
+        return {'loans': job.processed, 'changed': job.checkpoint['changed'], 'as_of': job.params['as_of']}
+
+
+@register
+class AccrueInterestJob(JobKind):
+    """
+    Posts the interest and penalties open loans accrued by the end of a
+    business date, today by default (see core.accruals).
+    """
+    name = 'accrue_interest'
+    roles = (User.Role.SUPER_MANAGER,)
+
+    def clean_params(self, params, user):
+        try:
+            business_date = (date.fromisoformat(params['business_date']) if params.get('business_date')
+                             else timezone.localdate())
+        except (TypeError, ValueError):
+            raise ValidationError({'business_date': 'Must be a date in YYYY-MM-DD format.'})
+        return {'business_date': business_date.isoformat()}
+
+    def count(self, job):
+        return accruals.pending(date.fromisoformat(job.params['business_date'])).count()
+
+    def run_chunk(self, job, checkpoint, size):
+        checkpoint = checkpoint or {'after': 0, 'accrued': 0, 'interest': 0, 'penalties': 0}
+        chunk = accruals.accrue_chunk(date.fromisoformat(job.params['business_date']), checkpoint['after'], size)
+        checkpoint = {
+            'after': chunk.last_id,
+            'accrued': checkpoint['accrued'] + chunk.accrued,
+            'interest': checkpoint['interest'] + chunk.interest,
+            'penalties': checkpoint['penalties'] + chunk.penalties,
+        }
+        return checkpoint, chunk.loans, chunk.last
+
+    def finish(self, job):
+        checkpoint = job.checkpoint or {'accrued': 0, 'interest': 0, 'penalties': 0}
+        return accruals.summary(date.fromisoformat(job.params['business_date']), checkpoint['accrued'],
+                                checkpoint['interest'], checkpoint['penalties'])
+
+
+@register
+class TransitionLoansJob(JobKind):
+    """
+    Applies a batch status transition rule (see core.transitions), or with
+    `dry_run` only counts what it would move.
+    """
+    name = 'transition_loans'
+    roles = (User.Role.SUPER_MANAGER,)
+
+    def clean_params(self, params, user):
+        try:
+            rule = transitions.get_rule(params.get('rule'))
+            cleaned = rule.clean_params(params)
+        except ValueError as e:
+            raise ValidationError({'rule': str(e)})
+        return {'rule': rule.name, 'dry_run': bool(params.get('dry_run')), 'run': str(uuid.uuid4()), **cleaned}
+
+    def count(self, job):
+        return transitions.get_rule(job.params['rule']).count(job.params)
+
+    def run_chunk(self, job, checkpoint, size):
+        checkpoint = checkpoint or {'after': None, 'moved': {}, 'skipped': 0, 'missing': 0}
+        chunk = transitions.apply_chunk(
+            transitions.get_rule(job.params['rule']), job.params, checkpoint['after'], size,
+            uuid.UUID(job.params['run']), job.created_by, job.params['dry_run']
+        )
+        moved = Counter(checkpoint['moved']) + chunk.moved
+        checkpoint = {
+            'after': chunk.after,
+            'moved': dict(moved),
+            'skipped': checkpoint['skipped'] + chunk.skipped,
+            'missing': checkpoint['missing'] + chunk.missing,
+        }
+        return checkpoint, sum(chunk.moved.values()) + chunk.skipped + chunk.missing, chunk.last
+
+    def finish(self, job):
+        checkpoint = job.checkpoint
+        return transitions.summary(
+            transitions.get_rule(job.params['rule']), job.params['run'], Counter(checkpoint['moved']),
+            checkpoint['skipped'], checkpoint['missing'], job.params['dry_run']
+        )
+
+
+def submit(kind, params, user):
+    """
+    Create a job and queue it to run once the current transaction commits.
+    """
+    job = Job.objects.create(kind=kind, params=params, created_by=user)
+    transaction.on_commit(lambda: enqueue(job.pk))
+    return job
+
+
+def enqueue(job_id):
+    from .tasks import run_job
+
+    run_job.delay(job_id)
+
+
+def cancel(job):
+    """
+    Cancel a pending job at once, or ask a running one to stop before its
+    next chunk.
+    """
+    if not Job.objects.filter(pk=job.pk, status=Job.Status.PENDING).update(
+        status=Job.Status.CANCELED, cancel_requested=True, finished_at=timezone.now()
+    ):
+        Job.objects.filter(pk=job.pk).exclude(status__in=Job.FINISHED_STATUSES).update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def run(task, job_id):
+    """
+    Run the job's chunks until it finishes, is canceled, fails a chunk
+    (retried through `task`) or uses up its time slice.
+    """
+    started = time.monotonic()
+    size = settings.JOB_CHUNK_SIZE
+    while True:
+        try:
+            with transaction.atomic():
+                job = Job.objects.select_for_update().filter(pk=job_id).first()
+                if job is None or job.is_finished:
+                    return
+                kind = get_kind(job.kind)
+                if job.cancel_requested:
+                    job.status = Job.Status.CANCELED
+                    job.finished_at = timezone.now()
+                    job.save(update_fields=['status', 'finished_at'])
+                    kind.discard(job)
+                    logger.info('Job %s canceled after %d of %s items', job.pk, job.processed, job.total)
+                    return
+                if job.status == Job.Status.PENDING:
+                    job.status = Job.Status.RUNNING
+                    job.started_at = timezone.now()
+                    job.total = kind.count(job)
+                    job.artifact = kind.artifact_name(job)
+
+                checkpoint, processed, done = kind.run_chunk(job, job.checkpoint, size)
+                job.checkpoint = checkpoint
+                job.processed += processed
+                job.attempts = 0
+                job.error = ''
+                job.heartbeat_at = timezone.now()
+                if done:
+                    job.status = Job.Status.SUCCEEDED
+                    job.finished_at = job.heartbeat_at
+                    job.result = kind.finish(job)
+                job.save(update_fields=[
+                    'status', 'started_at', 'total', 'artifact', 'checkpoint', 'processed', 'attempts', 'error',
+                    'heartbeat_at', 'finished_at', 'result',
+                ])
+        except Exception as e:
+            job = record_failure(job_id, e)
+            if job.status == Job.Status.FAILED:
+                return
+            raise task.retry(exc=e, countdown=settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1))
+        if done:
+            logger.info('Job %s (%s) finished: %s', job.pk, job.kind, job.result)
+            return
+        if settings.JOB_TIME_SLICE_SECONDS and time.monotonic() - started >= settings.JOB_TIME_SLICE_SECONDS:
+            enqueue(job_id)
+            return
+
+
+def record_failure(job_id, error):
+    """
+    Count a failed attempt at the job's current chunk, failing the job once
+    JOB_MAX_RETRIES attempts have failed.
+    """
+    with transaction.atomic():
+        job = Job.objects.select_for_update().get(pk=job_id)
+        job.attempts += 1
+        job.error = f'{type(error).__name__}: {error}'
+        fields = ['attempts', 'error']
+        if job.attempts > settings.JOB_MAX_RETRIES:
+            job.status = Job.Status.FAILED
+            job.finished_at = timezone.now()
+            fields += ['status', 'finished_at']
+        job.save(update_fields=fields)
+    if job.status == Job.Status.FAILED:
+        logger.error('Job %s (%s) failed after %d attempts', job.pk, job.kind, job.attempts, exc_info=error)
+        if job.kind in KINDS:
+            KINDS[job.kind].discard(job)
+    else:
+        logger.warning('Job %s (%s) chunk failed (attempt %d); retrying', job.pk, job.kind, job.attempts,
+                       exc_info=error)
+    return job
@@ -0,0 +1,334 @@
+"""
+Loan ledger: an append-only LedgerEntry per movement on a loan's balance,
+with running balance snapshots.
+
+Entries are numbered from 1 per loan and written with the loan rows locked,
+so concurrent postings to a loan queue instead of losing updates. After
+every LEDGER_SNAPSHOT_INTERVAL-th entry a LedgerSnapshot records the loan's
+balance. The balance of a loan on any date (`balance`) is the latest
+snapshot booked by then plus the entries between it and the next snapshot:
+a few index seeks however long the loan's history. The balance of the whole
+portfolio on a date (`portfolio_balance`) is one scan of the covering
+(loan, booked_on, amount) index.
+
+A loan's ledger opens (`lock_ledgers`, `open_ledgers`) when it is approved, when its first
+payment is recorded or when `manage.py backfill_ledger` reaches it. The
+opening entries rebuild its history: the principal disbursed, the
+contractual interest accrued by each payment and by yesterday
+(Loan.interest_accrued), each payment on its payment date and, for
+written-off loans, the write-off of what remained. From then on the nightly
+accrual run (core.accruals) posts interest and penalties day by day.
+
+Payments are posted by core.payments, which also allocates them and keeps
+Loan.amount_paid, last_payment_date and status up to date from the locked
+row, as a projection of the ledger for the code that reads them.
+
+The ledger is the source of truth for the balance only. What has been paid
+is still read from Loan.amount_paid by close_paid (core.transitions), the
+accrual penalties (core.accruals) and the serializers. Deriving it from the
+PAYMENT entries instead is left for later. The projection is written in the
+same transaction, under the same row lock, as the entries it reflects, so
+the two agree.
+"""
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from loans.models import LedgerEntry, LedgerSnapshot, Loan, Payment
+
+from .bulk import insert_rows
+
+
+Posting = namedtuple('Posting', ['loan_id', 'entry_type', 'amount', 'value_date', 'reference'])
+Ledgers = namedtuple('Ledgers', ['loans', 'opened', 'last'])
+
+EntryType = LedgerEntry.EntryType
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+# Loans per query when reading the entries since their last snapshot; each
+# adds an OR term, and SQLite limits expression depth to 1000.
+SNAPSHOT_BATCH_SIZE = 200
+
+COLUMNS = ['loan_id', 'sequence', 'entry_type', 'amount', 'booked_on', 'value_date', 'reference', 'created_at']
+
+
+def cents(value):
+    # SQLite sums decimals in floating point.
+    return (value or ZERO).quantize(CENT)
+
+
+def snapshot_interval():
+    return max(1, getattr(settings, 'LEDGER_SNAPSHOT_INTERVAL', 50))
+
+
+def lock(loan_ids):
+    """
+    Lock the loans' rows, in primary key order, until the end of the
+    transaction. Return the ids of the loans that exist.
+    """
+    return list(Loan.objects.select_for_update().filter(pk__in=loan_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def latest(model, *fields):
+    """
+    Loans annotated with `last_<field>` of their last `model` row (entry or
+    snapshot), one index seek per loan and field.
+    """
+    last = model.objects.filter(loan_id=OuterRef('pk')).order_by('-sequence')
+    return Loan.objects.order_by().annotate(**{
+        f'last_{field}': Subquery(last.values(field)[:1]) for field in fields
+    })
+
+
+def positions(loan_ids):
+    """
+    Return {loan id: (last sequence, last booked_on)} of the loans with
+    ledger entries.
+    """
+    rows = latest(LedgerEntry, 'sequence', 'booked_on').filter(pk__in=loan_ids).values_list(
+        'pk', 'last_sequence', 'last_booked_on'
+    )
+    return {pk: (sequence, booked_on) for pk, sequence, booked_on in rows if sequence is not None}
+
+
+def append(postings, last=None):
+    """
+    Append postings to ledgers that are open and locked, in the order given,
+    and write the snapshots they complete. Amounts are positive; credits are
+    stored negated. `last` is the ledgers' positions when the caller has
+    them (see `lock_ledgers`), and is kept up to date. Return the number of
+    entries written.
+    """
+    postings = [posting for posting in postings if posting.amount]
+    if not postings:
+        return 0
+    if last is None:
+        last = positions({posting.loan_id for posting in postings})
+    first = {pk: sequence for pk, (sequence, _) in last.items()}
+    today = timezone.localdate()
+    now = timezone.now()
+
+    rows = []
+    for loan_id, entry_type, amount, value_date, reference in postings:
+        sequence, booked_on = last.get(loan_id, (0, None))
+        value_date = value_date or today
+        booked_on = max(value_date, booked_on) if booked_on else value_date
+        amount = Decimal(amount).quantize(CENT)
+        if entry_type in LedgerEntry.CREDIT_TYPES:
+            amount = -amount
+        rows.append((loan_id, sequence + 1, entry_type, amount, booked_on, value_date, reference or '', now))
+        last[loan_id] = (sequence + 1, booked_on)
+    insert_rows(LedgerEntry, COLUMNS, rows)
+
+    interval = snapshot_interval()
+    completed = [
+        pk for pk, (sequence, _) in last.items() if sequence // interval > first.get(pk, 0) // interval
+    ]
+    if completed:
+        write_snapshots(completed)
+    return len(rows)
+
+
+def since_snapshots(loan_ids):
+    """
+    Return ({loan id: (sequence, balance) of its last snapshot}, the loans'
+    entries since then as (loan id, sequence, booked_on, amount) in order).
+    """
+    base = {
+        pk: (sequence or 0, balance or ZERO)
+        for pk, sequence, balance in latest(LedgerSnapshot, 'sequence', 'balance').filter(
+            pk__in=loan_ids
+        ).values_list('pk', 'last_sequence', 'last_balance')
+    }
+
+    def entries():
+        ids = sorted(base)
+        for start in range(0, len(ids), SNAPSHOT_BATCH_SIZE):
+            # A range scan of the (loan, sequence) index per loan.
+            batch = ids[start:start + SNAPSHOT_BATCH_SIZE]
+            yield from LedgerEntry.objects.filter(
+                reduce(or_, (Q(loan_id=pk, sequence__gt=base[pk][0]) for pk in batch))
+            ).order_by('loan_id', 'sequence').values_list('loan_id', 'sequence', 'booked_on', 'amount')
+
+    return base, entries()
+
+
+def write_snapshots(loan_ids):
+    """
+    Snapshot the balance after every interval-th entry of the loans since
+    their last snapshot.
+    """
+    interval = snapshot_interval()
+    base, entries = since_snapshots(loan_ids)
+    balances = {pk: balance for pk, (_, balance) in base.items()}
+    snapshots = []
+    for loan_id, sequence, booked_on, amount in entries:
+        balances[loan_id] += amount
+        if sequence % interval == 0:
+            snapshots.append((loan_id, sequence, booked_on, balances[loan_id]))
+    insert_rows(LedgerSnapshot, ['loan_id', 'sequence', 'booked_on', 'balance'], snapshots)
+
+
+def current_balances(loan_ids):
+    """
+    Return {loan id: balance} of the loans, from their last snapshots.
+    """
+    base, entries = since_snapshots(loan_ids)
+    balances = {pk: balance for pk, (_, balance) in base.items()}
+    for loan_id, _, _, amount in entries:
+        balances[loan_id] += amount
+    return balances
+
+
+def lock_ledgers(loan_ids, through=None):
+    """
+    Lock the loans' rows, in primary key order, and open the ledgers of
+    those that have none from their history, with interest accrued by the
+    end of `through` (default: yesterday). Call in a transaction. Return
+    Ledgers: {loan id: loan} of the loans that exist, the ids of the loans
+    opened, and their {loan id: (last sequence, last booked_on)} for
+    `append`.
+    """
+    loans = {
+        loan.pk: loan for loan in latest(LedgerEntry, 'sequence', 'booked_on').select_for_update().filter(
+            pk__in=loan_ids
+        ).annotate(has_payments=Exists(Payment.objects.filter(loan_id=OuterRef('pk')))).order_by('pk')
+    }
+    last = {pk: (loan.last_sequence, loan.last_booked_on) for pk, loan in loans.items()
+            if loan.last_sequence is not None}
+    opened = set(loans) - set(last)
+    if not opened:
+        return Ledgers(loans, opened, last)
+    payments = {}
+    if any(loans[pk].has_payments for pk in opened):
+        for loan_id, amount, payment_date, reference in Payment.objects.filter(loan_id__in=opened).order_by(
+            'loan_id', 'payment_date', 'pk'
+        ).values_list('loan_id', 'amount', 'payment_date', 'payment_reference'):
+            payments.setdefault(loan_id, []).append(Posting(loan_id, EntryType.PAYMENT, amount, payment_date, reference))
+    # The accrual run for today (core.accruals) posts today's interest.
+    through = through or timezone.localdate() - timedelta(days=1)
+    postings = []
+    for pk in sorted(opened):
+        postings.extend(history(loans[pk], payments.get(pk, []), through))
+    append(postings, last)
+    Loan.objects.filter(pk__in=opened).update(accrued_through=through)
+    for pk in opened:
+        loans[pk].accrued_through = through
+    return Ledgers(loans, opened, last)
+
+
+def open_ledgers(loan_ids, through=None):
+    """
+    Open the ledgers of the loans that have none from their history, with
+    interest accrued by the end of `through` (default: yesterday). Return
+    the ids of the loans opened.
+    """
+    with transaction.atomic(savepoint=False):
+        return lock_ledgers(loan_ids, through).opened
+
+
+def history(loan, payments, through):
+    """
+    Opening postings of a loan, given its payment postings in date order:
+    interest accrued by each payment is posted before it, and what accrued
+    since by `through` after the last.
+    """
+    start = loan.accrual_start
+    if loan.status == Loan.Status.WRITTEN_OFF:
+        through = min(through, timezone.localdate(loan.updated_at))
+    postings = [Posting(loan.pk, EntryType.DISBURSEMENT, loan.principal_amount, start, loan.loan_reference)]
+    accrued = ZERO
+    for payment in [*payments, None]:
+        on = min(payment.value_date, through) if payment else through
+        interest = loan.interest_accrued(on) - accrued
+        if interest > 0:
+            # Booked no later than the day the interest finished accruing.
+            postings.append(Posting(loan.pk, EntryType.INTEREST, interest,
+                                    min(on, start + timedelta(days=loan.term_days)), 'accrual'))
+            accrued += interest
+        if payment:
+            postings.append(payment)
+    if loan.status == Loan.Status.WRITTEN_OFF:
+        remaining = loan.principal_amount + accrued - sum((posting.amount for posting in payments), ZERO)
+        if remaining > 0:
+            postings.append(Posting(loan.pk, EntryType.WRITE_OFF, remaining, through, 'opening'))
+    return postings
+
+
+def post_many(postings):
+    """
+    Post entries to loans' ledgers, opening them first where needed. Return
+    the number of entries written.
+    """
+    postings = list(postings)
+    with transaction.atomic(savepoint=False):
+        ledgers = lock_ledgers({posting.loan_id for posting in postings})
+        return append(postings, ledgers.last)
+
+
+def post(loan_id, entry_type, amount, value_date=None, reference=''):
+    return post_many([Posting(loan_id, entry_type, amount, value_date, reference)])
+
+
+def write_off(loan_ids, value_date=None, reference=''):
+    """
+    Post the write-off of the outstanding balance of each loan.
+    """
+    with transaction.atomic(savepoint=False):
+        # Ledgers opened now already carry the write-off of written-off loans.
+        ledgers = lock_ledgers(loan_ids)
+        balances = current_balances(set(ledgers.loans) - ledgers.opened)
+        return append([
+            Posting(loan_id, EntryType.WRITE_OFF, amount, value_date, reference)
+            for loan_id, amount in sorted(balances.items()) if amount > 0
+        ], ledgers.last)
+
+
+def balance(loan_id, as_of=None):
+    """
+    Balance of a loan's ledger at the end of `as_of` (default: now), from
+    the latest snapshot booked by then and the entries up to the next one.
+    """
+    entries = LedgerEntry.objects.filter(loan_id=loan_id)
+    snapshots = LedgerSnapshot.objects.filter(loan_id=loan_id)
+    upto = None
+    if as_of is None:
+        snapshot = snapshots.order_by('-sequence').values_list('sequence', 'balance').first()
+    else:
+        entries = entries.filter(booked_on__lte=as_of)
+        snapshot = snapshots.filter(booked_on__lte=as_of).order_by('-booked_on', '-sequence').values_list(
+            'sequence', 'balance'
+        ).first()
+        upto = snapshots.filter(booked_on__gt=as_of).order_by('booked_on', 'sequence').values_list(
+            'sequence', flat=True
+        ).first()
+    sequence, total = snapshot or (0, ZERO)
+    entries = entries.filter(sequence__gt=sequence)
+    if upto is not None:
+        entries = entries.filter(sequence__lt=upto)
+    return total + cents(entries.aggregate(total=Sum('amount'))['total'])
+
+
+def portfolio_balance(as_of, by_loan=False):
+    """
+    Balance of every ledger at the end of `as_of`: the total, or
+    {loan id: balance} with `by_loan`.
+    """
+    entries = LedgerEntry.objects.filter(booked_on__lte=as_of)
+    if by_loan:
+        return {
+            loan_id: cents(total)
+            for loan_id, total in entries.values('loan_id').annotate(total=Sum('amount')).order_by().values_list(
+                'loan_id', 'total'
+            )
+        }
+    return cents(entries.aggregate(total=Sum('amount'))['total'])
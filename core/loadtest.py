@@ -0,0 +1,400 @@
+"""
+Load generator (see `manage.py loadtest`).
+
+Virtual users log in through /api/token/ as generated staff accounts and
+replay a weighted mix of the requests field staff make all day: calling
+agents poll their follow-ups, search customers and schedule follow-ups on
+interactions; collection officers post payments. Concurrency is ramped
+through stages with asyncio, and throughput, latency percentiles and error
+rates are reported per interval so they can be plotted against the number
+of active users.
+
+The HTTP client is a minimal keep-alive HTTP/1.1 client on asyncio
+streams, so the generator needs nothing beyond the standard library and
+is meant for plain-HTTP servers on the local machine.
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from .benchmarks import percentile
+from .dataset import LAST_NAMES
+from users.models import User
+
+
+AGENT = User.Role.CALLING_AGENT
+OFFICER = User.Role.COLLECTION_OFFICER
+
+# Scenario name -> roles that perform it.
+SCENARIO_ROLES = {
+    'poll_follow_ups': (AGENT, OFFICER),
+    'search_customers': (AGENT,),
+    'create_follow_up': (AGENT,),
+    'post_payment': (OFFICER,),
+}
+DEFAULT_MIX = {
+    'poll_follow_ups': 45,
+    'search_customers': 20,
+    'create_follow_up': 15,
+    'post_payment': 20,
+}
+
+
+def parse_stages(value):
+    """
+    Parse ``"10:30,50:60"`` into [(10, 30.0), (50, 60.0)]: ramp to 10 users
+    over 30 seconds, then to 50 over the next 60.
+    """
+    stages = []
+    for part in value.split(','):
+        users, _, seconds = part.partition(':')
+        stages.append((int(users), float(seconds)))
+    return stages
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in SCENARIO_ROLES:
+            raise ValueError(f"Unknown scenario '{name}'; choose from {', '.join(SCENARIO_ROLES)}")
+        mix[name] = float(weight)
+    return mix
+
+
+class HTTPError(Exception):
+    pass
+
+
+class HTTPClient:
+    """
+    One keep-alive HTTP/1.1 connection.
+    """
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        if parts.scheme != 'http':
+            raise ValueError('Only http:// URLs are supported')
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=None):
+        """
+        Send a request and return (status, body). JSON bodies are encoded.
+        """
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers = {'Content-Type': 'application/json', **(headers or {})}
+        reused = self.writer is not None
+        try:
+            return await self._exchange(method, path, headers or {}, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.close()
+            if not reused:
+                raise
+            # The server closed an idle keep-alive connection; retry once.
+            return await self._exchange(method, path, headers or {}, body)
+
+    async def _exchange(self, method, path, headers, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Connection: keep-alive']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        lines.append(f'Content-Length: {len(body or b"")}')
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + (body or b''))
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b'\r\n')
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise HTTPError(f'Malformed status line {status_line!r}')
+        response_headers = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b'\r\n')
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            content = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            content = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            content = await self.reader.read()
+            await self.close()
+        if response_headers.get('connection', '').lower() == 'close' and self.writer is not None:
+            await self.close()
+        return status, content
+
+
+class Recorder:
+    """
+    Collects (time, scenario, status, latency) samples.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.samples = []
+        self.active_users = 0
+
+    def add(self, scenario, status, latency):
+        self.samples.append((time.monotonic() - self.started, scenario, status, latency))
+
+    def window(self, since, until):
+        return [sample for sample in self.samples if since <= sample[0] < until]
+
+    @staticmethod
+    def summarize(samples, seconds):
+        latencies = [sample[3] * 1000 for sample in samples]
+        errors = sum(1 for sample in samples if not 200 <= sample[2] < 400)
+        return {
+            'requests': len(samples),
+            'rps': round(len(samples) / seconds, 2) if seconds > 0 else 0,
+            'p50_ms': round(percentile(latencies, 0.50), 1) if latencies else None,
+            'p95_ms': round(percentile(latencies, 0.95), 1) if latencies else None,
+            'p99_ms': round(percentile(latencies, 0.99), 1) if latencies else None,
+            'errors': errors,
+            'error_rate': round(errors / len(samples), 4) if samples else 0,
+        }
+
+
+class VirtualUser:
+    """
+    One member of staff: logs in, then loops over weighted scenarios.
+    """
+
+    def __init__(self, base_url, username, password, role, mix, recorder, think_ms, rng):
+        self.client = HTTPClient(base_url)
+        self.username = username
+        self.password = password
+        self.role = role
+        self.recorder = recorder
+        self.think = think_ms / 1000
+        self.rng = rng
+        self.scenarios = [(name, weight) for name, weight in mix.items() if role in SCENARIO_ROLES[name] and weight > 0]
+        self.token = None
+        self.stopping = False
+        self.busy = False
+        self.user_id = None
+        self.interaction_ids = []
+        self.loan_ids = []
+
+    async def call(self, scenario, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        started = time.perf_counter()
+        self.busy = True
+        try:
+            status, content = await self.client.request(method, path, headers, body)
+        except (OSError, asyncio.IncompleteReadError, HTTPError):
+            status, content = 0, b''
+            await self.client.close()
+        finally:
+            self.busy = False
+        self.recorder.add(scenario, status, time.perf_counter() - started)
+        if status == 401 and self.token:
+            # Access token expired mid-run.
+            self.token = None
+        return status, content
+
+    def results(self, content):
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return []
+        return data.get('results', []) if isinstance(data, dict) else data
+
+    async def login(self):
+        status, content = await self.call(
+            'login', 'POST', '/api/token/', {'username': self.username, 'password': self.password}
+        )
+        if status != 200:
+            return False
+        self.token = json.loads(content)['access']
+        status, content = await self.call('setup', 'GET', '/api/users/me/')
+        if status != 200:
+            return False
+        self.user_id = json.loads(content)['id']
+        if self.role == AGENT:
+            status, content = await self.call(
+                'setup', 'GET', '/api/interactions/?' + urlencode({'initiated_by': self.user_id})
+            )
+            self.interaction_ids = [row['id'] for row in self.results(content)]
+        else:
+            status, content = await self.call(
+                'setup', 'GET', '/api/loans/?' + urlencode({'assigned_officer': self.user_id, 'status': 'ACTIVE'})
+            )
+            self.loan_ids = [row['id'] for row in self.results(content)]
+        return True
+
+    async def poll_follow_ups(self):
+        await self.call('poll_follow_ups', 'GET', '/api/follow-ups/?' + urlencode({
+            'assigned_to': self.user_id, 'status': 'PENDING', 'ordering': 'scheduled_date',
+        }))
+
+    async def search_customers(self):
+        await self.call('search_customers', 'GET', '/api/customers/?' + urlencode({
+            'search': self.rng.choice(LAST_NAMES),
+        }))
+
+    async def create_follow_up(self):
+        if not self.interaction_ids:
+            return await self.poll_follow_ups()
+        await self.call(
+            'create_follow_up', 'POST', f'/api/interactions/{self.rng.choice(self.interaction_ids)}/create_follow_up/',
+            {
+                'follow_up_type': 'CALL',
+                'scheduled_date': (date.today() + timedelta(days=self.rng.randint(1, 7))).isoformat(),
+                'assigned_to': self.user_id,
+                'notes': 'Load test follow-up',
+            },
+            headers={'Idempotency-Key': str(uuid.UUID(int=self.rng.getrandbits(128)))},
+        )
+
+    async def post_payment(self):
+        if not self.loan_ids:
+            return await self.poll_follow_ups()
+        await self.call(
+            'post_payment', 'POST', '/api/payments/',
+            {
+                'loan': self.rng.choice(self.loan_ids),
+                'amount': f'{self.rng.randrange(5, 50) * 100}.00',
+                'payment_date': date.today().isoformat(),
+                'payment_method': self.rng.choice(['CASH', 'MOBILE_MONEY', 'BANK_TRANSFER']),
+            },
+            headers={'Idempotency-Key': str(uuid.UUID(int=self.rng.getrandbits(128)))},
+        )
+
+    async def run(self):
+        self.recorder.active_users += 1
+        try:
+            while not self.stopping:
+                if self.token is None and not await self.login():
+                    await asyncio.sleep(1)
+                    continue
+                if not self.scenarios:
+                    return
+                names, weights = zip(*self.scenarios)
+                await getattr(self, self.rng.choices(names, weights)[0])()
+                if self.stopping:
+                    break
+                await asyncio.sleep(self.rng.uniform(0, 2 * self.think))
+        finally:
+            self.recorder.active_users -= 1
+            await self.client.close()
+
+
+async def run_load(base_url, accounts, password, stages, mix=None, think_ms=1000, report_interval=5,
+                   seed=None, on_report=None):
+    """
+    Drive virtual users through `stages` and return the report.
+
+    `accounts` maps a role to the usernames virtual users of that role log in
+    as; users are shared round-robin when there are more virtual users than
+    accounts. Officers make up the share of virtual users that the weight of
+    officer-only scenarios has in the mix.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    recorder = Recorder()
+    officer_weight = sum(w for name, w in mix.items() if SCENARIO_ROLES[name] == (OFFICER,))
+    officer_share = officer_weight / (sum(mix.values()) or 1) if accounts.get(OFFICER) else 0
+    counters = Counter()
+    tasks = []
+    curve = []
+
+    def spawn():
+        role = OFFICER if (counters[OFFICER] + 1) <= officer_share * (len(tasks) + 1) else AGENT
+        usernames = accounts.get(role) or accounts[AGENT]
+        username = usernames[counters[role] % len(usernames)]
+        counters[role] += 1
+        user = VirtualUser(base_url, username, password, role, mix, recorder, think_ms, random.Random(rng.random()))
+        tasks.append((user, asyncio.ensure_future(user.run())))
+
+    def report(since, until):
+        point = {'t': round(until, 1), 'users': recorder.active_users,
+                 **Recorder.summarize(recorder.window(since, until), until - since)}
+        curve.append(point)
+        if on_report:
+            on_report(point)
+
+    tick = 0.1
+    previous = 0
+    last_report = 0.0
+    try:
+        for target, seconds in stages:
+            stage_start = time.monotonic()
+            while True:
+                elapsed = time.monotonic() - stage_start
+                fraction = min(1.0, elapsed / seconds) if seconds else 1.0
+                desired = round(previous + (target - previous) * fraction)
+                while len(tasks) < desired:
+                    spawn()
+                while len(tasks) > desired:
+                    tasks.pop()[0].stopping = True
+                now = time.monotonic() - recorder.started
+                if now - last_report >= report_interval:
+                    report(last_report, now)
+                    last_report = now
+                if fraction >= 1.0:
+                    break
+                await asyncio.sleep(tick)
+            previous = target
+        now = time.monotonic() - recorder.started
+        if now > last_report:
+            report(last_report, now)
+    finally:
+        # Let requests in flight complete; users that are thinking stop now.
+        for user, task in tasks:
+            user.stopping = True
+            if not user.busy:
+                task.cancel()
+        running = [task for _, task in tasks]
+        if running:
+            await asyncio.wait(running, timeout=30)
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    duration = time.monotonic() - recorder.started
+    by_scenario = defaultdict(list)
+    for sample in recorder.samples:
+        by_scenario[sample[1]].append(sample)
+    return {
+        'url': base_url,
+        'stages': [{'users': users, 'seconds': seconds} for users, seconds in stages],
+        'mix': mix,
+        'duration_s': round(duration, 1),
+        'total': Recorder.summarize(
+            [s for s in recorder.samples if s[1] not in ('login', 'setup')], duration
+        ),
+        'scenarios': {name: Recorder.summarize(samples, duration) for name, samples in sorted(by_scenario.items())},
+        'statuses': {str(status): count for status, count in sorted(Counter(s[2] for s in recorder.samples).items())},
+        'curve': curve,
+    }
@@ -0,0 +1,51 @@
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import ledger
+from loans.models import LedgerEntry, Loan
+
+
+class Command(BaseCommand):
+    help = ('Open the ledgers of approved loans that have none from their principal, interest, payments and '
+            'write-offs, then report the portfolio balance')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help='Loans per transaction (default: LEDGER_BACKFILL_BATCH_SIZE)')
+        parser.add_argument('--as-of', help='Report the portfolio balance at the end of this date (default: today)')
+
+    def handle(self, *args, **options):
+        as_of = timezone.localdate()
+        if options['as_of']:
+            try:
+                as_of = date.fromisoformat(options['as_of'])
+            except ValueError:
+                raise CommandError('--as-of must be a date as YYYY-MM-DD')
+        batch_size = options['batch_size'] or getattr(settings, 'LEDGER_BACKFILL_BATCH_SIZE', 1000)
+
+        started = time.perf_counter()
+        loans = Loan.objects.exclude(status=Loan.Status.PENDING).order_by('pk')
+        opened, after = 0, 0
+        while True:
+            ids = list(loans.filter(pk__gt=after).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            opened += len(ledger.open_ledgers(ids))
+            after = ids[-1]
+        backfilled = time.perf_counter() - started
+
+        started = time.perf_counter()
+        balances = ledger.portfolio_balance(as_of, by_loan=True)
+        scanned = time.perf_counter() - started
+
+        self.stdout.write(f"{'loans opened':<24}{opened:>16}")
+        self.stdout.write(f"{'ledger entries':<24}{LedgerEntry.objects.count():>16}")
+        self.stdout.write(f"{'loans with a balance':<24}{sum(1 for value in balances.values() if value):>16}")
+        self.stdout.write(f"{'portfolio balance':<24}{sum(balances.values(), ledger.ZERO):>16}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Opened {opened} ledgers in {backfilled:.2f}s; portfolio balance as of {as_of} in {scanned:.2f}s'
+        ))
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import threading
+import time
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.views import APIView
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.async_views import AsyncAPIView
+from api.scopes import scope_customers
+from core.audit import audit_writer
+from core.benchmarks import percentile
+from customers.models import Customer
+from users.models import User
+
+
+ENDPOINTS = ('follow-ups', 'customer-search', 'agent-queue', 'timeline')
+
+
+class Command(BaseCommand):
+    help = ('Compare the async read endpoints with their sync counterparts at increasing numbers of concurrent '
+            'requests, served in-process by the ASGI handler')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='gen', help='Username prefix of the generated dataset')
+        parser.add_argument('--role', default=User.Role.COLLECTION_OFFICER, choices=User.Role.values,
+                            help='Role of the user making the requests')
+        parser.add_argument('--concurrency', default='1,10,50,100',
+                            help='Comma-separated numbers of requests in flight at once')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint, mode and level')
+        parser.add_argument('--search', default='an', help='Search term for the customer search endpoints')
+        parser.add_argument('--endpoint', action='append', choices=ENDPOINTS, help='Only these endpoints')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError(f"Invalid --concurrency: {options['concurrency']}")
+        user = User.objects.filter(
+            username__startswith=f"{options['prefix']}-", role=options['role'], is_active=True
+        ).order_by('username').first()
+        if user is None:
+            raise CommandError(f"No {options['role']} user with prefix '{options['prefix']}'; run generate_dataset first")
+        customer = scope_customers(Customer.objects.all(), user).order_by('pk').first()
+        if customer is None:
+            raise CommandError(f'{user.username} cannot see any customers')
+
+        urls = self.endpoint_urls(user, customer, options['search'])
+        token = str(RefreshToken.for_user(user).access_token)
+        app = ASGIHandler()
+
+        self.stdout.write(
+            f"{'endpoint':<17}{'mode':<7}{'conc':>6}{'requests/s':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+            f"{'errors':>8}{'threads':>9}"
+        )
+        results = []
+        # Throttles would reject most of a benchmark run from one user.
+        with mock.patch.object(APIView, 'throttle_classes', []), \
+                mock.patch.object(AsyncAPIView, 'throttle_classes', []):
+            for name in options['endpoint'] or ENDPOINTS:
+                for mode, url in zip(('sync', 'async'), urls[name]):
+                    for level in levels:
+                        result = asyncio.run(self.run_level(app, url, token, level, options['requests']))
+                        result.update(endpoint=name, mode=mode, url=url)
+                        results.append(result)
+                        self.stdout.write(
+                            f"{name:<17}{mode:<7}{level:>6}{result['rps']:>12.1f}{result['p50_ms']:>9.2f}"
+                            f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['errors']:>8}"
+                            f"{result['peak_threads']:>9}"
+                        )
+                        audit_writer.flush()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'user': user.username, 'role': user.role, 'results': results}, f, indent=2)
+                f.write('\n')
+        self.stdout.write(self.style.SUCCESS(f"Benchmarked {len(results)} endpoint/mode/concurrency combination(s)"))
+
+    def endpoint_urls(self, user, customer, search):
+        """
+        Return {endpoint: (sync url, async url)} serving the same rows.
+        """
+        queue = urlencode({'assigned_to': user.pk, 'status': 'PENDING', 'ordering': 'scheduled_date'})
+        return {
+            'follow-ups': ('/api/follow-ups/', '/api/async/follow-ups/'),
+            'customer-search': (f'/api/customers/?search={search}', f'/api/async/customers/?search={search}'),
+            'agent-queue': (f'/api/follow-ups/?{queue}', '/api/async/agent-queue/'),
+            'timeline': (f'/api/interactions/?customer={customer.pk}', f'/api/async/customers/{customer.pk}/timeline/'),
+        }
+
+    async def run_level(self, app, url, token, concurrency, count):
+        path, _, query = url.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())],
+            'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+        }
+        latencies = []
+        errors = [0]
+        peak_threads = [threading.active_count()]
+        remaining = [count]
+
+        async def request():
+            status = None
+            received = False
+
+            async def receive():
+                nonlocal received
+                if not received:
+                    received = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # The client stays connected until the handler is done with it.
+                await asyncio.Event().wait()
+
+            async def send(message):
+                nonlocal status
+                if message['type'] == 'http.response.start':
+                    status = message['status']
+
+            await app(dict(scope), receive, send)
+            return status
+
+        async def client():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                started = time.perf_counter()
+                status = await request()
+                latencies.append((time.perf_counter() - started) * 1000)
+                if status is None or status >= 400:
+                    errors[0] += 1
+                peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return {
+            'concurrency': concurrency,
+            'requests': len(latencies),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'errors': errors[0],
+            'peak_threads': peak_threads[0],
+        }
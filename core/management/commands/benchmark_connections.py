@@ -0,0 +1,122 @@
+import copy
+import importlib.util
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.benchmarks import percentile
+
+
+MODES = ('per-request', 'persistent', 'pooled')
+
+
+class Command(BaseCommand):
+    help = ('Compare requests per second with a new connection per request, persistent connections and a '
+            'connection pool, using threads that open, query and release connections like Django requests do')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database to benchmark (PostgreSQL only)')
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent request threads')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode')
+        parser.add_argument('--queries', type=int, default=3, help='Queries per request')
+        parser.add_argument('--pool-size', type=int, default=8,
+                            help='Pool max_size for the pooled mode; fewer than --threads shows queueing')
+        parser.add_argument('--mode', action='append', choices=MODES, help='Only these modes (default: all)')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        base = connections[options['database']].settings_dict
+        if not base['ENGINE'].endswith('postgresql'):
+            raise CommandError('Connection benchmarks need a PostgreSQL database')
+
+        modes = options['mode'] or list(MODES)
+        if 'pooled' in modes and importlib.util.find_spec('psycopg_pool') is None:
+            self.stdout.write(self.style.WARNING('psycopg_pool is not installed; skipping the pooled mode'))
+            modes.remove('pooled')
+
+        self.stdout.write(f"{'mode':<14}{'requests/s':>12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'connects':>10}")
+        results = []
+        for mode in modes:
+            result = self.run_mode(mode, base, options)
+            results.append(result)
+            self.stdout.write(
+                f"{mode:<14}{result['rps']:>12.1f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                f"{result['p99_ms']:>9.2f}{result['connects']:>10}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'threads': options['threads'], 'queries': options['queries'], 'results': results}, f,
+                          indent=2)
+                f.write('\n')
+        self.stdout.write(self.style.SUCCESS(f"Benchmarked {len(results)} connection mode(s)"))
+
+    def run_mode(self, mode, base, options):
+        settings_dict = copy.deepcopy(base)
+        settings_dict['OPTIONS'].pop('pool', None)
+        settings_dict['CONN_HEALTH_CHECKS'] = True
+        settings_dict['CONN_MAX_AGE'] = {'per-request': 0, 'persistent': None, 'pooled': 0}[mode]
+        if mode == 'pooled':
+            size = options['pool_size']
+            settings_dict['OPTIONS']['pool'] = {'min_size': size, 'max_size': size, 'timeout': 30}
+        alias = f'benchmark-{mode}'
+        connections.settings[alias] = settings_dict
+
+        latencies = []
+        lock = threading.Lock()
+        connects = [0]
+        per_thread = [options['requests'] // options['threads']] * options['threads']
+        per_thread[0] += options['requests'] % options['threads']
+
+        def worker(count):
+            connection = connections[alias]
+            timings = []
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    if connection.connection is None:
+                        with lock:
+                            connects[0] += 1
+                    with connection.cursor() as cursor:
+                        for _ in range(options['queries']):
+                            cursor.execute('SELECT 1')
+                            cursor.fetchone()
+                    # What the request_finished signal does at the end of every request.
+                    connection.close_if_unusable_or_obsolete()
+                    timings.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+                with lock:
+                    latencies.extend(timings)
+
+        try:
+            if mode == 'pooled':
+                # Fill the pool first, as a warmed-up worker would have.
+                connections[alias].pool.open(wait=True)
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                list(executor.map(worker, per_thread))
+            elapsed = time.perf_counter() - started
+            if mode == 'pooled':
+                # Checkouts were counted above; report the connections the pool actually opened.
+                connects[0] = connections[alias].pool.get_stats().get('connections_num', 0)
+        finally:
+            if mode == 'pooled':
+                connections[alias].close_pool()
+                del connections[alias]
+            del connections.settings[alias]
+
+        latencies_ms = [latency * 1000 for latency in latencies]
+        return {
+            'mode': mode,
+            'requests': len(latencies),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies_ms, 0.50), 2),
+            'p95_ms': round(percentile(latencies_ms, 0.95), 2),
+            'p99_ms': round(percentile(latencies_ms, 0.99), 2),
+            'connects': connects[0],
+        }
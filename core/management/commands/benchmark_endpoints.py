@@ -0,0 +1,126 @@
+import json
+import os
+import subprocess
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.benchmarks import budgets_from, compare, dataset_summary, run
+from users.models import User
+
+
+DEFAULT_BUDGETS = os.path.join(settings.BASE_DIR, 'benchmarks', 'budgets.json')
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every API action for each role: latency percentiles, SQL queries and response bytes, '
+            'compared against checked-in budgets')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='gen', help='Username prefix of the generated dataset to run as')
+        parser.add_argument('--customers', type=int,
+                            help='Generate a dataset of this many customers first if the prefix has no users')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for --customers')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per action and role')
+        parser.add_argument('--only', action='append', help='Only actions starting with this, e.g. LoanViewSet')
+        parser.add_argument('--budgets', default=DEFAULT_BUDGETS, help='Budgets file to compare against')
+        parser.add_argument('--update-budgets', action='store_true', help='Write the measurements as the new budgets')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--latency-tolerance', type=float, default=0.5,
+                            help='Allowed median latency growth over budget (0.5 = 50%%)')
+        parser.add_argument('--latency-slack-ms', type=float, default=5.0,
+                            help='Absolute latency allowance on top of the tolerance, for very fast actions')
+        parser.add_argument('--bytes-tolerance', type=float, default=0.1,
+                            help='Allowed response size growth over budget')
+        parser.add_argument('--no-latency', action='store_true',
+                            help='Do not fail on latency, e.g. on shared CI runners')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['customers'] and not User.objects.filter(username__startswith=f'{prefix}-').exists():
+            call_command('generate_dataset', customers=options['customers'], seed=options['seed'],
+                         prefix=prefix, stdout=self.stdout)
+
+        self.stdout.write(f"{'action':<40}{'role':<20}{'status':>7}{'p50 ms':>9}{'p95 ms':>9}"
+                          f"{'queries':>9}{'bytes':>9}")
+
+        def on_result(result):
+            if 'skipped' in result:
+                self.stdout.write(f"{result['action']:<40}{result['role']:<20}{'-':>7}  skipped: {result['skipped']}")
+                return
+            self.stdout.write(
+                f"{result['action']:<40}{result['role']:<20}{result['status']:>7}{result['p50_ms']:>9.1f}"
+                f"{result['p95_ms']:>9.1f}{result['queries']:>9}{result['bytes']:>9}"
+            )
+
+        try:
+            results = run(prefix, iterations=options['iterations'], only=options['only'], on_result=on_result)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        dataset = dataset_summary()
+        report = {
+            'generated_at': timezone.now().isoformat(),
+            'commit': self.commit(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'dataset': dataset,
+            'results': results,
+            'regressions': [],
+        }
+
+        if options['update_budgets']:
+            budgets = {'dataset': dataset, 'budgets': {}}
+            if options['only'] and os.path.exists(options['budgets']):
+                with open(options['budgets']) as f:
+                    budgets = json.load(f)
+                budgets['dataset'] = dataset
+            budgets['budgets'].update(budgets_from(results))
+            os.makedirs(os.path.dirname(os.path.abspath(options['budgets'])), exist_ok=True)
+            with open(options['budgets'], 'w') as f:
+                json.dump(budgets, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Wrote budgets to {options['budgets']}"))
+        elif os.path.exists(options['budgets']):
+            with open(options['budgets']) as f:
+                budgets = json.load(f)
+            if budgets.get('dataset', {}).get('customers') != dataset['customers']:
+                self.stdout.write(self.style.WARNING(
+                    f"Budgets were recorded against {budgets.get('dataset', {}).get('customers')} customers, "
+                    f"this database has {dataset['customers']}"
+                ))
+            report['regressions'] = compare(
+                results, budgets['budgets'],
+                latency_tolerance=options['latency_tolerance'],
+                latency_slack_ms=options['latency_slack_ms'],
+                bytes_tolerance=options['bytes_tolerance'],
+                check_latency=not options['no_latency'],
+            )
+            missing = sorted({r['action'] for r in results if 'skipped' not in r and 'budget' not in r})
+            if missing:
+                self.stdout.write(self.style.WARNING(f"No budget for: {', '.join(missing)}"))
+        else:
+            self.stdout.write(self.style.WARNING(f"No budgets file at {options['budgets']}"))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+
+        if report['regressions']:
+            for regression in report['regressions']:
+                self.stderr.write(regression)
+            raise CommandError(f"{len(report['regressions'])} benchmark(s) over budget")
+        self.stdout.write(self.style.SUCCESS(f'Benchmarked {len(results)} action/role pairs'))
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,112 @@
+import gzip
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api.serializers import LoanSerializer, InteractionSerializer
+from core.renderers import FastJSONRenderer
+from customers.models import Customer
+from interactions.models import Interaction
+from loans.models import Loan
+from users.models import User
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+class Command(BaseCommand):
+    help = 'Compare JSON encode time and response size for LoanSerializer and InteractionSerializer pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100, help='Objects per rendered page')
+        parser.add_argument('--iterations', type=int, default=200, help='Renders per renderer')
+        parser.add_argument(
+            '--source',
+            choices=['synthetic', 'db'],
+            default='synthetic',
+            help='Build pages from in-memory objects or from existing database rows',
+        )
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        iterations = options['iterations']
+
+        if options['source'] == 'db':
+            pages = {
+                'LoanSerializer': LoanSerializer(
+                    Loan.objects.select_related('customer', 'assigned_officer')[:page_size], many=True
+                ).data,
+                'InteractionSerializer': InteractionSerializer(
+                    Interaction.objects.select_related('customer', 'loan', 'initiated_by')[:page_size], many=True
+                ).data,
+            }
+        else:
+            loans, interactions = self.build_synthetic(page_size)
+            pages = {
+                'LoanSerializer': LoanSerializer(loans, many=True).data,
+                'InteractionSerializer': InteractionSerializer(interactions, many=True).data,
+            }
+
+        renderers = [('drf-json', JSONRenderer()), ('fast-json', FastJSONRenderer())]
+
+        self.stdout.write(
+            f"{'page':<24}{'renderer':<12}{'ms/render':>12}{'bytes':>10}{'gzip':>10}{'br':>10}"
+        )
+        for name, data in pages.items():
+            payload = {'count': len(data), 'next': None, 'previous': None, 'results': data}
+            for renderer_name, renderer in renderers:
+                body = renderer.render(payload)
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    renderer.render(payload)
+                elapsed_ms = (time.perf_counter() - start) * 1000 / iterations
+
+                gzip_size = len(gzip.compress(body))
+                br_size = len(brotli.compress(body, quality=4)) if brotli is not None else '-'
+                self.stdout.write(
+                    f"{name:<24}{renderer_name:<12}{elapsed_ms:>12.3f}{len(body):>10}{gzip_size:>10}{br_size:>10}"
+                )
+
+    def build_synthetic(self, count):
+        """
+        Build unsaved, fully populated model instances shaped like a real page.
+        """
+        officer = User(id=1, username='officer', first_name='Sarah', last_name='Officer',
+                       role=User.Role.COLLECTION_OFFICER)
+        now = timezone.now()
+        loans, interactions = [], []
+        for i in range(count):
+            customer = Customer(
+                id=i + 1, first_name=f'Customer{i}', last_name='Example',
+                primary_phone=f'+2547{i:08d}', assigned_officer=officer,
+            )
+            loan = Loan(
+                id=i + 1, customer=customer, loan_reference=f'LN-{i:08X}',
+                status=Loan.Status.ACTIVE, principal_amount=Decimal('15000.00') + i,
+                interest_rate=Decimal('12.50'), application_date=date.today() - timedelta(days=200),
+                approval_date=date.today() - timedelta(days=190),
+                disbursement_date=date.today() - timedelta(days=185),
+                first_payment_date=date.today() - timedelta(days=155),
+                maturity_date=date.today() + timedelta(days=180), term_months=12,
+                amount_paid=Decimal('4200.00'), last_payment_date=date.today() - timedelta(days=12),
+                days_past_due=i % 120, assigned_officer=officer, notes='Restructure requested by borrower',
+                created_at=now, updated_at=now,
+            )
+            loans.append(loan)
+            interactions.append(Interaction(
+                id=i + 1, customer=customer, loan=loan,
+                interaction_type=Interaction.InteractionType.CALL, initiated_by=officer,
+                contact_number=customer.primary_phone, contact_person='Self',
+                start_time=now - timedelta(minutes=15), end_time=now, duration=900,
+                outcome=Interaction.InteractionOutcome.PAYMENT_PROMISED,
+                notes='Customer promised to pay the arrears on Friday after salary.',
+                payment_promise_amount=Decimal('2500.00'), payment_promise_date=date.today() + timedelta(days=3),
+                created_at=now, updated_at=now,
+            ))
+        return loans, interactions
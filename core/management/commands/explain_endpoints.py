@@ -0,0 +1,72 @@
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.query_plans import capture, check, diff, render
+from users.models import User
+
+
+SNAPSHOT_DIR = os.path.join(settings.BASE_DIR, 'benchmarks', 'query_plans')
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN the queries of every list endpoint for each role, fail on sequential scans of large tables '
+            'or missing indexes, and diff the plans against the checked-in snapshot')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='gen', help='Username prefix of the generated dataset to run as')
+        parser.add_argument('--customers', type=int,
+                            help='Generate a dataset of this many customers first if the prefix has no users')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for --customers')
+        parser.add_argument('--only', action='append', help='Only endpoints starting with this, e.g. LoanViewSet')
+        parser.add_argument('--snapshot', help='Snapshot file (default: benchmarks/query_plans/<database>.txt)')
+        parser.add_argument('--update', action='store_true', help='Write the plans as the new snapshot')
+        parser.add_argument('--show', action='store_true', help='Print every plan')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['customers'] and not User.objects.filter(username__startswith=f'{prefix}-').exists():
+            call_command('generate_dataset', customers=options['customers'], seed=options['seed'],
+                         prefix=prefix, stdout=self.stdout)
+
+        try:
+            captured = capture(prefix, only=options['only'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        actual = render(captured)
+        if options['show']:
+            self.stdout.write(actual)
+
+        problems = check(captured)
+        snapshot = options['snapshot'] or os.path.join(SNAPSHOT_DIR, f'{connection.vendor}.txt')
+        if options['update']:
+            if options['only']:
+                raise CommandError('--update records every endpoint; drop --only')
+            os.makedirs(os.path.dirname(os.path.abspath(snapshot)), exist_ok=True)
+            with open(snapshot, 'w') as f:
+                f.write(actual)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {len(captured)} plans to {snapshot}'))
+        elif not os.path.exists(snapshot):
+            self.stdout.write(self.style.WARNING(f'No snapshot at {snapshot}'))
+        elif not options['only']:
+            with open(snapshot) as f:
+                expected = f.read()
+            recorded, current = expected.split('\n', 1)[0], actual.split('\n', 1)[0]
+            if recorded != current:
+                self.stdout.write(self.style.WARNING(
+                    f'Snapshot was recorded on {recorded[2:]}, this is {current[2:]}; not comparing'
+                ))
+            else:
+                changes = diff(expected, actual)
+                if changes:
+                    self.stdout.write(changes)
+                    problems.append(f'Plans differ from {snapshot}; review the diff and rerun with --update')
+
+        if problems:
+            for problem in problems:
+                self.stderr.write(problem)
+            raise CommandError(f'{len(problems)} query plan problem(s)')
+        self.stdout.write(self.style.SUCCESS(f'Checked plans of {len(captured)} endpoint/role pairs'))
@@ -0,0 +1,80 @@
+import time
+from collections import Counter
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.dataset import DEFAULT_AS_OF, DatasetPlan, create_users, generate
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset of staff, customers, loans, payments and interactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--as-of', type=date.fromisoformat, default=DEFAULT_AS_OF,
+                            help='Business date the data is generated relative to (YYYY-MM-DD)')
+        parser.add_argument('--prefix', default='gen', help='Prefix for generated usernames and national IDs')
+        parser.add_argument('--password', default='password123', help='Password for every generated user')
+        parser.add_argument('--super-managers', type=int, default=2)
+        parser.add_argument('--managers', type=int, default=10)
+        parser.add_argument('--officers-per-manager', type=int, default=10)
+        parser.add_argument('--levels', type=int, default=3,
+                            help='Levels of management above the officers, super managers included')
+        parser.add_argument('--span', type=int, default=5, help='Managers reporting to each manager one level up')
+        parser.add_argument('--agents', type=int, default=50)
+        parser.add_argument('--loans-per-customer', type=float, default=1.5)
+        parser.add_argument('--interactions-per-customer', type=float, default=5)
+        parser.add_argument('--follow-up-ratio', type=float, default=0.3,
+                            help='Fraction of interactions that schedule a follow-up')
+        parser.add_argument('--max-payments-per-loan', type=int, default=36)
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Customers generated per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Parallel worker processes')
+
+    def handle(self, *args, **options):
+        if options['managers'] < 1 or options['officers_per_manager'] < 1 or options['agents'] < 1:
+            raise CommandError('At least one manager, officer and agent is required')
+        if options['levels'] < 2 or options['span'] < 1:
+            raise CommandError('--levels must be at least 2 and --span at least 1')
+        if not options['prefix'].isalnum() or len(options['prefix']) > 10:
+            raise CommandError('--prefix must be alphanumeric and at most 10 characters')
+
+        started = time.monotonic()
+        try:
+            officer_ids, agent_ids = create_users(
+                options['prefix'], options['password'], options['super_managers'], options['managers'],
+                options['officers_per_manager'], options['agents'], options['levels'], options['span']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'Created {len(officer_ids)} officers and {len(agent_ids)} agents')
+
+        plan = DatasetPlan(
+            seed=options['seed'],
+            as_of=options['as_of'],
+            customers=options['customers'],
+            chunk_size=options['chunk_size'],
+            loans_per_customer=options['loans_per_customer'],
+            interactions_per_customer=options['interactions_per_customer'],
+            follow_up_ratio=options['follow_up_ratio'],
+            max_payments_per_loan=options['max_payments_per_loan'],
+            officer_ids=officer_ids,
+            agent_ids=agent_ids,
+            national_id_prefix=options['prefix'].upper(),
+        )
+        totals = Counter()
+
+        def on_chunk(counts):
+            totals.update(counts)
+            self.stdout.write(
+                f"{totals['customers']}/{plan.customers} customers "
+                f"({time.monotonic() - started:.1f}s)"
+            )
+
+        generate(plan, workers=options['workers'], on_chunk=on_chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {totals['customers']} customers, {totals['loans']} loans, {totals['payments']} payments, "
+            f"{totals['interactions']} interactions and {totals['follow_ups']} follow-ups "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
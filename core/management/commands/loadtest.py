@@ -0,0 +1,83 @@
+import asyncio
+import json
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loadtest import AGENT, DEFAULT_MIX, OFFICER, parse_mix, parse_stages, run_load
+from users.models import User
+
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+class Command(BaseCommand):
+    help = ('Ramp virtual agents and officers against a local server and report throughput, '
+            'latency and error rates per interval')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test')
+        parser.add_argument('--prefix', default='gen', help='Username prefix of the generated dataset to log in as')
+        parser.add_argument('--password', default='password123', help='Password of the generated users')
+        parser.add_argument('--stages', default='10:30,50:60,100:60',
+                            help='Comma-separated users:seconds ramp stages')
+        parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+                            help='Comma-separated scenario=weight pairs')
+        parser.add_argument('--think-ms', type=int, default=1000, help='Mean pause between requests of one user')
+        parser.add_argument('--report-interval', type=float, default=5, help='Seconds per reported interval')
+        parser.add_argument('--seed', type=int, help='Seed for the scenario choices')
+        parser.add_argument('--output', help='Write the report as JSON to this file')
+        parser.add_argument('--allow-remote', action='store_true', help='Allow a URL that is not on this machine')
+
+    def handle(self, *args, **options):
+        if urlsplit(options['url']).hostname not in LOCAL_HOSTS and not options['allow_remote']:
+            raise CommandError(f"{options['url']} is not local; pass --allow-remote to load test it anyway")
+        try:
+            stages = parse_stages(options['stages'])
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(f'Invalid --stages or --mix: {e}')
+
+        accounts = {}
+        for role in (AGENT, OFFICER):
+            accounts[role] = list(
+                User.objects.filter(username__startswith=f"{options['prefix']}-", role=role, is_active=True)
+                .order_by('username').values_list('username', flat=True)
+            )
+        if not accounts[AGENT]:
+            raise CommandError(f"No calling agents with prefix '{options['prefix']}'; run generate_dataset first")
+
+        self.stdout.write(f"{'t':>7}{'users':>7}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+
+        def on_report(point):
+            self.stdout.write(
+                f"{point['t']:>7.1f}{point['users']:>7}{point['rps']:>9.1f}{self.ms(point['p50_ms'])}"
+                f"{self.ms(point['p95_ms'])}{self.ms(point['p99_ms'])}{point['error_rate']:>8.1%}"
+            )
+
+        report = asyncio.run(run_load(
+            options['url'], accounts, options['password'], stages, mix=mix, think_ms=options['think_ms'],
+            report_interval=options['report_interval'], seed=options['seed'], on_report=on_report,
+        ))
+
+        self.stdout.write('')
+        self.stdout.write(f"{'scenario':<20}{'requests':>9}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for name, summary in report['scenarios'].items():
+            self.stdout.write(
+                f"{name:<20}{summary['requests']:>9}{summary['rps']:>9.1f}{self.ms(summary['p50_ms'])}"
+                f"{self.ms(summary['p95_ms'])}{self.ms(summary['p99_ms'])}{summary['errors']:>8}"
+            )
+        self.stdout.write(f"Status codes: {', '.join(f'{k}={v}' for k, v in report['statuses'].items())}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+
+        total = report['total']
+        message = (f"{total['requests']} requests in {report['duration_s']}s ({total['rps']} req/s), "
+                   f"{total['error_rate']:.1%} errors")
+        self.stdout.write(self.style.SUCCESS(message) if not total['errors'] else self.style.WARNING(message))
+
+    def ms(self, value):
+        return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
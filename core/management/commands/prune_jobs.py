@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Delete jobs that finished more than JOB_RETENTION_DAYS ago, with their result files'
+
+    def handle(self, *args, **kwargs):
+        cutoff = timezone.now() - timedelta(days=getattr(settings, 'JOB_RETENTION_DAYS', 7))
+        finished = Job.objects.filter(status__in=Job.FINISHED_STATUSES, finished_at__lte=cutoff)
+        for job in finished.exclude(artifact=''):
+            try:
+                jobs.get_kind(job.kind).discard(job)
+            except ValueError:
+                pass  # a kind that no longer exists
+        deleted, _ = finished.delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} finished jobs'))
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import OutboxEvent
+
+
+class Command(BaseCommand):
+    help = 'Delete outbox events relayed more than OUTBOX_RETENTION_DAYS ago'
+
+    def handle(self, *args, **kwargs):
+        cutoff = timezone.now() - timedelta(days=getattr(settings, 'OUTBOX_RETENTION_DAYS', 7))
+        deleted, _ = OutboxEvent.objects.filter(relayed_at__lte=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} relayed outbox events'))
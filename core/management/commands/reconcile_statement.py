@@ -0,0 +1,46 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import reconciliation
+from loans.models import Payment
+
+
+class Command(BaseCommand):
+    help = ('Match a bank or mobile money statement (CSV or MT940-like text) against payments, on reference and '
+            'then on amount, date and loan, and write matched, suspect and unmatched reports')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='Statement file')
+        parser.add_argument('--format', choices=['csv', 'mt940'], help='Statement format (default: from its contents)')
+        parser.add_argument('--window', type=int,
+                            help='Days a line may be from its payment (default: RECONCILIATION_WINDOW_DAYS)')
+        parser.add_argument('--method', action='append', choices=Payment.PaymentMethod.values,
+                            help='Only match payments made this way; repeatable')
+        parser.add_argument('--output-dir', help='Directory for the reports (default: the statement\'s)')
+
+    def handle(self, *args, **options):
+        directory = options['output_dir'] or os.path.dirname(os.path.abspath(options['file']))
+        if not os.path.isdir(directory):
+            raise CommandError(f'No directory {directory}')
+
+        started = time.perf_counter()
+        try:
+            statement = reconciliation.read_statement(options['file'], options['format'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        read = time.perf_counter() - started
+        result = reconciliation.reconcile(statement.lines, options['window'], options['method'])
+        paths = reconciliation.write_reports(
+            result, directory, os.path.splitext(os.path.basename(options['file']))[0]
+        )
+        elapsed = time.perf_counter() - started
+
+        for label, value in reconciliation.summary(statement, result).items():
+            self.stdout.write(f'{label:<24}{value:>16}')
+        for path in paths:
+            self.stdout.write(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled {len(statement.lines)} lines in {elapsed:.2f}s (read in {read:.2f}s)'
+        ))
@@ -0,0 +1,38 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import OutboxEvent
+from core.outbox import Relay, get_sink
+
+
+class Command(BaseCommand):
+    help = 'Publish pending outbox events to a Redis stream or to append-only files (at least once)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sink', choices=('redis', 'file'), help='Where to publish (default: OUTBOX_SINK)')
+        parser.add_argument('--batch-size', type=int, help='Events per batch (default: OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--poll-seconds', type=float, help='Pause when nothing is pending (default: OUTBOX_POLL_SECONDS)')
+        parser.add_argument('--once', action='store_true', help='Relay what is pending, then exit')
+
+    def handle(self, *args, **options):
+        try:
+            relay = Relay(get_sink(options['sink']), batch_size=options['batch_size'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        stopping = []
+        if not options['once']:
+            # Finish the batch in flight, then stop.
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stopping.append(True))
+            self.stdout.write(f"Relaying; {OutboxEvent.objects.filter(relayed_at__isnull=True).count()} pending")
+
+        started = time.perf_counter()
+        relay.run(poll_seconds=options['poll_seconds'], once=options['once'], should_stop=lambda: bool(stopping))
+        elapsed = time.perf_counter() - started
+        rate = relay.relayed / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f'Relayed {relay.relayed} outbox events in {elapsed:.2f}s ({rate:.0f} events/s)'
+        ))
@@ -0,0 +1,57 @@
+import csv
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import payments
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Record the payments of a settlement file (CSV with loan_reference, payment_reference, amount, '
+            'payment_date and payment_method columns), allocating them loan by loan, and report what they recovered')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='Settlement file')
+        parser.add_argument('--received-by', help='Username recorded as having received the payments')
+        parser.add_argument('--batch-size', type=int,
+                            help='Loans per transaction (default: PAYMENT_SETTLEMENT_BATCH_SIZE)')
+        parser.add_argument('--existing', action='store_true',
+                            help='Instead allocate the payments recorded before allocation existed')
+
+    def handle(self, *args, **options):
+        if bool(options['file']) == options['existing']:
+            raise CommandError('Give either a settlement file or --existing')
+        batch_size = options['batch_size'] or getattr(settings, 'PAYMENT_SETTLEMENT_BATCH_SIZE', 1000)
+        received_by = None
+        if options['received_by']:
+            try:
+                received_by = User.objects.get(username=options['received_by'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user {options['received_by']}")
+
+        started = time.perf_counter()
+        if options['existing']:
+            result = {'allocated': payments.amounts(payments.allocate_existing(batch_size))}
+        else:
+            try:
+                with open(options['file'], newline='') as f:
+                    reader = csv.DictReader(f)
+                    missing = set(payments.Line._fields) - {'payment_method'} - set(reader.fieldnames or ())
+                    if missing:
+                        raise CommandError(f"Missing columns: {', '.join(sorted(missing))}")
+                    lines = [payments.Line(*(row.get(field) for field in payments.Line._fields)) for row in reader]
+            except OSError as e:
+                raise CommandError(str(e))
+            result = payments.settle(lines, received_by, batch_size)
+        elapsed = time.perf_counter() - started
+
+        for label in ('lines', 'payments', 'loans'):
+            if label in result:
+                self.stdout.write(f'{label:<24}{result[label]:>16}')
+        for reason, count in result.get('rejected', {}).items():
+            self.stdout.write(f"{'rejected, ' + reason:<24}{count:>16}")
+        for name, amount in result['allocated'].items():
+            self.stdout.write(f'{name.lower():<24}{amount:>16}')
+        self.stdout.write(self.style.SUCCESS(f'Allocated payments in {elapsed:.2f}s'))
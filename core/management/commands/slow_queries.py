@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import SlowQuery
+
+
+ORDERINGS = {
+    'total': '-total_ms',
+    'count': '-count',
+    'max': '-max_ms',
+    'recent': '-last_seen',
+}
+
+
+class Command(BaseCommand):
+    help = 'List recorded slow queries, or show one in detail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fingerprint', nargs='?', help='Show the query whose fingerprint starts with this')
+        parser.add_argument('--order', choices=ORDERINGS, default='total', help='Sort order for the list')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--view', help='Only queries issued by this view action, e.g. CustomerViewSet.list')
+        parser.add_argument('--hours', type=int, help='Only queries seen in the last N hours')
+        parser.add_argument('--clear', action='store_true', help='Delete all recorded slow queries')
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} slow queries'))
+            return
+
+        if options['fingerprint']:
+            self.show(options['fingerprint'])
+            return
+
+        queries = SlowQuery.objects.order_by(ORDERINGS[options['order']])
+        if options['view']:
+            queries = queries.filter(view=options['view'])
+        if options['hours']:
+            queries = queries.filter(last_seen__gte=timezone.now() - timedelta(hours=options['hours']))
+
+        self.stdout.write(f"{'fingerprint':<10} {'count':>7} {'total ms':>10} {'avg ms':>8} {'max ms':>8}  view / origin")
+        for query in queries[:options['limit']]:
+            self.stdout.write(
+                f'{query.fingerprint[:8]:<10} {query.count:>7} {query.total_ms:>10.0f} '
+                f'{query.total_ms / query.count:>8.1f} {query.max_ms:>8.0f}  '
+                f'{query.view or "-"} {query.origin}'
+            )
+            self.stdout.write(f'           {query.sql[:150]}')
+
+    def show(self, prefix):
+        matches = list(SlowQuery.objects.filter(fingerprint__startswith=prefix)[:2])
+        if not matches:
+            raise CommandError(f'No slow query with fingerprint {prefix}')
+        if len(matches) > 1:
+            raise CommandError(f'Fingerprint {prefix} is ambiguous')
+
+        query = matches[0]
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Slow query {query.fingerprint}'))
+        self.stdout.write(
+            f'{query.count} executions, {query.total_ms:.0f} ms total, '
+            f'{query.total_ms / query.count:.1f} ms avg, {query.max_ms:.0f} ms max'
+        )
+        self.stdout.write(f'First seen {query.first_seen:%Y-%m-%d %H:%M}, last seen {query.last_seen:%Y-%m-%d %H:%M}')
+        self.stdout.write(f'View: {query.view or "-"}')
+        self.stdout.write(f'Origin: {query.origin or "-"}')
+        for title, text in (('SQL', query.sql), ('Latest example', query.example_sql),
+                            ('Stack', query.stack), ('Plan', query.explain)):
+            if text:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n{title}'))
+                self.stdout.write(text)
@@ -0,0 +1,66 @@
+import csv
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.transitions import RULES, run_rule
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Apply batch loan status transitions: default loans past the DPD threshold, close paid loans and '
+            'write off an approved list')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rule', action='append', choices=sorted(RULES), required=True,
+                            help='Rule to apply; repeat to apply several in order')
+        parser.add_argument('--references', help='File of loan references to write off, one per line '
+                                                 '(or the first column of a CSV)')
+        parser.add_argument('--dpd-threshold', type=int, help='Days past due above which loans default '
+                                                             '(default: LOAN_DEFAULT_DPD_THRESHOLD)')
+        parser.add_argument('--batch-size', type=int, help='Loans per transaction (default: LOAN_TRANSITION_BATCH_SIZE)')
+        parser.add_argument('--user', help='Username recorded as having made the changes')
+        parser.add_argument('--dry-run', action='store_true', help='Count the loans each rule would move; change nothing')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user '{options['user']}'")
+        params = {}
+        if options['dpd_threshold'] is not None:
+            params['dpd_threshold'] = options['dpd_threshold']
+        if options['references']:
+            params['references'] = self.read_references(options['references'])
+
+        run = uuid.uuid4()
+        self.stdout.write(f"{'rule':<17}{'to status':<13}{'from status':<14}{'loans':>8}")
+        moved = 0
+        started = time.perf_counter()
+        for name in options['rule']:
+            try:
+                summary = run_rule(name, params, user=user, dry_run=options['dry_run'],
+                                   batch_size=options['batch_size'], run=run)
+            except ValueError as e:
+                raise CommandError(str(e))
+            for from_status, count in summary['from_statuses'].items():
+                self.stdout.write(f"{name:<17}{summary['to_status']:<13}{from_status:<14}{count:>8}")
+            for label in ('skipped', 'missing'):
+                if summary[label]:
+                    self.stdout.write(f"{name:<17}{summary['to_status']:<13}{'(' + label + ')':<14}{summary[label]:>8}")
+            moved += summary['moved']
+        elapsed = time.perf_counter() - started
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Dry run: {moved} loans would change status'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Changed the status of {moved} loans in {elapsed:.2f}s (run {run})'))
+
+    def read_references(self, path):
+        try:
+            with open(path, newline='') as f:
+                return [row[0].strip() for row in csv.reader(f) if row and row[0].strip()]
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
@@ -0,0 +1,197 @@
+"""
+Per-view request metrics in Prometheus format.
+
+MetricsMiddleware labels every request with the DRF action that served it
+(e.g. ``CustomerViewSet.list``) and records request count, latency, number
+of database queries, time spent in the database and time spent rendering
+serializer data. With DB_POOL on, the state of each worker's connection
+pools is exported after every request as well.
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty directory before
+the workers start (see gunicorn.conf.py); each worker then writes its
+samples to memory-mapped files there and /metrics aggregates all of them.
+"""
+import os
+import time
+from contextvars import ContextVar
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from django.db import connections
+from rest_framework import serializers
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+REQUESTS = Counter(
+    'repaysync_view_requests_total', 'Requests handled, by view action and status.',
+    ['view', 'method', 'status']
+)
+LATENCY = Histogram(
+    'repaysync_view_latency_seconds', 'Request latency by view action.',
+    ['view'], buckets=LATENCY_BUCKETS
+)
+DB_QUERIES = Histogram(
+    'repaysync_view_db_queries', 'Database queries per request by view action.',
+    ['view'], buckets=QUERY_BUCKETS
+)
+DB_TIME = Histogram(
+    'repaysync_view_db_seconds', 'Time spent in the database per request by view action.',
+    ['view'], buckets=LATENCY_BUCKETS
+)
+SERIALIZER_TIME = Histogram(
+    'repaysync_view_serializer_seconds', 'Time spent producing serializer data per request by view action.',
+    ['view'], buckets=LATENCY_BUCKETS
+)
+POOL_CONNECTIONS = Gauge(
+    'repaysync_db_pool_connections', 'Pooled database connections: open (size) and idle (available).',
+    ['database', 'state'], multiprocess_mode='livesum'
+)
+POOL_WAITING = Gauge(
+    'repaysync_db_pool_waiting', 'Requests currently waiting for a pooled connection.',
+    ['database'], multiprocess_mode='livesum'
+)
+POOL_REQUESTS = Counter(
+    'repaysync_db_pool_requests', 'Connections handed out by the pool, and how many of them had to wait.',
+    ['database', 'outcome']
+)
+POOL_WAIT_TIME = Counter(
+    'repaysync_db_pool_wait_seconds', 'Time spent waiting for a pooled connection.', ['database']
+)
+POOL_ERRORS = Counter(
+    'repaysync_db_pool_errors', 'Pool failures: timeouts waiting, failed or lost connections, bad returns.',
+    ['database', 'kind']
+)
+
+
+class RequestStats:
+    """Counters for the request currently being handled."""
+
+    __slots__ = ('queries', 'db_time', 'serializer_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Used as a connection.execute_wrapper().
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+current_stats = ContextVar('current_stats', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper adding every query to the stats of the current request.
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """
+    connection_created receiver adding the query counter to a connection once.
+    """
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def view_label(request):
+    """
+    Name the view that handled `request`, e.g. ``LoanViewSet.approve``.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name or match.func.__name__
+    method = request.method.lower()
+    actions = getattr(match.func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+def record(request, response, duration, stats):
+    view = view_label(request)
+    REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+    LATENCY.labels(view).observe(duration)
+    DB_QUERIES.labels(view).observe(stats.queries)
+    DB_TIME.labels(view).observe(stats.db_time)
+    SERIALIZER_TIME.labels(view).observe(stats.serializer_time)
+
+
+def record_pool_stats():
+    """
+    Export the stats of the connection pools used by this thread.
+    """
+    for connection in connections.all(initialized_only=True):
+        pool = getattr(connection, 'pool', None)
+        if pool is None:
+            continue
+        # Counters are reset by pop_stats(), so each call adds what happened since the last one.
+        stats = pool.pop_stats()
+        alias = connection.alias
+        POOL_CONNECTIONS.labels(alias, 'size').set(stats.get('pool_size', 0))
+        POOL_CONNECTIONS.labels(alias, 'available').set(stats.get('pool_available', 0))
+        POOL_WAITING.labels(alias).set(stats.get('requests_waiting', 0))
+        POOL_REQUESTS.labels(alias, 'immediate').inc(stats.get('requests_num', 0) - stats.get('requests_queued', 0))
+        POOL_REQUESTS.labels(alias, 'queued').inc(stats.get('requests_queued', 0))
+        POOL_WAIT_TIME.labels(alias).inc(stats.get('requests_wait_ms', 0) / 1000)
+        for kind, key in (('timeout', 'requests_errors'), ('connect', 'connections_errors'),
+                          ('lost', 'connections_lost'), ('bad_return', 'returns_bad')):
+            POOL_ERRORS.labels(alias, kind).inc(stats.get(key, 0))
+
+
+def _timed_data(prop):
+    def data(self):
+        stats = current_stats.get()
+        if stats is None or hasattr(self, '_data'):
+            return prop.fget(self)
+        started = time.perf_counter()
+        try:
+            return prop.fget(self)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+    data._metrics_original = prop
+    return property(data)
+
+
+def instrument_serializers():
+    """
+    Time `.data` on DRF serializers, which is where representations are
+    built. Nested serializers go through `to_representation` and are
+    counted as part of their parent.
+    """
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not hasattr(cls.data.fget, '_metrics_original'):
+            cls.data = _timed_data(cls.data)
+
+
+def render_metrics():
+    """
+    Return (body, content_type) for the /metrics endpoint.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,16 @@
+# Core middleware package
+from .audit import AuditLogMiddleware
+from .compression import CompressionMiddleware
+from .metrics import MetricsMiddleware
+from .profiling import ProfilerMiddleware
+from .replicas import ReplicaRoutingMiddleware
+from .static import StaticFilesMiddleware
+
+__all__ = [
+    'AuditLogMiddleware',
+    'CompressionMiddleware',
+    'MetricsMiddleware',
+    'ProfilerMiddleware',
+    'ReplicaRoutingMiddleware',
+    'StaticFilesMiddleware',
+]
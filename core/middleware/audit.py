@@ -0,0 +1,108 @@
+"""
+Request/response audit logging.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.functional import LazyObject, empty
+
+from core.audit import AuditEntry, audit_writer
+
+
+BODY_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class AuditLogMiddleware:
+    """
+    Record every request under AUDIT_LOG_PATH_PREFIXES in the audit trail.
+
+    Only raw values are captured here; bodies are decoded and redacted by
+    the background writer so the request thread pays a few microseconds.
+    Must sit inside CompressionMiddleware so response bodies are captured
+    before they are compressed.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.audited(request):
+            return self.get_response(request)
+
+        started = self.start(request)
+        response = self.get_response(request)
+        self.submit(request, response, started, getattr(request, 'user', None))
+        return response
+
+    async def __acall__(self, request):
+        if not self.audited(request):
+            return await self.get_response(request)
+
+        started = self.start(request)
+        response = await self.get_response(request)
+        user = getattr(request, 'user', None)
+        if isinstance(user, LazyObject) and user._wrapped is empty and hasattr(request, 'auser'):
+            # Nothing loaded the session user yet; doing it here would block the event loop.
+            user = await request.auser()
+        if getattr(settings, 'AUDIT_LOG_ASYNC', True):
+            self.submit(request, response, started, user)
+        else:
+            # Inline writes hit the database.
+            await sync_to_async(self.submit)(request, response, started, user)
+        return response
+
+    def audited(self, request):
+        return getattr(settings, 'AUDIT_LOG_ENABLED', True) and \
+            request.path.startswith(tuple(getattr(settings, 'AUDIT_LOG_PATH_PREFIXES', ('/api/',))))
+
+    def start(self, request):
+        """
+        Return (timestamp, perf_counter, request body) taken before the view runs.
+        """
+        max_body = getattr(settings, 'AUDIT_LOG_MAX_BODY_BYTES', 4096)
+
+        # Read the body before the view does; Django keeps it in memory so
+        # the parsers can still consume it. Large bodies are logged by size.
+        request_body = None
+        if request.method in BODY_METHODS:
+            try:
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = 0
+            request_body = request.body if 0 < length <= max_body else (length or None)
+        return time.time(), time.perf_counter(), request_body
+
+    def submit(self, request, response, started, user):
+        timestamp, perf_started, request_body = started
+        duration_ms = (time.perf_counter() - perf_started) * 1000
+        max_body = getattr(settings, 'AUDIT_LOG_MAX_BODY_BYTES', 4096)
+
+        response_body = None
+        if not response.streaming and response.status_code != 304:
+            content = response.content
+            response_body = content if len(content) <= max_body else len(content)
+
+        authenticated = user is not None and user.is_authenticated
+        audit_writer.submit(AuditEntry(
+            timestamp=timestamp,
+            method=request.method,
+            path=request.path,
+            query_string=request.META.get('QUERY_STRING', ''),
+            user_id=user.pk if authenticated else None,
+            username=user.get_username() if authenticated else '',
+            role=getattr(user, 'role', '') if authenticated else '',
+            remote_addr=request.META.get('REMOTE_ADDR') or None,
+            status_code=response.status_code,
+            duration_ms=duration_ms,
+            request_content_type=request.META.get('CONTENT_TYPE', ''),
+            request_body=request_body,
+            response_content_type=response.get('Content-Type', ''),
+            response_body=response_body,
+        ))
@@ -0,0 +1,137 @@
+"""
+Negotiated response compression (gzip, or brotli when enabled).
+"""
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+# Content types worth compressing; images, archives and the like are
+# already compressed and are passed through untouched.
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'text/',
+)
+
+_encoding_re = re.compile(r'\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*')
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header into a {coding: qvalue} dict.
+    """
+    codings = {}
+    for part in header.split(','):
+        match = _encoding_re.fullmatch(part)
+        if not match:
+            continue
+        coding, qvalue = match.groups()
+        try:
+            codings[coding.lower()] = float(qvalue) if qvalue is not None else 1.0
+        except ValueError:
+            continue
+    return codings
+
+
+def choose_encoding(header, available):
+    """
+    Return the preferred coding from `available` accepted by the client, or None.
+
+    `available` is ordered by server preference, which breaks ties between
+    codings the client rates equally.
+    """
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in available:
+        qvalue = codings.get(coding, wildcard)
+        if qvalue > best_q:
+            best, best_q = coding, qvalue
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compress API responses above COMPRESSION_MIN_SIZE bytes.
+
+    Responses are gzipped with a randomly padded header against BREACH.
+    Brotli output cannot be padded, so it is only offered when
+    COMPRESSION_BROTLI is set and the `brotli` package is installed; it is
+    then preferred when the client accepts it. Streaming responses are never
+    buffered or compressed so that event streams keep flushing per event.
+
+    Settings:
+    - COMPRESSION_MIN_SIZE: smallest body worth compressing (default 1024)
+    - COMPRESSION_BROTLI: offer unpadded brotli (default False)
+    - COMPRESSION_BROTLI_QUALITY: brotli quality 0-11 (default 4)
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4)
+        use_brotli = brotli is not None and getattr(settings, 'COMPRESSION_BROTLI', False)
+        self.available = ('br', 'gzip') if use_brotli else ('gzip',)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+
+        content_type = response.get('Content-Type', '')
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        if len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.available)
+        if encoding is None:
+            return response
+
+        if encoding == 'br':
+            compressed = brotli.compress(response.content, quality=self.brotli_quality)
+        else:
+            # Random padding in the gzip header varies the length by up to 100
+            # bytes, as Django's GZipMiddleware does against BREACH.
+            compressed = compress_string(response.content, max_random_bytes=100)
+
+        # Only swap the body if compression actually made it smaller.
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+
+        # A strong ETag must not be shared between encodings (RFC 9110 8.8.1).
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+
+        return response
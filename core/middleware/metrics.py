@@ -0,0 +1,64 @@
+"""
+Per-view Prometheus metrics.
+"""
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from core.metrics import RequestStats, current_stats, record, record_pool_stats
+
+
+class MetricsMiddleware:
+    """
+    Count queries, database time and serializer time for each request and
+    record them, with the total latency, against the view that served it.
+
+    Queries are counted by the execute wrapper core.metrics installs on
+    every connection, into the stats of the current request; the stats
+    live in a context variable, so the queries async views run through the
+    async ORM on another thread are counted as well.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+
+        record(request, response, time.perf_counter() - started, stats)
+        record_pool_stats()
+        return response
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+
+        record(request, response, time.perf_counter() - started, stats)
+        if getattr(settings, 'DB_POOL', False):
+            # The connections of an async request belong to the thread its queries ran on.
+            await sync_to_async(record_pool_stats)()
+        return response
@@ -0,0 +1,104 @@
+"""
+Sampling profiler hook (see core.profiling).
+"""
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from core.metrics import view_label
+from core.models import ProfileSample
+from core.profiling import StackSampler, active_sessions, cached_sessions, session_matches
+
+
+class ProfilerMiddleware:
+    """
+    Profile a sampled fraction of requests matching an active ProfileSession.
+
+    Sampling starts in process_view, once the view is known. Users
+    authenticated by DRF (e.g. JWT) are only known after the view ran, so
+    user and role filters are re-checked before a sample is kept.
+
+    Samples follow the thread the view runs on, so under ASGI only sync
+    views are profiled: async views share the event loop thread with every
+    other request in flight.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+            # Django would otherwise run the sync hook in a thread for every request.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.finish(request)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if getattr(request, '_profile', None) is not None:
+            await sync_to_async(self.finish)(request)
+        return response
+
+    def finish(self, request):
+        profile = getattr(request, '_profile', None)
+        if profile is not None:
+            sampler, session, label, started = profile
+            stacks = sampler.stop()
+            if session_matches(session, getattr(request, 'user', None)):
+                ProfileSample.objects.create(
+                    session=session,
+                    view=label,
+                    path=request.path[:500],
+                    duration_ms=(time.perf_counter() - started) * 1000,
+                    stacks=dict(stacks),
+                )
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        sessions = active_sessions()
+        if sessions:
+            self.start(request, sessions, view_label(request))
+        return None
+
+    def start(self, request, sessions, label):
+        user = getattr(request, 'user', None)
+        known_user = user is not None and user.is_authenticated
+        for session in sessions:
+            if session.view and session.view != label:
+                continue
+            if known_user and not session_matches(session, user):
+                continue
+            if random.random() < session.sample_rate:
+                sampler = StackSampler(
+                    threading.get_ident(),
+                    session.interval_ms / 1000,
+                    root_code=ProfilerMiddleware.__call__.__code__,
+                ).start()
+                request._profile = (sampler, session, label, time.perf_counter())
+                break
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func):
+            return None
+        # Decide on the event loop whether any session could sample this
+        # request; the database is only read when the cache is stale.
+        sessions = cached_sessions()
+        if sessions is None:
+            sessions = await sync_to_async(active_sessions)()
+        label = view_label(request)
+        if not any(not session.view or session.view == label for session in sessions):
+            return None
+        # Runs on the thread-sensitive executor the sync view will run on next.
+        await sync_to_async(self.start)(request, sessions, label)
+        return None
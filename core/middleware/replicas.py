@@ -0,0 +1,81 @@
+"""
+Send the reads of safe-method requests to a read replica (see core.replicas).
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from core.replicas import choose_replica, is_sticky, mark_sticky, use_primary, use_replica
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_jwt = JWTAuthentication()
+
+
+def request_user_id(request):
+    """
+    The id of the requesting user, from the session or a bearer token.
+
+    DRF authenticates JWT users only once the view runs, so before that the
+    token is decoded here (signature checked, no database lookup).
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        return _jwt.get_validated_token(raw_token).get(jwt_settings.USER_ID_CLAIM)
+    except (InvalidToken, TokenError):
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route safe-method requests to a replica unless the user wrote recently.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICAS', None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method not in SAFE_METHODS:
+            with use_primary():
+                response = self.get_response(request)
+            mark_sticky(request_user_id(request))
+            return response
+
+        if is_sticky(request_user_id(request)):
+            with use_primary():
+                return self.get_response(request)
+        with use_replica():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # Resolving the user may load the session, the sticky flag lives in
+        # the cache and lag checks query the replicas: all run off the event loop.
+        if request.method not in SAFE_METHODS:
+            with use_primary():
+                response = await self.get_response(request)
+            await sync_to_async(lambda: mark_sticky(request_user_id(request)))()
+            return response
+
+        alias = await sync_to_async(
+            lambda: None if is_sticky(request_user_id(request)) else choose_replica()
+        )()
+        with use_replica(alias) if alias else use_primary():
+            return await self.get_response(request)
@@ -0,0 +1,34 @@
+# Generated by Django 5.1 on 2026-10-19 01:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(help_text='Model label, e.g. customers.customer', max_length=100, verbose_name='model')),
+                ('object_id', models.BigIntegerField(verbose_name='object ID')),
+                ('reason', models.CharField(choices=[('DELETED', 'Deleted'), ('REASSIGNED', 'Reassigned')], max_length=20, verbose_name='reason')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, help_text='User who lost visibility; empty when the row was removed for everyone', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sync_tombstones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'tombstone',
+                'verbose_name_plural': 'tombstones',
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['created_at', 'id'], name='core_tombst_created_9d3a21_idx'), models.Index(fields=['user', 'created_at'], name='core_tombst_user_id_bc148c_idx')],
+            },
+        ),
+    ]
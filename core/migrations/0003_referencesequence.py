@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-19 01:09
+
+from django.db import migrations, models
+
+
+REFERENCE_SEQUENCES = ('core_reference_loan_seq', 'core_reference_payment_seq')
+
+
+def create_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in REFERENCE_SEQUENCES:
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {name}')
+
+
+def drop_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in REFERENCE_SEQUENCES:
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='name')),
+                ('next_value', models.BigIntegerField(default=1, verbose_name='next value')),
+            ],
+            options={
+                'verbose_name': 'reference sequence',
+                'verbose_name_plural': 'reference sequences',
+            },
+        ),
+        migrations.RunPython(create_sequences, drop_sequences),
+    ]
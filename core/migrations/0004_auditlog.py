@@ -0,0 +1,37 @@
+# Generated by Django 5.1 on 2026-10-19 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_referencesequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='created at')),
+                ('method', models.CharField(max_length=10, verbose_name='method')),
+                ('path', models.CharField(max_length=500, verbose_name='path')),
+                ('query_string', models.TextField(blank=True, verbose_name='query string')),
+                ('user_id', models.BigIntegerField(blank=True, null=True, verbose_name='user ID')),
+                ('username', models.CharField(blank=True, max_length=150, verbose_name='username')),
+                ('role', models.CharField(blank=True, max_length=20, verbose_name='role')),
+                ('remote_addr', models.GenericIPAddressField(blank=True, null=True, verbose_name='remote address')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='status code')),
+                ('duration_ms', models.FloatField(verbose_name='duration (ms)')),
+                ('request_body', models.JSONField(blank=True, null=True, verbose_name='request body')),
+                ('response_body', models.JSONField(blank=True, null=True, verbose_name='response body')),
+            ],
+            options={
+                'verbose_name': 'audit log entry',
+                'verbose_name_plural': 'audit log',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='core_auditl_created_dc23ea_idx'), models.Index(fields=['user_id', 'created_at'], name='core_auditl_user_id_413764_idx')],
+            },
+        ),
+    ]
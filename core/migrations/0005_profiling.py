@@ -0,0 +1,54 @@
+# Generated by Django 5.1 on 2026-10-19 01:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_auditlog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(blank=True, help_text='View action as labelled in metrics, e.g. FollowUpViewSet.list', max_length=200, verbose_name='view')),
+                ('role', models.CharField(blank=True, choices=[('SUPER_MANAGER', 'Super Manager'), ('MANAGER', 'Manager'), ('COLLECTION_OFFICER', 'Collection Officer'), ('CALLING_AGENT', 'Calling Agent')], max_length=20, verbose_name='role')),
+                ('sample_rate', models.FloatField(default=0.1, help_text='Fraction of matching requests to profile', verbose_name='sample rate')),
+                ('interval_ms', models.PositiveSmallIntegerField(default=5, verbose_name='sampling interval (ms)')),
+                ('max_requests', models.PositiveIntegerField(default=500, verbose_name='max requests')),
+                ('is_active', models.BooleanField(default=True, verbose_name='active')),
+                ('expires_at', models.DateTimeField(verbose_name='expires at')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_profile_sessions', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='profile_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'profile session',
+                'verbose_name_plural': 'profile sessions',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProfileSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(max_length=200, verbose_name='view')),
+                ('path', models.CharField(max_length=500, verbose_name='path')),
+                ('duration_ms', models.FloatField(verbose_name='duration (ms)')),
+                ('stacks', models.JSONField(default=dict, help_text='Collapsed stack -> sample count', verbose_name='stacks')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='samples', to='core.profilesession')),
+            ],
+            options={
+                'verbose_name': 'profile sample',
+                'verbose_name_plural': 'profile samples',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1 on 2026-10-19 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_profiling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=32, unique=True, verbose_name='fingerprint')),
+                ('sql', models.TextField(verbose_name='normalized SQL')),
+                ('example_sql', models.TextField(help_text='Latest slow execution with its parameters', verbose_name='example SQL')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='count')),
+                ('total_ms', models.FloatField(default=0, verbose_name='total time (ms)')),
+                ('max_ms', models.FloatField(default=0, verbose_name='max time (ms)')),
+                ('view', models.CharField(blank=True, max_length=200, verbose_name='view')),
+                ('origin', models.CharField(blank=True, help_text='Serializer field or permission class that issued the query', max_length=200, verbose_name='origin')),
+                ('stack', models.TextField(blank=True, verbose_name='stack')),
+                ('explain', models.TextField(blank=True, verbose_name='explain output')),
+                ('first_seen', models.DateTimeField(auto_now_add=True, verbose_name='first seen')),
+                ('last_seen', models.DateTimeField(db_index=True, verbose_name='last seen')),
+            ],
+            options={
+                'verbose_name': 'slow query',
+                'verbose_name_plural': 'slow queries',
+                'ordering': ['-total_ms'],
+            },
+        ),
+    ]
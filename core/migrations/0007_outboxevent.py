@@ -0,0 +1,32 @@
+# Generated by Django 5.1 on 2026-10-19 03:00
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(help_text='e.g. payment.created, loan.approved', max_length=50, verbose_name='topic')),
+                ('aggregate_type', models.CharField(help_text='Model label, e.g. loans.payment', max_length=100, verbose_name='aggregate type')),
+                ('aggregate_id', models.CharField(max_length=64, verbose_name='aggregate ID')),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='payload')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('relayed_at', models.DateTimeField(blank=True, null=True, verbose_name='relayed at')),
+            ],
+            options={
+                'verbose_name': 'outbox event',
+                'verbose_name_plural': 'outbox events',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('relayed_at__isnull', True)), fields=['id'], name='core_outbox_pending_idx'), models.Index(fields=['relayed_at'], name='core_outbox_relayed_42d967_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1 on 2026-10-19 03:09
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_outboxevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='Registered job kind, e.g. export_customers', max_length=50, verbose_name='kind')),
+                ('params', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='parameters')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('SUCCEEDED', 'Succeeded'), ('FAILED', 'Failed'), ('CANCELED', 'Canceled')], default='PENDING', max_length=20, verbose_name='status')),
+                ('total', models.PositiveIntegerField(blank=True, help_text='Items to process; empty until the job starts', null=True, verbose_name='total')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='processed')),
+                ('checkpoint', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Where the next chunk starts', null=True, verbose_name='checkpoint')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='Failed attempts at the current chunk', verbose_name='attempts')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='cancel requested')),
+                ('result', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='result')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('artifact', models.CharField(blank=True, help_text='Result file name under JOB_ARTIFACT_DIR', max_length=255, verbose_name='artifact')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started at')),
+                ('heartbeat_at', models.DateTimeField(blank=True, help_text='When the last chunk was committed', null=True, verbose_name='heartbeat at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'job',
+                'verbose_name_plural': 'jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_by', 'created_at'], name='core_job_created_e7e3cf_idx'), models.Index(fields=['status', 'finished_at'], name='core_job_status_06586a_idx')],
+            },
+        ),
+    ]
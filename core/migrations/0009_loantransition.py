@@ -0,0 +1,36 @@
+# Generated by Django 5.1 on 2026-10-19 03:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_job'),
+        ('loans', '0004_loan_reference_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanTransition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rule', models.CharField(help_text='e.g. default_overdue, close_paid, write_off', max_length=50, verbose_name='rule')),
+                ('run', models.UUIDField(help_text='Identifies the batch run that applied the transition', verbose_name='run')),
+                ('from_status', models.CharField(choices=[('PENDING', 'Pending'), ('ACTIVE', 'Active'), ('PAID', 'Paid'), ('DEFAULTED', 'Defaulted'), ('RESTRUCTURED', 'Restructured'), ('WRITTEN_OFF', 'Written Off')], max_length=20, verbose_name='from status')),
+                ('to_status', models.CharField(choices=[('PENDING', 'Pending'), ('ACTIVE', 'Active'), ('PAID', 'Paid'), ('DEFAULTED', 'Defaulted'), ('RESTRUCTURED', 'Restructured'), ('WRITTEN_OFF', 'Written Off')], max_length=20, verbose_name='to status')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loan_transitions', to=settings.AUTH_USER_MODEL)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transitions', to='loans.loan')),
+            ],
+            options={
+                'verbose_name': 'loan transition',
+                'verbose_name_plural': 'loan transitions',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['loan', 'created_at'], name='core_loantr_loan_id_e9e022_idx'), models.Index(fields=['run'], name='core_loantr_run_6df6eb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,370 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from loans.models import Loan
+from users.models import User
+
+
+class Tombstone(models.Model):
+    """Marker for a row that left a user's (or everyone's) sync scope"""
+
+    class Reason(models.TextChoices):
+        DELETED = 'DELETED', _('Deleted')
+        REASSIGNED = 'REASSIGNED', _('Reassigned')
+
+    model = models.CharField(_('model'), max_length=100, help_text=_('Model label, e.g. customers.customer'))
+    object_id = models.BigIntegerField(_('object ID'))
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='sync_tombstones',
+        null=True,
+        blank=True,
+        help_text=_('User who lost visibility; empty when the row was removed for everyone')
+    )
+    reason = models.CharField(_('reason'), max_length=20, choices=Reason.choices)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('tombstone')
+        verbose_name_plural = _('tombstones')
+        ordering = ['created_at', 'id']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.model}#{self.object_id} {self.get_reason_display()}"
+
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a create request sent with an Idempotency-Key header"""
+
+    key_hash = models.CharField(
+        _('key hash'),
+        max_length=64,
+        unique=True,
+        help_text=_('SHA-256 of the user id and the client supplied key')
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys',
+        null=True,
+        blank=True
+    )
+    request_fingerprint = models.CharField(_('request fingerprint'), max_length=64)
+    status_code = models.PositiveSmallIntegerField(
+        _('status code'),
+        null=True,
+        blank=True,
+        help_text=_('Empty while the original request is still running')
+    )
+    response_body = models.JSONField(_('response body'), null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(_('expires at'), db_index=True)
+
+    class Meta:
+        verbose_name = _('idempotency key')
+        verbose_name_plural = _('idempotency keys')
+
+    def __str__(self):
+        return f"{self.key_hash[:12]} ({self.status_code or 'pending'})"
+
+
+class ReferenceSequence(models.Model):
+    """
+    Counter backing the reference allocator on databases without native
+    sequences. PostgreSQL uses real sequences instead (see core.references).
+    """
+
+    name = models.CharField(_('name'), max_length=50, unique=True)
+    next_value = models.BigIntegerField(_('next value'), default=1)
+
+    class Meta:
+        verbose_name = _('reference sequence')
+        verbose_name_plural = _('reference sequences')
+
+    def __str__(self):
+        return f"{self.name} @ {self.next_value}"
+
+
+class AuditLog(models.Model):
+    """
+    Append-only record of one API request and its response.
+
+    Rows are written in batches by core.audit.AuditWriter, never updated.
+    The user is stored by value rather than as a foreign key so that audit
+    history survives user deletion and inserts take no row locks.
+    """
+
+    created_at = models.DateTimeField(_('created at'))
+    method = models.CharField(_('method'), max_length=10)
+    path = models.CharField(_('path'), max_length=500)
+    query_string = models.TextField(_('query string'), blank=True)
+    user_id = models.BigIntegerField(_('user ID'), null=True, blank=True)
+    username = models.CharField(_('username'), max_length=150, blank=True)
+    role = models.CharField(_('role'), max_length=20, blank=True)
+    remote_addr = models.GenericIPAddressField(_('remote address'), null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(_('status code'))
+    duration_ms = models.FloatField(_('duration (ms)'))
+    request_body = models.JSONField(_('request body'), null=True, blank=True)
+    response_body = models.JSONField(_('response body'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('audit log entry')
+        verbose_name_plural = _('audit log')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['user_id', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M:%S} {self.method} {self.path} {self.status_code}"
+
+
+class ProfileSession(models.Model):
+    """
+    Request to sample-profile a fraction of matching requests.
+
+    Empty `view`, `user` and `role` match anything; a session stops
+    profiling once it is deactivated, expires, or has collected
+    `max_requests` samples.
+    """
+
+    view = models.CharField(
+        _('view'),
+        max_length=200,
+        blank=True,
+        help_text=_('View action as labelled in metrics, e.g. FollowUpViewSet.list')
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='profile_sessions',
+        null=True,
+        blank=True
+    )
+    role = models.CharField(_('role'), max_length=20, choices=User.Role.choices, blank=True)
+    sample_rate = models.FloatField(_('sample rate'), default=0.1, help_text=_('Fraction of matching requests to profile'))
+    interval_ms = models.PositiveSmallIntegerField(_('sampling interval (ms)'), default=5)
+    max_requests = models.PositiveIntegerField(_('max requests'), default=500)
+    is_active = models.BooleanField(_('active'), default=True)
+    expires_at = models.DateTimeField(_('expires at'))
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='created_profile_sessions',
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('profile session')
+        verbose_name_plural = _('profile sessions')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.view or '*'} / {self.user or self.role or '*'} @ {self.sample_rate:.0%}"
+
+
+class ProfileSample(models.Model):
+    """Collapsed stack samples captured from one profiled request"""
+
+    session = models.ForeignKey(ProfileSession, on_delete=models.CASCADE, related_name='samples')
+    view = models.CharField(_('view'), max_length=200)
+    path = models.CharField(_('path'), max_length=500)
+    duration_ms = models.FloatField(_('duration (ms)'))
+    stacks = models.JSONField(_('stacks'), default=dict, help_text=_('Collapsed stack -> sample count'))
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('profile sample')
+        verbose_name_plural = _('profile samples')
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.view} {self.duration_ms:.0f}ms"
+
+
+class SlowQuery(models.Model):
+    """
+    Aggregate of slow executions of one normalized SQL statement.
+
+    Written by core.slow_queries; browse with `manage.py slow_queries`.
+    """
+
+    fingerprint = models.CharField(_('fingerprint'), max_length=32, unique=True)
+    sql = models.TextField(_('normalized SQL'))
+    example_sql = models.TextField(_('example SQL'), help_text=_('Latest slow execution with its parameters'))
+    count = models.PositiveIntegerField(_('count'), default=0)
+    total_ms = models.FloatField(_('total time (ms)'), default=0)
+    max_ms = models.FloatField(_('max time (ms)'), default=0)
+    view = models.CharField(_('view'), max_length=200, blank=True)
+    origin = models.CharField(
+        _('origin'),
+        max_length=200,
+        blank=True,
+        help_text=_('Serializer field or permission class that issued the query')
+    )
+    stack = models.TextField(_('stack'), blank=True)
+    explain = models.TextField(_('explain output'), blank=True)
+    first_seen = models.DateTimeField(_('first seen'), auto_now_add=True)
+    last_seen = models.DateTimeField(_('last seen'), db_index=True)
+
+    class Meta:
+        verbose_name = _('slow query')
+        verbose_name_plural = _('slow queries')
+        ordering = ['-total_ms']
+
+    def __str__(self):
+        return f"{self.fingerprint[:8]} x{self.count} max {self.max_ms:.0f}ms"
+
+
+class OutboxEvent(models.Model):
+    """
+    A domain change waiting to be relayed to downstream systems.
+
+    Written in the same transaction as the change it describes, so an event
+    exists exactly when its change was committed; core.outbox.Relay then
+    publishes pending events in id order and marks them relayed.
+    """
+
+    topic = models.CharField(_('topic'), max_length=50, help_text=_('e.g. payment.created, loan.approved'))
+    aggregate_type = models.CharField(_('aggregate type'), max_length=100, help_text=_('Model label, e.g. loans.payment'))
+    aggregate_id = models.CharField(_('aggregate ID'), max_length=64)
+    payload = models.JSONField(_('payload'), encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    relayed_at = models.DateTimeField(_('relayed at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('outbox event')
+        verbose_name_plural = _('outbox events')
+        ordering = ['id']
+        indexes = [
+            # The relay's scan: only unrelayed rows, in id order.
+            models.Index(fields=['id'], condition=models.Q(relayed_at__isnull=True), name='core_outbox_pending_idx'),
+            models.Index(fields=['relayed_at']),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.topic} {self.aggregate_type}#{self.aggregate_id}"
+
+
+class LoanTransition(models.Model):
+    """
+    A loan status change applied by a batch rule (see core.transitions); one
+    row per loan moved, tagged with the run that moved it.
+    """
+
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='transitions')
+    rule = models.CharField(_('rule'), max_length=50, help_text=_('e.g. default_overdue, close_paid, write_off'))
+    run = models.UUIDField(_('run'), help_text=_('Identifies the batch run that applied the transition'))
+    from_status = models.CharField(_('from status'), max_length=20, choices=Loan.Status.choices)
+    to_status = models.CharField(_('to status'), max_length=20, choices=Loan.Status.choices)
+    changed_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='loan_transitions',
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('loan transition')
+        verbose_name_plural = _('loan transitions')
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['loan', 'created_at']),
+            models.Index(fields=['run']),
+        ]
+
+    def __str__(self):
+        return f"{self.loan_id}: {self.from_status} -> {self.to_status} ({self.rule})"
+
+
+class Job(models.Model):
+    """
+    A long-running operation (export, bulk reassignment, ...) run in chunks
+    by a Celery worker; see core.jobs.
+
+    Each committed chunk advances `checkpoint` and `processed` together with
+    its changes, so a job that is retried or redelivered resumes after the
+    last committed chunk.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('Pending')
+        RUNNING = 'RUNNING', _('Running')
+        SUCCEEDED = 'SUCCEEDED', _('Succeeded')
+        FAILED = 'FAILED', _('Failed')
+        CANCELED = 'CANCELED', _('Canceled')
+
+    FINISHED_STATUSES = (Status.SUCCEEDED, Status.FAILED, Status.CANCELED)
+
+    kind = models.CharField(_('kind'), max_length=50, help_text=_('Registered job kind, e.g. export_customers'))
+    params = models.JSONField(_('parameters'), default=dict, blank=True, encoder=DjangoJSONEncoder)
+    status = models.CharField(_('status'), max_length=20, choices=Status.choices, default=Status.PENDING)
+    total = models.PositiveIntegerField(_('total'), null=True, blank=True,
+                                        help_text=_('Items to process; empty until the job starts'))
+    processed = models.PositiveIntegerField(_('processed'), default=0)
+    checkpoint = models.JSONField(_('checkpoint'), null=True, blank=True, encoder=DjangoJSONEncoder,
+                                  help_text=_('Where the next chunk starts'))
+    attempts = models.PositiveSmallIntegerField(_('attempts'), default=0,
+                                                help_text=_('Failed attempts at the current chunk'))
+    cancel_requested = models.BooleanField(_('cancel requested'), default=False)
+    result = models.JSONField(_('result'), null=True, blank=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(_('error'), blank=True)
+    artifact = models.CharField(_('artifact'), max_length=255, blank=True,
+                                help_text=_('Result file name under JOB_ARTIFACT_DIR'))
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        related_name='jobs',
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(_('started at'), null=True, blank=True)
+    heartbeat_at = models.DateTimeField(_('heartbeat at'), null=True, blank=True,
+                                        help_text=_('When the last chunk was committed'))
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('job')
+        verbose_name_plural = _('jobs')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', 'created_at']),
+            models.Index(fields=['status', 'finished_at']),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED_STATUSES
+
+    @property
+    def progress(self):
+        """Fraction processed, or None before the total is known"""
+        if self.status == self.Status.SUCCEEDED:
+            return 1.0
+        if not self.total:
+            return None
+        return min(1.0, self.processed / self.total)
+
+    @property
+    def eta_seconds(self):
+        """Seconds left at the rate so far, or None when it cannot be told"""
+        if self.status != self.Status.RUNNING or not self.total or not self.processed or not self.started_at:
+            return None
+        elapsed = (timezone.now() - self.started_at).total_seconds()
+        return max(0.0, round(elapsed * (self.total - self.processed) / self.processed, 1))
@@ -0,0 +1,347 @@
+"""
+Transactional outbox for domain changes.
+
+Code that creates a payment or an interaction, or moves a loan to another
+status, records an OutboxEvent in the same transaction (`record`,
+`record_many` and the helpers below), so downstream systems (BI, the SMS
+reminder service, the gateway reconciler) hear about exactly the changes
+that were committed, without polling the API.
+
+`manage.py relay_outbox` runs a Relay that publishes pending events in
+batches to a sink and then marks them relayed:
+
+* RedisStreamSink appends them to a Redis stream (OUTBOX_REDIS_URL,
+  OUTBOX_STREAM). RedisStreamConsumer reads it through a consumer group,
+  whose last delivered id and pending entries are the consumer's offset;
+* FileSink appends JSON lines to numbered segment files in OUTBOX_FILE_DIR.
+  FileConsumer stores each consumer's offset (segment and byte position)
+  under `offsets/` in the same directory.
+
+Delivery is at least once. A batch is marked relayed only after the sink
+accepted it, so a relay that dies in between publishes it again, and a
+consumer that dies before committing its offset reads its last events
+again. Consumers dedupe by the event `id`.
+
+Run one relay per sink: events are then published in id order, except that
+a transaction committing after a later-numbered one has been relayed is
+published after it. The relay publishes whatever is unrelayed rather than
+tracking a high-water mark, so such late commits are never skipped.
+"""
+import json
+import logging
+import os
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .bulk import insert_rows
+from .models import OutboxEvent
+
+
+logger = logging.getLogger('repaysync.outbox')
+
+EVENT_FIELDS = ('id', 'topic', 'aggregate_type', 'aggregate_id', 'payload', 'created_at')
+
+COLUMNS = ('topic', 'aggregate_type', 'aggregate_id', 'payload', 'created_at')
+
+
+def enabled():
+    return getattr(settings, 'OUTBOX_ENABLED', True)
+
+
+def record(topic, instance, payload):
+    """
+    Record an event about `instance`. Call it inside the transaction that
+    changes the instance.
+    """
+    if not enabled():
+        return None
+    return OutboxEvent.objects.create(
+        topic=topic,
+        aggregate_type=instance._meta.label_lower,
+        aggregate_id=str(instance.pk),
+        payload=payload,
+    )
+
+
+def record_many(topic, events):
+    """
+    Record an event for each (instance, payload) pair in one insert (COPY on
+    PostgreSQL), for bulk changes.
+    """
+    if not enabled():
+        return
+    now = timezone.now()
+    encoder = DjangoJSONEncoder()
+    rows = [
+        # COPY takes the payload as it is; decimals and dates are encoded here.
+        (topic, instance._meta.label_lower, str(instance.pk), json.loads(encoder.encode(payload)), now)
+        for instance, payload in events
+    ]
+    insert_rows(OutboxEvent, COLUMNS, rows)
+
+
+def payment_payload(payment):
+    return {
+        'payment': payment.pk,
+        'payment_reference': payment.payment_reference,
+        'loan': payment.loan_id,
+        'amount': payment.amount,
+        'payment_date': payment.payment_date,
+        'payment_method': payment.payment_method,
+        'received_by': payment.received_by_id,
+    }
+
+
+def payment_created(payment):
+    return record('payment.created', payment, payment_payload(payment))
+
+
+def payments_created(payments):
+    return record_many('payment.created', [(payment, payment_payload(payment)) for payment in payments])
+
+
+def loan_status_changed(topic, loan, previous_status, user=None):
+    return record(topic, loan, {
+        'loan': loan.pk,
+        'loan_reference': loan.loan_reference,
+        'customer': loan.customer_id,
+        'from_status': previous_status,
+        'to_status': loan.status,
+        'changed_by': getattr(user, 'pk', None),
+    })
+
+
+def interaction_created(interaction):
+    return record('interaction.created', interaction, {
+        'interaction': interaction.pk,
+        'customer': interaction.customer_id,
+        'loan': interaction.loan_id,
+        'interaction_type': interaction.interaction_type,
+        'outcome': interaction.outcome,
+        'initiated_by': interaction.initiated_by_id,
+        'start_time': interaction.start_time,
+        'payment_promise_amount': interaction.payment_promise_amount,
+        'payment_promise_date': interaction.payment_promise_date,
+    })
+
+
+def encode_event(event):
+    return json.dumps(event, cls=DjangoJSONEncoder, separators=(',', ':'))
+
+
+class FileSink:
+    """
+    Appends events as JSON lines to `<n>.jsonl` segments, starting a new
+    segment once the current one reaches OUTBOX_FILE_SEGMENT_BYTES.
+
+    Batches are fsynced before the relay marks them relayed. Only one relay
+    may write to a directory.
+    """
+
+    def __init__(self, directory=None, segment_bytes=None):
+        self.directory = directory or settings.OUTBOX_FILE_DIR
+        self.segment_bytes = segment_bytes or getattr(settings, 'OUTBOX_FILE_SEGMENT_BYTES', 64 * 1024 * 1024)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def publish(self, events):
+        data = ''.join(encode_event(event) + '\n' for event in events).encode()
+        segments = list_segments(self.directory)
+        segment = segments[-1] if segments else 1
+        path = segment_path(self.directory, segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+            path = segment_path(self.directory, segment + 1)
+        with open(path, 'ab') as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+
+def segment_path(directory, segment):
+    return os.path.join(directory, f'{segment:010d}.jsonl')
+
+
+def list_segments(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name[:-6]) for name in os.listdir(directory) if name.endswith('.jsonl') and name[:-6].isdigit())
+
+
+class FileConsumer:
+    """
+    Reads a FileSink directory from the named consumer's committed offset.
+    """
+
+    def __init__(self, name, directory=None):
+        self.directory = directory or settings.OUTBOX_FILE_DIR
+        self.offset_path = os.path.join(self.directory, 'offsets', f'{name}.json')
+        try:
+            with open(self.offset_path) as handle:
+                offset = json.load(handle)
+            self.position = (offset['segment'], offset['position'])
+        except FileNotFoundError:
+            self.position = (1, 0)
+        self.committed = self.position
+
+    def read(self, count=1000):
+        """
+        Return up to `count` events after the last ones read.
+        """
+        events = []
+        segment, position = self.position
+        while len(events) < count:
+            segments = list_segments(self.directory)
+            if segment not in segments:
+                later = [number for number in segments if number > segment]
+                if not later:
+                    break
+                # Removed by the operator before this consumer read it.
+                logger.warning('Outbox segment %d is gone; skipping to segment %d', segment, later[0])
+                segment, position = later[0], 0
+                continue
+            # A later segment means this one is complete, so reaching its
+            # end below means moving on rather than waiting for more.
+            complete = segments[-1] > segment
+            with open(segment_path(self.directory, segment), 'rb') as handle:
+                handle.seek(position)
+                while len(events) < count:
+                    line = handle.readline()
+                    if not line.endswith(b'\n'):
+                        break  # end of file, or a batch still being written
+                    position += len(line)
+                    events.append(json.loads(line))
+            if len(events) >= count or not complete:
+                break
+            segment, position = segment + 1, 0
+        self.position = (segment, position)
+        return events
+
+    def commit(self):
+        """
+        Store the offset after the events read so far.
+        """
+        if self.position == self.committed:
+            return
+        os.makedirs(os.path.dirname(self.offset_path), exist_ok=True)
+        temporary = f'{self.offset_path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump({'segment': self.position[0], 'position': self.position[1]}, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, self.offset_path)
+        self.committed = self.position
+
+
+class RedisStreamSink:
+    """
+    Appends events to a Redis stream capped near OUTBOX_STREAM_MAXLEN entries.
+    """
+
+    def __init__(self, url=None, stream=None, maxlen=None):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.OUTBOX_REDIS_URL)
+        self.stream = stream or getattr(settings, 'OUTBOX_STREAM', 'repaysync:outbox')
+        self.maxlen = maxlen or getattr(settings, 'OUTBOX_STREAM_MAXLEN', 1000000)
+
+    def publish(self, events):
+        pipeline = self.client.pipeline(transaction=False)
+        for event in events:
+            pipeline.xadd(self.stream, {'event': encode_event(event)}, maxlen=self.maxlen, approximate=True)
+        pipeline.execute()
+
+
+class RedisStreamConsumer:
+    """
+    Reads the outbox stream as `name` in consumer group `group`.
+
+    Entries this consumer read but did not acknowledge before it stopped
+    are read again first.
+    """
+
+    def __init__(self, group, name, url=None, stream=None):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.OUTBOX_REDIS_URL)
+        self.stream = stream or getattr(settings, 'OUTBOX_STREAM', 'repaysync:outbox')
+        self.group = group
+        self.name = name
+        try:
+            self.client.xgroup_create(self.stream, group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self.pending_after = '0'
+        self.unacknowledged = []
+
+    def read(self, count=1000, block_ms=None):
+        while True:
+            start = self.pending_after if self.pending_after is not None else '>'
+            response = self.client.xreadgroup(self.group, self.name, {self.stream: start}, count=count,
+                                              block=block_ms if start == '>' else None)
+            entries = response[0][1] if response else []
+            if start != '>' and not entries:
+                self.pending_after = None  # re-delivered everything; read new entries now
+                continue
+            if start != '>':
+                self.pending_after = entries[-1][0]
+            self.unacknowledged.extend(entry_id for entry_id, _ in entries)
+            return [json.loads(fields[b'event']) for _, fields in entries]
+
+    def commit(self):
+        if self.unacknowledged:
+            self.client.xack(self.stream, self.group, *self.unacknowledged)
+            self.unacknowledged = []
+
+
+def get_sink(name=None):
+    name = name or getattr(settings, 'OUTBOX_SINK', 'file')
+    if name == 'redis':
+        return RedisStreamSink()
+    if name == 'file':
+        return FileSink()
+    raise ValueError(f"Unknown outbox sink '{name}'")
+
+
+class Relay:
+    """
+    Publishes pending outbox events to a sink in batches.
+    """
+
+    def __init__(self, sink, batch_size=None):
+        self.sink = sink
+        self.batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', 1000)
+        self.relayed = 0
+
+    def relay_batch(self):
+        """
+        Publish the oldest pending events and mark them relayed; return how many.
+        """
+        with transaction.atomic():
+            pending = OutboxEvent.objects.filter(relayed_at__isnull=True).order_by('id')
+            if connection.features.has_select_for_update_skip_locked:
+                pending = pending.select_for_update(skip_locked=True)
+            events = list(pending.values(*EVENT_FIELDS)[:self.batch_size])
+            if not events:
+                return 0
+            self.sink.publish(events)
+            OutboxEvent.objects.filter(pk__in=[event['id'] for event in events]).update(relayed_at=timezone.now())
+        self.relayed += len(events)
+        return len(events)
+
+    def run(self, poll_seconds=None, once=False, should_stop=lambda: False):
+        """
+        Relay until `should_stop()`, or with `once` until nothing is pending.
+        """
+        poll_seconds = getattr(settings, 'OUTBOX_POLL_SECONDS', 0.5) if poll_seconds is None else poll_seconds
+        while not should_stop():
+            relayed = self.relay_batch()
+            if relayed < self.batch_size:
+                if once:
+                    return
+                # Do not hold a connection while idle.
+                connection.close()
+                time.sleep(poll_seconds)
@@ -0,0 +1,401 @@
+"""
+Recording payments: posting them to loan ledgers, allocating them, and
+settlement files.
+
+`record_payments(payments)` takes saved Payment rows, one or a settlement
+file's worth. With their loans locked it posts them to the loans' ledgers
+(core.ledger), allocates every payment of those loans that has no
+allocation yet, and updates each loan's amount_paid, last_payment_date and
+status. Payment.save calls it for each new payment. `settle(lines)` creates
+the payments of a settlement file in bulk and calls it chunk by chunk of
+loans.
+
+Allocation goes through a loan's payments in date order in one pass,
+applying each to what the loan owes in PAYMENT_WATERFALL order:
+
+* FEE and PENALTY: the fees and penalties on the ledger with a value date
+  by the payment date, less waivers (penalties first) and what earlier payments
+  settled;
+* INTEREST and PRINCIPAL: the installments of the loan's schedule
+  (Loan.installment_due_date), each an equal share of the contractual
+  interest and of the principal, oldest first. Interest of an installment
+  not yet due is not collected early; its principal is.
+
+With PAYMENT_WATERFALL_BY_INSTALLMENT each installment's interest and
+principal are settled before the next installment's; without it all
+interest due is settled before any principal. What is left over is the
+payment's EXCESS. Each part is a PaymentAllocation row (payment, loan,
+installment, component, amount), written in bulk (COPY on PostgreSQL);
+`recovered` sums them by component, e.g. the principal recovered in a
+period.
+"""
+from collections import Counter, defaultdict, namedtuple
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Sum
+from django.utils import timezone
+
+from loans.models import LedgerEntry, Loan, Payment, PaymentAllocation, add_months
+
+from . import ledger, outbox
+from .bulk import insert_rows, update_rows
+from .models import Tombstone
+from .signals import status_tombstones
+
+
+Line = namedtuple('Line', ['loan_reference', 'payment_reference', 'amount', 'payment_date', 'payment_method'])
+
+Component = PaymentAllocation.Component
+EntryType = LedgerEntry.EntryType
+
+LOAN_COMPONENTS = (Component.FEE, Component.PENALTY)
+INSTALLMENT_COMPONENTS = (Component.INTEREST, Component.PRINCIPAL)
+CHARGES = {EntryType.FEE: Component.FEE, EntryType.PENALTY: Component.PENALTY}
+
+COLUMNS = ['payment_id', 'loan_id', 'installment', 'component', 'amount']
+PROJECTION = ['amount_paid', 'last_payment_date', 'status', 'updated_at']
+
+# References per query when resolving a settlement file.
+LOOKUP_BATCH_SIZE = 1000
+
+
+def to_cents(value):
+    return int(ledger.cents(Decimal(value)) * 100)
+
+
+def waterfall():
+    """
+    PAYMENT_WATERFALL as a list of steps: a loan-level component alone, or
+    the installment components settled together installment by installment.
+    """
+    names = getattr(settings, 'PAYMENT_WATERFALL', ('FEE', 'PENALTY', 'INTEREST', 'PRINCIPAL'))
+    try:
+        components = [Component[name] for name in names]
+    except KeyError as e:
+        raise ImproperlyConfigured(f'Unknown PAYMENT_WATERFALL component {e}')
+    if Component.EXCESS in components or len(set(components)) != len(components):
+        raise ImproperlyConfigured('PAYMENT_WATERFALL lists FEE, PENALTY, INTEREST and PRINCIPAL at most once each')
+    by_installment = getattr(settings, 'PAYMENT_WATERFALL_BY_INSTALLMENT', True)
+    steps = []
+    for component in components:
+        if by_installment and component in INSTALLMENT_COMPONENTS and steps and steps[-1][0] in INSTALLMENT_COMPONENTS:
+            steps[-1] += (component,)
+        else:
+            steps.append((component,))
+    return steps
+
+
+def shares(total, count):
+    """
+    `total` in `count` shares that differ by at most one and add up to it.
+    """
+    return [total * (number + 1) // count - total * number // count for number in range(count)]
+
+
+class Account:
+    """
+    What a loan owes, in cents, as allocation goes through its payments in
+    date order.
+    """
+
+    def __init__(self, loan, allocated, charges):
+        if loan.first_payment_date:
+            count = loan.installment_count
+            self.due_dates = [loan.installment_due_date(number) for number in range(count)]
+        else:
+            # Without a schedule everything falls due at the end of the term.
+            count = 1
+            self.due_dates = [add_months(loan.accrual_start, loan.term_months)]
+        self.owed = {
+            Component.INTEREST: shares(loan.interest_cents, count),
+            Component.PRINCIPAL: shares(int(loan.principal_amount * 100), count),
+        }
+        self.charged = {Component.FEE: 0, Component.PENALTY: 0}
+        self.settled = {Component.FEE: 0, Component.PENALTY: 0}
+        for (installment, component), cents in allocated.items():
+            if component in self.owed and installment is not None and installment < count:
+                self.owed[component][installment] -= cents
+            elif component in self.settled:
+                self.settled[component] += cents
+        self.first = {component: 0 for component in INSTALLMENT_COMPONENTS}  # first installment still owed
+        self.charges = charges  # [(value_date, entry_type, cents)] in date order
+        self.position = 0
+
+    def book_charges(self, on):
+        """
+        Add the fees, penalties and waivers with a value date by `on`.
+        """
+        while self.position < len(self.charges) and self.charges[self.position][0] <= on:
+            _, entry_type, cents = self.charges[self.position]
+            self.position += 1
+            if entry_type in CHARGES:
+                self.charged[CHARGES[entry_type]] += cents
+                continue
+            waived = -cents
+            for component in (Component.PENALTY, Component.FEE):
+                part = min(waived, max(0, self.charged[component] - self.settled[component]))
+                self.charged[component] -= part
+                waived -= part
+
+    def allocate(self, cents, on, steps):
+        """
+        Apply a payment of `cents` made on `on`; return its parts as
+        (installment, component, cents).
+        """
+        self.book_charges(on)
+        parts = []
+        for step in steps:
+            if not cents:
+                break
+            if step[0] in LOAN_COMPONENTS:
+                component = step[0]
+                part = min(cents, max(0, self.charged[component] - self.settled[component]))
+                if part:
+                    parts.append((None, component, part))
+                    self.settled[component] += part
+                    cents -= part
+                continue
+            for number in range(min(self.first[component] for component in step), len(self.due_dates)):
+                for component in step:
+                    if component == Component.INTEREST and self.due_dates[number] > on:
+                        continue
+                    part = min(cents, self.owed[component][number])
+                    if part > 0:
+                        parts.append((number, component, part))
+                        self.owed[component][number] -= part
+                        cents -= part
+                    if self.first[component] == number and self.owed[component][number] <= 0:
+                        self.first[component] = number + 1
+                if not cents:
+                    break
+        if cents:
+            parts.append((None, Component.EXCESS, cents))
+        return parts
+
+
+def allocate(loan_ids, loans=None):
+    """
+    Allocate the payments of the loans that have no allocation yet, one pass
+    per loan in date order. Call with the loans locked; `loans` is
+    {loan id: loan} when the caller already has them. Return a Counter of
+    the cents allocated by component.
+    """
+    pending = defaultdict(list)
+    for payment_id, loan_id, amount, payment_date in Payment.objects.filter(loan_id__in=loan_ids).exclude(
+        Exists(PaymentAllocation.objects.filter(payment_id=OuterRef('pk')))
+    ).order_by('loan_id', 'payment_date', 'pk').values_list('pk', 'loan_id', 'amount', 'payment_date'):
+        pending[loan_id].append((payment_id, to_cents(amount), payment_date))
+    if not pending:
+        return Counter()
+
+    allocated = defaultdict(dict)
+    for loan_id, installment, component, total in PaymentAllocation.objects.filter(loan_id__in=pending).values(
+        'loan_id', 'installment', 'component'
+    ).annotate(total=Sum('amount')).order_by().values_list('loan_id', 'installment', 'component', 'total'):
+        allocated[loan_id][installment, component] = to_cents(total)
+    charges = defaultdict(list)
+    for loan_id, value_date, entry_type, total in LedgerEntry.objects.filter(
+        loan_id__in=pending, entry_type__in=[EntryType.FEE, EntryType.PENALTY, EntryType.WAIVER]
+    ).values('loan_id', 'value_date', 'entry_type').annotate(total=Sum('amount')).order_by(
+        'loan_id', 'value_date', 'entry_type'
+    ).values_list('loan_id', 'value_date', 'entry_type', 'total'):
+        charges[loan_id].append((value_date, entry_type, to_cents(total)))
+
+    steps = waterfall()
+    rows = []
+    totals = Counter()
+    if loans is None:
+        loans = Loan.objects.in_bulk(list(pending))
+    for loan in (loans[pk] for pk in sorted(pending)):
+        account = Account(loan, allocated[loan.pk], charges[loan.pk])
+        for payment_id, cents, payment_date in pending[loan.pk]:
+            for installment, component, part in account.allocate(cents, payment_date, steps):
+                rows.append((payment_id, loan.pk, installment, component, Decimal(part) / 100))
+                totals[Component(component).name] += part
+    insert_rows(PaymentAllocation, COLUMNS, rows)
+    return totals
+
+
+def record_payments(payments):
+    """
+    Post saved, new payments to their loans' ledgers, allocate them and
+    update the loans' amount_paid, last_payment_date and status. Return a
+    Counter of the cents allocated by component.
+    """
+    payments = sorted(payments, key=lambda payment: (payment.loan_id, payment.payment_date, payment.pk))
+    loan_ids = sorted({payment.loan_id for payment in payments})
+    with transaction.atomic(savepoint=False):
+        # Opening a ledger posts all of the loan's payments, these included.
+        ledgers = ledger.lock_ledgers(loan_ids)
+        ledger.append([
+            ledger.Posting(payment.loan_id, EntryType.PAYMENT, payment.amount, payment.payment_date,
+                           payment.payment_reference)
+            for payment in payments if payment.loan_id not in ledgers.opened
+        ], ledgers.last)
+        loans = ledgers.loans
+        totals = allocate(loan_ids, loans)
+
+        paid = defaultdict(Decimal)
+        last_payment_date = {}
+        for payment in payments:
+            paid[payment.loan_id] += payment.amount
+            last_payment_date[payment.loan_id] = max(payment.payment_date,
+                                                     last_payment_date.get(payment.loan_id, payment.payment_date))
+        now = timezone.now()
+        previous_status = {loan.pk: loan.status for loan in loans.values()}
+        # The rows locked above, so the projection builds on current values.
+        for loan in loans.values():
+            loan.amount_paid += paid[loan.pk]
+            if not loan.last_payment_date or last_payment_date[loan.pk] > loan.last_payment_date:
+                loan.last_payment_date = last_payment_date[loan.pk]
+            if loan.amount_paid >= loan.total_amount_due:
+                loan.status = Loan.Status.PAID
+            loan.updated_at = now
+        update_rows(Loan, PROJECTION, [
+            (loan.pk, *(getattr(loan, field) for field in PROJECTION)) for loan in loans.values()
+        ])
+        Tombstone.objects.bulk_create(status_tombstones({
+            pk: status for pk, status in previous_status.items() if loans[pk].status == Loan.Status.PAID
+        }, Loan.Status.PAID))
+
+    # Keep the callers' copies of the loans in step.
+    for payment in payments:
+        if Payment.loan.is_cached(payment):
+            for field in PROJECTION:
+                setattr(payment.loan, field, getattr(loans[payment.loan_id], field))
+    return totals
+
+
+def clean_line(line):
+    """
+    Return a settlement line with its values parsed, or raise ValueError.
+    """
+    loan_reference, payment_reference, amount, payment_date, payment_method = (
+        value.strip() if isinstance(value, str) else value for value in line
+    )
+    if not loan_reference or not payment_reference:
+        raise ValueError('missing reference')
+    try:
+        amount = ledger.cents(Decimal(amount))
+    except (InvalidOperation, TypeError):
+        raise ValueError('invalid amount')
+    if amount <= 0:
+        raise ValueError('invalid amount')
+    if not isinstance(payment_date, date):
+        payment_date = date.fromisoformat(payment_date)
+    payment_method = payment_method or Payment.PaymentMethod.OTHER
+    if payment_method not in Payment.PaymentMethod.values:
+        raise ValueError('invalid payment method')
+    return Line(loan_reference, payment_reference, amount, payment_date, payment_method)
+
+
+def settle(lines, received_by=None, batch_size=None):
+    """
+    Create and record the payments of a settlement file. Lines that do not
+    parse, name an unknown loan or reuse a payment reference are rejected.
+    Return a summary.
+    """
+    batch_size = batch_size or getattr(settings, 'PAYMENT_SETTLEMENT_BATCH_SIZE', 1000)
+    rejected = Counter()
+    parsed = []
+    for line in lines:
+        try:
+            parsed.append(clean_line(line))
+        except ValueError:
+            rejected['invalid'] += 1
+
+    loans, existing = {}, set()
+    loan_references = sorted({line.loan_reference for line in parsed})
+    payment_references = sorted({line.payment_reference for line in parsed})
+    for start in range(0, max(len(loan_references), len(payment_references)), LOOKUP_BATCH_SIZE):
+        loans.update(Loan.objects.filter(
+            loan_reference__in=loan_references[start:start + LOOKUP_BATCH_SIZE]
+        ).values_list('loan_reference', 'pk'))
+        existing.update(Payment.objects.filter(
+            payment_reference__in=payment_references[start:start + LOOKUP_BATCH_SIZE]
+        ).values_list('payment_reference', flat=True))
+
+    by_loan = defaultdict(list)
+    for line in parsed:
+        if line.loan_reference not in loans:
+            rejected['unknown loan'] += 1
+        elif line.payment_reference in existing:
+            rejected['duplicate reference'] += 1
+        else:
+            existing.add(line.payment_reference)
+            by_loan[loans[line.loan_reference]].append(line)
+
+    loan_ids = sorted(by_loan)
+    totals = Counter()
+    created = 0
+    for start in range(0, len(loan_ids), batch_size):
+        with transaction.atomic():
+            payments = Payment.objects.bulk_create([
+                Payment(loan_id=loan_id, payment_reference=line.payment_reference, amount=line.amount,
+                        payment_date=line.payment_date, payment_method=line.payment_method, received_by=received_by)
+                for loan_id in loan_ids[start:start + batch_size]
+                for line in sorted(by_loan[loan_id], key=lambda line: line.payment_date)
+            ], batch_size=500)
+            outbox.payments_created(payments)
+            totals.update(record_payments(payments))
+        created += len(payments)
+    return {
+        'lines': len(parsed) + rejected['invalid'],
+        'payments': created,
+        'loans': len(loan_ids),
+        'rejected': dict(sorted(rejected.items())),
+        'allocated': amounts(totals),
+    }
+
+
+def amounts(totals):
+    """
+    A Counter of cents by component name as amounts, in waterfall order.
+    """
+    return {name: str((Decimal(totals[name]) / 100).quantize(ledger.CENT)) for name in Component.names if totals[name]}
+
+
+def allocate_existing(batch_size=None):
+    """
+    Allocate the payments recorded before allocation existed, chunk by chunk
+    of loans. Return a Counter of the cents allocated by component.
+    """
+    batch_size = batch_size or getattr(settings, 'PAYMENT_SETTLEMENT_BATCH_SIZE', 1000)
+    loans = Loan.objects.filter(Exists(Payment.objects.filter(loan_id=OuterRef('pk')).exclude(
+        Exists(PaymentAllocation.objects.filter(payment_id=OuterRef('pk')))
+    ))).order_by('pk')
+    totals = Counter()
+    after = 0
+    while True:
+        ids = list(loans.filter(pk__gt=after).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return totals
+        with transaction.atomic():
+            ledger.lock(ids)
+            totals.update(allocate(ids))
+        after = ids[-1]
+
+
+def recovered(loans=None, since=None, until=None):
+    """
+    Amounts allocated by component name over payments dated between `since`
+    and `until`, of `loans` (a queryset or ids) or all loans; e.g.
+    recovered()['PRINCIPAL'] is the principal recovered.
+    """
+    allocations = PaymentAllocation.objects.all()
+    if loans is not None:
+        allocations = allocations.filter(loan__in=loans)
+    if since is not None:
+        allocations = allocations.filter(payment__payment_date__gte=since)
+    if until is not None:
+        allocations = allocations.filter(payment__payment_date__lte=until)
+    return {
+        Component(component).name: ledger.cents(total)
+        for component, total in allocations.values('component').annotate(total=Sum('amount')).order_by(
+            'component'
+        ).values_list('component', 'total')
+    }
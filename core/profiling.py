@@ -0,0 +1,193 @@
+"""
+Opt-in sampling profiler.
+
+Admins open a ProfileSession for a view action, a user and/or a role. For
+a `sample_rate` fraction of matching requests ProfilerMiddleware starts a
+StackSampler thread that snapshots the request thread's stack every
+`interval_ms`; the collapsed stacks are stored as a ProfileSample and can be
+downloaded per session as a collapsed-stack file (for flamegraph.pl or
+speedscope) or as a ready-made SVG flame graph.
+
+With no active session the middleware costs one timestamp comparison per
+request; with PROFILER_ENABLED = False it is not installed at all.
+"""
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from html import escape
+
+from django.conf import settings
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import ProfileSession
+
+
+_cache_lock = threading.Lock()
+_cached_sessions = []
+_cached_at = None
+
+
+def active_sessions():
+    """
+    Return active sessions, re-read from the database at most every
+    PROFILER_REFRESH_SECONDS per process.
+    """
+    global _cached_sessions, _cached_at
+    now = time.monotonic()
+    refresh = getattr(settings, 'PROFILER_REFRESH_SECONDS', 10)
+    if _cached_at is not None and now - _cached_at < refresh:
+        return _cached_sessions
+    with _cache_lock:
+        if _cached_at is None or now - _cached_at >= refresh:
+            _cached_sessions = list(
+                ProfileSession.objects.filter(is_active=True, expires_at__gt=timezone.now())
+                .annotate(sample_count=Count('samples'))
+                .filter(sample_count__lt=F('max_requests'))
+            )
+            _cached_at = now
+    return _cached_sessions
+
+
+def cached_sessions():
+    """
+    Return the cached active sessions without touching the database, or None
+    when they are due to be re-read.
+    """
+    refresh = getattr(settings, 'PROFILER_REFRESH_SECONDS', 10)
+    if _cached_at is not None and time.monotonic() - _cached_at < refresh:
+        return _cached_sessions
+    return None
+
+
+def invalidate_sessions():
+    """
+    Make the next request in this process re-read the active sessions.
+    """
+    global _cached_at
+    _cached_at = None
+
+
+def session_matches(session, user):
+    if session.user_id and session.user_id != getattr(user, 'pk', None):
+        return False
+    if session.role and session.role != getattr(user, 'role', None):
+        return False
+    return True
+
+
+def frame_label(code):
+    filename = code.co_filename
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = filename[len(base):].lstrip('/')
+    elif 'site-packages/' in filename:
+        filename = filename.split('site-packages/', 1)[1]
+    return f'{filename}:{code.co_name}'
+
+
+def collapse(frame, root_code=None):
+    """
+    Collapse a frame's stack to ``outer;...;inner``, starting at `root_code`.
+    """
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        if frame.f_code is root_code:
+            break
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Samples one thread's stack from a helper thread until stopped.
+    """
+
+    def __init__(self, thread_id, interval, root_code=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root_code = root_code
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[collapse(frame, self.root_code)] += 1
+
+
+def merge_samples(samples):
+    counts = Counter()
+    for sample in samples:
+        counts.update(sample.stacks)
+    return counts
+
+
+def render_collapsed(counts):
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(counts.items()))
+
+
+def render_flamegraph(counts, title='Flame graph', width=1200, row_height=16):
+    """
+    Render collapsed stacks as a standalone SVG flame graph.
+    """
+    root = {'count': 0, 'children': {}}
+    for stack, count in counts.items():
+        node = root
+        node['count'] += count
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'count': 0, 'children': {}})
+            node['count'] += count
+
+    total = root['count'] or 1
+    rects = []
+
+    def walk(name, node, x, depth):
+        node_width = node['count'] / total * width
+        if node_width < 0.5:
+            return
+        rects.append((x, depth, node_width, name, node['count']))
+        for child_name, child in sorted(node['children'].items()):
+            walk(child_name, child, x, depth + 1)
+            x += child['count'] / total * width
+
+    x = 0.0
+    for name, child in sorted(root['children'].items()):
+        walk(name, child, x, 0)
+        x += child['count'] / total * width
+
+    depth = max((rect[1] for rect in rects), default=0) + 1
+    height = depth * row_height + 40
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="Verdana" font-size="11">',
+        f'<text x="{width / 2}" y="20" text-anchor="middle" font-size="15">{escape(title)} ({total} samples)</text>',
+    ]
+    for x, level, rect_width, name, count in rects:
+        y = height - (level + 1) * row_height
+        hue = zlib.crc32(name.encode()) % 55
+        label = name.rsplit(':', 1)[-1] if rect_width < 200 else name
+        parts.append(
+            f'<g><title>{escape(name)} ({count} samples, {count / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{rect_width:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue},85%,60%)"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{escape(label[:int(rect_width / 7)])}</text>'
+               if rect_width > 35 else '')
+            + '</g>'
+        )
+    parts.append('</svg>')
+    return '\n'.join(parts)
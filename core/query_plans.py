@@ -0,0 +1,319 @@
+"""
+Query plan checks (see `manage.py explain_endpoints`).
+
+Every list endpoint is requested as each of the four roles, the SELECTs it
+runs are captured, and each distinct statement is EXPLAINed. Plans are
+rendered as short indented text, with auto-generated index names replaced
+by `table(columns)` and literals by `?`, so the same plan renders the same
+way on every dataset and can be checked into the repository and diffed.
+
+Two rules are asserted on top of the snapshot:
+
+* no sequential scan of a large table, unless listed in ALLOWED_SEQ_SCANS;
+* the indexes in EXPECTED_INDEXES appear in the plan of their endpoint.
+
+On PostgreSQL plans are taken with `enable_seqscan` off: on a small test
+dataset the planner would rightly scan every table, but a Seq Scan that
+survives the setting means no usable index exists.
+"""
+import difflib
+import json
+import logging
+import re
+import sqlite3
+from unittest import mock
+
+from django.db import connection, transaction
+from rest_framework.test import APIClient
+from rest_framework.views import APIView
+
+from customers.models import Customer
+from interactions.models import Interaction, FollowUp
+from loans.models import Loan, Payment
+
+from .audit import audit_writer
+from .benchmarks import build_request, discover_endpoints, role_users
+from .models import AuditLog
+
+
+# Tables that grow with the portfolio; scanning one per request does not scale.
+LARGE_TABLES = {model._meta.db_table for model in (Customer, Loan, Payment, Interaction, FollowUp, AuditLog)}
+
+# Known sequential scans, as (endpoint, role, table). Every entry is a bug to fix.
+ALLOWED_SEQ_SCANS = {
+    # Agents see every active customer; only the page itself is read in
+    # (last_name, first_name) order, the conditional GET aggregates scan.
+    ('CustomerViewSet.list', 'CALLING_AGENT', 'customers_customer'),
+    # No index on application_date to read the newest loans first.
+    ('LoanViewSet.list', 'SUPER_MANAGER', 'loans_loan'),
+    ('LoanViewSet.list', 'MANAGER', 'loans_loan'),
+}
+
+# Indexes each (endpoint, role) must use, as `table(column)` for an index
+# whose leading column is `column`.
+EXPECTED_INDEXES = {
+    ('HierarchyViewSet.list', 'MANAGER'): ['users_hierarchy(manager_id)'],
+    ('CustomerViewSet.list', 'MANAGER'): ['users_hierarchy(manager_id)', 'customers_customer(assigned_officer_id)'],
+    ('CustomerViewSet.list', 'COLLECTION_OFFICER'): ['customers_customer(assigned_officer_id)'],
+    ('LoanViewSet.list', 'COLLECTION_OFFICER'): [
+        'customers_customer(assigned_officer_id)', 'loans_loan(assigned_officer_id)', 'loans_loan(customer_id)',
+    ],
+    ('LoanViewSet.list', 'CALLING_AGENT'): ['loans_loan(status)'],
+    ('PaymentViewSet.list', 'COLLECTION_OFFICER'): [
+        'loans_loan(assigned_officer_id)', 'loans_payment(loan_id)', 'loans_payment(received_by_id)',
+    ],
+    ('PaymentViewSet.list', 'CALLING_AGENT'): ['loans_payment(received_by_id)'],
+    ('InteractionViewSet.list', 'COLLECTION_OFFICER'): [
+        'interactions_interaction(customer_id)', 'interactions_interaction(initiated_by_id)',
+    ],
+    ('InteractionViewSet.list', 'CALLING_AGENT'): ['interactions_interaction(initiated_by_id)'],
+    ('FollowUpViewSet.list', 'COLLECTION_OFFICER'): [
+        'interactions_followup(customer_id)', 'interactions_followup(created_by_id)',
+        'interactions_followup(assigned_to_id)',
+    ],
+    ('FollowUpViewSet.list', 'CALLING_AGENT'): [
+        'interactions_followup(created_by_id)', 'interactions_followup(assigned_to_id)',
+    ],
+}
+
+
+class PlanCapture:
+    """
+    Execute wrapper that records the SELECT statements of a request.
+
+    Only statements run inside the view are recorded: middleware queries
+    (profiler sessions, audit rows) depend on process-level caches, not on
+    the endpoint.
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+    def patch(self):
+        dispatch = APIView.dispatch
+        recorder = self
+
+        def recording_dispatch(view, request, *args, **kwargs):
+            with connection.execute_wrapper(recorder):
+                return dispatch(view, request, *args, **kwargs)
+
+        return mock.patch.object(APIView, 'dispatch', recording_dispatch)
+
+
+class IndexNames:
+    """
+    Maps index names to `table(columns)` labels, using introspection.
+    """
+
+    def __init__(self, using_connection):
+        self.connection = using_connection
+        self.labels = None
+
+    def label(self, name):
+        if self.labels is None:
+            self.labels = {}
+            with self.connection.cursor() as cursor:
+                for table in self.connection.introspection.table_names(cursor):
+                    constraints = self.connection.introspection.get_constraints(cursor, table)
+                    for index, info in constraints.items():
+                        if info['columns'] and (info['index'] or info['primary_key'] or info['unique']):
+                            self.labels[index] = f"{table}({', '.join(info['columns'])})"
+        return self.labels.get(name, name)
+
+
+LITERAL = re.compile(r"'(?:[^']|'')*'(?:::[\w ]+)?|\b\d+(?:\.\d+)?\b")
+
+
+def normalize(text):
+    return LITERAL.sub('?', text)
+
+
+def explain_sqlite(cursor, sql, params, indexes):
+    cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _notused, detail in cursor.fetchall():
+        depth[node_id] = depth.get(parent, -1) + 1
+        detail = re.sub(
+            r'(USING (?:COVERING )?INDEX) (\w+)',
+            lambda match: f'{match.group(1)} {indexes.label(match.group(2))}',
+            detail,
+        )
+        # Which index an unfiltered count reads is arbitrary.
+        detail = re.sub(r'^(SCAN \w+ USING COVERING INDEX) \w+(?:\([^)]*\))?$', r'\1', detail)
+        lines.append('  ' * depth[node_id] + normalize(detail))
+    return lines
+
+
+POSTGRES_DETAILS = ('Index Cond', 'Recheck Cond', 'Hash Cond', 'Merge Cond', 'Join Filter', 'Filter', 'Sort Key')
+
+
+def explain_postgresql(cursor, sql, params, indexes):
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    lines = []
+
+    def walk(node, level):
+        line = node['Node Type']
+        if 'Relation Name' in node:
+            line += f" on {node['Relation Name']}"
+        # Which index a bitmap scan without a condition reads is arbitrary.
+        if 'Index Name' in node and (node['Node Type'] != 'Bitmap Index Scan' or 'Index Cond' in node):
+            line += f" using {indexes.label(node['Index Name'])}"
+        lines.append('  ' * level + line)
+        for key in POSTGRES_DETAILS:
+            if key in node:
+                value = ', '.join(node[key]) if isinstance(node[key], list) else node[key]
+                lines.append('  ' * (level + 2) + f'{key}: {normalize(value)}')
+        for child in node.get('Plans', []):
+            walk(child, level + 1)
+
+    walk(plan[0]['Plan'], 0)
+    return lines
+
+
+def engine_version():
+    """
+    Plans differ between database versions; snapshots record this.
+    """
+    if connection.vendor == 'postgresql':
+        return f'postgresql {connection.pg_version // 10000}'
+    if connection.vendor == 'sqlite':
+        return f'sqlite {sqlite3.sqlite_version}'
+    return connection.vendor
+
+
+def explain(sql, params, indexes):
+    """
+    Return the rendered plan of one statement as a list of lines.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            with transaction.atomic():
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                return explain_postgresql(cursor, sql, params, indexes)
+        if connection.vendor == 'sqlite':
+            return explain_sqlite(cursor, sql, params, indexes)
+    raise NotImplementedError(f'Plans are not supported on {connection.vendor}')
+
+
+def seq_scans(lines):
+    """
+    Return the tables a rendered plan reads in full.
+    """
+    tables = set()
+    for line in lines:
+        line = line.strip()
+        match = re.match(r'Seq Scan on (\w+)', line) or re.match(r'SCAN (\w+)$', line)
+        if match:
+            tables.add(match.group(1))
+    return tables
+
+
+def refresh_statistics():
+    """
+    Bring the planner's statistics up to date with the data.
+
+    PostgreSQL sizes a table it has not analyzed by the length of its file,
+    which counts dead rows and depends on whether autovacuum has run yet.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+def capture(prefix, only=None, on_plan=None):
+    """
+    EXPLAIN the SELECTs of every list endpoint for every role.
+
+    Returns {key: {'endpoint', 'role', 'status', 'plans'}} where `plans` is a
+    list of (sql, lines) for each distinct statement, ordered by SQL.
+    """
+    users = role_users(prefix)
+    indexes = IndexNames(connection)
+    refresh_statistics()
+    client = APIClient(SERVER_NAME='localhost')
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    captured = {}
+    try:
+        with mock.patch.object(APIView, 'throttle_classes', ()):
+            for endpoint in discover_endpoints():
+                if endpoint.detail or endpoint.method != 'get' or not endpoint.name.endswith('.list'):
+                    continue
+                if only and not any(endpoint.name.startswith(name) for name in only):
+                    continue
+                for role, user in users.items():
+                    url, _payload = build_request(endpoint, user)
+                    client.force_authenticate(user=user)
+                    recorder = PlanCapture()
+                    with transaction.atomic(), recorder.patch():
+                        response = client.get(url)
+                    audit_writer.flush()
+                    plans, seen = [], set()
+                    for sql, params in recorder.statements:
+                        if sql in seen:
+                            continue
+                        seen.add(sql)
+                        plans.append((sql, explain(sql, params, indexes)))
+                    # Lookups made while serializing run in an order that depends on the data.
+                    plans.sort(key=lambda plan: plan[0])
+                    key = f'{endpoint.name} as {role}'
+                    captured[key] = {
+                        'endpoint': endpoint.name, 'role': str(role), 'status': response.status_code, 'plans': plans,
+                    }
+                    if on_plan:
+                        on_plan(key, captured[key])
+    finally:
+        request_logger.setLevel(level)
+    return captured
+
+
+def render(captured):
+    """
+    Render captured plans as the text stored in the snapshot file.
+    """
+    sections = [f'# {engine_version()}']
+    for key, entry in captured.items():
+        lines = [f"## {key} [{entry['status']}]"]
+        for number, (sql, plan) in enumerate(entry['plans'], 1):
+            table = re.search(r'\bFROM "?(\w+)', sql)
+            lines.append(f"query {number} (from {table.group(1) if table else '?'}):")
+            lines.extend('  ' + line for line in plan)
+        sections.append('\n'.join(lines))
+    return '\n\n'.join(sections) + '\n'
+
+
+def check(captured):
+    """
+    Return the list of rule violations in captured plans.
+    """
+    problems = []
+    for key, entry in captured.items():
+        lines = [line for _sql, plan in entry['plans'] for line in plan]
+        for table in sorted(seq_scans(lines) & LARGE_TABLES):
+            if (entry['endpoint'], entry['role'], table) not in ALLOWED_SEQ_SCANS:
+                problems.append(f'{key}: sequential scan of {table}')
+        text = '\n'.join(lines)
+        for index in EXPECTED_INDEXES.get((entry['endpoint'], entry['role']), ()):
+            table, column = re.match(r'(\w+)\((\w+)\)', index).groups()
+            if not re.search(rf'\b{table}\({column}[,)]', text):
+                problems.append(f'{key}: does not use an index on {index}')
+    return problems
+
+
+def diff(expected, actual):
+    """
+    Return a unified diff between two rendered snapshots, or ''.
+    """
+    return ''.join(difflib.unified_diff(
+        expected.splitlines(keepends=True), actual.splitlines(keepends=True), 'expected', 'actual'
+    ))
@@ -0,0 +1,300 @@
+"""
+Bank and mobile money statement reconciliation.
+
+`read_statement(path)` reads a statement file, either CSV (amount and date
+columns, optionally reference, loan_reference and description) or
+MT940-like text (a :61: line per transaction, with an optional :86:
+narrative). Only credits are kept. `reconcile(lines)` matches the lines
+against Payment rows in two passes:
+
+1. on exact reference: a line whose reference is a payment's
+   payment_reference is matched to it. If the amount differs, the payment
+   date is outside the window, or the payment was already matched, the
+   line is suspect instead;
+2. on amount, date and loan: a line that names a loan (its loan_reference,
+   or a loan reference found in its reference or description) is matched
+   to that loan's payment of the same amount, not matched yet, whose date
+   is closest to the line's and at most RECONCILIATION_WINDOW_DAYS away.
+   Two payments equally close make the line suspect.
+
+Payments are loaded once for the statement's date range widened by the
+window, into hash indexes by reference and by (loan, amount in cents), so
+the statement's lines cost no queries; only references not found in the
+range are looked up, a thousand at a time. Lines left over are unmatched, and so
+are the payments dated within the statement that no line matched.
+`write_reports` writes the matched, suspect and unmatched reports as CSV
+files; `manage.py reconcile_statement` does all of it from the command line.
+"""
+import csv
+import os
+import re
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+
+from loans.models import Payment
+
+
+Line = namedtuple('Line', ['number', 'reference', 'cents', 'value_date', 'loan_reference', 'description'])
+Statement = namedtuple('Statement', ['lines', 'skipped'])
+Entry = namedtuple('Entry', ['pk', 'reference', 'cents', 'payment_date', 'method', 'loan_id', 'loan_reference'])
+Result = namedtuple('Result', ['matched', 'suspect', 'unmatched', 'missing'])
+
+BY_REFERENCE = 'reference'
+BY_AMOUNT = 'amount+date+loan'
+
+# References per query when looking up references outside the date range.
+LOOKUP_BATCH_SIZE = 1000
+
+TOKEN = re.compile(r'[A-Z0-9][A-Z0-9-]+')
+MT940_TRANSACTION = re.compile(
+    r':61:(?P<value_date>\d{6})(?:\d{4})?(?P<mark>R?[CD])[A-Z]?(?P<amount>\d+(?:,\d{0,2})?)'
+    r'[NSF][A-Z0-9]{3}(?P<reference>[^/\s]*)'
+)
+
+
+def window_days():
+    return int(getattr(settings, 'RECONCILIATION_WINDOW_DAYS', 3))
+
+
+def to_cents(value):
+    """
+    An amount as written in a statement in cents, or ValueError.
+    """
+    value = value.strip()
+    if ',' in value:  # a decimal comma, or thousands separators
+        value = value.replace(',', '' if '.' in value else '.')
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f'invalid amount {value!r}')
+    return int((amount * 100).to_integral_value())
+
+
+def read_csv(f):
+    """
+    Statement lines of a CSV file with amount and date columns, and
+    optionally reference, loan_reference and description.
+    """
+    reader = csv.DictReader(f)
+    missing = {'amount', 'date'} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    lines, skipped = [], 0
+    for number, row in enumerate(reader, start=2):
+        try:
+            cents = to_cents(row['amount'])
+            value_date = date.fromisoformat(row['date'].strip())
+        except (ValueError, AttributeError):
+            skipped += 1
+            continue
+        if cents <= 0:  # debits
+            skipped += 1
+            continue
+        lines.append(Line(number, (row.get('reference') or '').strip(), cents, value_date,
+                          (row.get('loan_reference') or '').strip(), (row.get('description') or '').strip()))
+    return Statement(lines, skipped)
+
+
+def read_mt940(f):
+    """
+    Statement lines of MT940-like text: the credits among its :61: lines,
+    each with the :86: narrative that follows it as description.
+    """
+    lines, skipped = [], 0
+    current, narrative = None, None
+
+    def flush():
+        nonlocal current, narrative
+        if current:
+            lines.append(current._replace(description=' '.join(narrative or ())))
+        current, narrative = None, None
+
+    for number, text in enumerate(f, start=1):
+        text = text.rstrip('\r\n')
+        if text.startswith(':61:'):
+            flush()
+            match = MT940_TRANSACTION.match(text)
+            if not match or not match['mark'].endswith('C'):
+                skipped += 1
+                continue
+            try:
+                value_date = date(2000 + int(text[4:6]), int(text[6:8]), int(text[8:10]))
+            except ValueError:
+                skipped += 1
+                continue
+            reference = match['reference']
+            current = Line(number, '' if reference == 'NONREF' else reference, to_cents(match['amount']), value_date,
+                           '', '')
+        elif text.startswith(':86:') and current:
+            narrative = [text[4:].strip()]
+        elif text.startswith(':'):
+            flush()
+        elif narrative is not None:
+            narrative.append(text.strip())
+    flush()
+    return Statement(lines, skipped)
+
+
+def read_statement(path, format=None):
+    """
+    Read a statement file as CSV or MT940-like text, by `format` or else by
+    its contents.
+    """
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if format is None:
+            head = f.read(4096)
+            f.seek(0)
+            format = 'mt940' if re.search(r'^:(20|25|60F|61):', head, re.MULTILINE) else 'csv'
+        return read_mt940(f) if format == 'mt940' else read_csv(f)
+
+
+def load_entries(payments):
+    """
+    Payments of a queryset as Entries.
+    """
+    return [
+        Entry(pk, reference, int((amount * 100).to_integral_value()), payment_date, method, loan_id, loan_reference)
+        for pk, reference, amount, payment_date, method, loan_id, loan_reference in payments.order_by().values_list(
+            'pk', 'payment_reference', 'amount', 'payment_date', 'payment_method', 'loan_id', 'loan__loan_reference'
+        ).iterator(chunk_size=10000)
+    ]
+
+
+def reconcile(lines, window=None, methods=None):
+    """
+    Match statement lines against payments. Return a Result of matched
+    (line, entry, rule), suspect (line, entry or None, reason) and unmatched
+    lines, and the missing entries: payments dated within the statement that
+    no line matched.
+    """
+    window = window_days() if window is None else window
+    if not lines:
+        return Result([], [], [], [])
+    first = min(line.value_date for line in lines)
+    last = max(line.value_date for line in lines)
+    payments = Payment.objects.filter(payment_date__range=(first - timedelta(days=window),
+                                                           last + timedelta(days=window)))
+    if methods:
+        payments = payments.filter(payment_method__in=methods)
+    entries = load_entries(payments)
+
+    by_reference = {entry.reference: entry for entry in entries}
+    # References the statement quotes that are not in the range; these are
+    # looked up in batches, never line by line.
+    unknown = sorted({line.reference for line in lines if line.reference and line.reference not in by_reference})
+    outside = {}
+    for start in range(0, len(unknown), LOOKUP_BATCH_SIZE):
+        outside.update((entry.reference, entry) for entry in load_entries(
+            Payment.objects.filter(payment_reference__in=unknown[start:start + LOOKUP_BATCH_SIZE])
+        ))
+
+    matched, suspect, rest = [], [], []
+    used = set()
+    for line in lines:
+        entry = by_reference.get(line.reference) if line.reference else None
+        if entry is None and line.reference in outside:
+            entry = outside[line.reference]
+            if entry.pk in used:
+                suspect.append((line, entry, 'payment already matched'))
+            else:
+                used.add(entry.pk)
+                suspect.append((line, entry, 'payment method differs' if methods and entry.method not in methods
+                                else 'date outside window'))
+        elif entry is None:
+            rest.append(line)
+        elif entry.pk in used:
+            suspect.append((line, entry, 'payment already matched'))
+        else:
+            used.add(entry.pk)
+            if entry.cents != line.cents:
+                suspect.append((line, entry, 'amount differs'))
+            elif abs((entry.payment_date - line.value_date).days) > window:
+                suspect.append((line, entry, 'date outside window'))
+            else:
+                matched.append((line, entry, BY_REFERENCE))
+
+    by_amount = defaultdict(list)
+    loans = {}
+    for entry in entries:
+        if entry.pk not in used:
+            by_amount[entry.loan_id, entry.cents].append(entry)
+        loans[entry.loan_reference] = entry.loan_id
+    unmatched = []
+    for line in rest:
+        if line.loan_reference:
+            loan_ids = {loans[line.loan_reference]} if line.loan_reference in loans else set()
+        else:
+            loan_ids = {loans[token] for token in TOKEN.findall(f'{line.reference} {line.description}'.upper())
+                        if token in loans}
+        candidates = sorted(
+            (abs((entry.payment_date - line.value_date).days), entry.pk, entry)
+            for loan_id in loan_ids for entry in by_amount.get((loan_id, line.cents), ())
+            if entry.pk not in used and abs((entry.payment_date - line.value_date).days) <= window
+        )
+        if not candidates:
+            unmatched.append(line)
+        elif len(candidates) > 1 and candidates[0][0] == candidates[1][0]:
+            suspect.append((line, candidates[0][2], 'several payments match'))
+        else:
+            used.add(candidates[0][1])
+            matched.append((line, candidates[0][2], BY_AMOUNT))
+
+    missing = [entry for entry in entries if entry.pk not in used and first <= entry.payment_date <= last]
+    return Result(matched, suspect, unmatched, missing)
+
+
+def summary(statement, result):
+    return {
+        'lines': len(statement.lines),
+        'skipped': statement.skipped,
+        'matched': len(result.matched),
+        'matched by reference': sum(1 for _, _, rule in result.matched if rule == BY_REFERENCE),
+        'matched amount': amount(sum(line.cents for line, _, _ in result.matched)),
+        'suspect': len(result.suspect),
+        'unmatched lines': len(result.unmatched),
+        'unmatched payments': len(result.missing),
+    }
+
+
+def amount(cents):
+    return str(Decimal(cents).scaleb(-2))
+
+
+def write_reports(result, directory, stem):
+    """
+    Write the matched, suspect and unmatched reports as
+    `<stem>.<report>.csv` in `directory`; return their paths.
+    """
+    line_columns = ['line', 'reference', 'amount', 'value_date', 'loan_reference']
+    payment_columns = ['payment_reference', 'payment_amount', 'payment_date', 'payment_method', 'payment_loan']
+
+    def line_row(line):
+        return [line.number, line.reference, amount(line.cents), line.value_date, line.loan_reference]
+
+    def entry_row(entry):
+        if entry is None:
+            return [''] * len(payment_columns)
+        return [entry.reference, amount(entry.cents), entry.payment_date, entry.method, entry.loan_reference]
+
+    reports = {
+        'matched': (line_columns + payment_columns + ['rule'],
+                    (line_row(line) + entry_row(entry) + [rule] for line, entry, rule in result.matched)),
+        'suspect': (line_columns + payment_columns + ['reason'],
+                    (line_row(line) + entry_row(entry) + [reason] for line, entry, reason in result.suspect)),
+        'unmatched': (['side'] + line_columns + payment_columns, (
+            *(['statement'] + line_row(line) + entry_row(None) for line in result.unmatched),
+            *(['payments'] + [''] * len(line_columns) + entry_row(entry) for entry in result.missing),
+        )),
+    }
+    paths = []
+    for report, (columns, rows) in reports.items():
+        path = os.path.join(directory, f'{stem}.{report}.csv')
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        paths.append(path)
+    return paths
@@ -0,0 +1,166 @@
+"""
+Collision-free, human-friendly reference numbers.
+
+References look like ``LN-NAIR-261019-0000AE7O`` /
+``PMT-NAIR-261019-0000ZJ90``:
+
+    <prefix>-<branch>-<YYMMDD>-<sequence><check>
+
+- the sequence is a 7 character base-36 number drawn from a database
+  sequence, so references are unique by construction rather than by luck;
+- the branch code and date make the reference readable to staff;
+- the last character is a Luhn mod 36 check character over branch, date
+  and sequence, which catches single-character typos and most
+  transpositions when references are keyed in by hand.
+
+Each worker process reserves ids in blocks (REFERENCE_BLOCK_SIZE) so that
+issuing a reference normally costs no database round trip at all. Ids left
+unused when a worker exits are simply skipped; gaps are harmless.
+
+On PostgreSQL every allocator is backed by a sequence named
+``core_reference_<name>_seq``, created by a migration.
+"""
+import os
+import re
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import ProgrammingError, connection, transaction
+from django.utils import timezone
+
+from .models import ReferenceSequence
+
+
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+SEQUENCE_WIDTH = 7
+DEFAULT_BRANCH_CODE = 'HQ'
+
+_reference_re = re.compile(r'^[A-Z]+-([0-9A-Z]{1,4})-(\d{6})-([0-9A-Z]{%d})([0-9A-Z])$' % SEQUENCE_WIDTH)
+
+
+def to_base36(value, width=SEQUENCE_WIDTH):
+    digits = []
+    while value:
+        value, remainder = divmod(value, 36)
+        digits.append(ALPHABET[remainder])
+    return ''.join(reversed(digits)).rjust(width, '0')
+
+
+def check_character(body):
+    """
+    Return the Luhn mod 36 check character for `body`.
+    """
+    total, factor = 0, 2
+    for char in reversed(body):
+        code = ALPHABET.index(char) * factor
+        total += code // 36 + code % 36
+        factor = 1 if factor == 2 else 2
+    return ALPHABET[(36 - total % 36) % 36]
+
+
+def is_valid_reference(reference):
+    """
+    Check the format and check character of a reference.
+    """
+    match = _reference_re.match(reference or '')
+    if not match:
+        return False
+    branch, day, sequence, check = match.groups()
+    return check_character(branch + day + sequence) == check
+
+
+def branch_code(branch):
+    """
+    Derive a short upper-case branch code from a free-text branch name.
+    """
+    code = re.sub(r'[^0-9A-Z]', '', (branch or '').upper())[:4]
+    return code or DEFAULT_BRANCH_CODE
+
+
+def sequence_name(name):
+    return f'core_reference_{name}_seq'
+
+
+class ReferenceAllocator:
+    """
+    Hands out references for one sequence, reserving ids in blocks.
+
+    Instances are module level singletons and are safe to share between
+    threads; a forked worker discards blocks inherited from its parent.
+    """
+
+    def __init__(self, name, prefix):
+        self.name = name
+        self.prefix = prefix
+        self._ids = deque()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @property
+    def block_size(self):
+        return getattr(settings, 'REFERENCE_BLOCK_SIZE', 50)
+
+    def format(self, value, branch=None, on=None):
+        day = (on or timezone.localdate()).strftime('%y%m%d')
+        body = f'{branch_code(branch)}-{day}-{to_base36(value)}'
+        return f'{self.prefix}-{body}{check_character(body.replace("-", ""))}'
+
+    def next(self, branch=None, on=None):
+        """
+        Return a single new reference.
+        """
+        return self.take(1, branch=branch, on=on)[0]
+
+    def take(self, count, branch=None, on=None):
+        """
+        Return `count` new references; used by bulk imports to number a whole
+        batch with at most one database round trip.
+        """
+        return [self.format(value, branch=branch, on=on) for value in self.reserve(count)]
+
+    def reserve(self, count):
+        """
+        Return `count` unused sequence values, to be passed to format() when
+        each reference needs its own branch or date.
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                self._ids.clear()
+                self._pid = os.getpid()
+            if len(self._ids) < count:
+                self._ids.extend(self._reserve(max(count - len(self._ids), self.block_size)))
+            return [self._ids.popleft() for _ in range(count)]
+
+    def _reserve(self, count):
+        if connection.vendor == 'postgresql':
+            return self._reserve_from_sequence(count)
+        return self._reserve_from_table(count)
+
+    def _reserve_from_sequence(self, count):
+        # nextval() is not transactional, so reserved ids are never handed
+        # out twice even if the surrounding transaction rolls back.
+        sequence = sequence_name(self.name)
+        with connection.cursor() as cursor:
+            try:
+                with transaction.atomic():
+                    cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [sequence, count])
+            except ProgrammingError:
+                # Databases built without migrations (e.g. pytest --no-migrations)
+                # lack the sequence; create it on first use.
+                cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {sequence}')
+                cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [sequence, count])
+            return [row[0] for row in cursor.fetchall()]
+
+    def _reserve_from_table(self, count):
+        # Fallback for databases without sequences (development and tests).
+        with transaction.atomic():
+            sequence, _ = ReferenceSequence.objects.select_for_update().get_or_create(name=self.name)
+            start = sequence.next_value
+            sequence.next_value = start + count
+            sequence.save(update_fields=['next_value'])
+        return range(start, start + count)
+
+
+loan_references = ReferenceAllocator('loan', 'LN')
+payment_references = ReferenceAllocator('payment', 'PMT')
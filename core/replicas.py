@@ -0,0 +1,159 @@
+"""
+Read replica routing.
+
+Reads are sent to a replica only inside `use_replica()`, which the replica
+middleware enters for safe-method requests and which reporting jobs can
+enter themselves; everything else, and every write, goes to the primary.
+Within a replica block:
+
+* one healthy replica is picked and used for all reads of the block;
+* a replica whose replication lag exceeds REPLICA_MAX_LAG_SECONDS, or that
+  cannot be reached, is skipped until its next lag check; with none left
+  reads fall back to the primary;
+* reads inside a transaction on the primary stay on the primary, so code
+  that writes and then reads sees its own writes.
+
+Users who just wrote are "sticky": their requests read from the primary for
+REPLICA_STICKY_SECONDS, so a list fetched right after a create shows the new
+row even if the replicas have not caught up yet.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger('repaysync.replicas')
+
+# Alias reads are routed to; None means the primary.
+_read_alias = contextvars.ContextVar('replica_read_alias', default=None)
+
+_lag_lock = threading.Lock()
+_lag_checked = {}
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def replica_lag(alias):
+    """
+    Seconds the replica is behind the primary (0 when it is not a standby).
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN NOT pg_is_in_recovery() "
+            "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        return float(cursor.fetchone()[0])
+
+
+def healthy_replicas():
+    """
+    Replicas within the lag limit, re-checked every REPLICA_LAG_CHECK_SECONDS.
+    """
+    interval = getattr(settings, 'REPLICA_LAG_CHECK_SECONDS', 5)
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 10)
+    now = time.monotonic()
+    healthy = []
+    for alias in replica_aliases():
+        checked = _lag_checked.get(alias)
+        if checked is None or now - checked[0] >= interval:
+            with _lag_lock:
+                checked = _lag_checked.get(alias)
+                if checked is None or now - checked[0] >= interval:
+                    try:
+                        lag = replica_lag(alias)
+                    except DatabaseError:
+                        logger.warning('Replica %s is unreachable; reading from the primary', alias, exc_info=True)
+                        lag = None
+                    if lag is not None and lag > max_lag:
+                        logger.warning('Replica %s is %.1fs behind; reading from the primary', alias, lag)
+                    checked = _lag_checked[alias] = (now, lag)
+        lag = checked[1]
+        if lag is not None and lag <= max_lag:
+            healthy.append(alias)
+    return healthy
+
+
+def reset_lag_checks():
+    _lag_checked.clear()
+
+
+def choose_replica():
+    """
+    Pick a healthy replica at random, or None for the primary.
+    """
+    healthy = healthy_replicas()
+    return random.choice(healthy) if healthy else None
+
+
+@contextmanager
+def use_replica(alias=None):
+    """
+    Route the reads of the block to `alias`, or to a healthy replica if
+    there is one.
+    """
+    token = _read_alias.set(alias or choose_replica())
+    try:
+        yield _read_alias.get()
+    finally:
+        _read_alias.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """
+    Route the reads of the block to the primary.
+    """
+    token = _read_alias.set(None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _sticky_key(user_id):
+    return f'replicas:sticky:{user_id}'
+
+
+def mark_sticky(user_id):
+    """
+    Read from the primary for this user for the next REPLICA_STICKY_SECONDS.
+    """
+    seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+    if user_id is not None and seconds:
+        cache.set(_sticky_key(user_id), True, seconds)
+
+
+def is_sticky(user_id):
+    return user_id is not None and cache.get(_sticky_key(user_id), False)
+
+
+class ReplicaRouter:
+    """
+    Database router sending reads to the replica chosen for the current block.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _read_alias.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
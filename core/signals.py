@@ -0,0 +1,261 @@
+"""
+Signal handlers that keep the delta sync bookkeeping up to date.
+
+A row leaves a user's sync scope when it is deleted, or when a change takes
+it out of the rules in api.scopes: a customer or loan moves to another
+officer, a customer is deactivated, a loan leaves the statuses calling
+agents work on, a follow-up is handed to someone else, or an officer stops
+reporting to a manager. Each change names the users who may have lost rows;
+the scope functions then decide which of the affected rows each of them can
+no longer see, and those are tombstoned for that user.
+"""
+from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api.scopes import (
+    CALLING_AGENT_LOAN_STATUSES,
+    scope_customers,
+    scope_loans,
+    scope_payments,
+    scope_interactions,
+    scope_follow_ups,
+)
+from customers.models import Customer
+from loans.models import Loan, Payment
+from interactions.models import Interaction, FollowUp
+from users.models import User, Hierarchy
+
+from .models import Tombstone
+
+
+SCOPES = {
+    Customer: scope_customers,
+    Loan: scope_loans,
+    Payment: scope_payments,
+    Interaction: scope_interactions,
+    FollowUp: scope_follow_ups,
+}
+
+SYNCED_MODELS = tuple(SCOPES)
+
+# Fields whose change can take rows out of someone's scope.
+SCOPE_FIELDS = {
+    Customer: ('assigned_officer', 'is_active'),
+    Loan: ('assigned_officer', 'status'),
+    Hierarchy: ('manager', 'collection_officer'),
+}
+
+
+def remember_previous(sender, instance, update_fields=None, **kwargs):
+    """
+    Stash the stored values of the scope fields so post_save can tell what
+    changed.
+    """
+    instance._previous = None
+    fields = SCOPE_FIELDS[sender]
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    instance._previous = sender.objects.filter(pk=instance.pk).values(
+        *(sender._meta.get_field(field).attname for field in fields)
+    ).order_by('pk').first()
+
+
+def previous_values(instance):
+    return getattr(instance, '_previous', None) or {}
+
+
+def scope_tombstones(model, ids, users):
+    """
+    Tombstones for the rows of `model` among `ids` that each of `users` can
+    no longer see.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    tombstones = []
+    for user in users:
+        visible = set(SCOPES[model](model.objects.filter(pk__in=ids), user).values_list('pk', flat=True))
+        tombstones += [
+            Tombstone(model=model._meta.label_lower, object_id=pk, user=user, reason=Tombstone.Reason.REASSIGNED)
+            for pk in ids if pk not in visible
+        ]
+    return tombstones
+
+
+def role_tombstones(model, ids, role):
+    """
+    Tombstones for the rows of `model` among `ids` that users with `role` can
+    no longer see, for a role whose scope of `model` is the same for all of
+    its users: the scope is checked once and the result fanned out.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    users = list(User.objects.filter(role=role).only('pk', 'role'))
+    hidden = [tombstone.object_id for tombstone in scope_tombstones(model, ids, users[:1])]
+    return [
+        Tombstone(model=model._meta.label_lower, object_id=pk, user=user, reason=Tombstone.Reason.REASSIGNED)
+        for user in users for pk in hidden
+    ]
+
+
+def reassignment_tombstones(customer_ids, officer_id):
+    """
+    Tombstones for customers moved away from an officer, and for their loans,
+    payments, interactions and follow-ups, for the officer and the managers
+    they report to.
+    """
+    customer_ids = list(customer_ids)
+    rows = (
+        (Customer, customer_ids),
+        (Loan, Loan.objects.filter(customer_id__in=customer_ids).values_list('pk', flat=True)),
+        (Payment, Payment.objects.filter(loan__customer_id__in=customer_ids).values_list('pk', flat=True)),
+        (Interaction, Interaction.objects.filter(customer_id__in=customer_ids).values_list('pk', flat=True)),
+        (FollowUp, FollowUp.objects.filter(customer_id__in=customer_ids).values_list('pk', flat=True)),
+    )
+    users = list(User.objects.filter(
+        Q(pk=officer_id) | Q(managed_officers__collection_officer_id=officer_id)
+    ).distinct())
+    return [tombstone for model, ids in rows for tombstone in scope_tombstones(model, ids, users)]
+
+
+def status_tombstones(previous, status):
+    """
+    Tombstones for loans moved to `status` from the statuses in `previous`
+    ({loan id: status}) for the calling agents who no longer see them.
+    """
+    if status in CALLING_AGENT_LOAN_STATUSES:
+        return []
+    ids = [pk for pk, previous_status in previous.items() if previous_status in CALLING_AGENT_LOAN_STATUSES]
+    return role_tombstones(Loan, ids, User.Role.CALLING_AGENT)
+
+
+@receiver(post_save, sender=Customer)
+def record_reassignment(sender, instance, created, **kwargs):
+    """
+    When a customer moves to another officer, tombstone it and its dependents
+    for the previous officer and their managers, and bump the dependents so
+    they reach the new officer's delta.
+    """
+    previous_officer_id = previous_values(instance).get('assigned_officer_id')
+    if created or previous_officer_id is None or previous_officer_id == instance.assigned_officer_id:
+        return
+
+    Tombstone.objects.bulk_create(reassignment_tombstones([instance.pk], previous_officer_id))
+
+    now = timezone.now()
+    Loan.objects.filter(customer=instance).update(updated_at=now)
+    Payment.objects.filter(loan__customer=instance).update(updated_at=now)
+    Interaction.objects.filter(customer=instance).update(updated_at=now)
+    FollowUp.objects.filter(customer=instance).update(updated_at=now)
+
+
+@receiver(post_save, sender=Customer)
+def record_deactivation(sender, instance, created, **kwargs):
+    """
+    Tombstone a deactivated customer for the calling agents.
+    """
+    if not created and previous_values(instance).get('is_active') and not instance.is_active:
+        Tombstone.objects.bulk_create(role_tombstones(Customer, [instance.pk], User.Role.CALLING_AGENT))
+
+
+@receiver(post_save, sender=Loan)
+def record_loan_reassignment(sender, instance, created, **kwargs):
+    """
+    When a loan moves to another officer, tombstone it and its payments for
+    the previous officer and bump the payments so they reach the new
+    officer's delta.
+    """
+    previous_officer_id = previous_values(instance).get('assigned_officer_id')
+    if created or previous_officer_id is None or previous_officer_id == instance.assigned_officer_id:
+        return
+
+    payment_ids = Payment.objects.filter(loan=instance).values_list('pk', flat=True)
+    officer = User.objects.filter(pk=previous_officer_id)
+    Tombstone.objects.bulk_create(
+        scope_tombstones(Loan, [instance.pk], officer) + scope_tombstones(Payment, payment_ids, officer)
+    )
+    Payment.objects.filter(loan=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Loan)
+def record_status_change(sender, instance, created, **kwargs):
+    """
+    Tombstone a loan that left the calling agents' statuses for them.
+    """
+    previous = previous_values(instance)
+    if not created and 'status' in previous:
+        Tombstone.objects.bulk_create(status_tombstones({instance.pk: previous['status']}, instance.status))
+
+
+@receiver(post_save, sender=FollowUp)
+def record_handover(sender, instance, created, **kwargs):
+    """
+    Tombstone a follow-up handed to someone else for its previous assignee.
+    """
+    # core.events stashes the state the follow-up was loaded with.
+    previous_assignee_id = (getattr(instance, '_previous_state', None) or {}).get('assigned_to_id')
+    if created or previous_assignee_id is None or previous_assignee_id == instance.assigned_to_id:
+        return
+    Tombstone.objects.bulk_create(
+        scope_tombstones(FollowUp, [instance.pk], User.objects.filter(pk=previous_assignee_id))
+    )
+
+
+def team_tombstones(manager_id, officer_id):
+    """
+    Tombstones for an officer's customers for a manager they stopped
+    reporting to.
+    """
+    customer_ids = Customer.objects.filter(assigned_officer_id=officer_id).values_list('pk', flat=True)
+    return scope_tombstones(Customer, customer_ids, User.objects.filter(pk=manager_id))
+
+
+@receiver(post_save, sender=Hierarchy)
+def record_team_change(sender, instance, created, **kwargs):
+    """
+    When an officer moves to another manager's team, tombstone their
+    customers for the previous manager and bump them so they reach the new
+    manager's delta.
+    """
+    previous = previous_values(instance)
+    moved = previous and (previous['manager_id'], previous['collection_officer_id']) != (
+        instance.manager_id, instance.collection_officer_id
+    )
+    if moved:
+        Tombstone.objects.bulk_create(team_tombstones(previous['manager_id'], previous['collection_officer_id']))
+    if created or moved:
+        Customer.objects.filter(assigned_officer_id=instance.collection_officer_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Hierarchy)
+def record_team_removal(sender, instance, origin=None, **kwargs):
+    """
+    Tombstone an officer's customers for the manager they no longer report to.
+    """
+    # Deleting the manager or the officer takes their tombstones with them.
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    Tombstone.objects.bulk_create(team_tombstones(instance.manager_id, instance.collection_officer_id))
+
+
+def record_deletion(sender, instance, **kwargs):
+    """
+    Tombstone a deleted row for every user.
+    """
+    Tombstone.objects.create(
+        model=sender._meta.label_lower,
+        object_id=instance.pk,
+        reason=Tombstone.Reason.DELETED,
+    )
+
+
+for model in SCOPE_FIELDS:
+    pre_save.connect(remember_previous, sender=model, dispatch_uid=f'sync-previous-{model._meta.label_lower}')
+
+for model in SYNCED_MODELS:
+    post_delete.connect(record_deletion, sender=model, dispatch_uid=f'sync-tombstone-{model._meta.label_lower}')
@@ -0,0 +1,254 @@
+"""
+Slow-query recorder.
+
+`record_slow_queries` is installed as an execute wrapper on every database
+connection (see CoreConfig.ready). Statements slower than
+SLOW_QUERY_THRESHOLD_MS are logged to the `repaysync.slow_queries` logger
+and folded into a SlowQuery row keyed by a fingerprint of the normalized
+SQL, together with where they came from:
+
+- the DRF view action that was running,
+- the innermost serializer field/method or permission class on the stack,
+- a trimmed stack of project frames.
+
+For a SLOW_QUERY_EXPLAIN_RATE fraction of slow SELECTs on PostgreSQL the
+statement is re-run under EXPLAIN (ANALYZE, BUFFERS) and the plan stored.
+Browse the results with `python manage.py slow_queries`.
+
+Only the attribution happens on the calling thread; rows are saved (and
+plans captured) by a background writer. executemany() batches (bulk writes)
+are not recorded.
+"""
+import hashlib
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.fields import Field
+from rest_framework.permissions import BasePermission
+from rest_framework.serializers import BaseSerializer
+from rest_framework.views import APIView
+
+from .models import SlowQuery
+
+
+logger = logging.getLogger('repaysync.slow_queries')
+
+STACK_DEPTH = 12
+
+_state = threading.local()
+
+_string_re = re.compile(r"'(?:[^']|'')*'")
+_number_re = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_in_list_re = re.compile(r'\bIN\s*\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)', re.IGNORECASE)
+_values_re = re.compile(r'(VALUES\s*\([^()]*\))(?:\s*,\s*\([^()]*\))+', re.IGNORECASE)
+_space_re = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+    Reduce a statement to its shape: literals become `?`, IN lists and
+    multi-row VALUES collapse, whitespace is squeezed.
+    """
+    sql = _string_re.sub('?', sql)
+    sql = _number_re.sub('?', sql)
+    sql = _in_list_re.sub('IN (...)', sql)
+    sql = _values_re.sub(r'\1, ...', sql)
+    return _space_re.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize_sql(sql).encode()).hexdigest()
+
+
+def attribute(frame):
+    """
+    Walk the stack from `frame` outwards and return (view, origin, stack).
+    """
+    base = str(settings.BASE_DIR)
+    this_file = os.path.abspath(__file__)
+    view = origin = ''
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        owner = frame.f_locals.get('self')
+        if owner is not None:
+            if isinstance(owner, APIView):
+                view = f'{type(owner).__name__}.{getattr(owner, "action", None) or code.co_name}'
+            elif not origin and isinstance(owner, BasePermission):
+                origin = f'{type(owner).__name__}.{code.co_name}'
+            elif not origin and isinstance(owner, BaseSerializer):
+                origin = f'{type(owner).__name__}.{code.co_name}'
+            elif not origin and isinstance(owner, Field) and owner.parent is not None:
+                origin = f'{type(owner.parent).__name__}.{owner.field_name}'
+        filename = code.co_filename
+        if filename.startswith(base) and 'site-packages' not in filename and filename != this_file \
+                and len(stack) < STACK_DEPTH:
+            stack.append(f'{os.path.relpath(filename, base)}:{frame.f_lineno} in {code.co_name}')
+        frame = frame.f_back
+    return view, origin, '\n'.join(reversed(stack))
+
+
+def explain(connection, sql, params):
+    if connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS)'
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN'
+    else:
+        return ''
+    with connection.cursor() as cursor:
+        cursor.execute(f'{prefix} {sql}', params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+SlowQueryEntry = namedtuple('SlowQueryEntry', [
+    'alias', 'sql', 'params', 'example', 'duration_ms', 'view', 'origin', 'stack', 'seen_at',
+])
+
+
+def save_entry(entry):
+    """
+    Fold one slow execution into its SlowQuery row, explaining a sample.
+    """
+    key = fingerprint(entry.sql)
+    values = {'example_sql': entry.example[:10000], 'last_seen': entry.seen_at}
+    if entry.view:
+        values['view'] = entry.view[:200]
+    if entry.origin:
+        values['origin'] = entry.origin[:200]
+    if entry.stack:
+        values['stack'] = entry.stack
+
+    queries = SlowQuery.objects.using(entry.alias)
+    updated = queries.filter(fingerprint=key).update(
+        count=F('count') + 1,
+        total_ms=F('total_ms') + entry.duration_ms,
+        max_ms=Greatest(F('max_ms'), entry.duration_ms),
+        **values
+    )
+    if not updated:
+        try:
+            with transaction.atomic(using=entry.alias):
+                queries.create(
+                    fingerprint=key, sql=normalize_sql(entry.sql), count=1,
+                    total_ms=entry.duration_ms, max_ms=entry.duration_ms, **values
+                )
+        except IntegrityError:
+            # Another worker recorded the same statement first.
+            return save_entry(entry)
+
+    rate = getattr(settings, 'SLOW_QUERY_EXPLAIN_RATE', 0)
+    if rate and entry.sql.split(None, 1)[0].upper() in {'SELECT', 'WITH'} and random.random() < rate:
+        try:
+            with transaction.atomic(using=entry.alias):
+                plan = explain(connections[entry.alias], entry.sql, entry.params)
+        except Exception:
+            logger.exception('Could not explain slow query %s', key[:8])
+        else:
+            queries.filter(fingerprint=key).update(explain=plan)
+
+
+class SlowQueryWriter:
+    """
+    Saves slow queries off the request path.
+
+    Entries are queued by the execute wrapper and saved by a background
+    thread on its own connection, so recording never adds a round trip to
+    the request and survives the request's transaction rolling back. With
+    SLOW_QUERY_BACKGROUND_WRITER = False entries wait until flush() is
+    called, which is what the test suite does.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1000)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, entry):
+        if getattr(settings, 'SLOW_QUERY_BACKGROUND_WRITER', True) and self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            pass
+
+    def flush(self):
+        _state.recording = True
+        try:
+            while True:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._save(entry)
+        finally:
+            _state.recording = False
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=1000)
+            threading.Thread(target=self._run, name='slow-query-writer', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        # Queries issued while saving must not be recorded themselves.
+        _state.recording = True
+        while True:
+            self._save(self._queue.get())
+            if self._queue.empty():
+                close_old_connections()
+
+    def _save(self, entry):
+        try:
+            save_entry(entry)
+        except Exception:
+            logger.exception('Could not record slow query')
+
+
+slow_query_writer = SlowQueryWriter()
+
+
+def record_slow_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper that records statements over SLOW_QUERY_THRESHOLD_MS.
+    """
+    threshold = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', None)
+    if threshold is None or getattr(_state, 'recording', False):
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - started) * 1000
+    if duration_ms >= threshold and not many:
+        connection = context['connection']
+        try:
+            example = connection.ops.last_executed_query(context['cursor'], sql, params)
+        except Exception:
+            example = f'{sql} -- params: {params!r}'
+        view, origin, stack = attribute(sys._getframe(1))
+        logger.warning('Slow query (%.0f ms) [%s] in %s %s', duration_ms, example[:500], view, origin)
+        slow_query_writer.submit(SlowQueryEntry(
+            connection.alias, sql, params, example, duration_ms, view, origin, stack, timezone.now()
+        ))
+    return result
+
+
+def install(connection, **kwargs):
+    """
+    connection_created receiver adding the recorder to a connection once.
+    """
+    if record_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_slow_queries)
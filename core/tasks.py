@@ -0,0 +1,11 @@
+from celery import shared_task
+
+from . import jobs
+
+
+@shared_task(bind=True, acks_late=True, ignore_result=True, max_retries=None)
+def run_job(self, job_id):
+    """
+    Run a Job from its checkpoint; core.jobs counts and limits the retries.
+    """
+    jobs.run(self, job_id)
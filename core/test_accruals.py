@@ -0,0 +1,134 @@
+"""
+Tests for the nightly interest and penalty accrual.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from customers.models import Customer
+from loans.models import LedgerEntry, Loan
+from users.models import User
+
+from . import jobs, ledger
+from .accruals import Columns, FIELDS, accrue
+from .models import Job
+
+
+@override_settings(LOAN_PENALTY_RATE=24)
+class AccrualTestCase(TestCase):
+    """Test case for accruing interest and penalties."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='boss', email='boss@example.com', password='password123', role=User.Role.SUPER_MANAGER
+        )
+        self.customer = Customer.objects.create(
+            first_name='Jane', last_name='Doe', primary_phone='+1234567890', created_by=self.user
+        )
+        # 1200.00 at 12% over 12 months: 144.00 of interest over 366 days
+        # and 12 monthly installments of 112.00 from 1 February.
+        self.loan = self.create('LN-1', Loan.Status.ACTIVE)
+        self.create('LN-2', Loan.Status.PAID)
+
+    def create(self, reference, status, **kwargs):
+        return Loan.objects.create(**{
+            'customer': self.customer, 'loan_reference': reference, 'status': status,
+            'principal_amount': Decimal('1200.00'), 'interest_rate': Decimal('12.00'), 'term_months': 12,
+            'disbursement_date': date(2024, 1, 1), 'first_payment_date': date(2024, 2, 1), **kwargs,
+        })
+
+    def accrued(self, entry_type):
+        return list(self.loan.ledger_entries.filter(entry_type=entry_type, reference='accrual').values_list(
+            'value_date', 'amount'
+        ))
+
+    def test_accrue(self):
+        """Test daily interest, penalties from the day after a missed installment, and catching up."""
+        summary = accrue(date(2024, 1, 31))
+        self.assertEqual(summary, {'business_date': '2024-01-31', 'loans': 1, 'interest': '0.40', 'penalties': '0.00'})
+        # Opened with the interest of the 29 days before.
+        self.assertEqual(list(self.loan.ledger_entries.values_list('entry_type', 'amount', 'value_date')), [
+            ('DISBURSEMENT', Decimal('1200.00'), date(2024, 1, 1)),
+            ('INTEREST', Decimal('11.40'), date(2024, 1, 30)),
+            ('INTEREST', Decimal('0.40'), date(2024, 1, 31)),
+        ])
+        self.assertEqual(accrue(date(2024, 1, 31))['loans'], 0)
+
+        # Two nights missed; 112.00 overdue from 2 February costs 0.07 a day.
+        self.assertEqual(accrue(date(2024, 2, 3))['penalties'], '0.14')
+        self.assertEqual(self.accrued('PENALTY'), [(date(2024, 2, 3), Decimal('0.14'))])
+        self.assertEqual(sum(amount for _, amount in self.accrued('INTEREST')),
+                         self.loan.interest_accrued(date(2024, 2, 3)))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.accrued_through, date(2024, 2, 3))
+
+        # Paid up: no more penalties; interest stops at the end of the term.
+        self.loan.payments.create(payment_reference='P-1', amount=Decimal('112.00'), payment_date=date(2024, 2, 3))
+        self.assertEqual(accrue(date(2024, 2, 4))['penalties'], '0.00')
+        accrue(date(2025, 6, 1))
+        penalties = Decimal('0.14') + self.penalties_after(date(2024, 2, 4))
+        self.assertEqual(ledger.balance(self.loan.pk, date(2025, 6, 1)), Decimal('1344.00') - Decimal('112.00') + penalties)
+
+    def penalties_after(self, day):
+        return sum(
+            (amount for value_date, amount in self.accrued('PENALTY') if value_date > day), Decimal('0.00')
+        )
+
+    def test_columns(self):
+        """Test that the integer columns agree with the loan's own schedule and interest."""
+        for number, (frequency, first) in enumerate([
+            ('MONTHLY', date(2024, 1, 31)), ('QUARTERLY', date(2024, 2, 29)), ('WEEKLY', date(2024, 1, 8)),
+            ('BIWEEKLY', date(2024, 1, 15)), ('DAILY', date(2024, 1, 2)), ('MONTHLY', None),
+        ]):
+            self.create(f'LN-{number + 3}', Loan.Status.ACTIVE, payment_frequency=frequency, first_payment_date=first,
+                        term_months=7)
+        loans = list(Loan.objects.order_by('pk'))
+        columns = Columns(Loan.objects.order_by('pk').values_list(*FIELDS))
+        day = date(2023, 12, 25)
+        while day < date(2024, 9, 30):
+            expected = [
+                0 if loan.first_payment_date is None else
+                sum(1 for n in range(loan.installment_count) if loan.installment_due_date(n) <= day)
+                for loan in loans
+            ]
+            self.assertEqual(columns.installments_due(day), expected, day)
+            self.assertEqual(columns.accrued_interest([day.toordinal()] * len(loans)),
+                             [int(loan.interest_accrued(day) * 100) for loan in loans])
+            day += timedelta(days=3)
+
+    @override_settings(LOAN_ACCRUAL_BATCH_SIZE=1)
+    def test_restart(self):
+        """Test that a run that fails part way posts each loan once when started again."""
+        self.create('LN-3', Loan.Status.DEFAULTED)
+        append = ledger.append
+        calls = []
+
+        def flaky(postings, last=None):
+            calls.append(postings)
+            if len(calls) == 4:
+                raise ConnectionError('database went away')
+            return append(postings, last)
+
+        with mock.patch('core.ledger.append', flaky), self.assertRaises(ConnectionError):
+            accrue(date(2024, 3, 1))
+        self.assertEqual(accrue(date(2024, 3, 1))['loans'], 1)
+        self.assertEqual(LedgerEntry.objects.filter(value_date=date(2024, 3, 1), entry_type='INTEREST').count(), 2)
+
+        out = StringIO()
+        call_command('accrue_interest', '--date=2024-03-01', stdout=out)
+        self.assertRegex(out.getvalue(), r'loans\s+0\n')
+
+    def test_job(self):
+        """Test that an accrual runs as a background job."""
+        with self.captureOnCommitCallbacks(execute=True):
+            job = jobs.submit('accrue_interest', jobs.get_kind('accrue_interest').clean_params(
+                {'business_date': '2024-01-31'}, self.user
+            ), self.user)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertEqual(job.result, {'business_date': '2024-01-31', 'loans': 1, 'interest': '0.40', 'penalties': '0.00'})
@@ -0,0 +1,154 @@
+"""
+Tests for the audit logging middleware and writer.
+"""
+import gzip
+import json
+import os
+import tempfile
+import time
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.test_views import TEST_DRF_SETTINGS
+from users.models import User
+
+from .audit import COLUMNS, AuditEntry, AuditWriter, REDACTED, audit_writer, decode_body
+from .bulk import copy_rows, copy_value
+from .models import AuditLog
+
+
+@override_settings(REST_FRAMEWORK=TEST_DRF_SETTINGS, AUDIT_LOG_ASYNC=False, AUDIT_LOG_SINK='database')
+class AuditLogMiddlewareTestCase(TestCase):
+    """Test case for requests captured by AuditLogMiddleware."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='officer',
+            email='officer@example.com',
+            password='password123',
+            role=User.Role.COLLECTION_OFFICER
+        )
+        self.client = APIClient()
+        # Requests made by other test modules are written asynchronously;
+        # wait for them and start from an empty table.
+        audit_writer.flush()
+        AuditLog.objects.all().delete()
+
+    def test_authenticated_request(self):
+        """Test that user, role, status and latency are recorded."""
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('customer-list'), {'search': 'doe'})
+
+        entry = AuditLog.objects.get()
+        self.assertEqual(entry.method, 'GET')
+        self.assertEqual(entry.path, reverse('customer-list'))
+        self.assertEqual(entry.query_string, 'search=doe')
+        self.assertEqual(entry.user_id, self.user.id)
+        self.assertEqual(entry.role, User.Role.COLLECTION_OFFICER)
+        self.assertEqual(entry.status_code, response.status_code)
+        self.assertGreater(entry.duration_ms, 0)
+
+    def test_bodies_are_redacted(self):
+        """Test that credentials and tokens never reach the audit table."""
+        response = self.client.post(
+            reverse('token_obtain_pair'),
+            {'email': 'officer@example.com', 'username': 'officer', 'password': 'password123'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        entry = AuditLog.objects.get()
+        self.assertEqual(entry.request_body['password'], REDACTED)
+        self.assertEqual(entry.response_body['access'], REDACTED)
+        self.assertEqual(entry.response_body['refresh'], REDACTED)
+        self.assertNotIn('password123', json.dumps(entry.request_body))
+
+    @override_settings(AUDIT_LOG_MAX_BODY_BYTES=10)
+    def test_large_bodies_recorded_by_size(self):
+        """Test that bodies over the limit are stored as their size only."""
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse('customer-list'), {'first_name': 'A' * 50}, format='json')
+
+        entry = AuditLog.objects.get()
+        self.assertTrue(entry.request_body['truncated'])
+        self.assertGreater(entry.request_body['size'], 50)
+
+    def test_paths_outside_prefixes_skipped(self):
+        """Test that non-API paths are not audited."""
+        self.client.get('/swagger.json')
+        self.assertFalse(AuditLog.objects.exists())
+
+    @override_settings(AUDIT_LOG_ENABLED=False)
+    def test_disabled(self):
+        """Test that nothing is recorded when audit logging is off."""
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse('customer-list'))
+        self.assertFalse(AuditLog.objects.exists())
+
+
+class AuditWriterTestCase(TestCase):
+    """Test case for the background writer and file sink."""
+
+    def make_entry(self, path='/api/customers/'):
+        return AuditEntry(
+            timestamp=time.time(), method='POST', path=path, query_string='',
+            user_id=1, username='officer', role='COLLECTION_OFFICER', remote_addr='127.0.0.1',
+            status_code=201, duration_ms=1.5,
+            request_content_type='application/x-www-form-urlencoded',
+            request_body=b'first_name=Jane&password=secret',
+            response_content_type='application/json', response_body=b'{"id": 1}',
+        )
+
+    def test_background_thread_writes_rotated_gzip_files(self):
+        """Test that queued entries are flushed to gzip files that rotate by size."""
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(AUDIT_LOG_SINK='file', AUDIT_LOG_DIR=directory,
+                                   AUDIT_LOG_ASYNC=True, AUDIT_LOG_FILE_MAX_BYTES=1):
+                writer = AuditWriter()
+                for index in range(3):
+                    writer.submit(self.make_entry(f'/api/customers/{index}/'))
+                    writer.flush()
+
+            files = sorted(os.listdir(directory))
+            rows = []
+            for name in files:
+                with gzip.open(os.path.join(directory, name), 'rt') as handle:
+                    rows.extend(json.loads(line) for line in handle)
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(files), 3)
+        self.assertEqual(rows[0]['request_body'], {'first_name': 'Jane', 'password': REDACTED})
+        self.assertEqual(rows[0]['response_body'], {'id': 1})
+
+    def test_unparseable_bodies(self):
+        """Test that non-JSON bodies are summarised instead of stored."""
+        self.assertEqual(
+            decode_body(b'\x89PNG', 'image/png', set()),
+            {'content_type': 'image/png', 'size': 4}
+        )
+
+
+class CopyRowsTestCase(TestCase):
+    """Test case for loading audit rows with COPY."""
+
+    def test_copy_values(self):
+        """Test that NULL is the only unquoted \\N, so empty strings stay strings."""
+        self.assertEqual(','.join(map(copy_value, [None, '', '\\N', 'say "hi"', 7, 1.5])),
+                         '\\N,"","\\N","say ""hi""",7,1.5')
+
+    def test_copy_nulls(self):
+        """Test that an anonymous request's row loads with NULLs and empty strings."""
+        if connection.vendor != 'postgresql':
+            self.skipTest('COPY is PostgreSQL only')
+        copy_rows(AuditLog, COLUMNS, [
+            [timezone.now(), 'GET', '/api/customers/', '', None, '', '', None, 401, 0.5, None, {'a': '\\N'}],
+        ])
+        log = AuditLog.objects.get()
+        self.assertEqual((log.user_id, log.username, log.remote_addr, log.request_body, log.response_body),
+                         (None, '', None, None, {'a': '\\N'}))
@@ -0,0 +1,132 @@
+"""
+Tests for the endpoint benchmark suite.
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from .benchmarks import discover_endpoints
+
+
+class DiscoverEndpointsTestCase(TestCase):
+    """Test case for listing the routed actions."""
+
+    def test_actions(self):
+        """Test that extra actions are listed and disallowed methods are not."""
+        names = {endpoint.name for endpoint in discover_endpoints()}
+        self.assertIn('LoanViewSet.approve', names)
+        self.assertIn('InteractionViewSet.create_follow_up', names)
+        self.assertIn('SyncView.get', names)
+        self.assertNotIn('InteractionViewSet.update', names)
+
+
+class BenchmarkEndpointsTestCase(TestCase):
+    """Test case for the benchmark_endpoints command."""
+
+    def setUp(self):
+        """Set up test data."""
+        call_command(
+            'generate_dataset', customers=12, prefix='bench', super_managers=1, managers=1,
+            officers_per_manager=2, agents=2, stdout=StringIO()
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.budgets = os.path.join(self.directory.name, 'budgets.json')
+        self.output = os.path.join(self.directory.name, 'results.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def benchmark(self, **options):
+        call_command(
+            'benchmark_endpoints', prefix='bench', iterations=2, budgets=self.budgets, output=self.output,
+            only=['CustomerViewSet.list', 'LoanViewSet.approve'], stdout=StringIO(), stderr=StringIO(), **options
+        )
+        with open(self.output) as f:
+            return json.load(f)
+
+    def test_results(self):
+        """Test that every role is measured and writes are rolled back."""
+        report = self.benchmark(update_budgets=True)
+
+        results = {(r['action'], r['role']): r for r in report['results']}
+        self.assertEqual(len(results), 8)
+        customers = results[('CustomerViewSet.list', 'SUPER_MANAGER')]
+        self.assertEqual(customers['status'], 200)
+        self.assertGreater(customers['queries'], 0)
+        self.assertGreater(customers['bytes'], 0)
+        self.assertEqual(results[('LoanViewSet.approve', 'CALLING_AGENT')]['status'], 404)
+        # The same pending loan could be approved on every iteration.
+        if 'skipped' not in results[('LoanViewSet.approve', 'SUPER_MANAGER')]:
+            self.assertEqual(results[('LoanViewSet.approve', 'SUPER_MANAGER')]['status'], 200)
+
+        with open(self.budgets) as f:
+            budgets = json.load(f)
+        self.assertEqual(budgets['dataset']['customers'], 12)
+        self.assertIn('MANAGER', budgets['budgets']['CustomerViewSet.list'])
+
+    def test_regressions(self):
+        """Test that exceeding a query budget fails the run."""
+        self.benchmark(update_budgets=True)
+        self.assertEqual(self.benchmark(no_latency=True)['regressions'], [])
+
+        with open(self.budgets) as f:
+            budgets = json.load(f)
+        budgets['budgets']['CustomerViewSet.list']['MANAGER']['queries'] = 0
+        with open(self.budgets, 'w') as f:
+            json.dump(budgets, f)
+
+        with self.assertRaises(CommandError):
+            self.benchmark(no_latency=True)
+        with open(self.output) as f:
+            regressions = json.load(f)['regressions']
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('CustomerViewSet.list as MANAGER', regressions[0])
+
+
+class BenchmarkConnectionsTestCase(TestCase):
+    """Test case for the benchmark_connections command."""
+
+    def test_requires_postgresql(self):
+        """Test that other databases are refused."""
+        if connection.vendor == 'postgresql':
+            self.skipTest('only checks the refusal on other databases')
+        with self.assertRaises(CommandError):
+            call_command('benchmark_connections', stdout=StringIO())
+
+
+class BenchmarkAsyncTestCase(TransactionTestCase):
+    """Test case for the benchmark_async command."""
+    # The ASGI handler serves requests from its own threads, which only see committed rows.
+
+    def setUp(self):
+        """Set up test data."""
+        call_command(
+            'generate_dataset', customers=6, prefix='asyncbench', super_managers=1, managers=1,
+            officers_per_manager=1, agents=1, stdout=StringIO()
+        )
+
+    def test_results(self):
+        """Test that both modes of every endpoint are measured without errors."""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('benchmark_async', prefix='asyncbench', concurrency='1,3', requests=3, output=output,
+                         stdout=StringIO())
+            with open(output) as f:
+                report = json.load(f)
+
+        results = {(r['endpoint'], r['mode'], r['concurrency']): r for r in report['results']}
+        self.assertEqual(len(results), 16)
+        for result in results.values():
+            self.assertEqual(result['requests'], 3)
+            self.assertEqual(result['errors'], 0)
+
+    def test_unknown_prefix(self):
+        """Test that a missing dataset is reported."""
+        with self.assertRaises(CommandError):
+            call_command('benchmark_async', prefix='missing', stdout=StringIO())
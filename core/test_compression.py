@@ -0,0 +1,98 @@
+"""
+Tests for the fast JSON renderer and response compression middleware.
+"""
+import gzip
+import json
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from core.middleware.compression import CompressionMiddleware, brotli, choose_encoding
+from core.renderers import FastJSONRenderer
+
+
+class FastJSONRendererTestCase(SimpleTestCase):
+    """Test case for FastJSONRenderer."""
+
+    def test_matches_drf_output(self):
+        """Test that the rendered document is identical to DRF's JSONRenderer."""
+        data = {
+            'results': [
+                {'id': 1, 'amount': '10.50', 'name': 'Jane   Doe', 'active': True},
+                {'id': 2, 'amount': None, 'name': 'John', 'active': False},
+            ],
+            'created_at': datetime(2025, 4, 6, 14, 32, 1, tzinfo=dt_timezone.utc),
+            'due': date(2025, 5, 1),
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_decimal_is_rendered_exactly(self):
+        """Test that raw Decimals keep their exact value."""
+        rendered = json.loads(FastJSONRenderer().render({'total': Decimal('12345678.91')}))
+        self.assertEqual(rendered['total'], '12345678.91')
+
+    def test_indent_uses_stock_renderer(self):
+        """Test that pretty-printed output still honours the indent."""
+        rendered = FastJSONRenderer().render({'a': 1}, 'application/json; indent=4')
+        self.assertEqual(rendered, b'{\n    "a": 1\n}')
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionMiddlewareTestCase(SimpleTestCase):
+    """Test case for CompressionMiddleware."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.body = json.dumps([{'id': i, 'notes': 'Customer promised to pay'} for i in range(50)]).encode()
+
+    def get_response(self, accept_encoding, response=None):
+        response = response or HttpResponse(self.body, content_type='application/json')
+        middleware = CompressionMiddleware(lambda request: response)
+        return middleware(self.factory.get('/api/loans/', HTTP_ACCEPT_ENCODING=accept_encoding))
+
+    def test_choose_encoding(self):
+        """Test Accept-Encoding negotiation with q-values."""
+        self.assertEqual(choose_encoding('gzip, br', ('br', 'gzip')), 'br')
+        self.assertEqual(choose_encoding('br;q=0.5, gzip', ('br', 'gzip')), 'gzip')
+        self.assertEqual(choose_encoding('identity', ('br', 'gzip')), None)
+        self.assertEqual(choose_encoding('*', ('gzip',)), 'gzip')
+
+    def test_gzip_response(self):
+        """Test that a large JSON response is gzipped when accepted."""
+        response = self.get_response('gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_gzip_length_is_randomized(self):
+        """Test that gzipped lengths vary between responses, against BREACH."""
+        lengths = {len(self.get_response('gzip').content) for _ in range(20)}
+        self.assertGreater(len(lengths), 1)
+
+    def test_brotli_is_off_by_default(self):
+        """Test that clients preferring brotli get padded gzip unless brotli is enabled."""
+        response = self.get_response('br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    @override_settings(COMPRESSION_BROTLI=True)
+    def test_brotli_response(self):
+        """Test that brotli is preferred once enabled."""
+        if brotli is None:
+            self.skipTest('brotli is not installed')
+        response = self.get_response('br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.body)
+
+    def test_small_response_is_not_compressed(self):
+        """Test that responses below the threshold are left alone."""
+        response = self.get_response('gzip', HttpResponse(b'{}', content_type='application/json'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming_response_is_not_compressed(self):
+        """Test that streaming responses are passed through untouched."""
+        streaming = StreamingHttpResponse(iter([self.body]), content_type='text/event-stream')
+        response = self.get_response('gzip', streaming)
+        self.assertFalse(response.has_header('Content-Encoding'))
@@ -0,0 +1,146 @@
+"""
+Tests for the follow-up events.
+"""
+import asyncio
+from datetime import timedelta
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from customers.models import Customer
+from interactions.models import Interaction, FollowUp
+from users.models import User
+
+from .events import InProcessBroker, format_event, get_broker, reset_broker
+
+
+class FollowUpEventsTestCase(TestCase):
+    """Test case for the events published when follow-ups change."""
+
+    def setUp(self):
+        """Set up test data."""
+        reset_broker()
+        self.officer = User.objects.create_user(
+            username='officer', email='officer@example.com', password='password123', role=User.Role.COLLECTION_OFFICER
+        )
+        self.agent = User.objects.create_user(
+            username='agent', email='agent@example.com', password='password123', role=User.Role.CALLING_AGENT
+        )
+        self.customer = Customer.objects.create(
+            first_name='Jane', last_name='Doe', primary_phone='+1234567890', created_by=self.officer
+        )
+        interaction = Interaction.objects.create(
+            customer=self.customer, interaction_type=Interaction.InteractionType.CALL,
+            initiated_by=self.officer, start_time=timezone.now(),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.follow_up = FollowUp.objects.create(
+                interaction=interaction, customer=self.customer, follow_up_type=FollowUp.FollowUpType.CALL,
+                scheduled_date=timezone.localdate(), assigned_to=self.agent, created_by=self.officer,
+            )
+        self.broker = get_broker()
+
+    def events(self, user):
+        return asyncio.run(self.broker.history(user.pk, 0))[0]
+
+    def save(self, **changes):
+        for field, value in changes.items():
+            setattr(self.follow_up, field, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.follow_up.save()
+
+    def test_types(self):
+        """Test that each kind of change is named and sent to the assignee."""
+        self.save(notes='Call after lunch')
+        self.save(status=FollowUp.FollowUpStatus.RESCHEDULED,
+                  scheduled_date=str(timezone.localdate() + timedelta(days=1)))
+        self.save(scheduled_time='10:30')
+        self.save(status=FollowUp.FollowUpStatus.COMPLETED)
+
+        events = self.events(self.agent)
+        self.assertEqual([event.type for event in events], [
+            'follow_up.created', 'follow_up.updated', 'follow_up.rescheduled', 'follow_up.rescheduled',
+            'follow_up.completed',
+        ])
+        self.assertEqual([event.id for event in events], [1, 2, 3, 4, 5])
+        self.assertEqual([event.data['in_queue'] for event in events], [True, True, True, True, False])
+        self.assertEqual(events[3].data['scheduled_time'], '10:30:00')
+        self.assertEqual(events[0].data['follow_up'], self.follow_up.pk)
+
+    def test_loaded_state(self):
+        """Test that a loaded follow-up is compared with the state it was loaded with, without reading it again."""
+        follow_up = FollowUp.objects.get(pk=self.follow_up.pk)
+        follow_up.status = FollowUp.FollowUpStatus.COMPLETED
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            follow_up.save()
+        # Compared with the state it was saved with this time.
+        follow_up.notes = 'Paid in full'
+        with self.captureOnCommitCallbacks(execute=True):
+            follow_up.save()
+        self.assertEqual([event.type for event in self.events(self.agent)][1:],
+                         ['follow_up.completed', 'follow_up.updated'])
+
+    def test_reassignment(self):
+        """Test that a reassigned follow-up leaves the previous assignee's queue."""
+        self.save(assigned_to=self.officer)
+
+        removed = self.events(self.agent)[-1]
+        added = self.events(self.officer)[-1]
+        self.assertEqual((removed.type, removed.data['in_queue']), ('follow_up.reassigned', False))
+        self.assertEqual((added.type, added.data['in_queue']), ('follow_up.reassigned', True))
+        self.assertEqual(added.data['previous_assigned_to'], self.agent.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.follow_up.delete()
+        self.assertEqual(self.events(self.officer)[-1].type, 'follow_up.deleted')
+
+    def test_rolled_back(self):
+        """Test that nothing is published for a change that is not committed."""
+        with self.captureOnCommitCallbacks(execute=False):
+            self.follow_up.save()
+        self.assertEqual(len(self.events(self.agent)), 1)
+
+
+@override_settings(EVENTS_REDIS_URL='')
+class InProcessBrokerTestCase(SimpleTestCase):
+    """Test case for subscribing to the in-process broker."""
+
+    async def receive(self, subscription, count):
+        return [await asyncio.wait_for(subscription.get(), 1) for _ in range(count)]
+
+    async def test_resume(self):
+        """Test that missed events come first, once each, followed by live ones."""
+        broker = InProcessBroker(history_size=3)
+        for number in range(1, 3):
+            broker.publish(7, 'follow_up.updated', {'number': number})
+
+        async with broker.subscribe(7, last_event_id=1) as subscription:
+            broker.publish(7, 'follow_up.updated', {'number': 3})
+            broker.publish(8, 'follow_up.updated', {'number': 0})
+            events = await self.receive(subscription, 2)
+            self.assertEqual([event.id for event in events], [2, 3])
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(subscription.get(), 0.05)
+
+        async with broker.subscribe(7) as subscription:
+            await asyncio.to_thread(broker.publish, 7, 'follow_up.completed', {})
+            self.assertEqual([event.id for event in await self.receive(subscription, 1)], [4])
+
+    async def test_reset(self):
+        """Test that a client further behind than the history, or ahead of it, is told to reload."""
+        broker = InProcessBroker(history_size=2)
+        for number in range(5):
+            broker.publish(7, 'follow_up.updated', {})
+
+        for last_event_id, latest in ((1, 5), (9, 6)):
+            async with broker.subscribe(7, last_event_id=last_event_id) as subscription:
+                reset, = await self.receive(subscription, 1)
+                self.assertEqual((reset.type, reset.id), ('reset', latest))
+                broker.publish(7, 'follow_up.updated', {})
+                self.assertEqual((await self.receive(subscription, 1))[0].type, 'follow_up.updated')
+
+    def test_format(self):
+        """Test the text/event-stream encoding."""
+        broker = InProcessBroker()
+        event = broker.publish(7, 'follow_up.created', {'follow_up': 1})
+        self.assertEqual(format_event(event), 'id: 1\nevent: follow_up.created\ndata: {"follow_up":1}\n\n')
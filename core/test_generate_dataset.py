@@ -0,0 +1,116 @@
+"""
+Tests for the synthetic dataset generator.
+"""
+import hashlib
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+from django.test import TestCase
+
+from customers.models import Customer
+from interactions.models import Interaction, FollowUp
+from loans.models import Loan, Payment
+from users.models import User, Hierarchy
+
+
+def generate(prefix, seed=7, customers=30):
+    call_command(
+        'generate_dataset', customers=customers, seed=seed, as_of=date(2024, 6, 30), prefix=prefix,
+        super_managers=1, managers=2, officers_per_manager=2, agents=3, chunk_size=8,
+        stdout=StringIO()
+    )
+
+
+def digest(prefix):
+    """
+    Hash the generated data, leaving out ids, sequence-backed references
+    and timestamps filled in on insert.
+    """
+    officers = {
+        user_id: index for index, user_id in enumerate(
+            User.objects.filter(username__startswith=f'{prefix}-').order_by('username').values_list('id', flat=True)
+        )
+    }
+    lines = []
+    customers = Customer.objects.filter(assigned_officer__username__startswith=f'{prefix}-').order_by('id')
+    for customer in customers.prefetch_related('loans__payments', 'interactions__follow_ups'):
+        lines.append((customer.first_name, customer.last_name, customer.branch, customer.risk_score,
+                      officers[customer.assigned_officer_id]))
+        for loan in customer.loans.order_by('id'):
+            lines.append((loan.status, loan.principal_amount, loan.days_past_due, loan.amount_paid,
+                          loan.maturity_date, [(p.amount, p.payment_date) for p in loan.payments.order_by('id')]))
+        for interaction in customer.interactions.order_by('id'):
+            lines.append((interaction.outcome, interaction.start_time, officers[interaction.initiated_by_id],
+                          [(f.status, f.scheduled_date) for f in interaction.follow_ups.order_by('id')]))
+    return hashlib.sha256(repr(lines).encode()).hexdigest()
+
+
+class GenerateDatasetTestCase(TestCase):
+    """Test case for the generate_dataset command."""
+
+    def test_relationships(self):
+        """Test that the generated graph is consistent."""
+        generate('alpha')
+
+        officers = User.objects.filter(username__startswith='alpha-', role=User.Role.COLLECTION_OFFICER)
+        self.assertEqual(officers.count(), 4)
+        self.assertEqual(User.objects.filter(username__startswith='alpha-', role=User.Role.CALLING_AGENT).count(), 3)
+        # Every officer reports to a manager, the manager above and the super manager.
+        self.assertEqual(Hierarchy.objects.filter(collection_officer__in=officers).count(), 12)
+
+        self.assertEqual(Customer.objects.count(), 30)
+        self.assertFalse(Customer.objects.exclude(assigned_officer__in=officers).exists())
+        self.assertTrue(Loan.objects.exists())
+        self.assertFalse(Loan.objects.exclude(assigned_officer__in=officers).exists())
+        self.assertFalse(Loan.objects.filter(status=Loan.Status.DEFAULTED, days_past_due__lte=90).exists())
+        self.assertFalse(Loan.objects.filter(status=Loan.Status.PENDING, disbursement_date__isnull=False).exists())
+        for loan in Loan.objects.filter(status=Loan.Status.PAID):
+            self.assertEqual(loan.amount_paid, loan.total_amount_due.quantize(Decimal('0.01')))
+        self.assertFalse(Interaction.objects.filter(loan__isnull=False).exclude(loan__customer=F('customer')).exists())
+        self.assertFalse(FollowUp.objects.exclude(customer=F('interaction__customer')).exists())
+        self.assertTrue(Payment.objects.exists())
+        self.assertEqual(len(set(Loan.objects.values_list('loan_reference', flat=True))), Loan.objects.count())
+
+    def test_hierarchy_levels(self):
+        """Test that each level of management sees every officer below it."""
+        call_command(
+            'generate_dataset', customers=4, prefix='tree', super_managers=1, managers=4, officers_per_manager=1,
+            agents=1, levels=4, span=2, stdout=StringIO()
+        )
+        reports = {
+            username: set(Hierarchy.objects.filter(manager__username=username).values_list(
+                'collection_officer__username', flat=True
+            ))
+            for username in User.objects.filter(username__startswith='tree-').exclude(
+                role__in=[User.Role.COLLECTION_OFFICER, User.Role.CALLING_AGENT]
+            ).values_list('username', flat=True)
+        }
+        officers = {f'tree-officer-{number:04d}' for number in range(1, 5)}
+        self.assertEqual(reports, {
+            'tree-manager-0001': {'tree-officer-0001'},
+            'tree-manager-0002': {'tree-officer-0002'},
+            'tree-manager-0003': {'tree-officer-0003'},
+            'tree-manager-0004': {'tree-officer-0004'},
+            'tree-manager-l2-0001': {'tree-officer-0001', 'tree-officer-0002'},
+            'tree-manager-l2-0002': {'tree-officer-0003', 'tree-officer-0004'},
+            'tree-manager-l3-0001': officers,
+            'tree-super-manager-0001': officers,
+        })
+
+    def test_deterministic(self):
+        """Test that the same seed produces the same data."""
+        generate('alpha')
+        generate('beta')
+        generate('gamma', seed=8)
+        self.assertEqual(digest('alpha'), digest('beta'))
+        self.assertNotEqual(digest('alpha'), digest('gamma'))
+
+    def test_existing_prefix(self):
+        """Test that an existing prefix is refused."""
+        generate('alpha', customers=1)
+        with self.assertRaises(CommandError):
+            generate('alpha', customers=1)
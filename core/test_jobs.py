@@ -0,0 +1,245 @@
+"""
+Tests for the background jobs.
+"""
+import csv
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from customers.models import Customer
+from loans.models import Loan
+from users.models import User, Hierarchy
+
+from . import jobs
+from .models import Job, Tombstone
+
+
+class JobTestCase(TestCase):
+    """Base for the job tests: users, customers and a scratch artifact directory."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = override_settings(
+            JOB_ARTIFACT_DIR=self.directory.name, JOB_CHUNK_SIZE=10, JOB_RETRY_BACKOFF_SECONDS=0
+        )
+        self.settings.enable()
+        self.super_manager = User.objects.create_user(
+            username='boss', email='boss@example.com', password='password123', role=User.Role.SUPER_MANAGER
+        )
+        self.manager = User.objects.create_user(
+            username='manager', email='manager@example.com', password='password123', role=User.Role.MANAGER
+        )
+        self.officers = [
+            User.objects.create_user(
+                username=f'officer{number}', email=f'officer{number}@example.com', password='password123',
+                role=User.Role.COLLECTION_OFFICER
+            )
+            for number in range(2)
+        ]
+        self.agent = User.objects.create_user(
+            username='agent', email='agent@example.com', password='password123', role=User.Role.CALLING_AGENT
+        )
+        Customer.objects.bulk_create([
+            Customer(first_name=f'Customer{number}', last_name='Doe', primary_phone=f'+1555000{number:04d}',
+                     assigned_officer=self.officers[0], created_by=self.super_manager)
+            for number in range(25)
+        ])
+        self.client = APIClient(SERVER_NAME='localhost')
+
+    def tearDown(self):
+        self.settings.disable()
+        self.directory.cleanup()
+
+    def submit(self, user, kind, params=None):
+        """
+        Submit a job, run it (eagerly, once the request commits) and return
+        the response of the submission, or the job when it was accepted.
+        """
+        self.client.force_authenticate(user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/jobs/', {'kind': kind, 'params': params or {}}, format='json')
+        if response.status_code != 202:
+            return response
+        return self.client.get(f"/api/jobs/{response.data['id']}/")
+
+    def download(self, job_id):
+        response = self.client.get(f'/api/jobs/{job_id}/artifact/')
+        self.assertEqual(response.status_code, 200)
+        return list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+
+
+class JobRunTestCase(JobTestCase):
+    """Test case for running jobs in chunks."""
+
+    def test_export(self):
+        """Test that an export runs chunk by chunk and its file can be downloaded."""
+        response = self.submit(self.officers[0], 'export_customers')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], Job.Status.SUCCEEDED)
+        self.assertEqual((response.data['processed'], response.data['total']), (25, 25))
+        self.assertEqual(response.data['progress'], 1.0)
+        self.assertEqual(response.data['result'], {'rows': 25, 'bytes': mock.ANY})
+        self.assertTrue(response.data['artifact_url'].endswith(f"/api/jobs/{response.data['id']}/artifact/"))
+
+        rows = self.download(response.data['id'])
+        self.assertEqual(rows[0][:3], ['id', 'first_name', 'last_name'])
+        self.assertEqual(len(rows), 26)
+        self.assertEqual(len({row[0] for row in rows[1:]}), 25)
+
+        # Another officer's export sees none of them.
+        response = self.submit(self.officers[1], 'export_customers')
+        self.assertEqual(response.data['result']['rows'], 0)
+
+    @override_settings(JOB_TIME_SLICE_SECONDS=1e-9)
+    def test_time_slices(self):
+        """Test that a job handed on to fresh tasks continues from its checkpoint."""
+        with mock.patch('core.jobs.enqueue', wraps=jobs.enqueue) as enqueue:
+            response = self.submit(self.super_manager, 'export_customers')
+        self.assertEqual(enqueue.call_count, 3)  # the submission, then after each of the first two chunks
+        self.assertEqual(response.data['processed'], 25)
+        self.assertEqual(len(self.download(response.data['id'])), 26)
+
+    def test_retry(self):
+        """Test that a chunk that fails after writing is retried without duplicating rows."""
+        original = jobs.ExportCustomersJob.run_chunk
+        calls = []
+
+        def flaky(kind, job, checkpoint, size):
+            result = original(kind, job, checkpoint, size)
+            calls.append(checkpoint)
+            if len(calls) == 2:
+                raise ConnectionError('database went away')
+            return result
+
+        with mock.patch.object(jobs.ExportCustomersJob, 'run_chunk', flaky):
+            response = self.submit(self.super_manager, 'export_customers')
+        self.assertEqual(response.data['status'], Job.Status.SUCCEEDED)
+        self.assertEqual((response.data['attempts'], response.data['error']), (0, ''))
+        self.assertEqual(calls[1], calls[2])  # the failed chunk ran again from the same checkpoint
+        rows = self.download(response.data['id'])
+        self.assertEqual([int(row[0]) for row in rows[1:]], sorted(Customer.objects.values_list('pk', flat=True)))
+
+    @override_settings(JOB_MAX_RETRIES=2)
+    def test_failure(self):
+        """Test that a job fails once a chunk has failed too often, leaving no partial file."""
+        with mock.patch.object(jobs.ExportCustomersJob, 'count', side_effect=ValueError('broken')):
+            response = self.submit(self.super_manager, 'export_customers')
+        job = Job.objects.get(pk=response.data['id'])
+        self.assertEqual((job.status, job.attempts, job.error), (Job.Status.FAILED, 3, 'ValueError: broken'))
+        self.assertIsNone(response.data['artifact_url'])
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.assertEqual(self.client.get(f'/api/jobs/{job.pk}/artifact/').status_code, 404)
+
+    def test_cancel(self):
+        """Test that a running job stops before its next chunk and a pending one at once."""
+        original = jobs.ExportCustomersJob.run_chunk
+
+        def cancel_after(kind, job, checkpoint, size):
+            result = original(kind, job, checkpoint, size)
+            if checkpoint:
+                jobs.cancel(Job.objects.get(pk=job.pk))
+            return result
+
+        with mock.patch.object(jobs.ExportCustomersJob, 'run_chunk', cancel_after):
+            response = self.submit(self.super_manager, 'export_customers')
+        job = Job.objects.get(pk=response.data['id'])
+        self.assertEqual((job.status, job.processed, job.cancel_requested), (Job.Status.CANCELED, 20, True))
+        self.assertEqual(os.listdir(self.directory.name), [])
+        self.assertEqual(self.client.post(f'/api/jobs/{job.pk}/cancel/').status_code, 400)
+
+        self.client.force_authenticate(user=self.agent)
+        with self.captureOnCommitCallbacks(execute=False):
+            pending = self.client.post('/api/jobs/', {'kind': 'export_customers'}, format='json').data
+        self.assertEqual(pending['status'], Job.Status.PENDING)
+        response = self.client.post(f"/api/jobs/{pending['id']}/cancel/")
+        self.assertEqual(response.data['status'], Job.Status.CANCELED)
+        jobs.run(mock.Mock(), pending['id'])
+        self.assertEqual(Job.objects.get(pk=pending['id']).processed, 0)
+
+    def test_eta(self):
+        """Test the progress and ETA of a running job."""
+        job = Job.objects.create(kind='export_customers', status=Job.Status.RUNNING, total=100, processed=25,
+                                 started_at=timezone.now() - timedelta(seconds=10), created_by=self.agent)
+        self.assertEqual(job.progress, 0.25)
+        self.assertAlmostEqual(job.eta_seconds, 30, delta=1)
+        self.assertIsNone(Job(kind='export_customers').eta_seconds)
+
+    def test_prune(self):
+        """Test that finished jobs past the retention period are deleted with their files."""
+        old = self.submit(self.super_manager, 'export_customers').data['id']
+        recent = self.submit(self.super_manager, 'export_customers').data['id']
+        Job.objects.filter(pk=old).update(finished_at=timezone.now() - timedelta(days=30))
+        call_command('prune_jobs', stdout=StringIO())
+        self.assertEqual(list(Job.objects.values_list('pk', flat=True)), [recent])
+        self.assertEqual(os.listdir(self.directory.name), [f'job-{recent}.csv'])
+
+
+class JobKindTestCase(JobTestCase):
+    """Test case for the bulk reassignment and days past due jobs, and who may run what."""
+
+    def test_reassign(self):
+        """Test that a manager moves an officer's customers, loans and sync state to another officer."""
+        for officer in self.officers:
+            Hierarchy.objects.create(manager=self.manager, collection_officer=officer)
+        customer = Customer.objects.order_by('pk').first()
+        loan = Loan.objects.create(
+            customer=customer, loan_reference='LN-1', principal_amount=Decimal('1000.00'),
+            interest_rate=Decimal('10.00'), term_months=12, assigned_officer=self.officers[0]
+        )
+        params = {'from_officer': self.officers[0].pk, 'to_officer': self.officers[1].pk}
+
+        response = self.submit(self.manager, 'reassign_customers', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['result']['customers'], 25)
+        self.assertEqual(Customer.objects.filter(assigned_officer=self.officers[1]).count(), 25)
+        tombstones = Tombstone.objects.filter(user=self.officers[0], reason=Tombstone.Reason.REASSIGNED)
+        self.assertEqual(tombstones.filter(model='customers.customer').count(), 25)
+        self.assertEqual(list(tombstones.filter(model='loans.loan').values_list('object_id', flat=True)), [loan.pk])
+        loan.refresh_from_db()
+        self.assertEqual(loan.assigned_officer, self.officers[1])
+
+    def test_validation(self):
+        """Test that parameters are checked and roles limited when a job is submitted."""
+        params = {'from_officer': self.officers[0].pk, 'to_officer': self.officers[1].pk}
+        response = self.submit(self.manager, 'reassign_customers', params)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('from_officer', response.data['error']['params'])
+        self.assertEqual(self.submit(self.agent, 'reassign_customers', params).status_code, 403)
+        self.assertEqual(self.submit(self.super_manager, 'reassign_customers', {'from_officer': 'x'}).status_code, 400)
+        self.assertEqual(self.submit(self.super_manager, 'unknown').status_code, 400)
+        self.assertEqual(self.submit(self.super_manager, 'recompute_dpd', {'as_of': '15/04/2024'}).status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+    def test_recompute_dpd(self):
+        """Test that days past due are recomputed for open loans only."""
+        customer = Customer.objects.order_by('pk').first()
+        for number, (status, paid) in enumerate([
+            (Loan.Status.ACTIVE, '0.00'), (Loan.Status.ACTIVE, '1866.66'), (Loan.Status.PAID, '0.00'),
+        ]):
+            Loan.objects.create(
+                customer=customer, loan_reference=f'LN-{number}', principal_amount=Decimal('10000.00'),
+                interest_rate=Decimal('12.00'), term_months=12, status=status, amount_paid=Decimal(paid),
+                first_payment_date=date(2024, 1, 31), days_past_due=7,
+            )
+        response = self.submit(self.super_manager, 'recompute_dpd', {'as_of': '2024-04-15'})
+        self.assertEqual(response.data['result'], {'loans': 2, 'changed': 2, 'as_of': '2024-04-15'})
+        self.assertEqual(dict(Loan.objects.values_list('loan_reference', 'days_past_due')),
+                         {'LN-0': 75, 'LN-1': 15, 'LN-2': 7})
+
+    def test_visibility(self):
+        """Test that users see their own jobs and Super Managers see everyone's."""
+        mine = self.submit(self.agent, 'export_customers').data['id']
+        self.client.force_authenticate(user=self.officers[0])
+        self.assertEqual(self.client.get(f'/api/jobs/{mine}/').status_code, 404)
+        self.assertEqual(self.client.get('/api/jobs/').data['count'], 0)
+        self.client.force_authenticate(user=self.super_manager)
+        self.assertEqual(self.client.get(f'/api/jobs/?kind=export_customers&status={Job.Status.SUCCEEDED}').data['count'], 1)
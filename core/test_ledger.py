@@ -0,0 +1,163 @@
+"""
+Tests for the loan ledger.
+"""
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from customers.models import Customer
+from loans.models import LedgerEntry, LedgerSnapshot, Loan, Payment
+from users.models import User
+
+from . import ledger
+from .transitions import run_rule
+
+
+@override_settings(LEDGER_SNAPSHOT_INTERVAL=3)
+class LedgerTestCase(TestCase):
+    """Test case for posting to loan ledgers and reading their balances."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='boss', email='boss@example.com', password='password123', role=User.Role.SUPER_MANAGER
+        )
+        self.customer = Customer.objects.create(
+            first_name='Jane', last_name='Doe', primary_phone='+1234567890', created_by=self.user
+        )
+        # 1000.00 at 12% over 12 months: 1120.00 due
+        self.loan = Loan.objects.create(
+            customer=self.customer, loan_reference='LN-1', status=Loan.Status.ACTIVE,
+            principal_amount=Decimal('1000.00'), interest_rate=Decimal('12.00'), term_months=12,
+            disbursement_date=date(2024, 1, 1),
+        )
+
+    def pay(self, reference, amount, payment_date, loan=None):
+        return Payment.objects.create(
+            loan=loan or self.loan, payment_reference=reference, amount=Decimal(amount), payment_date=payment_date,
+            received_by=self.user
+        )
+
+    def test_payments(self):
+        """Test that payments open the ledger from history and are posted in turn."""
+        self.pay('P-1', '100.00', date(2024, 2, 1))
+        # Interest accrues daily over the 366 days of the term.
+        self.assertEqual(list(self.loan.ledger_entries.values_list('sequence', 'entry_type', 'amount', 'booked_on')), [
+            (1, 'DISBURSEMENT', Decimal('1000.00'), date(2024, 1, 1)),
+            (2, 'INTEREST', Decimal('10.16'), date(2024, 2, 1)),
+            (3, 'PAYMENT', Decimal('-100.00'), date(2024, 2, 1)),
+            (4, 'INTEREST', Decimal('109.84'), date(2025, 1, 1)),
+        ])
+        self.assertEqual(self.loan.interest_accrued(date(2024, 2, 1)), Decimal('10.16'))
+        self.pay('P-2', '200.00', date(2024, 3, 1))
+        # Back-valued: booked on the loan's latest booking date.
+        self.pay('P-3', '50.00', date(2024, 2, 15))
+
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_paid, Decimal('350.00'))
+        self.assertEqual(self.loan.last_payment_date, date(2024, 3, 1))
+        self.assertEqual(ledger.balance(self.loan.pk), self.loan.remaining_balance)
+        self.assertEqual(self.loan.ledger_entries.get(sequence=6).booked_on, date(2025, 1, 1))
+        self.assertEqual(list(LedgerSnapshot.objects.values_list('sequence', 'balance')), [
+            (3, Decimal('910.16')), (6, Decimal('770.00')),
+        ])
+
+        self.pay('P-4', '770.00', date(2024, 4, 1))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, Loan.Status.PAID)
+        self.assertEqual(ledger.balance(self.loan.pk), Decimal('0.00'))
+
+    def test_point_in_time(self):
+        """Test balances on past dates against a running sum of the entries."""
+        Loan.objects.filter(pk=self.loan.pk).update(interest_rate=Decimal('0.00'))
+        ledger.open_ledgers([self.loan.pk])
+        postings = []
+        for day in range(1, 29):
+            postings.append(ledger.Posting(self.loan.pk, LedgerEntry.EntryType.INTEREST, '0.33', date(2024, 2, day), ''))
+            if day % 7 == 0:
+                postings.append(ledger.Posting(self.loan.pk, LedgerEntry.EntryType.PAYMENT, '25.00',
+                                               date(2024, 2, day), f'P-{day}'))
+        ledger.post_many(postings[:10])
+        ledger.post_many(postings[10:])
+        self.assertEqual(LedgerSnapshot.objects.count(), LedgerEntry.objects.count() // 3)
+
+        entries = list(self.loan.ledger_entries.values_list('booked_on', 'amount'))
+        for day in (date(2023, 12, 31), date(2024, 1, 1), date(2024, 2, 7), date(2024, 2, 20), date(2024, 3, 1)):
+            expected = sum((amount for booked_on, amount in entries if booked_on <= day), Decimal('0.00'))
+            self.assertEqual(ledger.balance(self.loan.pk, day), expected, day)
+        self.assertEqual(ledger.balance(self.loan.pk), Decimal('1000.00') + Decimal('9.24') - Decimal('100.00'))
+
+        with self.assertRaises(ValueError):
+            entry = LedgerEntry.objects.first()
+            entry.amount = Decimal('0.00')
+            entry.save()
+
+    def test_portfolio_and_write_off(self):
+        """Test that write-offs clear balances and the portfolio balance adds up by date."""
+        other = Loan.objects.create(
+            customer=self.customer, loan_reference='LN-2', status=Loan.Status.ACTIVE,
+            principal_amount=Decimal('500.00'), interest_rate=Decimal('0.00'), term_months=6,
+            disbursement_date=date(2024, 3, 1),
+        )
+        self.pay('P-1', '120.00', date(2024, 2, 1))
+        self.pay('P-2', '100.00', date(2024, 3, 10), loan=other)
+        self.assertEqual(ledger.portfolio_balance(date(2024, 2, 28)), Decimal('890.16'))
+        self.assertEqual(ledger.portfolio_balance(date(2024, 3, 31), by_loan=True),
+                         {self.loan.pk: Decimal('890.16'), other.pk: Decimal('400.00')})
+
+        summary = run_rule('write_off', {'references': ['LN-2']})
+        self.assertEqual(other.ledger_entries.last().amount, Decimal('-400.00'))
+        self.assertEqual(other.ledger_entries.last().reference, summary['run'])
+        self.assertEqual(ledger.balance(other.pk), Decimal('0.00'))
+        self.assertEqual(ledger.balance(other.pk, date(2024, 3, 31)), Decimal('400.00'))
+
+        # A loan written off before it had a ledger opens with its write-off.
+        third = Loan.objects.create(
+            customer=self.customer, loan_reference='LN-3', status=Loan.Status.WRITTEN_OFF,
+            principal_amount=Decimal('300.00'), interest_rate=Decimal('0.00'), term_months=6, amount_paid=Decimal('0'),
+        )
+        out = StringIO()
+        call_command('backfill_ledger', '--batch-size=1', stdout=out)
+        self.assertEqual(list(third.ledger_entries.values_list('entry_type', 'amount')), [
+            ('DISBURSEMENT', Decimal('300.00')), ('WRITE_OFF', Decimal('-300.00')),
+        ])
+        self.assertRegex(out.getvalue(), r'loans opened\s+1\n')
+        self.assertRegex(out.getvalue(), r'portfolio balance\s+1000.00\n')
+
+    def test_api(self):
+        """Test the balance endpoint and that approval opens the ledger."""
+        pending = Loan.objects.create(
+            customer=self.customer, loan_reference='LN-2', principal_amount=Decimal('500.00'),
+            interest_rate=Decimal('10.00'), term_months=12,
+        )
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=self.user)
+        self.assertEqual(client.get(f'/api/loans/{pending.pk}/balance/').status_code, 409)
+        self.assertEqual(client.post(f'/api/loans/{pending.pk}/approve/').status_code, 200)
+        response = client.get(f'/api/loans/{pending.pk}/balance/')
+        self.assertEqual(response.data['balance'], Decimal('500.00'))  # no interest accrued yet
+        response = client.get(f'/api/loans/{pending.pk}/balance/?as_of=2000-01-01')
+        self.assertEqual((response.data['as_of'], response.data['balance']), (date(2000, 1, 1), Decimal('0.00')))
+        self.assertEqual(client.get(f'/api/loans/{pending.pk}/balance/?as_of=yesterday').status_code, 400)
+
+        self.assertEqual(client.post(f'/api/loans/{pending.pk}/write_off/').status_code, 200)
+        self.assertEqual(ledger.balance(pending.pk), Decimal('0.00'))
+
+        # Posted payments are not edited or deleted behind the ledger's back.
+        payment = self.pay('P-1', '100.00', date(2024, 2, 1))
+        self.assertEqual(client.patch(f'/api/payments/{payment.pk}/', {'amount': '1.00'}).status_code, 405)
+        self.assertEqual(client.delete(f'/api/payments/{payment.pk}/').status_code, 405)
+
+    def test_api_opens_ledger(self):
+        """Test that the balance of a loan never posted to is read from its opened ledger."""
+        self.assertFalse(LedgerEntry.objects.filter(loan=self.loan).exists())
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user=self.user)
+        response = client.get(f'/api/loans/{self.loan.pk}/balance/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['balance'], Decimal('1120.00'))  # the whole term has accrued
+        self.assertTrue(LedgerEntry.objects.filter(loan=self.loan).exists())
@@ -0,0 +1,65 @@
+"""
+Tests for the load generator.
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import LiveServerTestCase, SimpleTestCase, override_settings
+
+from .loadtest import parse_mix, parse_stages
+
+
+class ParseTestCase(SimpleTestCase):
+    """Test case for parsing the ramp stages and scenario mix."""
+
+    def test_stages(self):
+        """Test that stages are parsed as (users, seconds) pairs."""
+        self.assertEqual(parse_stages('10:30,50:60'), [(10, 30.0), (50, 60.0)])
+
+    def test_mix(self):
+        """Test that unknown scenarios are rejected."""
+        self.assertEqual(parse_mix('post_payment=3,poll_follow_ups=1'), {'post_payment': 3.0, 'poll_follow_ups': 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix('delete_everything=1')
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class LoadTestCommandTestCase(LiveServerTestCase):
+    """Test case for the loadtest command against a live server."""
+
+    def setUp(self):
+        """Set up test data."""
+        call_command(
+            'generate_dataset', customers=12, prefix='load', super_managers=1, managers=1,
+            officers_per_manager=1, agents=1, stdout=StringIO()
+        )
+        self.directory = tempfile.TemporaryDirectory()
+        self.output = os.path.join(self.directory.name, 'load.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_run(self):
+        """Test that virtual users log in and replay the mix."""
+        call_command(
+            'loadtest', url=self.live_server_url, prefix='load', stages='2:1,2:1', think_ms=20,
+            report_interval=0.5, seed=1, output=self.output, stdout=StringIO()
+        )
+        with open(self.output) as f:
+            report = json.load(f)
+
+        self.assertEqual(report['statuses'].get('401'), None)
+        self.assertGreater(report['scenarios']['login']['requests'], 0)
+        self.assertEqual(report['scenarios']['login']['errors'], 0)
+        self.assertGreater(report['total']['requests'], 0)
+        self.assertGreaterEqual(len(report['curve']), 3)
+        self.assertEqual(report['curve'][-1]['users'], 2)
+
+    def test_remote_url(self):
+        """Test that non-local servers are refused."""
+        with self.assertRaises(CommandError):
+            call_command('loadtest', url='http://example.com', prefix='load', stdout=StringIO())
@@ -0,0 +1,92 @@
+"""
+Tests for per-view metrics and the /metrics endpoint.
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+
+from api.test_views import TEST_DRF_SETTINGS
+from core.metrics import record_pool_stats
+from customers.models import Customer
+from users.models import User
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@override_settings(REST_FRAMEWORK=TEST_DRF_SETTINGS)
+class MetricsTestCase(TestCase):
+    """Test case for MetricsMiddleware."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.superuser = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpassword'
+        )
+        Customer.objects.create(first_name='Jane', last_name='Doe', primary_phone='+1234567890')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+
+    def test_records_view_action(self):
+        """Test that requests are labelled with the DRF action and count queries."""
+        view = 'CustomerViewSet.list'
+        requests = sample('repaysync_view_requests_total', view=view, method='GET', status='200')
+        queries = sample('repaysync_view_db_queries_sum', view=view)
+        serializer_calls = sample('repaysync_view_serializer_seconds_count', view=view)
+
+        self.client.get(reverse('customer-list'))
+
+        self.assertEqual(sample('repaysync_view_requests_total', view=view, method='GET', status='200'), requests + 1)
+        self.assertGreater(sample('repaysync_view_db_queries_sum', view=view), queries)
+        self.assertEqual(sample('repaysync_view_serializer_seconds_count', view=view), serializer_calls + 1)
+
+    def test_custom_action_label(self):
+        """Test that extra actions get their own label."""
+        customer = Customer.objects.get()
+        self.client.get(reverse('customer-loans', args=[customer.id]))
+        self.assertGreaterEqual(sample('repaysync_view_latency_seconds_count', view='CustomerViewSet.loans'), 1)
+
+    def test_metrics_endpoint(self):
+        """Test that the scrape endpoint serves Prometheus text to allowed IPs only."""
+        self.client.get(reverse('customer-list'))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'repaysync_view_requests_total{', response.content)
+        self.assertIn(b'view="CustomerViewSet.list"', response.content)
+
+        self.client.force_authenticate(user=None)
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(response.status_code, 403)
+
+
+class PoolMetricsTestCase(SimpleTestCase):
+    """Test case for exporting connection pool stats."""
+
+    def test_record_pool_stats(self):
+        """Test that pool gauges are set and counters advance by the popped stats."""
+        stats = {
+            'pool_size': 4, 'pool_available': 1, 'requests_waiting': 2, 'requests_num': 10,
+            'requests_queued': 3, 'requests_wait_ms': 1500, 'requests_errors': 1,
+        }
+        pool = mock.Mock(**{'pop_stats.return_value': stats})
+        connection = mock.Mock(alias='pooltest', pool=pool)
+        queued = sample('repaysync_db_pool_requests_total', database='pooltest', outcome='queued')
+        timeouts = sample('repaysync_db_pool_errors_total', database='pooltest', kind='timeout')
+
+        with mock.patch('core.metrics.connections') as connections:
+            connections.all.return_value = [connection, mock.Mock(pool=None)]
+            record_pool_stats()
+
+        self.assertEqual(sample('repaysync_db_pool_connections', database='pooltest', state='size'), 4)
+        self.assertEqual(sample('repaysync_db_pool_connections', database='pooltest', state='available'), 1)
+        self.assertEqual(sample('repaysync_db_pool_waiting', database='pooltest'), 2)
+        self.assertEqual(sample('repaysync_db_pool_requests_total', database='pooltest', outcome='queued'), queued + 3)
+        self.assertEqual(sample('repaysync_db_pool_errors_total', database='pooltest', kind='timeout'), timeouts + 1)
+        self.assertGreaterEqual(sample('repaysync_db_pool_wait_seconds_total', database='pooltest'), 1.5)
@@ -0,0 +1,164 @@
+"""
+Tests for the transactional outbox and its relay.
+"""
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from customers.models import Customer
+from loans.models import Loan
+from users.models import User
+
+from .models import OutboxEvent
+from .outbox import FileConsumer, FileSink, Relay, list_segments, payment_created, record_many
+
+
+class OutboxRecordTestCase(TestCase):
+    """Test case for recording outbox events with the changes they describe."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='manager', email='manager@example.com', password='password123',
+            role=User.Role.SUPER_MANAGER
+        )
+        self.customer = Customer.objects.create(
+            first_name='Jane', last_name='Doe', primary_phone='+1234567890', created_by=self.user
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer, loan_reference='LN-1001', principal_amount=Decimal('10000.00'),
+            interest_rate=Decimal('12.00'), term_months=12, status=Loan.Status.PENDING,
+            assigned_officer=self.user, created_by=self.user
+        )
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.force_authenticate(user=self.user)
+
+    def test_api_changes(self):
+        """Test that payments, loan transitions and interactions each record one event."""
+        self.assertEqual(self.client.post(f'/api/loans/{self.loan.pk}/approve/').status_code, 200)
+        response = self.client.post('/api/payments/', {
+            'loan': self.loan.pk, 'amount': '250.00', 'payment_date': '2024-03-01', 'payment_method': 'CASH',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.post(f'/api/loans/{self.loan.pk}/write_off/').status_code, 200)
+        response = self.client.post('/api/interactions/', {
+            'customer': self.customer.pk, 'interaction_type': 'CALL', 'start_time': timezone.now().isoformat(),
+            'notes': 'Promised to pay', 'initiated_by': self.user.pk,
+        })
+        self.assertEqual(response.status_code, 201)
+
+        events = list(OutboxEvent.objects.values_list('topic', 'aggregate_type', 'payload'))
+        self.assertEqual([event[:2] for event in events], [
+            ('loan.approved', 'loans.loan'),
+            ('payment.created', 'loans.payment'),
+            ('loan.written_off', 'loans.loan'),
+            ('interaction.created', 'interactions.interaction'),
+        ])
+        self.assertEqual(events[0][2]['from_status'], 'PENDING')
+        self.assertEqual(events[0][2]['to_status'], 'ACTIVE')
+        self.assertEqual(events[1][2]['amount'], '250.00')
+        self.assertEqual(events[1][2]['loan'], self.loan.pk)
+        self.assertEqual(events[2][2]['from_status'], 'ACTIVE')
+
+    def test_rejected_change(self):
+        """Test that a change that is refused or rolled back leaves no event."""
+        self.loan.status = Loan.Status.PAID
+        self.loan.save()
+        self.assertEqual(self.client.post(f'/api/loans/{self.loan.pk}/write_off/').status_code, 400)
+
+        self.loan.status = Loan.Status.ACTIVE
+        self.loan.save()
+        with mock.patch('core.outbox.OutboxEvent.objects.create', side_effect=RuntimeError):
+            self.assertEqual(self.client.post(f'/api/loans/{self.loan.pk}/restructure/').status_code, 500)
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.status, Loan.Status.ACTIVE)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    @override_settings(OUTBOX_ENABLED=False)
+    def test_disabled(self):
+        """Test that nothing is recorded with the outbox switched off."""
+        self.assertIsNone(payment_created(self.loan.payments.create(
+            payment_reference='P-1', amount=Decimal('1.00'), payment_date=timezone.localdate()
+        )))
+        self.assertFalse(OutboxEvent.objects.exists())
+
+
+class OutboxRelayTestCase(TestCase):
+    """Test case for relaying outbox events to files and consuming them."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.user = User.objects.create_user(
+            username='officer', email='officer@example.com', password='password123',
+            role=User.Role.COLLECTION_OFFICER
+        )
+        record_many('user.touched', [(self.user, {'number': number}) for number in range(2500)])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_relay_and_consume(self):
+        """Test that every event is published once, in order, and consumers resume from their offsets."""
+        with override_settings(OUTBOX_FILE_DIR=self.directory.name):
+            out = StringIO()
+            call_command('relay_outbox', once=True, sink='file', batch_size=1000, stdout=out)
+        self.assertIn('Relayed 2500 outbox events', out.getvalue())
+        self.assertFalse(OutboxEvent.objects.filter(relayed_at__isnull=True).exists())
+
+        consumer = FileConsumer('bi', self.directory.name)
+        first = consumer.read(1000)
+        self.assertEqual([event['payload']['number'] for event in first], list(range(1000)))
+        self.assertEqual(first[0]['topic'], 'user.touched')
+        self.assertEqual(first[0]['aggregate_id'], str(self.user.pk))
+        consumer.commit()
+        consumer.read(1000)
+
+        # Uncommitted events are read again by the next consumer of that name.
+        resumed = FileConsumer('bi', self.directory.name)
+        rest = resumed.read(5000)
+        self.assertEqual([event['payload']['number'] for event in rest], list(range(1000, 2500)))
+        self.assertEqual(resumed.read(), [])
+        self.assertEqual(len(FileConsumer('sms', self.directory.name).read(5000)), 2500)
+
+    def test_segments(self):
+        """Test that a consumer follows the sink across segment files."""
+        relay = Relay(FileSink(self.directory.name, segment_bytes=50000), batch_size=400)
+        consumer = FileConsumer('bi', self.directory.name)
+        numbers = []
+        while relay.relay_batch():
+            numbers.extend(event['payload']['number'] for event in consumer.read(300))
+        numbers.extend(event['payload']['number'] for event in consumer.read(5000))
+
+        self.assertGreater(len(list_segments(self.directory.name)), 2)
+        self.assertEqual(numbers, list(range(2500)))
+
+        # A partially written line is left for the next read.
+        with open(os.path.join(self.directory.name, '%010d.jsonl' % list_segments(self.directory.name)[-1]),
+                  'ab') as handle:
+            handle.write(json.dumps({'id': 0})[:5].encode())
+        self.assertEqual(consumer.read(), [])
+
+    def test_failed_publish(self):
+        """Test that a batch the sink did not accept stays pending."""
+        sink = mock.Mock()
+        sink.publish.side_effect = ConnectionError
+        with self.assertRaises(ConnectionError):
+            Relay(sink, batch_size=100).relay_batch()
+        self.assertEqual(OutboxEvent.objects.filter(relayed_at__isnull=True).count(), 2500)
+
+    def test_prune(self):
+        """Test that relayed events past the retention period are deleted."""
+        OutboxEvent.objects.filter(pk__in=OutboxEvent.objects.values('pk')[:100]).update(
+            relayed_at=timezone.now() - timezone.timedelta(days=30)
+        )
+        call_command('prune_outbox', stdout=StringIO())
+        self.assertEqual(OutboxEvent.objects.count(), 2400)
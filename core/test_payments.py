@@ -0,0 +1,155 @@
+"""
+Tests for payment allocation and settlement files.
+"""
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from customers.models import Customer
+from loans.models import LedgerEntry, Loan, Payment, PaymentAllocation
+from users.models import User
+
+from . import ledger, payments
+from .models import OutboxEvent
+
+
+class PaymentAllocationTestCase(TestCase):
+    """Test case for allocating payments and settling settlement files."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='boss', email='boss@example.com', password='password123', role=User.Role.SUPER_MANAGER
+        )
+        self.customer = Customer.objects.create(
+            first_name='Jane', last_name='Doe', primary_phone='+1234567890', created_by=self.user
+        )
+        # 1200.00 at 12% over 12 months: 12 monthly installments from
+        # 1 February of 12.00 interest and 100.00 principal.
+        self.loan = self.create('LN-1')
+        self.other = self.create('LN-2')
+
+    def create(self, reference):
+        return Loan.objects.create(
+            customer=self.customer, loan_reference=reference, status=Loan.Status.ACTIVE,
+            principal_amount=Decimal('1200.00'), interest_rate=Decimal('12.00'), term_months=12,
+            disbursement_date=date(2024, 1, 1), first_payment_date=date(2024, 2, 1),
+        )
+
+    def pay(self, reference, amount, payment_date, loan=None):
+        return Payment.objects.create(
+            loan=loan or self.loan, payment_reference=reference, amount=Decimal(amount), payment_date=payment_date,
+            received_by=self.user
+        )
+
+    def allocations(self, payment):
+        return [
+            (installment, PaymentAllocation.Component(component).name, amount)
+            for installment, component, amount in payment.allocations.order_by('pk').values_list(
+                'installment', 'component', 'amount'
+            )
+        ]
+
+    def test_waterfall(self):
+        """Test that payments settle fees, penalties, then installments oldest first, without collecting interest early."""
+        first = self.pay('P-1', '112.00', date(2024, 2, 1))
+        self.assertEqual(self.allocations(first), [(0, 'INTEREST', Decimal('12.00')), (0, 'PRINCIPAL', Decimal('100.00'))])
+
+        ledger.post_many([
+            ledger.Posting(self.loan.pk, LedgerEntry.EntryType.PENALTY, '5.00', date(2024, 2, 20), ''),
+            ledger.Posting(self.loan.pk, LedgerEntry.EntryType.FEE, '10.00', date(2024, 2, 20), ''),
+            ledger.Posting(self.loan.pk, LedgerEntry.EntryType.WAIVER, '2.00', date(2024, 2, 25), ''),
+        ])
+        second = self.pay('P-2', '200.00', date(2024, 3, 1))
+        # The second installment, then the third's principal: its interest is not due yet.
+        self.assertEqual(self.allocations(second), [
+            (None, 'FEE', Decimal('10.00')), (None, 'PENALTY', Decimal('3.00')),
+            (1, 'INTEREST', Decimal('12.00')), (1, 'PRINCIPAL', Decimal('100.00')), (2, 'PRINCIPAL', Decimal('75.00')),
+        ])
+        third = self.pay('P-3', '100.00', date(2024, 4, 1))
+        self.assertEqual(self.allocations(third), [
+            (2, 'INTEREST', Decimal('12.00')), (2, 'PRINCIPAL', Decimal('25.00')), (3, 'PRINCIPAL', Decimal('63.00')),
+        ])
+
+        self.assertEqual(payments.recovered([self.loan.pk]), {
+            'FEE': Decimal('10.00'), 'PENALTY': Decimal('3.00'), 'INTEREST': Decimal('36.00'),
+            'PRINCIPAL': Decimal('363.00'),
+        })
+        self.assertEqual(payments.recovered(since=date(2024, 3, 2))['PRINCIPAL'], Decimal('88.00'))
+        self.loan.refresh_from_db()
+        self.assertEqual(self.loan.amount_paid, Decimal('412.00'))
+        self.assertEqual(self.loan.last_payment_date, date(2024, 4, 1))
+
+    @override_settings(PAYMENT_WATERFALL=('PRINCIPAL', 'INTEREST'), PAYMENT_WATERFALL_BY_INSTALLMENT=False)
+    def test_configured_waterfall(self):
+        """Test a waterfall that settles all principal before interest due, leaving an excess."""
+        payment = self.pay('P-1', '1250.00', date(2024, 3, 15))
+        self.assertEqual(self.allocations(payment), [
+            *((number, 'PRINCIPAL', Decimal('100.00')) for number in range(12)),
+            (0, 'INTEREST', Decimal('12.00')), (1, 'INTEREST', Decimal('12.00')), (None, 'EXCESS', Decimal('26.00')),
+        ])
+        with override_settings(PAYMENT_WATERFALL=('FEE', 'TIP')), self.assertRaises(ImproperlyConfigured):
+            payments.waterfall()
+
+    def test_copy(self):
+        """Test that allocations outside the schedule are copied with a NULL installment on PostgreSQL."""
+        if connection.vendor != 'postgresql':
+            self.skipTest('COPY is only used on PostgreSQL')
+        ledger.post(self.loan.pk, LedgerEntry.EntryType.FEE, '10.00', date(2024, 1, 15))
+        payment = self.pay('P-1', '2000.00', date(2024, 2, 1))
+        allocations = self.allocations(payment)
+        self.assertEqual(allocations[0], (None, 'FEE', Decimal('10.00')))
+        self.assertEqual(allocations[-1], (None, 'EXCESS', Decimal('778.00')))
+        self.assertEqual(payment.allocations.filter(installment__isnull=True).count(), 2)
+
+    def test_settle(self):
+        """Test that a settlement file is recorded loan by loan in date order and bad lines are rejected."""
+        self.pay('P-0', '112.00', date(2024, 2, 1))
+        summary = payments.settle([
+            ('LN-2', 'S-3', '112.00', '2024-03-01', 'CASH'),
+            ('LN-2', 'S-2', '112.00', '2024-02-01', 'BANK_TRANSFER'),
+            ('LN-1', 'S-1', '212.00', '2024-03-01', ''),
+            ('LN-9', 'S-4', '10.00', '2024-03-01', ''),
+            ('LN-1', 'P-0', '10.00', '2024-03-01', ''),
+            ('LN-1', 'S-1', '10.00', '2024-03-01', ''),
+            ('LN-1', 'S-5', '-1.00', '2024-03-01', ''),
+            ('LN-1', 'S-6', '1.00', 'yesterday', ''),
+        ], received_by=self.user, batch_size=1)
+        self.assertEqual(summary, {
+            'lines': 8, 'payments': 3, 'loans': 2,
+            'rejected': {'duplicate reference': 2, 'invalid': 2, 'unknown loan': 1},
+            'allocated': {'INTEREST': '36.00', 'PRINCIPAL': '400.00'},
+        })
+        self.assertEqual(self.allocations(Payment.objects.get(payment_reference='S-2')),
+                         [(0, 'INTEREST', Decimal('12.00')), (0, 'PRINCIPAL', Decimal('100.00'))])
+        self.assertEqual(Payment.objects.get(payment_reference='S-1').payment_method, Payment.PaymentMethod.OTHER)
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.amount_paid, self.other.last_payment_date), (Decimal('224.00'), date(2024, 3, 1)))
+        self.assertEqual(ledger.balance(self.other.pk), self.other.remaining_balance)
+        self.assertEqual(OutboxEvent.objects.filter(topic='payment.created').count(), 3)
+
+    def test_command(self):
+        """Test settling a file from the command line and allocating existing payments."""
+        Payment.objects.bulk_create([Payment(loan=self.other, payment_reference='OLD-1', amount=Decimal('50.00'),
+                                             payment_date=date(2024, 2, 1))])
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('loan_reference,payment_reference,amount,payment_date\nLN-1,S-1,112.00,2024-02-01\n')
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('settle_payments', f.name, '--received-by=boss', stdout=out)
+        self.assertRegex(out.getvalue(), r'payments\s+1\n')
+        self.assertRegex(out.getvalue(), r'principal\s+100.00\n')
+        self.assertEqual(Payment.objects.get(payment_reference='S-1').received_by, self.user)
+
+        out = StringIO()
+        call_command('settle_payments', '--existing', stdout=out)
+        self.assertRegex(out.getvalue(), r'interest\s+12.00\n')
+        self.assertRegex(out.getvalue(), r'principal\s+38.00\n')
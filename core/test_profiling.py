@@ -0,0 +1,164 @@
+"""
+Tests for the sampling profiler.
+"""
+import threading
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import resolve, reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.test_views import TEST_DRF_SETTINGS
+from users.models import User
+
+from .middleware.profiling import ProfilerMiddleware
+from .models import ProfileSample, ProfileSession
+from .profiling import StackSampler, active_sessions, invalidate_sessions, render_collapsed, render_flamegraph
+
+
+def busy_wait(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class StackSamplerTestCase(TestCase):
+    """Test case for stack sampling and rendering."""
+
+    def test_samples_running_code(self):
+        """Test that the sampler sees the function the thread is busy in."""
+        sampler = StackSampler(threading.get_ident(), 0.001).start()
+        busy_wait(0.05)
+        counts = sampler.stop()
+
+        self.assertTrue(counts)
+        self.assertTrue(any('core/test_profiling.py:busy_wait' in stack for stack in counts))
+
+    def test_render(self):
+        """Test collapsed and SVG output."""
+        counts = {'a.py:main;b.py:handler': 3, 'a.py:main;c.py:<render>': 1}
+
+        self.assertEqual(render_collapsed(counts), 'a.py:main;b.py:handler 3\na.py:main;c.py:<render> 1\n')
+        svg = render_flamegraph(counts, title='Test')
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertIn('b.py:handler (3 samples, 75.0%)', svg)
+        self.assertIn('&lt;render&gt;', svg)
+
+
+@override_settings(REST_FRAMEWORK=TEST_DRF_SETTINGS)
+class ProfileSessionAPITestCase(TestCase):
+    """Test case for the profiling sessions API and middleware."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.superuser = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpassword'
+        )
+        self.manager = User.objects.create_user(
+            username='manager',
+            email='manager@example.com',
+            password='password123',
+            role=User.Role.MANAGER
+        )
+        self.url = reverse('profile-session-list')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+        invalidate_sessions()
+
+    def tearDown(self):
+        invalidate_sessions()
+
+    def test_admin_only(self):
+        """Test that non-staff users cannot manage profiling."""
+        self.client.force_authenticate(user=self.manager)
+        response = self.client.post(self.url, {'view': 'FollowUpViewSet.list'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_profiles_matching_requests(self):
+        """Test that matching requests are profiled and downloadable."""
+        response = self.client.post(self.url, {
+            'view': 'FollowUpViewSet.list',
+            'role': User.Role.MANAGER,
+            'sample_rate': 1,
+            'interval_ms': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        session_id = response.data['id']
+
+        self.client.force_authenticate(user=self.manager)
+        self.client.get(reverse('follow-up-list'))
+        self.client.get(reverse('customer-list'))
+        self.client.force_authenticate(user=self.superuser)
+        self.client.get(reverse('follow-up-list'))
+
+        sample = ProfileSample.objects.get()
+        self.assertEqual(sample.session_id, session_id)
+        self.assertEqual(sample.view, 'FollowUpViewSet.list')
+
+        response = self.client.get(reverse('profile-session-collapsed', args=[session_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        response = self.client.get(reverse('profile-session-flamegraph', args=[session_id]))
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+
+    def test_inactive_session_not_used(self):
+        """Test that deactivating a session stops profiling."""
+        session = ProfileSession.objects.create(
+            view='FollowUpViewSet.list', sample_rate=1, is_active=False,
+            expires_at='2099-01-01T00:00:00Z'
+        )
+        self.client.get(reverse('follow-up-list'))
+        self.assertFalse(session.samples.exists())
+
+
+class AsyncProfilerMiddlewareTestCase(TestCase):
+    """Test case for the profiler middleware under ASGI."""
+
+    def setUp(self):
+        """Set up test data."""
+        async def get_response(request):
+            return None
+
+        self.middleware = ProfilerMiddleware(get_response)
+        invalidate_sessions()
+
+    def tearDown(self):
+        invalidate_sessions()
+
+    def process_view(self):
+        request = RequestFactory().get(reverse('follow-up-list'))
+        request.resolver_match = resolve(request.path)
+        request.user = AnonymousUser()
+        with mock.patch('core.middleware.profiling.sync_to_async', wraps=sync_to_async) as hop:
+            async_to_sync(self.middleware.aprocess_view)(request, request.resolver_match.func, (), {})
+        return request, hop.call_count
+
+    def test_stays_on_event_loop(self):
+        """Test that no thread is used while no cached session could sample the request."""
+        ProfileSession.objects.create(
+            view='CustomerViewSet.list', sample_rate=1, expires_at='2099-01-01T00:00:00Z'
+        )
+        _request, hops = self.process_view()
+        self.assertEqual(hops, 1)
+
+        request, hops = self.process_view()
+        self.assertEqual(hops, 0)
+        self.assertFalse(hasattr(request, '_profile'))
+
+    def test_profiles_matching_view(self):
+        """Test that a request a session could sample is profiled."""
+        ProfileSession.objects.create(
+            view='FollowUpViewSet.list', sample_rate=1, expires_at='2099-01-01T00:00:00Z'
+        )
+        active_sessions()
+        request, hops = self.process_view()
+        self.assertEqual(hops, 1)
+        sampler = request._profile[0]
+        sampler.stop()
@@ -0,0 +1,93 @@
+"""
+Tests for the query plan checks.
+"""
+import os
+import tempfile
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from .models import Job
+from .query_plans import capture, check, render, seq_scans
+
+
+def fresh_tables():
+    """
+    Swap the tables the plans read for empty files, until the test rolls back.
+
+    PostgreSQL prices reads by the size of a table's file, which keeps the
+    rows earlier tests rolled back.
+    """
+    models = [
+        model for model in apps.get_models()
+        if model._meta.app_label in ('customers', 'loans', 'interactions', 'users', 'dummy_app')
+    ]
+    tables = [model._meta.db_table for model in models + [Job]]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sql_flush(no_style(), tables, allow_cascade=True):
+            cursor.execute(sql)
+
+
+class SeqScansTestCase(SimpleTestCase):
+    """Test case for spotting full table reads in rendered plans."""
+
+    def test_seq_scans(self):
+        """Test that index scans are not reported."""
+        lines = [
+            'SCAN loans_loan',
+            '  SEARCH customers_customer USING INTEGER PRIMARY KEY (rowid=?)',
+            'SCAN loans_payment USING INDEX loans_payment(payment_date)',
+            'Nested Loop',
+            '  Seq Scan on interactions_followup',
+            '  Index Scan on interactions_interaction using interactions_interaction(initiated_by_id)',
+        ]
+        self.assertEqual(seq_scans(lines), {'loans_loan', 'interactions_followup'})
+
+
+class QueryPlanTestCase(TestCase):
+    """Test case for the plans of the role-scoped list endpoints."""
+
+    def setUp(self):
+        """Set up test data."""
+        if connection.vendor == 'postgresql':
+            fresh_tables()
+        call_command(
+            'generate_dataset', customers=12, prefix='plans', super_managers=1, managers=1,
+            officers_per_manager=2, agents=2, stdout=StringIO()
+        )
+
+    def test_plans(self):
+        """Test that no large table is scanned and the expected indexes are used."""
+        captured = capture('plans')
+        self.assertIn('LoanViewSet.list as COLLECTION_OFFICER', captured)
+        self.assertEqual(check(captured), [])
+
+    def test_snapshot_diff(self):
+        """Test that a changed plan fails with a diff."""
+        if connection.vendor == 'postgresql':
+            actual, changed = 'Bitmap Heap Scan on loans_payment', 'Seq Scan on loans_payment'
+        else:
+            actual, changed = 'SEARCH loans_payment', 'SCAN loans_payment'
+        with tempfile.TemporaryDirectory() as directory:
+            snapshot = os.path.join(directory, 'plans.txt')
+            call_command('explain_endpoints', prefix='plans', snapshot=snapshot, update=True, stdout=StringIO())
+            call_command('explain_endpoints', prefix='plans', snapshot=snapshot, stdout=StringIO())
+
+            with open(snapshot) as f:
+                text = f.read()
+            with open(snapshot, 'w') as f:
+                f.write(text.replace(actual, changed, 1))
+            stdout = StringIO()
+            with self.assertRaises(CommandError):
+                call_command('explain_endpoints', prefix='plans', snapshot=snapshot, stdout=stdout, stderr=StringIO())
+            self.assertRegex(stdout.getvalue(), rf'(?m)^-\s+{changed}')
+            self.assertRegex(stdout.getvalue(), rf'(?m)^\+\s+{actual}')
+
+    def test_checked_in_snapshot(self):
+        """Test that the plans match the snapshot recorded for this database version."""
+        call_command('explain_endpoints', prefix='plans', stdout=StringIO())
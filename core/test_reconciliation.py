@@ -0,0 +1,120 @@
+"""
+Tests for statement reconciliation.
+"""
+import csv
+import io
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from customers.models import Customer
+from loans.models import Loan, Payment
+from users.models import User
+
+from . import reconciliation
+
+
+STATEMENT = """reference,amount,date,loan_reference,description
+P-1,100.00,2024-03-01,,
+P-2,55.00,2024-03-02,,
+BANK-1,75.00,2024-03-06,LN-2,
+BANK-2,75.00,2024-03-08,,Repayment for ln-2
+P-5,20.00,2024-03-04,,
+X-9,12.00,2024-03-04,,
+P-1,100.00,2024-03-01,,
+,-10.00,2024-03-04,,
+bad,abc,2024-03-04,,
+"""
+
+MT940 = """:20:STATEMENT
+:25:12345678
+:28C:1/1
+:60F:C240301EUR0,00
+:61:2403010301C100,00NTRFP-1//B1
+:86:Payment
+:61:240308D5,00NCHGNONREF
+:61:240308C75,00NTRFNONREF//B2
+:86:Repayment loan
+LN-2 thanks
+:62F:C240308EUR170,00
+"""
+
+
+class ReconciliationTestCase(TestCase):
+    """Test case for matching statements against payments."""
+
+    def setUp(self):
+        """Set up test data."""
+        user = User.objects.create_user(username='boss', email='boss@example.com', password='password123')
+        customer = Customer.objects.create(
+            first_name='Jane', last_name='Doe', primary_phone='+1234567890', created_by=user
+        )
+        loans = {
+            reference: Loan.objects.create(
+                customer=customer, loan_reference=reference, status=Loan.Status.ACTIVE,
+                principal_amount=Decimal('1000.00'), interest_rate=Decimal('12.00'), term_months=12,
+            )
+            for reference in ('LN-1', 'LN-2')
+        }
+        Payment.objects.bulk_create([
+            Payment(loan=loans[loan], payment_reference=reference, amount=Decimal(amount), payment_date=payment_date,
+                    payment_method=method)
+            for reference, loan, amount, payment_date, method in [
+                ('P-1', 'LN-1', '100.00', date(2024, 3, 1), 'BANK_TRANSFER'),
+                ('P-2', 'LN-1', '50.00', date(2024, 3, 2), 'MOBILE_MONEY'),
+                ('P-3', 'LN-2', '75.00', date(2024, 3, 5), 'BANK_TRANSFER'),
+                ('P-4', 'LN-2', '75.00', date(2024, 3, 7), 'BANK_TRANSFER'),
+                ('P-5', 'LN-2', '20.00', date(2024, 1, 1), 'BANK_TRANSFER'),
+                ('P-6', 'LN-1', '30.00', date(2024, 3, 3), 'BANK_TRANSFER'),
+            ]
+        ])
+
+    def test_reconcile(self):
+        """Test matching on reference, then on amount, date and loan, and what is left suspect or unmatched."""
+        statement = reconciliation.read_csv(io.StringIO(STATEMENT))
+        self.assertEqual(statement.skipped, 2)
+        result = reconciliation.reconcile(statement.lines, window=3)
+        self.assertEqual([(line.number, entry.reference, rule) for line, entry, rule in result.matched], [
+            (2, 'P-1', 'reference'), (5, 'P-4', 'amount+date+loan'),
+        ])
+        self.assertEqual([(line.number, entry.reference, reason) for line, entry, reason in result.suspect], [
+            (3, 'P-2', 'amount differs'), (6, 'P-5', 'date outside window'), (8, 'P-1', 'payment already matched'),
+            (4, 'P-3', 'several payments match'),
+        ])
+        self.assertEqual([line.number for line in result.unmatched], [7])
+        self.assertEqual(sorted(entry.reference for entry in result.missing), ['P-3', 'P-6'])
+        self.assertEqual(reconciliation.summary(statement, result), {
+            'lines': 7, 'skipped': 2, 'matched': 2, 'matched by reference': 1, 'matched amount': '175.00',
+            'suspect': 4, 'unmatched lines': 1, 'unmatched payments': 2,
+        })
+
+    def test_mt940(self):
+        """Test reading credits and their narratives from MT940-like text."""
+        statement = reconciliation.read_mt940(io.StringIO(MT940))
+        self.assertEqual(statement, reconciliation.Statement([
+            reconciliation.Line(5, 'P-1', 10000, date(2024, 3, 1), '', 'Payment'),
+            reconciliation.Line(8, '', 7500, date(2024, 3, 8), '', 'Repayment loan LN-2 thanks'),
+        ], 1))
+        result = reconciliation.reconcile(statement.lines, window=3, methods=['BANK_TRANSFER'])
+        self.assertEqual([entry.reference for _, entry, _ in result.matched], ['P-1', 'P-4'])
+
+    def test_command(self):
+        """Test that the command writes the three reports."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'march.csv')
+            with open(path, 'w') as f:
+                f.write(STATEMENT)
+            out = StringIO()
+            call_command('reconcile_statement', path, '--window=3', stdout=out)
+            self.assertRegex(out.getvalue(), r'unmatched lines\s+1\n')
+            with open(os.path.join(directory, 'march.matched.csv'), newline='') as f:
+                rows = list(csv.DictReader(f))
+            self.assertEqual([(row['line'], row['payment_reference'], row['payment_loan']) for row in rows],
+                             [('2', 'P-1', 'LN-1'), ('5', 'P-4', 'LN-2')])
+            with open(os.path.join(directory, 'march.unmatched.csv'), newline='') as f:
+                self.assertEqual([row['side'] for row in csv.DictReader(f)], ['statement', 'payments', 'payments'])
@@ -0,0 +1,114 @@
+"""
+Tests for the reference allocator.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.test_views import TEST_DRF_SETTINGS
+from customers.models import Customer
+from users.models import User
+
+from .models import ReferenceSequence
+from .references import ReferenceAllocator, branch_code, is_valid_reference
+
+
+class ReferenceFormatTestCase(TestCase):
+    """Test case for reference formatting and check characters."""
+
+    def test_format(self):
+        """Test that references carry prefix, branch, date and a valid check character."""
+        allocator = ReferenceAllocator('test', 'LN')
+        reference = allocator.format(1295, branch='Nairobi West', on=date(2026, 10, 19))
+
+        self.assertTrue(reference.startswith('LN-NAIR-261019-00000ZZ'))
+        self.assertTrue(is_valid_reference(reference))
+
+    def test_typos_are_detected(self):
+        """Test that changing any single character invalidates the reference."""
+        reference = ReferenceAllocator('test', 'LN').format(123456, branch='Mombasa', on=date(2026, 1, 2))
+        for position, char in enumerate(reference):
+            if char == '-' or position < 3:
+                continue
+            replacement = '7' if char != '7' else '8'
+            typo = reference[:position] + replacement + reference[position + 1:]
+            self.assertFalse(is_valid_reference(typo), typo)
+
+    def test_branch_code(self):
+        """Test branch code derivation and the default for missing branches."""
+        self.assertEqual(branch_code('nairobi-west'), 'NAIR')
+        self.assertEqual(branch_code(''), 'HQ')
+
+
+@override_settings(REFERENCE_BLOCK_SIZE=10)
+class ReferenceAllocationTestCase(TestCase):
+    """Test case for reserving ids in blocks."""
+
+    def test_block_reservation(self):
+        """Test that ids are reserved a block at a time and never repeat."""
+        allocator = ReferenceAllocator('test', 'LN')
+        references = [allocator.next() for _ in range(15)]
+
+        self.assertEqual(len(set(references)), 15)
+        self.assertEqual(ReferenceSequence.objects.get(name='test').next_value, 21)
+
+    def test_workers_do_not_collide(self):
+        """Test that two allocators on the same sequence get disjoint blocks."""
+        first, second = ReferenceAllocator('test', 'LN'), ReferenceAllocator('test', 'LN')
+        references = first.take(5) + second.take(5) + first.take(10)
+
+        self.assertEqual(len(set(references)), 20)
+
+    def test_bulk_take(self):
+        """Test that a bulk request larger than a block is served in one go."""
+        references = ReferenceAllocator('test', 'PMT').take(25, branch='Kisumu')
+
+        self.assertEqual(len(set(references)), 25)
+        self.assertTrue(all(is_valid_reference(reference) for reference in references))
+
+
+@override_settings(REST_FRAMEWORK=TEST_DRF_SETTINGS)
+class ReferenceAPITestCase(TestCase):
+    """Test case for references issued through the API."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.superuser = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='adminpassword'
+        )
+        self.customer = Customer.objects.create(
+            first_name='Jane',
+            last_name='Doe',
+            primary_phone='+1234567890',
+            branch='Nairobi'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.superuser)
+
+    def test_loan_and_payment_references(self):
+        """Test that created loans and payments get valid branch references."""
+        response = self.client.post(reverse('loan-list'), {
+            'customer': self.customer.id,
+            'principal_amount': '10000.00',
+            'interest_rate': '12.00',
+            'term_months': 12,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['loan_reference'].startswith('LN-NAIR-'))
+        self.assertTrue(is_valid_reference(response.data['loan_reference']))
+
+        response = self.client.post(reverse('payment-list'), {
+            'loan': response.data['id'],
+            'amount': str(Decimal('500.00')),
+            'payment_date': date.today().isoformat(),
+            'payment_method': 'CASH',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['payment_reference'].startswith('PMT-NAIR-'))
+        self.assertTrue(is_valid_reference(response.data['payment_reference']))
@@ -0,0 +1,94 @@
+"""
+Tests for read replica routing.
+
+These need a second database standing in for a replica: set
+DB_TEST_REPLICA_NAME (e.g. repaysync_replica) so settings define the
+`replica_test` alias. Nothing replicates into it, which is what lets the
+tests tell which database a read went to.
+"""
+import csv
+import tempfile
+import unittest
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core import jobs, replicas
+from core.replicas import use_replica
+from customers.models import Customer
+from users.models import User
+
+
+REPLICA = 'replica_test'
+
+
+@unittest.skipUnless(REPLICA in settings.DATABASES, 'set DB_TEST_REPLICA_NAME to run the replica tests')
+@override_settings(DATABASE_REPLICAS=[REPLICA], REPLICA_STICKY_SECONDS=5, AUDIT_LOG_ASYNC=False)
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """Test case for routing reads between the primary and a replica."""
+
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        """Set up test data."""
+        replicas.reset_lag_checks()
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='manager', email='manager@example.com', password='password', role=User.Role.SUPER_MANAGER
+        )
+        # JWT authentication looks the user up on the replica.
+        self.user.save(using=REPLICA, force_insert=True)
+        Customer.objects.create(first_name='Only', last_name='Primary', primary_phone='+911111111111')
+        Customer.objects.using(REPLICA).create(first_name='Only', last_name='Replica', primary_phone='+912222222222')
+
+        self.client = APIClient(SERVER_NAME='localhost')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def last_names(self):
+        response = self.client.get('/api/customers/')
+        self.assertEqual(response.status_code, 200)
+        return [row['last_name'] for row in response.data['results']]
+
+    def test_reads_go_to_replica(self):
+        """Test that a GET reads from the replica."""
+        self.assertEqual(self.last_names(), ['Replica'])
+
+    def test_read_your_writes(self):
+        """Test that a user reads from the primary right after writing."""
+        response = self.client.post('/api/customers/', {
+            'first_name': 'New', 'last_name': 'Customer', 'primary_phone': '+913333333333',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(self.last_names()), ['Customer', 'Primary'])
+
+        cache.clear()
+        self.assertEqual(self.last_names(), ['Replica'])
+
+    def test_lagging_replica(self):
+        """Test that reads fall back to the primary when the replica lags."""
+        with mock.patch.object(replicas, 'replica_lag', return_value=60.0):
+            self.assertEqual(self.last_names(), ['Primary'])
+
+    def test_use_replica(self):
+        """Test that reporting code can read from a replica outside requests."""
+        with use_replica() as alias:
+            self.assertEqual(alias, REPLICA)
+            self.assertEqual(list(Customer.objects.values_list('last_name', flat=True)), ['Replica'])
+            with transaction.atomic():
+                self.assertEqual(list(Customer.objects.values_list('last_name', flat=True)), ['Primary'])
+        self.assertEqual(list(Customer.objects.values_list('last_name', flat=True)), ['Primary'])
+
+    def test_export_job_reads_replica(self):
+        """Test that an export job reads from the replica, though its chunks run in a transaction."""
+        with tempfile.TemporaryDirectory() as directory, override_settings(JOB_ARTIFACT_DIR=directory):
+            job = jobs.submit('export_customers', {}, self.user)
+            job.refresh_from_db()
+            self.assertEqual(job.status, job.Status.SUCCEEDED)
+            with open(jobs.artifact_path(job), newline='') as f:
+                rows = list(csv.reader(f))
+        self.assertEqual([row[2] for row in rows[1:]], ['Replica'])
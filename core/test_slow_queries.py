@@ -0,0 +1,116 @@
+"""
+Tests for the slow-query recorder.
+"""
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from api.test_views import TEST_DRF_SETTINGS
+from customers.models import Customer
+from users.models import User
+
+from .models import SlowQuery
+from .slow_queries import fingerprint, normalize_sql, slow_query_writer
+
+
+class CustomerCountSerializer(serializers.Serializer):
+    customer_count = serializers.SerializerMethodField()
+
+    def get_customer_count(self, obj):
+        return Customer.objects.filter(assigned_officer=obj).count()
+
+
+class NormalizeSQLTestCase(TestCase):
+    """Test case for SQL fingerprinting."""
+
+    def test_literals_and_lists(self):
+        """Test that literals, IN lists and VALUES rows are collapsed."""
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t1 WHERE a = 'x''y' AND b IN (%s, %s, %s) AND c > 10.5"),
+            'SELECT * FROM t1 WHERE a = ? AND b IN (...) AND c > ?'
+        )
+        self.assertEqual(
+            normalize_sql('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'),
+            'INSERT INTO t (a, b) VALUES (%s, %s), ...'
+        )
+
+    def test_same_shape_same_fingerprint(self):
+        """Test that statements differing only in list length share a fingerprint."""
+        self.assertEqual(
+            fingerprint('SELECT id FROM t WHERE id IN (%s, %s)'),
+            fingerprint('SELECT  id FROM t\nWHERE id IN (%s)')
+        )
+
+
+@override_settings(
+    REST_FRAMEWORK=TEST_DRF_SETTINGS,
+    SLOW_QUERY_THRESHOLD_MS=0,
+    SLOW_QUERY_EXPLAIN_RATE=1,
+    SLOW_QUERY_BACKGROUND_WRITER=False,
+)
+class SlowQueryRecorderTestCase(TestCase):
+    """Test case for recording queries over the threshold."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.officer = User.objects.create_user(
+            username='officer',
+            email='officer@example.com',
+            password='password123',
+            role=User.Role.COLLECTION_OFFICER
+        )
+        Customer.objects.create(first_name='Jane', last_name='Doe', primary_phone='+1234567890')
+        slow_query_writer.flush()
+        SlowQuery.objects.all().delete()
+
+    def test_view_attribution_and_dedupe(self):
+        """Test that queries are attributed to the view and deduplicated."""
+        client = APIClient()
+        client.force_authenticate(user=self.officer)
+        client.get(reverse('customer-list'))
+        client.get(reverse('customer-list'))
+        slow_query_writer.flush()
+
+        query = SlowQuery.objects.filter(view='CustomerViewSet.list', sql__contains='customers_customer').first()
+        self.assertIsNotNone(query)
+        self.assertGreaterEqual(query.count, 2)
+        self.assertIn('api/', query.stack)
+        self.assertTrue(query.explain)
+
+    def test_cte_is_explained(self):
+        """Test that a statement starting with a CTE is explained like a SELECT."""
+        with connection.cursor() as cursor:
+            cursor.execute('WITH active AS (SELECT id FROM customers_customer WHERE is_active) '
+                           'SELECT COUNT(*) FROM active')
+        slow_query_writer.flush()
+
+        query = SlowQuery.objects.get(sql__startswith='WITH active')
+        self.assertTrue(query.explain)
+
+    def test_serializer_attribution(self):
+        """Test that queries issued from serializer methods name the method."""
+        CustomerCountSerializer(self.officer).data
+        slow_query_writer.flush()
+
+        query = SlowQuery.objects.get(origin='CustomerCountSerializer.get_customer_count')
+        self.assertIn('COUNT', query.sql.upper())
+
+    def test_command(self):
+        """Test listing and showing recorded queries."""
+        CustomerCountSerializer(self.officer).data
+        slow_query_writer.flush()
+        query = SlowQuery.objects.get(origin='CustomerCountSerializer.get_customer_count')
+
+        out = StringIO()
+        call_command('slow_queries', stdout=out)
+        self.assertIn(query.fingerprint[:8], out.getvalue())
+
+        out = StringIO()
+        call_command('slow_queries', query.fingerprint[:8], stdout=out)
+        self.assertIn('CustomerCountSerializer.get_customer_count', out.getvalue())
+        self.assertIn('core/test_slow_queries.py', out.getvalue())
@@ -0,0 +1,119 @@
+"""
+Tests for the batch loan status transitions.
+"""
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from customers.models import Customer
+from loans.models import Loan
+from users.models import User
+
+from . import jobs
+from .models import Job, LoanTransition, OutboxEvent
+from .transitions import run_rule
+
+
+class TransitionTestCase(TestCase):
+    """Test case for applying transition rules to loans."""
+
+    def setUp(self):
+        """Set up test data."""
+        self.user = User.objects.create_user(
+            username='boss', email='boss@example.com', password='password123', role=User.Role.SUPER_MANAGER
+        )
+        customer = Customer.objects.create(
+            first_name='Jane', last_name='Doe', primary_phone='+1234567890', created_by=self.user
+        )
+        # 1000.00 at 10% over 6 months: 1050.00 due
+        loans = [
+            ('LN-1', Loan.Status.ACTIVE, 120, '0.00'),
+            ('LN-2', Loan.Status.RESTRUCTURED, 95, '0.00'),
+            ('LN-3', Loan.Status.ACTIVE, 90, '0.00'),
+            ('LN-4', Loan.Status.DEFAULTED, 200, '0.00'),
+            ('LN-5', Loan.Status.PENDING, 100, '0.00'),
+            ('LN-6', Loan.Status.ACTIVE, 0, '1050.00'),
+            ('LN-7', Loan.Status.DEFAULTED, 150, '1100.00'),
+            ('LN-8', Loan.Status.ACTIVE, 0, '1049.99'),
+        ]
+        for reference, status, days_past_due, paid in loans:
+            Loan.objects.create(
+                customer=customer, loan_reference=reference, status=status, days_past_due=days_past_due,
+                principal_amount=Decimal('1000.00'), interest_rate=Decimal('10.00'), term_months=6,
+                amount_paid=Decimal(paid),
+            )
+
+    def statuses(self):
+        return dict(Loan.objects.values_list('loan_reference', 'status'))
+
+    def test_default_and_close(self):
+        """Test that overdue loans default and paid loans close, once, with an audit row and event each."""
+        defaulted = run_rule('default_overdue', user=self.user, batch_size=1)
+        self.assertEqual((defaulted['moved'], defaulted['from_statuses']), (2, {'ACTIVE': 1, 'RESTRUCTURED': 1}))
+        closed = run_rule('close_paid', user=self.user)
+        self.assertEqual((closed['moved'], closed['from_statuses']), (2, {'ACTIVE': 1, 'DEFAULTED': 1}))
+
+        statuses = self.statuses()
+        self.assertEqual([statuses[f'LN-{number}'] for number in range(1, 9)], [
+            'DEFAULTED', 'DEFAULTED', 'ACTIVE', 'DEFAULTED', 'PENDING', 'PAID', 'PAID', 'ACTIVE',
+        ])
+        transitions = LoanTransition.objects.filter(run=defaulted['run'])
+        self.assertEqual(
+            sorted(transitions.values_list('loan__loan_reference', 'from_status', 'to_status', 'changed_by')),
+            [('LN-1', 'ACTIVE', 'DEFAULTED', self.user.pk), ('LN-2', 'RESTRUCTURED', 'DEFAULTED', self.user.pk)]
+        )
+        self.assertEqual(OutboxEvent.objects.filter(topic='loan.defaulted').count(), 2)
+        self.assertEqual(OutboxEvent.objects.filter(topic='loan.paid').first().payload['rule'], 'close_paid')
+        self.assertEqual(Loan.objects.get(loan_reference='LN-1').updated_by, self.user)
+
+        self.assertEqual(run_rule('default_overdue')['moved'], 0)
+        self.assertEqual(run_rule('default_overdue', {'dpd_threshold': 89})['moved'], 1)
+
+    def test_dry_run(self):
+        """Test that a dry run counts the same loans and changes nothing."""
+        summary = run_rule('default_overdue', dry_run=True)
+        self.assertEqual((summary['moved'], summary['dry_run']), (2, True))
+        self.assertEqual(self.statuses()['LN-1'], Loan.Status.ACTIVE)
+        self.assertFalse(LoanTransition.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_write_off(self):
+        """Test that a write-off list moves open loans only and reports the rest."""
+        summary = run_rule('write_off', {'references': ['LN-1', 'LN-4', 'LN-5', 'LN-99', 'LN-1']}, batch_size=2)
+        self.assertEqual(summary['from_statuses'], {'ACTIVE': 1, 'DEFAULTED': 1})
+        self.assertEqual((summary['skipped'], summary['missing']), (1, 1))
+        self.assertEqual(self.statuses()['LN-5'], Loan.Status.PENDING)
+
+        with self.assertRaises(ValueError):
+            run_rule('write_off', {})
+
+    def test_command(self):
+        """Test the transition_loans command."""
+        out = StringIO()
+        call_command('transition_loans', '--rule=default_overdue', '--rule=close_paid', '--dry-run', stdout=out)
+        self.assertIn('Dry run: 4 loans would change status', out.getvalue())
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'write-off.csv')
+            with open(path, 'w') as f:
+                f.write('LN-3,approved\nLN-8,approved\n')
+            out = StringIO()
+            call_command('transition_loans', '--rule=write_off', references=path, user='boss', stdout=out)
+        self.assertRegex(out.getvalue(), r'write_off\s+WRITTEN_OFF\s+ACTIVE\s+2')
+        self.assertIn('Changed the status of 2 loans', out.getvalue())
+
+    @override_settings(JOB_CHUNK_SIZE=3)
+    def test_job(self):
+        """Test that a transition runs as a background job with a summary as its result."""
+        with self.captureOnCommitCallbacks(execute=True):
+            job = jobs.submit('transition_loans', jobs.get_kind('transition_loans').clean_params(
+                {'rule': 'default_overdue'}, self.user
+            ), self.user)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+        self.assertEqual(job.result['from_statuses'], {'ACTIVE': 1, 'RESTRUCTURED': 1})
+        self.assertEqual(LoanTransition.objects.filter(run=job.params['run']).count(), 2)
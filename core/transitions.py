@@ -0,0 +1,238 @@
+"""
+Batch loan status transitions for month-end runs.
+
+A TransitionRule moves every loan in one of its `from_statuses` that matches
+its condition to its `to_status`:
+
+* default_overdue moves active and restructured loans more than
+  LOAN_DEFAULT_DPD_THRESHOLD days past due to DEFAULTED;
+* close_paid moves open loans whose amount_paid covers total_amount_due to
+  PAID;
+* write_off moves the open loans of an approved list of loan references to
+  WRITTEN_OFF and posts the write-off of their balances to their ledgers
+  (core.ledger).
+
+Rules run chunk by chunk (`apply_chunk`). Each chunk locks its candidate
+rows with the guard (status and condition) checked again, updates them in
+one statement, and in the same transaction writes a LoanTransition row per
+loan with bulk_create and an outbox event per loan with
+`outbox.record_many`. A loan that changed between selection and lock is
+skipped, never moved from a status the rule does not allow. With `dry_run`
+the same chunks are only counted.
+
+`manage.py transition_loans` runs rules from the command line; the
+`transition_loans` job kind (core.jobs) runs one in the background.
+"""
+import uuid
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Value
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from loans.models import Loan
+
+from . import ledger, outbox
+from .models import LoanTransition, Tombstone
+from .signals import status_tombstones
+
+
+Chunk = namedtuple('Chunk', ['after', 'last', 'moved', 'skipped', 'missing'])
+
+OPEN_STATUSES = (Loan.Status.ACTIVE, Loan.Status.RESTRUCTURED, Loan.Status.DEFAULTED)
+
+# amount_paid >= Loan.total_amount_due, multiplied out by 1200 so that no
+# database divides integers, with half a cent to spare for databases that
+# compute it in floating point (SQLite).
+PAID_OFF = GreaterThanOrEqual(
+    ExpressionWrapper(F('amount_paid') * 1200 + Value(6), output_field=DecimalField()),
+    ExpressionWrapper(F('principal_amount') * 1200 + F('principal_amount') * F('interest_rate') * F('term_months'),
+                      output_field=DecimalField()),
+)
+
+
+class TransitionRule:
+    """
+    Moves loans in `from_statuses` that match `condition` to `to_status`.
+    Subclasses set the names and statuses and override `condition`.
+    """
+    name = None
+    topic = None  # outbox topic of each transition
+    from_statuses = ()
+    to_status = None
+
+    def clean_params(self, params):
+        """
+        Return the rule's parameters, or raise ValueError.
+        """
+        return {}
+
+    def condition(self, params):
+        return Q()
+
+    def guard(self, params):
+        return Q(status__in=self.from_statuses) & self.condition(params)
+
+    def count(self, params):
+        return Loan.objects.filter(self.guard(params)).count()
+
+    def moved(self, ids, run):
+        """
+        Called in the chunk's transaction with the ids of the loans moved.
+        """
+
+    def chunk(self, params, after, size):
+        """
+        Return (filter for the loans of the chunk after `after`, how many
+        loans it asks for, position after the chunk, whether it is the last).
+        """
+        ids = list(Loan.objects.filter(self.guard(params), pk__gt=after or 0).order_by('pk').values_list(
+            'pk', flat=True
+        )[:size])
+        return Q(pk__in=ids), len(ids), (ids[-1] if ids else after), len(ids) < size
+
+
+class DefaultOverdueRule(TransitionRule):
+    name = 'default_overdue'
+    topic = 'loan.defaulted'
+    from_statuses = (Loan.Status.ACTIVE, Loan.Status.RESTRUCTURED)
+    to_status = Loan.Status.DEFAULTED
+
+    def clean_params(self, params):
+        threshold = params.get('dpd_threshold', getattr(settings, 'LOAN_DEFAULT_DPD_THRESHOLD', 90))
+        try:
+            threshold = int(threshold)
+        except (TypeError, ValueError):
+            raise ValueError('dpd_threshold must be a whole number of days')
+        return {'dpd_threshold': threshold}
+
+    def condition(self, params):
+        return Q(days_past_due__gt=params['dpd_threshold'])
+
+
+class ClosePaidRule(TransitionRule):
+    name = 'close_paid'
+    topic = 'loan.paid'
+    from_statuses = OPEN_STATUSES
+    to_status = Loan.Status.PAID
+
+    def condition(self, params):
+        return Q(PAID_OFF)
+
+
+class WriteOffRule(TransitionRule):
+    name = 'write_off'
+    topic = 'loan.written_off'
+    from_statuses = OPEN_STATUSES
+    to_status = Loan.Status.WRITTEN_OFF
+
+    def clean_params(self, params):
+        references = params.get('references')
+        if not isinstance(references, (list, tuple)) or not references:
+            raise ValueError('write_off needs a list of loan references')
+        return {'references': sorted({str(reference).strip() for reference in references} - {''})}
+
+    def condition(self, params):
+        return Q(loan_reference__in=params['references'])
+
+    def count(self, params):
+        return len(params['references'])
+
+    def moved(self, ids, run):
+        ledger.write_off(ids, reference=str(run))
+
+    def chunk(self, params, after, size):
+        # Walk the approved list rather than the loans table.
+        after = after or 0
+        references = params['references'][after:after + size]
+        return (Q(loan_reference__in=references), len(references), after + len(references),
+                after + size >= len(params['references']))
+
+
+RULES = {rule.name: rule() for rule in (DefaultOverdueRule, ClosePaidRule, WriteOffRule)}
+
+
+def get_rule(name):
+    try:
+        return RULES[name]
+    except KeyError:
+        raise ValueError(f"Unknown transition rule '{name}'")
+
+
+def apply_chunk(rule, params, after, size, run, user=None, dry_run=False):
+    """
+    Apply `rule` to the chunk after `after`. Return a Chunk with the
+    position after it, whether it was the last, a Counter of the loans moved
+    by previous status, and how many loans of the chunk no longer matched
+    the guard (`skipped`) or do not exist (`missing`).
+    """
+    chunk, requested, after, last = rule.chunk(params, after, size)
+    with transaction.atomic():
+        candidates = Loan.objects.filter(chunk)
+        found = candidates.count()
+        eligible = candidates.filter(rule.guard(params)).order_by('pk')
+        if not dry_run and connection.features.has_select_for_update:
+            eligible = eligible.select_for_update()
+        rows = list(eligible.values_list('pk', 'loan_reference', 'customer_id', 'status'))
+        result = Chunk(after, last, Counter(status for *_, status in rows), found - len(rows), requested - found)
+        if dry_run or not rows:
+            return result
+
+        now = timezone.now()
+        user_id = getattr(user, 'pk', None)
+        ids = [row[0] for row in rows]
+        Loan.objects.filter(pk__in=ids).update(status=rule.to_status, updated_at=now, updated_by_id=user_id)
+        Tombstone.objects.bulk_create(status_tombstones({pk: status for pk, _, _, status in rows}, rule.to_status))
+        rule.moved(ids, run)
+        LoanTransition.objects.bulk_create([
+            LoanTransition(loan_id=pk, rule=rule.name, run=run, from_status=status, to_status=rule.to_status,
+                           changed_by_id=user_id)
+            for pk, _, _, status in rows
+        ], batch_size=1000)
+        outbox.record_many(rule.topic, [
+            (Loan(pk=pk), {
+                'loan': pk,
+                'loan_reference': reference,
+                'customer': customer_id,
+                'from_status': status,
+                'to_status': rule.to_status,
+                'changed_by': user_id,
+                'rule': rule.name,
+                'run': str(run),
+            })
+            for pk, reference, customer_id, status in rows
+        ])
+    return result
+
+
+def run_rule(name, params=None, user=None, dry_run=False, batch_size=None, run=None):
+    """
+    Apply a rule to every matching loan; return its summary.
+    """
+    rule = get_rule(name)
+    params = rule.clean_params(params or {})
+    batch_size = batch_size or getattr(settings, 'LOAN_TRANSITION_BATCH_SIZE', 1000)
+    run = run or uuid.uuid4()
+    moved, skipped, missing, after, last = Counter(), 0, 0, None, False
+    while not last:
+        chunk = apply_chunk(rule, params, after, batch_size, run, user, dry_run)
+        moved.update(chunk.moved)
+        skipped += chunk.skipped
+        missing += chunk.missing
+        after, last = chunk.after, chunk.last
+    return summary(rule, run, moved, skipped, missing, dry_run)
+
+
+def summary(rule, run, moved, skipped, missing, dry_run):
+    return {
+        'rule': rule.name,
+        'run': str(run),
+        'to_status': rule.to_status,
+        'dry_run': dry_run,
+        'moved': sum(moved.values()),
+        'from_statuses': dict(sorted(moved.items())),
+        'skipped': skipped,
+        'missing': missing,
+    }
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .metrics import render_metrics
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint.
+
+    Open to METRICS_ALLOWED_IPS (the scraper) and to logged-in staff.
+    """
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1'])
+    user = getattr(request, 'user', None)
+    if request.META.get('REMOTE_ADDR') not in allowed_ips and not (user and user.is_staff):
+        return HttpResponseForbidden()
+
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
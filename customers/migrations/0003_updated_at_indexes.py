@@ -0,0 +1,23 @@
+# Generated by Django 5.1 on 2026-10-19 01:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['updated_at'], name='customers_c_updated_7518c4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['assigned_officer', 'updated_at'], name='customers_c_assigne_baa53f_idx'),
+        ),
+    ]
@@ -104,6 +104,8 @@ class Customer(models.Model):
             models.Index(fields=['primary_phone']),
             models.Index(fields=['national_id']),
             models.Index(fields=['last_name', 'first_name']),
+            models.Index(fields=['updated_at']),
+            models.Index(fields=['assigned_officer', 'updated_at']),
         ]
         
     def __str__(self):
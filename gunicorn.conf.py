@@ -0,0 +1,27 @@
+"""
+Gunicorn settings.
+
+Prometheus metrics are aggregated across workers through files in
+PROMETHEUS_MULTIPROC_DIR (see core.metrics); the directory is emptied when
+the master starts and dead workers' gauges are cleaned up on exit.
+"""
+import os
+import shutil
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+# 'uvicorn.workers.UvicornWorker' serves repaysync.asgi, for the async endpoints under /api/async/
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/repaysync-metrics')
+
+
+def on_starting(server):
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
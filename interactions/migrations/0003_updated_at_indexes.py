@@ -0,0 +1,29 @@
+# Generated by Django 5.1 on 2026-10-19 01:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0003_updated_at_indexes'),
+        ('interactions', '0002_initial'),
+        ('loans', '0003_updated_at_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='followup',
+            index=models.Index(fields=['updated_at'], name='interaction_updated_8fa2a7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='followup',
+            index=models.Index(fields=['assigned_to', 'updated_at'], name='interaction_assigne_aa6889_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['updated_at'], name='interaction_updated_7629ec_idx'),
+        ),
+    ]
@@ -93,6 +93,7 @@ class Interaction(models.Model):
             models.Index(fields=['loan']),
             models.Index(fields=['initiated_by']),
             models.Index(fields=['start_time']),
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
@@ -202,7 +203,32 @@ class FollowUp(models.Model):
             models.Index(fields=['assigned_to']),
             models.Index(fields=['status']),
             models.Index(fields=['scheduled_date']),
+            models.Index(fields=['updated_at']),
+            models.Index(fields=['assigned_to', 'updated_at']),
         ]
     
+    # Stored state that core.events compares a save against.
+    STATE_FIELDS = ('assigned_to_id', 'status', 'scheduled_date', 'scheduled_time')
+
     def __str__(self):
         return f"{self.get_follow_up_type_display()} with {self.customer} on {self.scheduled_date}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored state, so that a save need not read it again"""
+        instance = super().from_db(db, field_names, values)
+        instance.remember_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.remember_state()
+
+    def remember_state(self):
+        """Take the current state as the stored one, or forget it if part of it is deferred"""
+        if all(field in self.__dict__ for field in self.STATE_FIELDS):
+            self._stored_state = {
+                field: self._meta.get_field(field).to_python(self.__dict__[field]) for field in self.STATE_FIELDS
+            }
+        else:
+            self._stored_state = None
@@ -1,4 +1,7 @@
 from django.contrib import admin
+
+from core.references import loan_references, payment_references
+
 from .models import Loan, Payment
 
 
@@ -46,8 +49,7 @@ class LoanAdmin(admin.ModelAdmin):
             
             # Generate a loan reference if not provided
             if not obj.loan_reference:
-                import uuid
-                obj.loan_reference = f"LN-{str(uuid.uuid4())[:8].upper()}"
+                obj.loan_reference = loan_references.next(branch=obj.customer.branch)
                 
         obj.updated_by = request.user
         super().save_model(request, obj, form, change)
@@ -66,8 +68,7 @@ class PaymentAdmin(admin.ModelAdmin):
         if not change:  # If creating a new object
             # Generate a payment reference if not provided
             if not obj.payment_reference:
-                import uuid
-                obj.payment_reference = f"PMT-{str(uuid.uuid4())[:8].upper()}"
+                obj.payment_reference = payment_references.next(branch=obj.loan.customer.branch)
                 
             # Set the receiver to the current user if not specified
             if not obj.received_by:
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-19 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0003_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loan',
+            name='loan_reference',
+            field=models.CharField(max_length=30, unique=True, verbose_name='loan reference'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1 on 2026-10-19 03:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_loan_reference_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField(verbose_name='sequence')),
+                ('entry_type', models.CharField(choices=[('DISBURSEMENT', 'Disbursement'), ('INTEREST', 'Interest'), ('PENALTY', 'Penalty'), ('FEE', 'Fee'), ('PAYMENT', 'Payment'), ('WAIVER', 'Waiver'), ('WRITE_OFF', 'Write-off')], max_length=20, verbose_name='entry type')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='amount')),
+                ('booked_on', models.DateField(verbose_name='booked on')),
+                ('value_date', models.DateField(verbose_name='value date')),
+                ('reference', models.CharField(blank=True, max_length=64, verbose_name='reference')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to='loans.loan', verbose_name='loan')),
+            ],
+            options={
+                'verbose_name': 'ledger entry',
+                'verbose_name_plural': 'ledger entries',
+                'ordering': ['loan', 'sequence'],
+                'indexes': [models.Index(fields=['loan', 'booked_on', 'amount'], name='loans_ledger_balance_idx')],
+                'constraints': [models.UniqueConstraint(fields=('loan', 'sequence'), name='loans_ledger_entry_sequence')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField(verbose_name='sequence')),
+                ('booked_on', models.DateField(verbose_name='booked on')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='balance')),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_snapshots', to='loans.loan', verbose_name='loan')),
+            ],
+            options={
+                'verbose_name': 'ledger snapshot',
+                'verbose_name_plural': 'ledger snapshots',
+                'indexes': [models.Index(fields=['loan', 'booked_on', 'sequence'], name='loans_ledger_snapshot_idx')],
+                'constraints': [models.UniqueConstraint(fields=('loan', 'sequence'), name='loans_ledger_snapshot_sequence')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-19 03:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0005_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='accrued_through',
+            field=models.DateField(blank=True, null=True, verbose_name='interest accrued through'),
+        ),
+    ]
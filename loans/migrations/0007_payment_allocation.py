@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-19 03:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0006_loan_accrued_through'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('installment', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='installment')),
+                ('component', models.PositiveSmallIntegerField(choices=[(1, 'Fee'), (2, 'Penalty'), (3, 'Interest'), (4, 'Principal'), (5, 'Excess')], verbose_name='component')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='amount')),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='loans.loan', verbose_name='loan')),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='loans.payment', verbose_name='payment')),
+            ],
+            options={
+                'verbose_name': 'payment allocation',
+                'verbose_name_plural': 'payment allocations',
+                'indexes': [models.Index(fields=['loan', 'installment', 'component'], name='loans_allocation_loan_idx')],
+            },
+        ),
+    ]
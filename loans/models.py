@@ -1,12 +1,34 @@
-from django.db import models
+import calendar
+import math
+
+from django.db import models, transaction
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import MinValueValidator
+from datetime import timedelta
 from decimal import Decimal
 
 from customers.models import Customer
 from users.models import User
 
 
+# Installment spacing per payment frequency, as (months, days).
+PAYMENT_PERIODS = {
+    'DAILY': (0, 1),
+    'WEEKLY': (0, 7),
+    'BIWEEKLY': (0, 14),
+    'MONTHLY': (1, 0),
+    'QUARTERLY': (3, 0),
+}
+
+
+def add_months(value, months):
+    """Same day `months` later, clamped to the end of shorter months"""
+    month = value.month - 1 + months
+    year = value.year + month // 12
+    month = month % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+
 class Loan(models.Model):
     """Loan model representing a customer's loan"""
     
@@ -25,7 +47,7 @@ class Loan(models.Model):
         related_name='loans',
         verbose_name=_('customer')
     )
-    loan_reference = models.CharField(_('loan reference'), max_length=20, unique=True)
+    loan_reference = models.CharField(_('loan reference'), max_length=30, unique=True)
     status = models.CharField(_('status'), max_length=20, choices=Status.choices, default=Status.PENDING)
     
     # Loan Amounts
@@ -73,6 +95,7 @@ class Loan(models.Model):
     )
     last_payment_date = models.DateField(_('last payment date'), null=True, blank=True)
     days_past_due = models.PositiveIntegerField(_('days past due'), default=0)
+    accrued_through = models.DateField(_('interest accrued through'), null=True, blank=True)
     
     # Assigned Officer and Notes
     assigned_officer = models.ForeignKey(
@@ -116,6 +139,7 @@ class Loan(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['customer']),
             models.Index(fields=['assigned_officer']),
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
@@ -132,6 +156,62 @@ class Loan(models.Model):
         """Calculate the remaining balance"""
         return self.total_amount_due - self.amount_paid
     
+    @property
+    def accrual_start(self):
+        """Date from which interest accrues"""
+        return self.disbursement_date or self.approval_date or self.application_date
+
+    @property
+    def term_days(self):
+        """Days from the accrual start to the end of the term"""
+        start = self.accrual_start
+        return max(1, (add_months(start, self.term_months) - start).days)
+
+    @property
+    def interest_cents(self):
+        """Contractual interest of total_amount_due in whole cents, rounded half up"""
+        cents = int(self.principal_amount * 100) * int(self.interest_rate * 100) * self.term_months
+        return (cents * 2 + 120000) // 240000
+
+    def interest_accrued(self, as_of):
+        """
+        Contractual interest accrued by the end of `as_of`, in equal daily
+        parts over the term from the accrual start and rounded down to the
+        cent, so that the parts add up to the whole interest at maturity.
+        """
+        days = min(max((as_of - self.accrual_start).days, 0), self.term_days)
+        return Decimal(self.interest_cents * days // self.term_days) / 100
+
+    @property
+    def installment_count(self):
+        """Number of equal installments over the term"""
+        months, days = PAYMENT_PERIODS.get(self.payment_frequency, (1, 0))
+        if months:
+            return max(1, math.ceil(self.term_months / months))
+        return max(1, round(self.term_months * 365 / 12 / days))
+
+    def installment_due_date(self, number):
+        """Due date of installment `number`, counting the first as 0"""
+        months, days = PAYMENT_PERIODS.get(self.payment_frequency, (1, 0))
+        if months:
+            return add_months(self.first_payment_date, months * number)
+        return self.first_payment_date + timedelta(days=days * number)
+
+    def compute_days_past_due(self, as_of):
+        """
+        Days between `as_of` and the due date of the oldest installment that
+        `amount_paid` does not cover, assuming equal installments from the
+        first payment date; 0 when nothing is overdue or there is no schedule.
+        """
+        if self.first_payment_date is None:
+            return 0
+        count = self.installment_count
+        installment = (self.total_amount_due / count).quantize(Decimal('0.01'))
+        covered = int(self.amount_paid // installment) if installment > 0 else count
+        if covered >= count:
+            return 0
+        return max(0, (as_of - self.installment_due_date(covered)).days)
+
     @property
     def payment_status(self):
         """Return a descriptive payment status"""
@@ -200,27 +280,145 @@ class Payment(models.Model):
             models.Index(fields=['payment_reference']),
             models.Index(fields=['loan']),
             models.Index(fields=['payment_date']),
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
         return f"{self.payment_reference} - {self.amount}"
     
     def save(self, *args, **kwargs):
-        """Override save to update loan amount_paid and last_payment_date"""
+        """
+        Override save to post new payments to the loan's ledger and allocate
+        them, which also updates the loan's amount_paid, last_payment_date
+        and status
+        """
+        from core import payments  # core's models depend on this app
+
         is_new = self.pk is None
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if is_new:  # Only post new payments
+                payments.record_payments([self])
+
+
+class PaymentAllocation(models.Model):
+    """
+    Part of a payment applied to one component of what a loan owes: a fee,
+    penalty, or an installment's interest or principal (see
+    core.payments). What a payment could not settle is its excess.
+    """
+
+    class Component(models.IntegerChoices):
+        FEE = 1, _('Fee')
+        PENALTY = 2, _('Penalty')
+        INTEREST = 3, _('Interest')
+        PRINCIPAL = 4, _('Principal')
+        EXCESS = 5, _('Excess')
+
+    payment = models.ForeignKey(
+        Payment,
+        on_delete=models.CASCADE,
+        related_name='allocations',
+        verbose_name=_('payment')
+    )
+    loan = models.ForeignKey(
+        Loan,
+        on_delete=models.CASCADE,
+        related_name='allocations',
+        verbose_name=_('loan')
+    )
+    installment = models.PositiveSmallIntegerField(_('installment'), null=True, blank=True)
+    component = models.PositiveSmallIntegerField(_('component'), choices=Component.choices)
+    amount = models.DecimalField(_('amount'), max_digits=12, decimal_places=2)
+
+    class Meta:
+        verbose_name = _('payment allocation')
+        verbose_name_plural = _('payment allocations')
+        indexes = [
+            models.Index(fields=['loan', 'installment', 'component'], name='loans_allocation_loan_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.payment_id} {self.get_component_display()} {self.amount}"
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only record of a movement on a loan's balance. Amounts are signed:
+    disbursements and charges are positive, payments and reliefs negative.
+    Entries are numbered per loan and booked on their value date, or on the
+    loan's latest booking date when back-valued, so that booked_on never
+    decreases along a loan's sequence.
+    """
+
+    class EntryType(models.TextChoices):
+        DISBURSEMENT = 'DISBURSEMENT', _('Disbursement')
+        INTEREST = 'INTEREST', _('Interest')
+        PENALTY = 'PENALTY', _('Penalty')
+        FEE = 'FEE', _('Fee')
+        PAYMENT = 'PAYMENT', _('Payment')
+        WAIVER = 'WAIVER', _('Waiver')
+        WRITE_OFF = 'WRITE_OFF', _('Write-off')
+
+    CREDIT_TYPES = (EntryType.PAYMENT, EntryType.WAIVER, EntryType.WRITE_OFF)
+
+    loan = models.ForeignKey(
+        Loan,
+        on_delete=models.CASCADE,
+        related_name='ledger_entries',
+        verbose_name=_('loan')
+    )
+    sequence = models.PositiveIntegerField(_('sequence'))
+    entry_type = models.CharField(_('entry type'), max_length=20, choices=EntryType.choices)
+    amount = models.DecimalField(_('amount'), max_digits=14, decimal_places=2)
+    booked_on = models.DateField(_('booked on'))
+    value_date = models.DateField(_('value date'))
+    reference = models.CharField(_('reference'), max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('ledger entry')
+        verbose_name_plural = _('ledger entries')
+        ordering = ['loan', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['loan', 'sequence'], name='loans_ledger_entry_sequence'),
+        ]
+        indexes = [
+            # Covers point-in-time sums per loan and the portfolio scan.
+            models.Index(fields=['loan', 'booked_on', 'amount'], name='loans_ledger_balance_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.loan_id}#{self.sequence} {self.entry_type} {self.amount}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Ledger entries are append-only; post a correcting entry instead')
         super().save(*args, **kwargs)
-        
-        if is_new:  # Only update loan data for new payments
-            # Update loan's amount_paid and last_payment_date
-            loan = self.loan
-            loan.amount_paid += self.amount
-            
-            # Check if this payment date is more recent than the last recorded payment
-            if not loan.last_payment_date or self.payment_date > loan.last_payment_date:
-                loan.last_payment_date = self.payment_date
-            
-            # Check if loan is fully paid
-            if loan.amount_paid >= loan.total_amount_due:
-                loan.status = Loan.Status.PAID
-            
-            loan.save(update_fields=['amount_paid', 'last_payment_date', 'status']) 
\ No newline at end of file
+
+
+class LedgerSnapshot(models.Model):
+    """Running balance of a loan's ledger after entry `sequence`"""
+
+    loan = models.ForeignKey(
+        Loan,
+        on_delete=models.CASCADE,
+        related_name='ledger_snapshots',
+        verbose_name=_('loan')
+    )
+    sequence = models.PositiveIntegerField(_('sequence'))
+    booked_on = models.DateField(_('booked on'))
+    balance = models.DecimalField(_('balance'), max_digits=14, decimal_places=2)
+
+    class Meta:
+        verbose_name = _('ledger snapshot')
+        verbose_name_plural = _('ledger snapshots')
+        constraints = [
+            models.UniqueConstraint(fields=['loan', 'sequence'], name='loans_ledger_snapshot_sequence'),
+        ]
+        indexes = [
+            models.Index(fields=['loan', 'booked_on', 'sequence'], name='loans_ledger_snapshot_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.loan_id}#{self.sequence} {self.balance}"
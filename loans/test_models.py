@@ -102,6 +102,31 @@ class LoanModelTestCase(TestCase):
         self.loan.status = Loan.Status.PAID
         self.assertEqual(self.loan.payment_status, "Fully Paid")
         
+    def test_loan_days_past_due(self):
+        """Test the compute_days_past_due method."""
+        as_of = date(2024, 4, 15)
+        # No schedule yet
+        self.assertEqual(self.loan.compute_days_past_due(as_of), 0)
+
+        # 12 monthly installments of 933.33 from the end of January
+        self.loan.first_payment_date = date(2024, 1, 31)
+        self.assertEqual(self.loan.installment_count, 12)
+        self.assertEqual(self.loan.compute_days_past_due(as_of), 75)
+        self.loan.amount_paid = Decimal('2799.98')
+        self.assertEqual(self.loan.installment_due_date(2), date(2024, 3, 31))
+        self.assertEqual(self.loan.compute_days_past_due(as_of), 15)
+        self.loan.amount_paid = Decimal('2799.99')
+        self.assertEqual(self.loan.compute_days_past_due(as_of), 0)
+        self.loan.amount_paid = self.loan.total_amount_due
+        self.assertEqual(self.loan.compute_days_past_due(as_of), 0)
+
+        # Weekly installments
+        self.loan.payment_frequency = 'WEEKLY'
+        self.loan.first_payment_date = date(2024, 1, 1)
+        self.loan.amount_paid = Decimal('430.76')
+        self.assertEqual(self.loan.installment_count, 52)
+        self.assertEqual(self.loan.compute_days_past_due(date(2024, 1, 20)), 5)
+
     def test_loan_str_method(self):
         """Test the Loan __str__ method."""
         expected = f"LN-1001 - {self.customer}"
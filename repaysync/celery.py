@@ -0,0 +1,17 @@
+"""
+Celery application for background jobs (see core.jobs).
+
+Start a worker with `celery -A repaysync worker -l info` once
+CELERY_BROKER_URL points at Redis. Without a broker, tasks run eagerly in
+the process that submits them.
+"""
+import os
+
+from celery import Celery
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'repaysync.settings')
+
+app = Celery('repaysync')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -64,7 +64,6 @@ INSTALLED_APPS = [
     'django_filters',
     'drf_yasg',
     'corsheaders', # Ensure corsheaders is here
-    'debug_toolbar',
 
     # Project apps
     'users',
@@ -78,18 +77,33 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise, able to run in an async middleware chain under ASGI
+    'core.middleware.StaticFilesMiddleware',
+    # Per-view request/query/serializer metrics, exposed on /metrics
+    'core.middleware.MetricsMiddleware',
+    # Compress API responses; placed after WhiteNoise, which serves pre-compressed static files itself
+    'core.middleware.CompressionMiddleware',
+    # Audit trail; inside compression so it sees uncompressed bodies, writes off the request thread
+    'core.middleware.AuditLogMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     # CorsMiddleware should come BEFORE CommonMiddleware and other response-generating middleware
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Reads of GET/HEAD/OPTIONS requests go to a read replica; only active with DATABASE_REPLICAS
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware', # Debug toolbar usually last before closing body tag injection
+    # Opt-in sampling profiler, driven by sessions opened through /api/profiling/sessions/
+    'core.middleware.ProfilerMiddleware',
 ]
 
+# The debug toolbar is a development aid only; it is far too heavy for real traffic
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware') # Debug toolbar usually last before closing body tag injection
+
 ROOT_URLCONF = 'repaysync.urls'
 
 TEMPLATES = [
@@ -130,6 +144,66 @@ else:
         }
     }
 
+# Read replicas (see core/replicas.py), as aliases replica1..N. With DATABASE_URL list their URLs in
+# DATABASE_REPLICA_URLS; otherwise list host[:port][/name] entries in DB_REPLICAS, sharing the primary's
+# credentials. Test runs read them through the primary's test database.
+if os.environ.get('DATABASE_URL'):
+    _replicas = [dj_database_url.parse(url, conn_max_age=600) for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url]
+else:
+    _replicas = []
+    for _entry in filter(None, os.getenv('DB_REPLICAS', '').split(',')):
+        _host, _, _name = _entry.partition('/')
+        _host, _, _port = _host.partition(':')
+        _replicas.append({**DATABASES['default'], 'HOST': _host, 'PORT': _port or DATABASES['default']['PORT'],
+                          'NAME': _name or DATABASES['default']['NAME']})
+DATABASE_REPLICAS = []
+for _index, _replica in enumerate(_replicas, 1):
+    DATABASES[f'replica{_index}'] = {**_replica, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{_index}')
+
+# A second local database standing in for a replica in core/test_replicas.py (skipped without it)
+if os.getenv('DB_TEST_REPLICA_NAME'):
+    DATABASES['replica_test'] = {**DATABASES['default'], 'NAME': os.environ['DB_TEST_REPLICA_NAME'],
+                                 'TEST': {'NAME': f"test_{os.environ['DB_TEST_REPLICA_NAME']}"}}
+
+# Connection handling for the PostgreSQL databases above. By default each thread keeps its connection for
+# DB_CONN_MAX_AGE seconds. DB_POOL=True instead gives every worker process a bounded psycopg 3 connection pool
+# (pip install "psycopg[binary,pool]"); keep workers * DB_POOL_MAX_SIZE under the server's max_connections.
+# DB_TRANSACTION_POOLING=True is for running behind a transaction-level pooler such as PgBouncer: server-side
+# cursors are disabled (prepared statements already are).
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2')) # connections kept open per worker process
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10')) # hard cap per worker process
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '10')) # seconds a request waits for a free connection before failing
+DB_TRANSACTION_POOLING = os.getenv('DB_TRANSACTION_POOLING', 'False') == 'True'
+for _database in DATABASES.values():
+    if not _database['ENGINE'].endswith('postgresql'):
+        continue
+    _database['CONN_HEALTH_CHECKS'] = True # pooled connections are checked on checkout, persistent ones per request
+    if DB_POOL:
+        _database['CONN_MAX_AGE'] = 0 # the pool keeps connections; Django must hand them back after each request
+        _database['OPTIONS'] = {**_database.get('OPTIONS', {}), 'pool': {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_idle': 300, # close connections idle for 5 minutes, down to min_size
+            'max_lifetime': 3600, # recycle connections hourly
+        }}
+    else:
+        _database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    if DB_TRANSACTION_POOLING:
+        _database['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5')) # users read from the primary this long after a write
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '10')) # lagging further than this, a replica is skipped
+REPLICA_LAG_CHECK_SECONDS = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', '5')) # how often each worker re-checks replica lag
+
+# Shared cache, so that replica stickiness holds across workers; per-process memory when unset
+if os.getenv('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['REDIS_URL']}}
+
 
 # Password validation
 # ... (keep your existing AUTH_PASSWORD_VALIDATORS) ...
@@ -180,6 +254,10 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer', # orjson-backed, falls back to stdlib json
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_THROTTLE_CLASSES': (
@@ -187,12 +265,116 @@ REST_FRAMEWORK = {
         'rest_framework.throttling.UserRateThrottle',
     ),
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '100/day',
-        'user': '1000/day', # Consider increasing if needed
+        'anon': os.getenv('ANON_THROTTLE_RATE', '100/day'),
+        'user': os.getenv('USER_THROTTLE_RATE', '1000/day'), # raise both for `manage.py loadtest` runs
     },
     'EXCEPTION_HANDLER': 'core.utils.custom_exception_handler',
 }
 
+# Response compression (see core.middleware.CompressionMiddleware)
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)) # bytes
+COMPRESSION_BROTLI = os.environ.get('COMPRESSION_BROTLI', 'False') == 'True' # unpadded, so exposed to BREACH
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4)) # 0-11, higher is slower
+
+# Delta sync for offline clients (see api.sync)
+SYNC_BATCH_SIZE = 500 # rows per collection per page
+SYNC_SAFETY_WINDOW_SECONDS = 2 # skip rows newer than this; their transactions may still be open
+SYNC_TOMBSTONE_RETENTION_DAYS = 30 # older tokens trigger a full resync
+
+# Long polling on the async list endpoints (see api.async_views)
+LONG_POLL_MAX_SECONDS = int(os.getenv('LONG_POLL_MAX_SECONDS', 25)) # keep below proxy read timeouts
+LONG_POLL_INTERVAL_SECONDS = float(os.getenv('LONG_POLL_INTERVAL_SECONDS', 2)) # how often a held request re-checks
+
+# Follow-up event stream (see core.events); fanned out over Redis pub/sub, or in-process when unset
+EVENTS_REDIS_URL = os.getenv('EVENTS_REDIS_URL', os.getenv('REDIS_URL', ''))
+EVENTS_HISTORY = int(os.getenv('EVENTS_HISTORY', 1000)) # events kept per user for Last-Event-ID resume
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv('EVENTS_KEEPALIVE_SECONDS', 15)) # comment lines that keep proxies from timing out
+EVENTS_STREAM_MAX_SECONDS = int(os.getenv('EVENTS_STREAM_MAX_SECONDS', 300)) # streams end after this; clients reconnect and resume
+EVENTS_RETRY_MS = 3000 # reconnect delay sent to EventSource clients
+
+# Transactional outbox of domain events for downstream systems (see core.outbox)
+OUTBOX_ENABLED = os.getenv('OUTBOX_ENABLED', 'True') == 'True'
+OUTBOX_SINK = os.getenv('OUTBOX_SINK', 'file') # 'redis' (a Redis stream) or 'file' (append-only .jsonl segments)
+OUTBOX_REDIS_URL = os.getenv('OUTBOX_REDIS_URL', os.getenv('REDIS_URL', ''))
+OUTBOX_STREAM = os.getenv('OUTBOX_STREAM', 'repaysync:outbox')
+OUTBOX_STREAM_MAXLEN = 1000000 # approximate cap; consumers must stay within this many events
+OUTBOX_FILE_DIR = os.path.join(BASE_DIR, 'logs/outbox') # used by the 'file' sink
+OUTBOX_FILE_SEGMENT_BYTES = 1024*1024*64 # 64 MB per segment file
+OUTBOX_BATCH_SIZE = 1000 # events per relay round trip
+OUTBOX_POLL_SECONDS = 0.5 # relay pause when nothing is pending
+OUTBOX_RETENTION_DAYS = 7 # relayed events older than this are deleted by prune_outbox
+
+# Background jobs (see core.jobs); without a broker, Celery runs them inline once the submitting request commits
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', os.getenv('REDIS_URL', ''))
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', str(not CELERY_BROKER_URL)) == 'True'
+CELERY_TASK_IGNORE_RESULT = True # progress and results are kept on the Job row
+CELERY_TASK_ACKS_LATE = True # a task lost with its worker is redelivered and resumes from the checkpoint
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1 # jobs are long; do not reserve them ahead on a busy worker
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 3600} # must exceed JOB_TIME_SLICE_SECONDS
+JOB_CHUNK_SIZE = int(os.getenv('JOB_CHUNK_SIZE', 1000)) # rows per committed chunk
+JOB_MAX_RETRIES = 5 # failed attempts at one chunk before the job fails
+JOB_RETRY_BACKOFF_SECONDS = 5 # doubled on each further attempt
+JOB_TIME_SLICE_SECONDS = 60 # a task hands the job to a fresh task after this; 0 runs it to the end
+JOB_ARTIFACT_DIR = os.path.join(BASE_DIR, 'logs/jobs') # result files such as exports
+JOB_RETENTION_DAYS = 7 # finished jobs and their files older than this are deleted by prune_jobs
+
+# Batch loan status transitions (see core.transitions)
+LOAN_DEFAULT_DPD_THRESHOLD = 90 # loans more than this many days past due move to DEFAULTED
+LOAN_TRANSITION_BATCH_SIZE = 1000 # loans per transaction
+
+# Loan ledger (see core.ledger)
+LEDGER_SNAPSHOT_INTERVAL = 50 # entries between running balance snapshots of a loan
+LEDGER_BACKFILL_BATCH_SIZE = 1000 # loans opened per transaction by backfill_ledger
+
+# Nightly interest and penalty accrual (see core.accruals)
+LOAN_PENALTY_RATE = 24 # % a year, charged daily on overdue installments
+LOAN_ACCRUAL_BATCH_SIZE = 1000 # loans per transaction
+
+# Payment allocation (see core.payments)
+PAYMENT_WATERFALL = ('FEE', 'PENALTY', 'INTEREST', 'PRINCIPAL') # order payments settle what a loan owes in
+PAYMENT_WATERFALL_BY_INSTALLMENT = True # settle each installment's interest and principal before the next one's
+PAYMENT_SETTLEMENT_BATCH_SIZE = 1000 # loans per transaction when settling a file
+
+# Statement reconciliation (see core.reconciliation)
+RECONCILIATION_WINDOW_DAYS = 3 # days a statement line's date may be from its payment's when matched on amount
+
+# Idempotency-Key handling on create endpoints (see core.idempotency)
+IDEMPOTENCY_KEY_TTL_HOURS = 24 # stored responses are replayed for this long
+IDEMPOTENCY_LOCK_TIMEOUT_SECONDS = 60 # unfinished claims older than this can be taken over
+
+# Reference numbers
+REFERENCE_BLOCK_SIZE = 50 # ids each worker reserves per database round trip
+
+# Audit logging (see core.audit)
+AUDIT_LOG_ENABLED = os.getenv('AUDIT_LOG_ENABLED', 'True') == 'True'
+AUDIT_LOG_SINK = os.getenv('AUDIT_LOG_SINK', 'database') # 'database' (core_auditlog table) or 'file' (rotated .jsonl.gz)
+AUDIT_LOG_DIR = os.path.join(BASE_DIR, 'logs/audit') # used by the 'file' sink
+AUDIT_LOG_FILE_MAX_BYTES = 1024*1024*50 # 50 MB per file before rotating
+AUDIT_LOG_ASYNC = True # write from a background thread; False writes inline (tests)
+AUDIT_LOG_QUEUE_SIZE = 10000 # entries beyond this are dropped rather than blocking requests
+AUDIT_LOG_BATCH_SIZE = 500
+AUDIT_LOG_FLUSH_SECONDS = 1.0
+AUDIT_LOG_MAX_BODY_BYTES = 4096 # larger bodies are recorded by size only
+AUDIT_LOG_PATH_PREFIXES = ('/api/', '/admin/')
+AUDIT_LOG_REDACT_FIELDS = (
+    'password', 'password2', 'old_password', 'new_password',
+    'access', 'refresh', 'token', 'authorization', 'secret', 'national_id',
+)
+
+# Metrics (see core.metrics); set PROMETHEUS_MULTIPROC_DIR when running several workers
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',') # scrapers allowed on /metrics without login
+
+# Sampling profiler (see core.profiling)
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'True') == 'True' # False removes the middleware entirely
+PROFILER_REFRESH_SECONDS = 10 # how often each worker re-reads the active profile sessions
+PROFILER_SESSION_TTL_MINUTES = 60 # default lifetime of a profile session
+
+# Slow-query recorder (see core.slow_queries); browse with `manage.py slow_queries`
+SLOW_QUERY_THRESHOLD_MS = int(os.getenv('SLOW_QUERY_THRESHOLD_MS', '200')) # statements slower than this are recorded
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', '0')) # fraction of slow SELECTs re-run under EXPLAIN (ANALYZE, BUFFERS)
+SLOW_QUERY_BACKGROUND_WRITER = True # False keeps records queued until slow_query_writer.flush() (tests)
+
 # JWT settings
 # ... (keep your existing SIMPLE_JWT settings) ...
 SIMPLE_JWT = {
@@ -294,6 +476,11 @@ LOGGING = {
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'), # Control level via env var
             'propagate': True,
         },
+        'repaysync.slow_queries': {
+            'handlers': ['console', 'file'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
         'repaysync': { # Your project's logger
             'handlers': ['console', 'file'],
             'level': 'INFO', # Set to DEBUG for more verbose app logging